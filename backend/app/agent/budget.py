@@ -0,0 +1,75 @@
+"""
+Per-request latency budget.
+
+The endpoint stamps an absolute `deadline` (epoch seconds) into AgentState,
+REQUEST_SLO_SECONDS after the request arrived. Nodes ask how much time is
+left, keep a reserve for the nodes that still have to run after them, and
+degrade deliberately when the budget is tight (fewer queries, fewer
+candidates enriched, eco lookup skipped, fallback sentiment, template
+response). Each degradation is appended to `state['degradations']` and the
+response node reports the ones belonging to this request.
+"""
+from app.core.config import settings
+from typing import Any, Dict, List, Optional
+import math
+import time
+
+# Seconds to leave for the nodes that run after each stage
+RESERVE_SECONDS = {
+    "vision": 12.0,        # research/scout + analysis + response
+    "research": 7.0,       # veto + critique/analysis + response
+    "market_scout": 7.0,
+    "veto": 6.0,           # critique/analysis + response
+    "critique": 3.0,       # response
+    "analysis": 3.0,
+    "response": 0.0,
+}
+
+# Never hand out a timeout shorter than this (a call that cannot finish is skipped instead)
+MIN_STEP_SECONDS = 1.0
+
+
+def new_deadline(slo_seconds: Optional[float] = None, started_at: Optional[float] = None) -> float:
+    """Absolute deadline for a request that started at `started_at` (default: now)."""
+    return (started_at or time.time()) + (slo_seconds or settings.REQUEST_SLO_SECONDS)
+
+
+def remaining(state: Dict[str, Any], node: Optional[str] = None) -> float:
+    """
+    Seconds left before the deadline, minus the reserve for `node`'s
+    downstream stages. Infinite if the request carries no deadline.
+    """
+    deadline = state.get("deadline")
+    if not deadline:
+        return math.inf
+    return deadline - time.time() - RESERVE_SECONDS.get(node, 0.0)
+
+
+def step_timeout(state: Dict[str, Any], node: str, cap: float) -> float:
+    """Timeout for one call inside `node`: the usual cap, shrunk to what the budget allows."""
+    return max(MIN_STEP_SECONDS, min(cap, remaining(state, node)))
+
+
+def can_afford(state: Dict[str, Any], node: str, seconds: float) -> bool:
+    """True if `node` still has `seconds` to spend on an optional step."""
+    return remaining(state, node) >= seconds
+
+
+def degradation(state: Dict[str, Any], node: str, skipped: str, reason: str = "latency budget") -> Dict[str, Any]:
+    """Builds one `degradations` entry (tagged with the request deadline)."""
+    print(f"   [Budget] ⏳ {node}: {skipped} ({reason}, {remaining(state):.1f}s left)")
+    return {"node": node, "skipped": skipped, "reason": reason, "deadline": state.get("deadline")}
+
+
+def request_degradations(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Degradations recorded during the current request. `degradations` is an
+    append-only channel, so entries from earlier turns of the same thread
+    are filtered out by deadline.
+    """
+    deadline = state.get("deadline")
+    return [
+        {"node": d.get("node"), "skipped": d.get("skipped"), "reason": d.get("reason")}
+        for d in (state.get("degradations") or [])
+        if d.get("deadline") == deadline
+    ]
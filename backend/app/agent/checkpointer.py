@@ -0,0 +1,490 @@
+"""
+Bounded, persistent LangGraph checkpointer.
+
+MemorySaver keeps every thread forever, loses everything on restart, and is
+private to one gunicorn worker, so a /chat-followup routed to another worker
+never finds its thread. SQLCheckpointSaver stores checkpoints in a SQL
+database (DATABASE_URL unless CHECKPOINT_DB_URL is set) shared by all
+workers, and keeps it bounded:
+
+- TTL eviction: threads idle for longer than CHECKPOINT_TTL_SECONDS are
+  deleted (checked at most every CHECKPOINT_EVICT_INTERVAL_SECONDS).
+- Per-thread cap: after each put, the oldest checkpoints of the thread are
+  dropped until it holds at most CHECKPOINT_MAX_PER_THREAD checkpoints and
+  CHECKPOINT_MAX_THREAD_BYTES bytes (the latest one is always kept).
+
+Each checkpoint row stores the full serialized checkpoint (channel values
+included), so any single row is enough to resume a thread.
+
+`create_checkpointer()` picks the backend from CHECKPOINT_BACKEND
+("sql" or "memory"). If the SQL store cannot be opened the API refuses to
+start rather than silently dropping to per-worker memory.
+"""
+from app.core.config import settings
+from collections import deque
+from typing import Any, Dict, Iterator, AsyncIterator, Optional, Sequence, Tuple
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+from sqlalchemy import (
+    Column, Float, Integer, LargeBinary, MetaData, String, Table, Text,
+    create_engine, delete, event, func, select, and_,
+)
+
+logger = logging.getLogger(__name__)
+
+metadata_obj = MetaData()
+
+checkpoints_table = Table(
+    "agent_checkpoints", metadata_obj,
+    Column("thread_id", String(128), primary_key=True),
+    Column("checkpoint_ns", String(255), primary_key=True, default=""),
+    Column("checkpoint_id", String(64), primary_key=True),
+    Column("parent_checkpoint_id", String(64), nullable=True),
+    Column("type", String(32)),
+    Column("checkpoint", LargeBinary),
+    Column("metadata_type", String(32)),
+    Column("metadata", LargeBinary),
+    Column("size_bytes", Integer, default=0),
+    Column("created_at", Float, index=True),
+)
+
+writes_table = Table(
+    "agent_checkpoint_writes", metadata_obj,
+    Column("thread_id", String(128), primary_key=True),
+    Column("checkpoint_ns", String(255), primary_key=True, default=""),
+    Column("checkpoint_id", String(64), primary_key=True),
+    Column("task_id", String(64), primary_key=True),
+    Column("idx", Integer, primary_key=True),
+    Column("channel", String(255)),
+    Column("type", String(32)),
+    Column("value", LargeBinary),
+    Column("task_path", Text, default=""),
+    Column("size_bytes", Integer, default=0),
+)
+
+
+def create_store_engine(db_url: str):
+    """
+    SQLAlchemy engine for a store shared by the gunicorn workers (checkpoints,
+    job queue). An empty URL means DATABASE_URL. SQLite gets WAL so workers
+    can read while one of them writes.
+    """
+    db_url = db_url or settings.DATABASE_URL
+    if db_url.startswith("sqlite"):
+        path = db_url.split("sqlite:///", 1)[-1]
+        if path and path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        engine = create_engine(db_url, connect_args={"check_same_thread": False, "timeout": 30})
+
+        @event.listens_for(engine, "connect")
+        def _sqlite_pragmas(dbapi_conn, _):
+            # WAL lets the gunicorn workers read while one of them writes
+            cursor = dbapi_conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        return engine
+    return create_engine(db_url, pool_pre_ping=True)
+
+
+class LatencyStats:
+    """Rolling latency window (last N samples) for a checkpointer operation."""
+
+    def __init__(self, window: int = 1000):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+
+        def pct(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {"count": self.count, "p50_ms": pct(0.50), "p95_ms": pct(0.95), "max_ms": round(samples[-1] * 1000, 2)}
+
+
+class SQLCheckpointSaver(BaseCheckpointSaver):
+    def __init__(
+        self,
+        db_url: Optional[str] = None,
+        ttl_seconds: Optional[int] = None,
+        max_per_thread: Optional[int] = None,
+        max_thread_bytes: Optional[int] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.db_url = db_url or settings.CHECKPOINT_DB_URL
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.CHECKPOINT_TTL_SECONDS
+        self.max_per_thread = max_per_thread if max_per_thread is not None else settings.CHECKPOINT_MAX_PER_THREAD
+        self.max_thread_bytes = max_thread_bytes if max_thread_bytes is not None else settings.CHECKPOINT_MAX_THREAD_BYTES
+
+        self.engine = self._create_engine(self.db_url)
+        metadata_obj.create_all(self.engine)
+
+        self._last_evict = 0.0
+        self._evict_lock = threading.Lock()
+        self.get_latency = LatencyStats()
+        self.put_latency = LatencyStats()
+        self.evicted_threads = 0
+        self.trimmed_checkpoints = 0
+
+    @staticmethod
+    def _create_engine(db_url: str):
+        return create_store_engine(db_url)
+
+    # --- Read path ---
+
+    def _parent_config(self, thread_id: str, checkpoint_ns: str, parent_id: Optional[str]) -> Optional[RunnableConfig]:
+        if not parent_id:
+            return None
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+
+    def _load_writes(self, conn, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        rows = conn.execute(
+            select(writes_table.c.task_id, writes_table.c.channel, writes_table.c.type,
+                   writes_table.c.value, writes_table.c.task_path, writes_table.c.idx)
+            .where(and_(
+                writes_table.c.thread_id == thread_id,
+                writes_table.c.checkpoint_ns == checkpoint_ns,
+                writes_table.c.checkpoint_id == checkpoint_id,
+            ))
+        ).fetchall()
+        rows = sorted(rows, key=lambda r: writes_sort_key(r.task_path or "", r.task_id, r.idx))
+        return [(r.task_id, r.channel, self.serde.loads_typed((r.type, r.value))) for r in rows]
+
+    def _row_to_tuple(self, conn, row) -> CheckpointTuple:
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": row.thread_id,
+                "checkpoint_ns": row.checkpoint_ns,
+                "checkpoint_id": row.checkpoint_id,
+            }},
+            checkpoint=self.serde.loads_typed((row.type, row.checkpoint)),
+            metadata=self.serde.loads_typed((row.metadata_type, row.metadata)),
+            parent_config=self._parent_config(row.thread_id, row.checkpoint_ns, row.parent_checkpoint_id),
+            pending_writes=self._load_writes(conn, row.thread_id, row.checkpoint_ns, row.checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        start = time.perf_counter()
+        try:
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+            query = select(checkpoints_table).where(and_(
+                checkpoints_table.c.thread_id == thread_id,
+                checkpoints_table.c.checkpoint_ns == checkpoint_ns,
+            ))
+            if checkpoint_id := get_checkpoint_id(config):
+                query = query.where(checkpoints_table.c.checkpoint_id == checkpoint_id)
+            else:
+                query = query.order_by(checkpoints_table.c.checkpoint_id.desc()).limit(1)
+
+            with self.engine.connect() as conn:
+                row = conn.execute(query).first()
+                return self._row_to_tuple(conn, row) if row else None
+        finally:
+            self.get_latency.observe(time.perf_counter() - start)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = select(checkpoints_table)
+        if config:
+            query = query.where(checkpoints_table.c.thread_id == config["configurable"]["thread_id"])
+            if (ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query = query.where(checkpoints_table.c.checkpoint_ns == ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query = query.where(checkpoints_table.c.checkpoint_id == checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query = query.where(checkpoints_table.c.checkpoint_id < before_id)
+        query = query.order_by(checkpoints_table.c.checkpoint_id.desc())
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).fetchall()
+            for row in rows:
+                if filter:
+                    metadata = self.serde.loads_typed((row.metadata_type, row.metadata))
+                    if not all(metadata.get(k) == v for k, v in filter.items()):
+                        continue
+                if limit is not None:
+                    if limit <= 0:
+                        break
+                    limit -= 1
+                yield self._row_to_tuple(conn, row)
+
+    # --- Write path ---
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        start = time.perf_counter()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, payload = self.serde.dumps_typed(checkpoint)
+        meta_type, meta_payload = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(delete(checkpoints_table).where(and_(
+                    checkpoints_table.c.thread_id == thread_id,
+                    checkpoints_table.c.checkpoint_ns == checkpoint_ns,
+                    checkpoints_table.c.checkpoint_id == checkpoint["id"],
+                )))
+                conn.execute(checkpoints_table.insert().values(
+                    thread_id=thread_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint["id"],
+                    parent_checkpoint_id=config["configurable"].get("checkpoint_id"),
+                    type=type_,
+                    checkpoint=payload,
+                    metadata_type=meta_type,
+                    metadata=meta_payload,
+                    size_bytes=len(payload) + len(meta_payload),
+                    created_at=time.time(),
+                ))
+                self._enforce_thread_cap(conn, thread_id)
+        finally:
+            self.put_latency.observe(time.perf_counter() - start)
+
+        self._maybe_evict()
+        return {"configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        key = and_(
+            writes_table.c.thread_id == thread_id,
+            writes_table.c.checkpoint_ns == checkpoint_ns,
+            writes_table.c.checkpoint_id == checkpoint_id,
+            writes_table.c.task_id == task_id,
+        )
+
+        with self.engine.begin() as conn:
+            existing = {r.idx for r in conn.execute(select(writes_table.c.idx).where(key))}
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                if idx >= 0 and idx in existing:
+                    # Regular writes are idempotent per (task, idx)
+                    continue
+                if idx in existing:
+                    # Special channels (error/interrupt/...) overwrite
+                    conn.execute(delete(writes_table).where(and_(key, writes_table.c.idx == idx)))
+                type_, payload = self.serde.dumps_typed(value)
+                conn.execute(writes_table.insert().values(
+                    thread_id=thread_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint_id,
+                    task_id=task_id,
+                    idx=idx,
+                    channel=channel,
+                    type=type_,
+                    value=payload,
+                    task_path=task_path,
+                    size_bytes=len(payload),
+                ))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.engine.begin() as conn:
+            self._delete_threads(conn, [thread_id])
+
+    # --- Bounding ---
+
+    @staticmethod
+    def _delete_threads(conn, thread_ids: Sequence[str]):
+        if not thread_ids:
+            return
+        conn.execute(delete(writes_table).where(writes_table.c.thread_id.in_(thread_ids)))
+        conn.execute(delete(checkpoints_table).where(checkpoints_table.c.thread_id.in_(thread_ids)))
+
+    def _enforce_thread_cap(self, conn, thread_id: str):
+        """Drops the thread's oldest checkpoints beyond the count/byte caps (keeps the latest)."""
+        rows = conn.execute(
+            select(checkpoints_table.c.checkpoint_ns, checkpoints_table.c.checkpoint_id, checkpoints_table.c.size_bytes)
+            .where(checkpoints_table.c.thread_id == thread_id)
+            .order_by(checkpoints_table.c.created_at.desc(), checkpoints_table.c.checkpoint_id.desc())
+        ).fetchall()
+
+        total = 0
+        doomed = []
+        for position, row in enumerate(rows):
+            total += row.size_bytes or 0
+            if position == 0:
+                continue
+            if position >= self.max_per_thread or total > self.max_thread_bytes:
+                doomed.append((row.checkpoint_ns, row.checkpoint_id))
+
+        for checkpoint_ns, checkpoint_id in doomed:
+            conn.execute(delete(writes_table).where(and_(
+                writes_table.c.thread_id == thread_id,
+                writes_table.c.checkpoint_ns == checkpoint_ns,
+                writes_table.c.checkpoint_id == checkpoint_id,
+            )))
+            conn.execute(delete(checkpoints_table).where(and_(
+                checkpoints_table.c.thread_id == thread_id,
+                checkpoints_table.c.checkpoint_ns == checkpoint_ns,
+                checkpoints_table.c.checkpoint_id == checkpoint_id,
+            )))
+        self.trimmed_checkpoints += len(doomed)
+
+    def _maybe_evict(self):
+        now = time.time()
+        if now - self._last_evict < settings.CHECKPOINT_EVICT_INTERVAL_SECONDS:
+            return
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_evict = now
+            self.evict_expired(now)
+        except Exception as e:
+            logger.error(f"Checkpoint eviction failed: {e}")
+        finally:
+            self._evict_lock.release()
+
+    def evict_expired(self, now: Optional[float] = None) -> int:
+        """Deletes threads whose newest checkpoint is older than the TTL. Returns the count."""
+        cutoff = (now or time.time()) - self.ttl_seconds
+        with self.engine.begin() as conn:
+            expired = [
+                r.thread_id for r in conn.execute(
+                    select(checkpoints_table.c.thread_id)
+                    .group_by(checkpoints_table.c.thread_id)
+                    .having(func.max(checkpoints_table.c.created_at) < cutoff)
+                )
+            ]
+            for i in range(0, len(expired), 500):
+                self._delete_threads(conn, expired[i:i + 500])
+        if expired:
+            self.evicted_threads += len(expired)
+            logger.info(f"Evicted {len(expired)} expired checkpoint threads")
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        """Storage size and latency metrics for monitoring."""
+        with self.engine.connect() as conn:
+            cp = conn.execute(select(
+                func.count(), func.count(func.distinct(checkpoints_table.c.thread_id)),
+                func.coalesce(func.sum(checkpoints_table.c.size_bytes), 0),
+            )).first()
+            wr = conn.execute(select(
+                func.count(), func.coalesce(func.sum(writes_table.c.size_bytes), 0),
+            )).first()
+        return {
+            "backend": "sql",
+            "threads": cp[1],
+            "checkpoints": cp[0],
+            "checkpoint_bytes": int(cp[2]),
+            "writes": wr[0],
+            "write_bytes": int(wr[1]),
+            "get_latency": self.get_latency.summary(),
+            "put_latency": self.put_latency.summary(),
+            "evicted_threads": self.evicted_threads,
+            "trimmed_checkpoints": self.trimmed_checkpoints,
+        }
+
+    # --- Async API (SQLAlchemy engine is sync; keep it off the event loop) ---
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def create_checkpointer() -> BaseCheckpointSaver:
+    """
+    Builds the graph checkpointer from settings. Raises if the SQL store
+    cannot be opened: a MemorySaver fallback would lose every conversation
+    on restart and break follow-ups routed to another worker without anyone
+    noticing. Set CHECKPOINT_BACKEND=memory to run without the store.
+    """
+    from langgraph.checkpoint.memory import MemorySaver
+
+    if settings.CHECKPOINT_BACKEND == "memory":
+        logger.warning("Using in-memory checkpoints (CHECKPOINT_BACKEND=memory): threads are per-worker and lost on restart")
+        return MemorySaver()
+    try:
+        return SQLCheckpointSaver()
+    except Exception as e:
+        logger.critical(f"Checkpoint store unavailable: {e}")
+        raise RuntimeError(
+            f"Checkpoint store unavailable ({e}); fix CHECKPOINT_DB_URL/DATABASE_URL "
+            "or set CHECKPOINT_BACKEND=memory"
+        ) from e
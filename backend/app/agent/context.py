@@ -0,0 +1,169 @@
+"""
+Prompt context builder.
+
+Nodes used to paste their inputs into prompts as they came: the response
+node sent `json.dumps(analysis, indent=2)` (which carries the alternatives
+twice, as `alternatives_ranked` and `alternatives`), the full risk report
+and `products_detail` (the same alternatives a third time); the scout
+concatenated 25 raw search results; the chat node cut `str(analysis)` at
+500 characters, mid-structure. Input tokens are what LLM latency scales
+with, so these helpers keep prompts small:
+
+- `compact_json`: no indentation or spaces, None/empty values dropped,
+  floats rounded.
+- `analysis_context`: the analysis object without its duplicated fields
+  (one alternatives list, no repeated product names or URLs).
+- `budget_json` / `budget_lines`: fit a structure or a list of text lines
+  into a token budget by dropping list tails and shortening long strings,
+  never by cutting JSON in half.
+- `estimate_tokens`: local estimate (no tokenizer round trip), about 4
+  characters per token for Gemini on English text and JSON.
+
+Budgets per node are in PROMPT_TOKEN_BUDGETS; `record_prompt` exports the
+estimated size of the final prompt as agent_prompt_tokens{call_site}.
+"""
+from app.core.config import settings
+from app.core import metrics
+from typing import Any, Iterable, Optional
+import copy
+import json
+import math
+
+CHARS_PER_TOKEN = 4.0
+# Longest string kept when a structure must shrink to fit its budget
+MIN_STRING_CHARS = 160
+# Floor when strings must shrink further (after list tails are gone)
+MIN_SHRUNK_STRING_CHARS = 8
+
+# Analysis fields that repeat other fields (or go to the UI only)
+_DUPLICATE_ANALYSIS_KEYS = ("alternatives", "identified_product", "active_product")
+_ALTERNATIVE_KEYS = ("name", "score", "price_text", "reason", "eco_score", "eco_notes")
+
+
+def estimate_tokens(text: Any) -> int:
+    if not text:
+        return 0
+    return math.ceil(len(text if isinstance(text, str) else str(text)) / CHARS_PER_TOKEN)
+
+
+def budget_for(node: str, default: int = 2000) -> int:
+    return int(settings.PROMPT_TOKEN_BUDGETS.get(node, default))
+
+
+def _prune(value: Any) -> Any:
+    if isinstance(value, dict):
+        pruned = {k: _prune(v) for k, v in value.items()}
+        return {k: v for k, v in pruned.items() if v not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [v for v in (_prune(v) for v in value) if v not in (None, "", [], {})]
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(_prune(value), separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def analysis_context(analysis: dict, max_alternatives: Optional[int] = None) -> dict:
+    """
+    The analysis object for a prompt: `alternatives_ranked` only (the
+    `alternatives` list repeats it with UI breakdowns), without image/link
+    URLs and without the fields that repeat `recommended_product`.
+    `max_alternatives=0` leaves the alternatives out (the caller sends them
+    separately).
+    """
+    if not analysis:
+        return {}
+    context = {k: v for k, v in analysis.items()
+               if k not in _DUPLICATE_ANALYSIS_KEYS and k != "alternatives_ranked"}
+    alternatives = analysis.get("alternatives_ranked") or analysis.get("alternatives") or []
+    if max_alternatives != 0:
+        context["alternatives_ranked"] = [
+            {k: a.get(k) for k in _ALTERNATIVE_KEYS}
+            for a in alternatives[:max_alternatives]
+        ]
+    active = analysis.get("active_product") or {}
+    if active.get("price_text"):
+        context["price_text"] = active["price_text"]
+    return context
+
+
+def _longest_list(value: Any) -> Optional[list]:
+    best = None
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            if len(node) > 1 and (best is None or len(node) > len(best)):
+                best = node
+            stack.extend(node)
+    return best
+
+
+def _shorten_strings(value: Any, limit: int, keep_urls: bool = True) -> Any:
+    if isinstance(value, dict):
+        return {k: _shorten_strings(v, limit, keep_urls) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shorten_strings(v, limit, keep_urls) for v in value]
+    if isinstance(value, str) and len(value) > limit and not (keep_urls and value.startswith("http")):
+        return value[:limit].rstrip() + "…"
+    return value
+
+
+def budget_json(value: Any, max_tokens: int) -> str:
+    """
+    compact_json(value), shrunk to max_tokens: long strings (not URLs) first,
+    then list tails, then strings below MIN_STRING_CHARS, URLs last. The
+    result is always valid JSON; if even that does not fit it stays over.
+    """
+    text = compact_json(value)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    value = _shorten_strings(_prune(copy.deepcopy(value)), MIN_STRING_CHARS)
+    text = compact_json(value)
+    while estimate_tokens(text) > max_tokens:
+        longest = _longest_list(value)
+        if longest is None:
+            break
+        longest.pop()
+        text = compact_json(value)
+    # Oversized scalars: nothing structural left to drop, so shorten them further
+    for keep_urls in (True, False):
+        limit = MIN_STRING_CHARS
+        while estimate_tokens(text) > max_tokens and limit > MIN_SHRUNK_STRING_CHARS:
+            limit //= 2
+            value = _shorten_strings(value, limit, keep_urls)
+            text = compact_json(value)
+    return text
+
+
+def budget_lines(lines: Iterable[str], max_tokens: int, max_line_chars: int = 600,
+                 separator: str = "\n") -> str:
+    """Joins unique, whitespace-trimmed lines (each at most max_line_chars) until the budget is spent."""
+    kept, seen, used = [], set(), 0
+    for line in lines:
+        line = " ".join(str(line).split())
+        if not line or line in seen:
+            continue
+        if len(line) > max_line_chars:
+            line = line[:max_line_chars].rstrip() + "…"
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        seen.add(line)
+        kept.append(line)
+        used += cost
+    return separator.join(kept)
+
+
+def record_prompt(call_site: str, prompt: Any) -> int:
+    """Estimated prompt size (str or list of messages), exported per call site."""
+    if isinstance(prompt, (list, tuple)):
+        tokens = sum(estimate_tokens(getattr(m, "content", m)) for m in prompt)
+    else:
+        tokens = estimate_tokens(prompt)
+    metrics.PROMPT_TOKENS.labels(call_site=call_site).observe(tokens)
+    return tokens
@@ -1,5 +1,5 @@
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
+from app.agent.checkpointer import create_checkpointer
 from app.agent.state import AgentState
 from app.agent.nodes import (
     node_user_intent_vision,
@@ -11,6 +11,7 @@ from app.agent.nodes.analysis import node_analysis_synthesis
 from app.agent.nodes.response import node_response_formulation
 from app.agent.nodes.router import node_router
 from app.agent.nodes.chat import node_chat
+from app.agent.timing import timed_node
 from typing import Dict, Any
 
 # Merge node to combine parallel outputs from Critique and Analysis
@@ -35,19 +36,19 @@ def node_discovery_join(state: AgentState) -> Dict[str, Any]:
 # 1. Define the Graph
 workflow = StateGraph(AgentState)
 
-# 2. Add Nodes (direct, no wrappers for now)
-workflow.add_node("router_node", node_router)
-workflow.add_node("vision_node", node_user_intent_vision)
-workflow.add_node("research_node", node_discovery_runner)
-workflow.add_node("market_scout_node", node_market_scout)
+# 2. Add Nodes (timed_node records a span + node_timings entry per node)
+workflow.add_node("router_node", timed_node("router")(node_router))
+workflow.add_node("vision_node", timed_node("vision")(node_user_intent_vision))
+workflow.add_node("research_node", timed_node("research")(node_discovery_runner))
+workflow.add_node("market_scout_node", timed_node("market_scout")(node_market_scout))
 workflow.add_node("discovery_join_node", node_discovery_join) # New Join Node
-workflow.add_node("chat_node", node_chat)
-workflow.add_node("veto_node", node_skeptic_veto) # New Veto Check Node
+workflow.add_node("chat_node", timed_node("chat")(node_chat))
+workflow.add_node("veto_node", timed_node("veto")(node_skeptic_veto)) # New Veto Check Node
 workflow.add_node("parallel_start_node", node_fan_out) # New Branch Node
-workflow.add_node("skeptic_node", node_skeptic_critique)
-workflow.add_node("analysis_node", node_analysis_synthesis)
+workflow.add_node("skeptic_node", timed_node("critique")(node_skeptic_critique))
+workflow.add_node("analysis_node", timed_node("analysis")(node_analysis_synthesis))
 workflow.add_node("merge_node", node_merge_parallel)
-workflow.add_node("response_node", node_response_formulation)
+workflow.add_node("response_node", timed_node("response")(node_response_formulation))
 
 # 3. Define Edges (The Flow)
 
@@ -168,5 +169,6 @@ workflow.add_edge("merge_node", "response_node")
 workflow.add_edge("response_node", END)
 
 # 4. Compile the Graph with Persistence
-checkpointer = MemorySaver()
+# Shared across gunicorn workers and bounded (TTL + per-thread cap), see checkpointer.py
+checkpointer = create_checkpointer()
 agent_app = workflow.compile(checkpointer=checkpointer)
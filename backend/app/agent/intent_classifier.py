@@ -0,0 +1,247 @@
+"""
+Local intent classifier in front of the router LLM.
+
+`node_router` used to ask Gemini about every text turn, including the
+messages its own prompt classifies by keyword. `classify()` now decides
+those locally, in two stages:
+
+1. rules: the router prompt's own keyword rules, limited to preference
+   statements. A dollar amount or a stated budget means re_search, a colour
+   or style asked for after a cue ("show me blue", "I don't like red") means
+   re_search, "cheaper"/"affordable" without an amount means re_analysis,
+   and a bare greeting or thanks means chat. Questions (a "?" or a leading
+   interrogative) and rule conflicts (e.g. "cheaper blue ones") are left to
+   the next stage.
+2. model: a multinomial Naive Bayes over word uni- and bigrams. It is
+   trained from the decisions the LLM made (the `router_decisions` table,
+   shared by the gunicorn workers) and used once ROUTER_MODEL_MIN_SAMPLES
+   of them exist. Its prediction counts only at
+   ROUTER_MODEL_MIN_CONFIDENCE or above.
+
+Everything else escalates to the LLM. Each LLM decision is logged as a new
+training example, and is compared with the model's own guess to feed the
+agreement counter. A ROUTER_SHADOW_RATE sample of local decisions is also
+re-checked by the LLM in the background, so agreement is measured where the
+local stage does decide. Decisions, confidences and agreement are exported
+as agent_router_* metrics.
+"""
+from app.agent.checkpointer import create_store_engine
+from app.core.config import settings
+from app.core import metrics
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import logging
+import math
+import re
+import threading
+import time
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, select, and_
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("vision_search", "chat", "re_search", "re_analysis")
+
+metadata_obj = MetaData()
+
+decisions_table = Table(
+    "router_decisions", metadata_obj,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("message", Text),
+    Column("has_image", Integer),
+    Column("decision", String(32)),
+    Column("source", String(16), index=True),
+    Column("confidence", Float, nullable=True),
+    Column("created_at", Float, index=True),
+)
+
+# --- Rules (mirror the router prompt) ---
+# Only unambiguous preference statements are decided here. Questions ("Is this a
+# good brand?", "What colors does it come in?") are `chat` for the router
+# prompt, so anything phrased as one goes to the model/LLM stage.
+
+_QUESTION = re.compile(
+    r"\?|^(?:what|which|who|whose|when|where|why|how|is|are|was|were|does|do|did|can|could|will|would"
+    r"|should|has|have|tell me|explain|describe)\b"
+)
+_MONEY = re.compile(
+    r"\$\s?\d|\b\d[\d,.]*\s?(?:dollars|bucks|usd)\b"
+    r"|\bbudget\b[^.?!\d]{0,20}\d{2,}"
+)
+_CHEAPER = re.compile(
+    r"\b(?:cheaper|cheapest|affordable|inexpensive|budget[- ]friendly|less expensive|lower price"
+    r"|price is important|on a budget|budget is tight|tight budget|save money)\b"
+)
+_COLOURS = (
+    "red|blue|green|black|white|grey|gray|pink|purple|yellow|orange|brown|beige|silver|gold"
+    "|navy|teal|maroon|cream"
+)
+# A colour or style adjective right after a preference cue ("show me blue", "I don't like red")
+_PREFERENCE_CUE = (
+    r"show me|give me|find|i want|i'd like|i would like|i prefer|prefer|i like|i love|i don't like"
+    r"|i do not like|i dislike|i hate|don't want|do not want|not|no|avoid|without|only|something|any|in"
+)
+_VISUAL = re.compile(
+    rf"\b(?:{_PREFERENCE_CUE})\b(?:\s+[\w']+){{0,3}}?\s+(?:{_COLOURS}|modern|minimalist|retro|vintage|sleek)\b"
+)
+_SMALL_TALK = re.compile(
+    r"^(?:hi|hello|hey|thanks|thank you|thank you so much|thx|ok|okay|cool|great|awesome|bye|goodbye)[\s!.]*$"
+)
+
+
+def rule_decision(message: str) -> Optional[str]:
+    """The intent the keyword rules imply, or None if none or several apply (or it is a question)."""
+    text = message.lower().strip()
+    if not text:
+        return None
+    if _SMALL_TALK.match(text):
+        return "chat"
+    if _QUESTION.search(text):
+        return None
+    if _MONEY.search(text):
+        return "re_search"  # A specific amount may need new products
+    cheaper, visual = bool(_CHEAPER.search(text)), bool(_VISUAL.search(text))
+    if cheaper and visual:
+        return None
+    if cheaper:
+        return "re_analysis"
+    if visual:
+        return "re_search"
+    return None
+
+
+# --- Naive Bayes ---
+
+_TOKEN = re.compile(r"\$?\d[\d,.]*|[a-z]+(?:'[a-z]+)?")
+
+
+def features(message: str, has_image: bool = False) -> List[str]:
+    tokens = ["<money>" if t.startswith("$") else "<num>" if t[0].isdigit() else t
+              for t in _TOKEN.findall(message.lower())]
+    feats = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    feats.append("<image>" if has_image else "<no_image>")
+    return feats
+
+
+class NaiveBayes:
+    """Multinomial Naive Bayes with add-one smoothing."""
+
+    def __init__(self):
+        self.class_counts: Counter = Counter()
+        self.feature_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.totals: Counter = Counter()
+        self.vocab: set = set()
+
+    def fit(self, samples: List[Tuple[List[str], str]]) -> "NaiveBayes":
+        for feats, label in samples:
+            self.class_counts[label] += 1
+            self.feature_counts[label].update(feats)
+            self.totals[label] += len(feats)
+            self.vocab.update(feats)
+        return self
+
+    @property
+    def size(self) -> int:
+        return sum(self.class_counts.values())
+
+    def predict(self, feats: List[str]) -> Tuple[Optional[str], float]:
+        """(label, posterior probability), or (None, 0.0) before any training."""
+        if not self.class_counts:
+            return None, 0.0
+        n, v = self.size, len(self.vocab) + 1
+        scores = {}
+        for label, count in self.class_counts.items():
+            counts, denom = self.feature_counts[label], self.totals[label] + v
+            scores[label] = math.log(count / n) + sum(math.log((counts[f] + 1) / denom) for f in feats)
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / norm
+
+
+@dataclass
+class LocalDecision:
+    decision: Optional[str]  # Best local guess (None if the model is not trained)
+    confidence: float
+    source: str              # "rules" or "model"
+    confident: bool          # True = route without the LLM
+
+
+class IntentClassifier:
+    def __init__(self, db_url: Optional[str] = None):
+        self.db_url = db_url or settings.ROUTER_DB_URL
+        self._engine = None
+        self._model = NaiveBayes()
+        self._trained_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = create_store_engine(self.db_url)
+            metadata_obj.create_all(self._engine)
+        return self._engine
+
+    @property
+    def stale(self) -> bool:
+        return time.time() - self._trained_at >= settings.ROUTER_MODEL_RETRAIN_SECONDS
+
+    def retrain(self):
+        """Refits the model on the latest LLM decisions (blocking; run it in a thread)."""
+        with self._lock:
+            if not self.stale:
+                return
+            self._trained_at = time.time()
+            try:
+                with self.engine.connect() as conn:
+                    rows = conn.execute(
+                        select(decisions_table.c.message, decisions_table.c.has_image, decisions_table.c.decision)
+                        .where(and_(decisions_table.c.source == "llm", decisions_table.c.decision.in_(INTENTS)))
+                        .order_by(decisions_table.c.id.desc())
+                        .limit(settings.ROUTER_MODEL_MAX_SAMPLES)
+                    ).fetchall()
+            except Exception as e:
+                logger.error(f"Router model training failed: {e}")
+                return
+            self._model = NaiveBayes().fit([(features(r.message, bool(r.has_image)), r.decision) for r in rows])
+            print(f"[Router] Local model trained on {self._model.size} LLM decisions")
+
+    def classify(self, message: str, has_image: bool = False) -> LocalDecision:
+        decision = rule_decision(message)
+        if decision:
+            return LocalDecision(decision, 1.0, "rules", True)
+        model = self._model
+        decision, confidence = model.predict(features(message, has_image))
+        confident = (
+            decision is not None
+            and model.size >= settings.ROUTER_MODEL_MIN_SAMPLES
+            and confidence >= settings.ROUTER_MODEL_MIN_CONFIDENCE
+        )
+        return LocalDecision(decision, confidence, "model", confident)
+
+    def log_decision(self, message: str, has_image: bool, decision: str, source: str,
+                     confidence: Optional[float] = None):
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(decisions_table.insert().values(
+                    message=message, has_image=int(has_image), decision=decision,
+                    source=source, confidence=confidence, created_at=time.time(),
+                ))
+        except Exception as e:
+            logger.error(f"Router decision log failed: {e}")
+
+
+intent_classifier = IntentClassifier()
+
+
+def record_decision(source: str, decision: str, confidence: float):
+    metrics.ROUTER_DECISIONS.labels(source=source, decision=decision).inc()
+    metrics.ROUTER_CONFIDENCE.labels(source=source).observe(confidence)
+
+
+def record_agreement(source: str, local_decision: Optional[str], llm_decision: str):
+    """Local guess vs the LLM's decision for the same message."""
+    if local_decision is None:
+        return
+    result = "agree" if local_decision == llm_decision else "disagree"
+    metrics.ROUTER_AGREEMENT.labels(source=source, result=result).inc()
@@ -0,0 +1,109 @@
+"""
+Process-wide registry of LLM and embedding clients.
+
+Nodes used to build a new ChatGoogleGenerativeAI (and the Skeptic a new
+SkepticAgent) on every call, paying client construction and a fresh TLS
+handshake each time. `get_llm(model, temperature, max_tokens)` returns one
+shared, preconfigured client per configuration instead; the underlying
+google-genai client keeps its connection pool between calls.
+
+`warm_up()` (FastAPI startup) builds the clients the graph uses and, with
+LLM_WARMUP_PING, opens their connections with a free count_tokens call, so
+the first request of a worker does not pay for it either.
+
+Clients are GovernedChatGoogleGenerativeAI (agent/llm_governor.py): calls
+share a per-model concurrency limit, and 429/5xx retries happen in the
+governor (with backoff and a circuit breaker) instead of the SDK.
+"""
+from app.agent.llm_governor import GovernedChatGoogleGenerativeAI
+from app.core.config import settings
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import threading
+
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+
+logger = logging.getLogger(__name__)
+
+# Model used by the router, chat node and target location
+FAST_MODEL = "gemini-2.0-flash"
+EMBEDDING_MODEL = "models/gemini-embedding-001"
+
+_llms: Dict[Tuple, ChatGoogleGenerativeAI] = {}
+_embeddings: Dict[str, GoogleGenerativeAIEmbeddings] = {}
+_lock = threading.Lock()
+
+
+def get_llm(model: str, temperature: float = 0.0, max_tokens: Optional[int] = None,
+            max_retries: Optional[int] = None) -> ChatGoogleGenerativeAI:
+    """
+    Shared client for (model, temperature, max_tokens[, max_retries]); built
+    on first use. `max_retries` is the governor's retry count on 429/5xx
+    (default LLM_GOVERNOR_MAX_RETRIES).
+    """
+    key = (model, temperature, max_tokens, max_retries)
+    llm = _llms.get(key)
+    if llm is not None:
+        return llm
+    with _lock:
+        llm = _llms.get(key)
+        if llm is None:
+            # max_retries=1: a single SDK attempt, the governor does the retrying
+            kwargs = {"model": model, "temperature": temperature, "google_api_key": settings.GOOGLE_API_KEY,
+                      "max_retries": 1, "governor_retries": max_retries}
+            if max_tokens is not None:
+                kwargs["max_output_tokens"] = max_tokens
+            llm = _llms[key] = GovernedChatGoogleGenerativeAI(**kwargs)
+    return llm
+
+
+def get_embeddings(model: str = EMBEDDING_MODEL) -> GoogleGenerativeAIEmbeddings:
+    embeddings = _embeddings.get(model)
+    if embeddings is not None:
+        return embeddings
+    with _lock:
+        embeddings = _embeddings.get(model)
+        if embeddings is None:
+            embeddings = _embeddings[model] = GoogleGenerativeAIEmbeddings(
+                model=model, google_api_key=settings.GOOGLE_API_KEY
+            )
+    return embeddings
+
+
+def default_clients() -> List[ChatGoogleGenerativeAI]:
+    """The configurations the graph and endpoints use (see each call site)."""
+    return [
+        get_llm(FAST_MODEL, 0),                          # router, target location
+        get_llm(FAST_MODEL, 0.3),                        # chat
+        get_llm(settings.MODEL_VISION, 0.4, 1024),       # vision
+        get_llm(settings.MODEL_REASONING, 0.1),          # market scout extraction
+        get_llm(settings.MODEL_REASONING, 0.1, None, 2), # skeptic (veto)
+        get_llm(settings.MODEL_ANALYSIS, 0.1, None, 2),  # skeptic (reviews, alternatives)
+        get_llm(settings.MODEL_RESPONSE, 0.7, 256),      # response summary
+        get_llm(settings.MODEL_RESPONSE, 0.7),           # response (llm mode)
+    ]
+
+
+async def _ping(llm: ChatGoogleGenerativeAI):
+    try:
+        await asyncio.wait_for(llm.async_client.models.count_tokens(model=llm.model, contents="ping"), timeout=5)
+    except Exception as e:
+        logger.warning(f"LLM warm-up ping failed for {llm.model}: {e}")
+
+
+async def warm_up():
+    """Builds the shared clients and (optionally) opens their connections."""
+    if not settings.GOOGLE_API_KEY:
+        print("[LLM] GOOGLE_API_KEY not set, skipping client warm-up")
+        return
+    try:
+        clients = default_clients()
+        get_embeddings()
+    except Exception as e:
+        logger.error(f"LLM client warm-up failed: {e}")
+        return
+    if settings.LLM_WARMUP_PING:
+        # Each client has its own connection pool, so each one is pinged
+        await asyncio.gather(*(_ping(llm) for llm in clients))
+    print(f"[LLM] Warmed {len(_llms)} shared clients")
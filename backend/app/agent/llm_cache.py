@@ -0,0 +1,290 @@
+"""
+LLM response cache.
+
+The router, the chat node's preference extraction, the scout's candidate
+extraction and the Skeptic's batch alternatives assessment are asked the
+same prompts again and again (the same follow-up wording, the same product
+searched by several users). `acached_invoke(llm, prompt, call_site)` returns
+the stored reply for a prompt already answered instead of paying the round
+trip.
+
+Caching is opt-in per call site: only sites listed in LLM_CACHE_TTLS are
+cached, each with its own TTL. Two tiers:
+
+- exact: key = sha256(model, temperature, normalized prompt), where
+  normalizing collapses whitespace in every message. Checked in process
+  first, then in the `llm_cache` table (SQLite by default, shared by the
+  gunicorn workers like the checkpoint store).
+- semantic (sites in LLM_CACHE_SEMANTIC_SITES): on an exact miss, the
+  `semantic_text` the call site passes (the user's words, not the template
+  around them) is embedded and compared with stored prompts that share the
+  rest of the prompt verbatim (same model, temperature, system prompt and
+  template fields such as "Has Image"). A cosine similarity of at least
+  LLM_CACHE_SIMILARITY_THRESHOLD is a hit. Without `semantic_text` the
+  tier is skipped.
+  Only the router is on by default; for the extraction sites a one-word
+  difference ("red" vs "blue") changes the answer.
+
+Only the raw reply text is stored; call sites parse it (with `parse`, a
+reply that does not parse is returned as an error and not stored). The
+`llm.<call_site>` span (and its latency histogram) covers real LLM calls
+only, hits are counted in llm_cache_requests_total.
+"""
+from app.agent.checkpointer import create_store_engine
+from app.agent.llm import get_embeddings
+from app.agent.timing import span
+from app.core.config import settings
+from app.core import metrics
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+from langchain_core.messages import BaseMessage
+from langchain_core.output_parsers import StrOutputParser
+from sqlalchemy import (
+    Column, Float, Integer, LargeBinary, MetaData, String, Table, Text,
+    delete, select, and_,
+)
+
+logger = logging.getLogger(__name__)
+
+# Expired rows are deleted at most this often
+GC_INTERVAL_SECONDS = 600
+# Stored prompts compared per (call site, prompt prefix) in the semantic tier
+SEMANTIC_MAX_ENTRIES = 2000
+# An embedding slower than this is skipped (the LLM call goes ahead)
+EMBED_TIMEOUT_SECONDS = 2.0
+
+metadata_obj = MetaData()
+
+llm_cache_table = Table(
+    "llm_cache", metadata_obj,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("key", String(64), unique=True),
+    Column("call_site", String(64), index=True),
+    Column("model", String(128)),
+    Column("prefix_key", String(64), nullable=True),
+    Column("embedding", LargeBinary, nullable=True),
+    Column("response", Text),
+    Column("created_at", Float),
+    Column("expires_at", Float, index=True),
+)
+
+Prompt = Union[str, Sequence[BaseMessage]]
+
+_WHITESPACE = re.compile(r"\s+")
+_to_text = StrOutputParser()
+
+
+def _normalize(text: Any) -> str:
+    return _WHITESPACE.sub(" ", str(text)).strip()
+
+
+def _messages(prompt: Prompt) -> List[Tuple[str, str]]:
+    if isinstance(prompt, str):
+        return [("human", _normalize(prompt))]
+    return [(m.type, _normalize(m.content)) for m in prompt]
+
+
+def _template(messages: List[Tuple[str, str]], semantic_text: Optional[str]) -> Optional[List[Tuple[str, str]]]:
+    """The messages with `semantic_text` cut out of the last one, or None if it is not there."""
+    text = _normalize(semantic_text) if semantic_text else ""
+    if not text or not messages or text not in messages[-1][1]:
+        return None
+    role, last = messages[-1]
+    return messages[:-1] + [(role, last.replace(text, "\x00", 1))]
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, db_url: Optional[str] = None):
+        self.db_url = db_url or settings.LLM_CACHE_DB_URL
+        self._engine = None
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # (call_site, prefix_key) -> [(expires_at, unit vector, response)]
+        self._vectors: Dict[Tuple[str, str], List[Tuple[float, np.ndarray, str]]] = {}
+        self._vectors_high_water = 0
+        self._lock = threading.Lock()
+        self._last_gc = 0.0
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = create_store_engine(self.db_url)
+            metadata_obj.create_all(self._engine)
+        return self._engine
+
+    # --- Exact tier ---
+
+    def _remember(self, key: str, response: str, expires_at: float):
+        with self._lock:
+            self._memory[key] = (response, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > settings.LLM_CACHE_MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(llm_cache_table.c.response, llm_cache_table.c.expires_at)
+                .where(and_(llm_cache_table.c.key == key, llm_cache_table.c.expires_at > now))
+            ).first()
+        if row is None:
+            return None
+        self._remember(key, row.response, row.expires_at)
+        return row.response
+
+    def put(self, key: str, call_site: str, model: str, response: str, ttl: int,
+            prefix_key: Optional[str] = None, embedding: Optional[np.ndarray] = None):
+        now = time.time()
+        expires_at = now + ttl
+        self._remember(key, response, expires_at)
+        with self.engine.begin() as conn:
+            conn.execute(delete(llm_cache_table).where(llm_cache_table.c.key == key))
+            conn.execute(llm_cache_table.insert().values(
+                key=key, call_site=call_site, model=model, prefix_key=prefix_key,
+                embedding=embedding.astype(np.float32).tobytes() if embedding is not None else None,
+                response=response, created_at=now, expires_at=expires_at,
+            ))
+        if now - self._last_gc > GC_INTERVAL_SECONDS:
+            self._last_gc = now
+            with self.engine.begin() as conn:
+                conn.execute(delete(llm_cache_table).where(llm_cache_table.c.expires_at <= now))
+
+    # --- Semantic tier ---
+
+    def _refresh_vectors(self):
+        """Loads embedded entries written (by any worker) since the last refresh."""
+        now = time.time()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(llm_cache_table.c.id, llm_cache_table.c.call_site, llm_cache_table.c.prefix_key,
+                       llm_cache_table.c.embedding, llm_cache_table.c.response, llm_cache_table.c.expires_at)
+                .where(and_(llm_cache_table.c.id > self._vectors_high_water,
+                            llm_cache_table.c.embedding.isnot(None),
+                            llm_cache_table.c.expires_at > now))
+                .order_by(llm_cache_table.c.id)
+            ).fetchall()
+        with self._lock:
+            for row in rows:
+                self._vectors_high_water = max(self._vectors_high_water, row.id)
+                entries = self._vectors.setdefault((row.call_site, row.prefix_key), [])
+                entries.append((row.expires_at, np.frombuffer(row.embedding, dtype=np.float32), row.response))
+                if len(entries) > SEMANTIC_MAX_ENTRIES:
+                    del entries[:len(entries) - SEMANTIC_MAX_ENTRIES]
+
+    def nearest(self, call_site: str, prefix_key: str, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        """Best stored reply for a prompt with the same prefix, and its cosine similarity."""
+        self._refresh_vectors()
+        now = time.time()
+        with self._lock:
+            entries = [e for e in self._vectors.get((call_site, prefix_key), []) if e[0] > now]
+            self._vectors[(call_site, prefix_key)] = entries
+        if not entries:
+            return None, 0.0
+        matrix = np.stack([e[1] for e in entries])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return entries[best][2], float(scores[best])
+
+
+llm_cache = LLMResponseCache()
+
+
+def _ttl(call_site: str) -> int:
+    if not settings.LLM_CACHE_ENABLED:
+        return 0
+    return int(settings.LLM_CACHE_TTLS.get(call_site, 0))
+
+
+async def _embed(text: str) -> Optional[np.ndarray]:
+    try:
+        vector = await asyncio.wait_for(get_embeddings().aembed_query(text), timeout=EMBED_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.warning(f"LLM cache embedding failed: {e}")
+        return None
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+async def acached_invoke(llm, prompt: Prompt, call_site: str,
+                         parse: Optional[Callable[[str], Any]] = None,
+                         semantic_text: Optional[str] = None, **invoke_kwargs) -> Any:
+    """
+    Reply text of `llm` for `prompt` (a string or a list of messages, e.g.
+    ChatPromptTemplate.format_messages(...)), served from the cache when
+    `call_site` is opted in and the prompt was answered before.
+
+    With `parse`, returns parse(text) instead, and a reply that does not
+    parse is not stored. `invoke_kwargs` (e.g. JSON mode) go to the LLM call
+    and into the key. `semantic_text` is the part of the last message that
+    the semantic tier embeds; the rest of the prompt must match exactly.
+    """
+    model = getattr(llm, "model", "unknown")
+    finish = parse or (lambda text: text)
+
+    async def call() -> str:
+        with span(f"llm.{call_site}", kind="llm", model=model):
+            return _to_text.invoke(await llm.ainvoke(prompt, **invoke_kwargs))
+
+    ttl = _ttl(call_site)
+    if not ttl:
+        return finish(await call())
+
+    messages = _messages(prompt)
+    temperature = getattr(llm, "temperature", None)
+    options = json.dumps(invoke_kwargs, sort_keys=True, default=str) if invoke_kwargs else ""
+    key = _digest(model, temperature, options, *(f"{role}:{text}" for role, text in messages))
+
+    try:
+        with span("llm_cache.get", kind="cache", call_site=call_site):
+            cached = await asyncio.to_thread(llm_cache.get, key)
+    except Exception as e:
+        logger.error(f"LLM cache read failed: {e}")
+        cached = None
+    if cached is not None:
+        metrics.LLM_CACHE.labels(call_site=call_site, result="hit").inc()
+        print(f"   [LLMCache] ⚡ {call_site}: exact hit")
+        return finish(cached)
+
+    prefix_key = vector = None
+    template = _template(messages, semantic_text) if call_site in settings.LLM_CACHE_SEMANTIC_SITES else None
+    if template is not None:
+        prefix_key = _digest(model, temperature, options, *(f"{role}:{text}" for role, text in template))
+        vector = await _embed(_normalize(semantic_text))
+        if vector is not None:
+            try:
+                response, score = await asyncio.to_thread(llm_cache.nearest, call_site, prefix_key, vector)
+            except Exception as e:
+                logger.error(f"LLM cache similarity lookup failed: {e}")
+                response, score = None, 0.0
+            if response is not None and score >= settings.LLM_CACHE_SIMILARITY_THRESHOLD:
+                metrics.LLM_CACHE.labels(call_site=call_site, result="semantic_hit").inc()
+                print(f"   [LLMCache] ⚡ {call_site}: similar prompt (cos={score:.3f})")
+                return finish(response)
+
+    metrics.LLM_CACHE.labels(call_site=call_site, result="miss").inc()
+    response = await call()
+    result = finish(response)  # Raises before storing if the reply does not parse
+    try:
+        await asyncio.to_thread(llm_cache.put, key, call_site, model, response, ttl,
+                                prefix_key if vector is not None else None, vector)
+    except Exception as e:
+        logger.error(f"LLM cache write failed: {e}")
+    return result
@@ -0,0 +1,340 @@
+"""
+Per-model concurrency governor for Gemini calls.
+
+Under load Gemini answers 429 (RESOURCE_EXHAUSTED) or 503. Before this,
+each client retried on its own inside the google-genai SDK (6 attempts by
+default, 2 for the Skeptic). Every worker kept sending at full concurrency
+into a throttled model, and requests piled up behind slow retry chains.
+
+Every client from `get_llm` is now a `GovernedChatGoogleGenerativeAI`. Its
+`_agenerate`/`_generate`/`_astream` go through the model's `ModelGovernor`:
+
+- AIMD concurrency limit: calls wait for a slot (up to
+  LLM_GOVERNOR_QUEUE_TIMEOUT_SECONDS). Each success raises the limit by
+  about one per window of calls (additive increase), and a 429/5xx halves it
+  (multiplicative decrease, at most once per second so a burst of 429s
+  counts once). The limit stays between LLM_GOVERNOR_MIN_CONCURRENCY and
+  LLM_GOVERNOR_MAX_CONCURRENCY.
+- Retries: 429/5xx are retried up to LLM_GOVERNOR_MAX_RETRIES times with
+  exponential backoff and full jitter, honouring the server's retryDelay
+  when it sends one. SDK retries are turned off (max_retries=1) so the
+  retries no longer multiply.
+- Circuit breaker: after LLM_BREAKER_FAILURE_THRESHOLD consecutive failed
+  calls the model is "open" for LLM_BREAKER_COOLDOWN_SECONDS. Calls fail at
+  once with LLMUnavailableError, which the call sites already turn into their
+  fallbacks (_build_fallback_response, neutral sentiment, the template
+  summary). After the cooldown one probe call goes through, and its success
+  closes the breaker.
+
+Governors are per worker process. Limit, in-flight calls, breaker state,
+retries and rejections are exported as llm_governor_* metrics.
+"""
+from app.core.config import settings
+from app.core import metrics
+from typing import Any, AsyncIterator, Dict, Optional
+import asyncio
+import random
+import re
+import threading
+import time
+
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_BREAKER_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_RETRY_DELAY = re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s")
+
+
+class LLMUnavailableError(RuntimeError):
+    """The model's circuit breaker is open, or no concurrency slot freed up in time."""
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """HTTP status of a Gemini error (langchain wraps the SDK's APIError, which has .code)."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        code = getattr(error, "code", None) or getattr(error, "status_code", None)
+        if isinstance(code, int):
+            return code
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """'rate_limit', 'server_error', or None if the error is not worth retrying."""
+    code = _status_code(error)
+    text = str(error)
+    if code == 429 or "RESOURCE_EXHAUSTED" in text:
+        return "rate_limit"
+    if (code is not None and code >= 500) or "UNAVAILABLE" in text:
+        return "server_error"
+    return None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    match = _RETRY_DELAY.search(str(getattr(error, "__cause__", None) or error))
+    return float(match.group(1)) if match else None
+
+
+class ModelGovernor:
+    def __init__(self, model: str):
+        self.model = model
+        self.limit = float(settings.LLM_GOVERNOR_INITIAL_CONCURRENCY)
+        self.in_flight = 0
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._waiters: list = []  # (loop, future) of async callers waiting for a slot
+        self._publish()
+
+    # --- Metrics ---
+
+    def _publish(self):
+        metrics.LLM_CONCURRENCY_LIMIT.labels(model=self.model).set(int(self.limit))
+        metrics.LLM_GOVERNED_IN_FLIGHT.labels(model=self.model).set(self.in_flight)
+        metrics.LLM_BREAKER_STATE.labels(model=self.model).set(_BREAKER_STATE_VALUE[self.state])
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"model": self.model, "limit": int(self.limit), "in_flight": self.in_flight,
+                "state": self.state, "consecutive_failures": self.consecutive_failures}
+
+    # --- Circuit breaker ---
+
+    def _admit(self) -> bool:
+        """Breaker check before a call (lock held). Half-open lets a single probe through."""
+        if self.state == OPEN:
+            if time.time() - self.opened_at < settings.LLM_BREAKER_COOLDOWN_SECONDS:
+                return False
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def _reject(self, reason: str):
+        metrics.LLM_GOVERNOR_REJECTIONS.labels(model=self.model, reason=reason).inc()
+        raise LLMUnavailableError(f"{self.model} unavailable ({reason})")
+
+    # --- Slots ---
+
+    def _try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= max(1, int(self.limit)):
+                return False
+            self.in_flight += 1
+        self._publish()
+        return True
+
+    def release(self, probe: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if probe:
+                self._probe_in_flight = False
+            free = max(1, int(self.limit)) - self.in_flight
+            wake, self._waiters = self._waiters[:free], self._waiters[free:]
+        for loop, future in wake:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+        self._publish()
+
+    async def acquire(self):
+        deadline = time.monotonic() + settings.LLM_GOVERNOR_QUEUE_TIMEOUT_SECONDS
+        loop = asyncio.get_running_loop()
+        while not self._try_acquire():
+            future = loop.create_future()
+            with self._lock:
+                self._waiters.append((loop, future))
+            if self._try_acquire():  # A slot freed up between the check and the registration
+                future.cancel()
+                return
+            remaining = deadline - time.monotonic()
+            try:
+                await asyncio.wait_for(future, timeout=max(0.0, remaining))
+            except asyncio.TimeoutError:
+                self._reject("queue_timeout")
+            finally:
+                with self._lock:
+                    self._waiters = [w for w in self._waiters if w[1] is not future]
+
+    def acquire_sync(self):
+        deadline = time.monotonic() + settings.LLM_GOVERNOR_QUEUE_TIMEOUT_SECONDS
+        while not self._try_acquire():
+            if time.monotonic() > deadline:
+                self._reject("queue_timeout")
+            time.sleep(0.05)
+
+    # --- Outcomes ---
+
+    def check(self) -> bool:
+        """Fails fast while the breaker is open; True if this call is the half-open probe."""
+        with self._lock:
+            admitted = self._admit()
+            probe = self.state == HALF_OPEN
+        if not admitted:
+            self._reject("circuit_open")
+        return probe
+
+    def on_success(self):
+        with self._lock:
+            self.limit = min(settings.LLM_GOVERNOR_MAX_CONCURRENCY, self.limit + 1.0 / max(1.0, self.limit))
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                print(f"[LLMGovernor] {self.model}: circuit closed")
+            self.state = CLOSED
+            self._probe_in_flight = False
+        self._publish()
+
+    def on_throttle(self):
+        """429/5xx: halve the limit (once per second at most)."""
+        now = time.time()
+        with self._lock:
+            if now - self._last_decrease >= 1.0:
+                self._last_decrease = now
+                self.limit = max(float(settings.LLM_GOVERNOR_MIN_CONCURRENCY), self.limit / 2)
+        self._publish()
+
+    def on_failure(self):
+        """A call failed for good (retries exhausted): counts towards opening the breaker."""
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= settings.LLM_BREAKER_FAILURE_THRESHOLD:
+                if self.state != OPEN:
+                    print(f"[LLMGovernor] ⚠️ {self.model}: circuit open for {settings.LLM_BREAKER_COOLDOWN_SECONDS:g}s")
+                self.state = OPEN
+                self.opened_at = time.time()
+        self._publish()
+
+    def end_probe(self):
+        """The half-open probe is over whatever happened (success, error, cancellation)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        delay = min(settings.LLM_GOVERNOR_BACKOFF_MAX_SECONDS,
+                    settings.LLM_GOVERNOR_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        delay = random.uniform(0, delay)  # Full jitter: workers do not retry in lockstep
+        server_hint = _retry_after(error)
+        if server_hint is not None:
+            delay = max(delay, min(server_hint, settings.LLM_GOVERNOR_BACKOFF_MAX_SECONDS))
+        return delay
+
+
+_governors: Dict[str, ModelGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(model: str) -> ModelGovernor:
+    governor = _governors.get(model)
+    if governor is None:
+        with _governors_lock:
+            governor = _governors.get(model)
+            if governor is None:
+                governor = _governors[model] = ModelGovernor(model)
+    return governor
+
+
+def governor_stats() -> list:
+    return [g.snapshot() for g in list(_governors.values())]
+
+
+class GovernedChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+    """ChatGoogleGenerativeAI whose calls go through the model's ModelGovernor."""
+
+    # Governor-level retries on 429/5xx (None = LLM_GOVERNOR_MAX_RETRIES); SDK retries stay off
+    governor_retries: Optional[int] = None
+
+    def _retries(self) -> int:
+        return settings.LLM_GOVERNOR_MAX_RETRIES if self.governor_retries is None else self.governor_retries
+
+    def _handle_error(self, governor: ModelGovernor, error: BaseException, attempt: int,
+                      probe: bool, streamed: bool = False) -> float:
+        """Backoff before the next attempt, or re-raises `error` if the call is over."""
+        reason = classify_error(error)
+        if reason is None:  # Bad request, safety block...: not the service's health
+            raise error
+        governor.on_throttle()
+        if probe or streamed or attempt >= self._retries():
+            governor.on_failure()
+            raise error
+        metrics.LLM_GOVERNOR_RETRIES.labels(model=self.model, reason=reason).inc()
+        delay = governor.backoff(attempt, error)
+        print(f"   [LLMGovernor] {self.model}: {reason}, retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    async def _aenter(self, governor: ModelGovernor) -> bool:
+        probe = governor.check()
+        try:
+            await governor.acquire()
+        except BaseException:
+            if probe:
+                governor.end_probe()
+            raise
+        return probe
+
+    async def _agenerate(self, *args, **kwargs):
+        governor = get_governor(self.model)
+        attempt = 0
+        while True:
+            probe = await self._aenter(governor)
+            try:
+                result = await super()._agenerate(*args, **kwargs)
+            except Exception as e:
+                delay = self._handle_error(governor, e, attempt, probe)
+            else:
+                governor.on_success()
+                return result
+            finally:
+                governor.release(probe)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _generate(self, *args, **kwargs):
+        governor = get_governor(self.model)
+        attempt = 0
+        while True:
+            probe = governor.check()
+            try:
+                governor.acquire_sync()
+            except BaseException:
+                if probe:
+                    governor.end_probe()
+                raise
+            try:
+                result = super()._generate(*args, **kwargs)
+            except Exception as e:
+                delay = self._handle_error(governor, e, attempt, probe)
+            else:
+                governor.on_success()
+                return result
+            finally:
+                governor.release(probe)
+            time.sleep(delay)
+            attempt += 1
+
+    async def _astream(self, *args, **kwargs) -> AsyncIterator:
+        """Holds one slot for the whole stream; retries only if nothing was streamed yet."""
+        governor = get_governor(self.model)
+        attempt = 0
+        while True:
+            probe = await self._aenter(governor)
+            streamed = False
+            try:
+                async for chunk in super()._astream(*args, **kwargs):
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                delay = self._handle_error(governor, e, attempt, probe, streamed)
+            else:
+                governor.on_success()
+                return
+            finally:
+                governor.release(probe)
+            await asyncio.sleep(delay)
+            attempt += 1
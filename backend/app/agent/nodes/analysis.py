@@ -4,7 +4,10 @@ from app.db.session import SessionLocal
 from app.services.preference_service import get_learned_weights, merge_weights, save_choice, get_user_explicit_preferences
 from app.agent.scoring import calculate_weighted_score
 from app.agent.skeptic import SkepticAgent
+from app.services.blob_store import resolve_json
 from app.core.config import settings
+from app.agent import budget
+import asyncio
 import logging
 import time
 
@@ -50,6 +53,28 @@ def adjust_eco_score(raw_score: float, product_name: str) -> float:
     return max(0.05, min(0.95, adjusted))  # Never go to extremes 0 or 1
 
 
+def _cached_sentiments(state: AgentState) -> Dict[str, Any]:
+    """
+    Sentiment already computed for products scored earlier in this thread
+    (chat re-runs of the analysis node), keyed by product name.
+    """
+    from app.agent.skeptic import ReviewSentiment
+    cached = {}
+    for a in state.get('alternatives_analysis') or []:
+        details = a.get('score_details') or {}
+        if not a.get('name') or 'trust_score' not in details:
+            continue
+        cached[a['name']] = ReviewSentiment(
+            summary=a.get('sentiment_summary') or "Previously analyzed.",
+            trust_score=details.get('trust_score', 5.0),
+            sentiment_score=details.get('sentiment_score', 0.0),
+            eco_score=details.get('eco_score', 0.5),
+            eco_notes=a.get('eco_notes', ''),
+            verdict="Previously analyzed"
+        )
+    return cached
+
+
 def sanitize_eco_notes(eco_notes: str, product_name: str, has_research_data: bool) -> str:
     """
     Strip out hallucinated certifications from eco_notes.
@@ -89,42 +114,14 @@ def sanitize_eco_notes(eco_notes: str, product_name: str, has_research_data: boo
     return eco_notes
 
 
-def node_analysis_synthesis(state: AgentState) -> Dict[str, Any]:
-    """
-    Node 4: Analysis & Synthesis (The "Brain")
-    
-    Responsibilities:
-    1. Load user preferences (explicit + learned).
-    2. Run Skeptic analysis on alternatives (if not done in Node 3).
-    3. Calculate weighted scores for all products (Main + Alternatives).
-    4. Rank products and generate final analysis.
-    5. Save preference context (optional, happens on final choice usually, 
-       but we can prep the data here).
-    """
-    print("--- 4. Executing Analysis Node (The Brain) ---")
-    log_file = "/app/debug_output.txt"
-    def log_debug(message):
-        try:
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"{str(message)}\n")
-        except Exception:
-            pass
-
-    log_debug("--- 4. Executing Analysis Node (The Brain) ---")
-    
-    # Inputs
-    research = state.get('research_data', {})
-    risk = state.get('risk_report', {})
-    market_scout = state.get('market_scout_data', {})
-    market_scout = state.get('market_scout_data', {})
-    
-    # 1. Load User Preferences
+def _load_weights(state: AgentState):
+    """Returns (final_weights, explicit_prefs) merged from DB, learned weights and state."""
     db = SessionLocal()
     final_weights = {}
+    # Get explicit quals (from DB or State)
+    state_prefs = state.get('user_preferences', {})
+    explicit_prefs = state_prefs
     try:
-        # Get explicit quals (from DB or State)
-        state_prefs = state.get('user_preferences', {})
-        
         # Determine User ID - try state, then session lookup, then default
         state_id = state.get('user_id')
         user_id = 1
@@ -150,11 +147,44 @@ def node_analysis_synthesis(state: AgentState) -> Dict[str, Any]:
     except Exception as e:
         print(f"   [Analysis] Error loading preferences: {e}")
         # Fallback
-        state_prefs = state.get('user_preferences', {})
         final_weights = merge_weights(state_prefs, {})
         
     finally:
         db.close()
+    return final_weights, explicit_prefs
+
+
+async def node_analysis_synthesis(state: AgentState) -> Dict[str, Any]:
+    """
+    Node 4: Analysis & Synthesis (The "Brain")
+    
+    Responsibilities:
+    1. Load user preferences (explicit + learned).
+    2. Run Skeptic analysis on alternatives (if not done in Node 3).
+    3. Calculate weighted scores for all products (Main + Alternatives).
+    4. Rank products and generate final analysis.
+    5. Save preference context (optional, happens on final choice usually, 
+       but we can prep the data here).
+    """
+    print("--- 4. Executing Analysis Node (The Brain) ---")
+    log_file = "/app/debug_output.txt"
+    def log_debug(message):
+        try:
+            with open(log_file, "a", encoding="utf-8") as f:
+                f.write(f"{str(message)}\n")
+        except Exception:
+            pass
+
+    log_debug("--- 4. Executing Analysis Node (The Brain) ---")
+    
+    # Inputs
+    research = state.get('research_data', {})
+    risk = state.get('risk_report', {})
+    market_scout = state.get('market_scout_data', {})
+    market_scout = state.get('market_scout_data', {})
+    
+    # 1. Load User Preferences (blocking DB I/O, run off the event loop)
+    final_weights, explicit_prefs = await asyncio.to_thread(_load_weights, state)
     print(f"   [Analysis] Final Weights (DB Skipped): {final_weights}")
         
     # 2. Analyze Alternatives (if available)
@@ -178,7 +208,7 @@ def node_analysis_synthesis(state: AgentState) -> Dict[str, Any]:
              pass
     
     # Extract reviews for main product
-    main_reviews = research.get('reviews', [])
+    main_reviews = resolve_json(research.get('reviews'), default=[])
 
     # Try to find main product image/link from research prices or context
     main_image = None
@@ -245,24 +275,32 @@ def node_analysis_synthesis(state: AgentState) -> Dict[str, Any]:
     print(f"   [Analysis] Market Average Price: ${market_avg:.2f}")
 
     # --- BATCH OPTIMIZATION: Process all candidates in one (or two) LLM calls ---
-    from app.agent.skeptic import SkepticAgent
-    agent = SkepticAgent(model_name=settings.MODEL_ANALYSIS)
+    from app.agent.skeptic import get_skeptic_agent
+    agent = get_skeptic_agent(settings.MODEL_ANALYSIS)
     
     # 1. Split Main Product and Alternatives
     main_candidate = next((a for a in alternatives if a.get('is_main')), None)
     other_candidates = [a for a in alternatives if not a.get('is_main')]
     
-    # 2. Analyze Main Product (Detailed)
-    # We use Node 3 risk report if available to avoid a third LLM call
-    if main_candidate:
+    # Latency budget: without time for the LLM calls, reuse sentiment from earlier
+    # turns of this thread and neutral defaults for the rest
+    degradations = []
+    cached_sentiment = _cached_sentiments(state)
+    llm_affordable = budget.can_afford(state, "analysis", 4.0)
+    llm_timeout = budget.step_timeout(state, "analysis", 30)
+
+    def reuse_sentiment(candidates: List[dict]) -> List[Any]:
+        neutral = SkepticAgent._batch_fallback(candidates)
+        return [cached_sentiment.get(c.get('name'), neutral[i]) for i, c in enumerate(candidates)]
+
+    async def analyze_main() -> Dict[str, Any]:
         print(f"   [Analysis] Processing Main Product: {main_candidate['name']}")
-        main_reviews = main_candidate.get('reviews', [])[:5] # Limit to 5
         
         # Reuse Node 3 Risk Report if Trust Score is present
         if risk and 'trust_score' in risk:
              print(f"   [Analysis] ♻️ Reusing Risk Report from Node 3 for {main_candidate['name']}")
              # Map Risk Report to Sentiment Data
-             main_sentiment = {
+             return {
                  "summary": risk.get('summary', "Found through visual search."),
                  "trust_score": risk.get('trust_score', 7.0),
                  "sentiment_score": risk.get('sentiment_score', 0.5), # Default or extract
@@ -270,18 +308,44 @@ def node_analysis_synthesis(state: AgentState) -> Dict[str, Any]:
                  "eco_notes": risk.get('eco_notes', "Analysis based on product category."),
                  "verdict": risk.get('verdict', "Neutral assessment")
              }
-        else:
-             # Fallback: Individual analysis for main product
-             from app.agent.skeptic import Review
-             valid_reviews = []
-             for r in main_reviews:
-                 try:
-                     valid_reviews.append(Review(source=r.get("source", "Unknown"), text=r.get("snippet", "") or r.get("text", ""), rating=r.get("rating"), date=r.get("date")))
-                 except: pass
-             
-             sentiment_result = agent.analyze_reviews(main_candidate['name'], valid_reviews, eco_context)
-             main_sentiment = sentiment_result.model_dump()
-             
+        if not llm_affordable:
+            degradations.append(budget.degradation(state, "analysis", "main product review analysis"))
+            return reuse_sentiment([main_candidate])[0].model_dump()
+        # Node 3 runs in parallel, so its report is not in state yet: share its
+        # in-flight review analysis instead of issuing a second LLM call
+        from app.agent.review_memo import get_main_review_analysis
+        try:
+            sentiment_result = await asyncio.wait_for(get_main_review_analysis(state), timeout=llm_timeout)
+        except asyncio.TimeoutError:
+            degradations.append(budget.degradation(state, "analysis", "main product review analysis", "timed out"))
+            sentiment_result = reuse_sentiment([main_candidate])[0]
+        return sentiment_result.model_dump()
+
+    async def analyze_alternatives() -> List[Any]:
+        if not other_candidates:
+            return []
+        if not llm_affordable:
+            degradations.append(budget.degradation(state, "analysis", "alternatives review analysis"))
+            # No LLM call, but memoized assessments (local lookup) still beat neutral defaults
+            for name, sentiment in (await asyncio.to_thread(agent.memoized_alternatives, other_candidates)).items():
+                cached_sentiment.setdefault(name, sentiment)
+            return reuse_sentiment(other_candidates)
+        print(f"   [Analysis] 🚀 Batch Analyzing {len(other_candidates)} alternatives...")
+        try:
+            return await asyncio.wait_for(
+                agent.abatch_analyze_alternatives(other_candidates, eco_context), timeout=llm_timeout)
+        except asyncio.TimeoutError:
+            degradations.append(budget.degradation(state, "analysis", "alternatives review analysis", "timed out"))
+            return reuse_sentiment(other_candidates)
+
+    # 2. Main product and alternatives are independent LLM calls - run them concurrently
+    # We use Node 3 risk report if available to avoid a third LLM call
+    main_sentiment, batch_results = await asyncio.gather(
+        analyze_main() if main_candidate else asyncio.sleep(0, result=None),
+        analyze_alternatives(),
+    )
+
+    if main_candidate:
         # Create full candidate object for main product
         price = main_candidate.get('prices', [{}])[0].get('price', 0)
         try:
@@ -315,9 +379,6 @@ def node_analysis_synthesis(state: AgentState) -> Dict[str, Any]:
 
     # 3. Analyze Alternatives (BATCH)
     if other_candidates:
-        print(f"   [Analysis] 🚀 Batch Analyzing {len(other_candidates)} alternatives...")
-        batch_results = agent.batch_analyze_alternatives(other_candidates, eco_context)
-        
         for i, alt in enumerate(other_candidates):
             try:
                 # Use results from batch call (order matches)
@@ -456,5 +517,6 @@ def node_analysis_synthesis(state: AgentState) -> Dict[str, Any]:
     return {
         "analysis_object": analysis_object, 
         "alternatives_analysis": alternatives_scored,
-        "node_timings": existing_timings
+        "node_timings": existing_timings,
+        "degradations": degradations
     }
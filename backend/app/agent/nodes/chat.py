@@ -1,14 +1,17 @@
 from typing import Dict, Any, List
 from app.agent.state import AgentState
-from langchain_google_genai import ChatGoogleGenerativeAI
+from app.agent.timing import span
+from app.agent.context import analysis_context, budget_for, budget_json, record_prompt
+from app.agent.llm import get_llm, FAST_MODEL
+from app.agent.llm_governor import LLMUnavailableError
+from app.agent.streaming import astream_text
+from app.agent.structured import ainvoke_json
+from app.schemas.llm_outputs import BudgetPreferences, SearchPreferences
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 from app.services.preference_service import get_user_explicit_preferences, merge_weights
 # from app.db.session import SessionLocal # Avoid circular import if possible, use dependency injection pattern or import inside
 from sqlalchemy.orm import Session
 from app.db.session import SessionLocal
-import json
-import os
 import logging
 
 logger = logging.getLogger(__name__)
@@ -35,12 +38,8 @@ async def node_chat(state: AgentState) -> Dict[str, Any]:
     new_prefs = {}
     search_criteria = {}
     
-    # 1. Initialize LLM
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        temperature=0.3,
-        google_api_key=os.getenv("GOOGLE_API_KEY")
-    )
+    # 1. Shared LLM client (agent/llm.py)
+    llm = get_llm(FAST_MODEL, 0.3)
 
     # 2. Handle Re-Analysis (Budget/Price preferences → Node 4)
     if router_decision == "re_analysis":
@@ -65,16 +64,9 @@ Return ONLY valid JSON, no markdown."""),
             ("human", "{user_query}")
         ])
         
-        chain = extraction_prompt | llm | StrOutputParser()
         try:
-            result = await chain.ainvoke({"user_query": user_query})
-            cleaned_result = result.strip()
-            if cleaned_result.startswith("```"):
-                lines = cleaned_result.split("\n")
-                if len(lines) >= 3:
-                    cleaned_result = "\n".join(lines[1:-1])
-            
-            new_prefs = json.loads(cleaned_result)
+            new_prefs = await ainvoke_json(llm, extraction_prompt.format_messages(user_query=user_query),
+                                           "chat.extract_preferences", BudgetPreferences, cache=True)
             logger.info(f"CHAT: Extracted budget prefs: {new_prefs}")
             loop_step = "analysis_node"
             
@@ -112,16 +104,9 @@ Return ONLY valid JSON, no markdown."""),
             ("human", "{user_query}")
         ])
         
-        chain = extraction_prompt | llm | StrOutputParser()
         try:
-            result = await chain.ainvoke({"user_query": user_query})
-            cleaned_result = result.strip()
-            if cleaned_result.startswith("```"):
-                lines = cleaned_result.split("\n")
-                if len(lines) >= 3:
-                    cleaned_result = "\n".join(lines[1:-1])
-            
-            search_criteria = json.loads(cleaned_result)
+            search_criteria = await ainvoke_json(llm, extraction_prompt.format_messages(user_query=user_query),
+                                                 "chat.extract_preferences", SearchPreferences, cache=True)
             logger.info(f"CHAT: Extracted search prefs: {search_criteria}")
             print(f"   [Chat] 🔍 Detected preference: {search_criteria}")
             
@@ -212,7 +197,8 @@ If the user is just chatting, be friendly.
 Keep responses concise and helpful."""
     
     if analysis:
-        system_text += f"\n\nCurrent Analysis Context: {str(analysis)[:500]}"  # Limit context size
+        # Compact, deduplicated summary of the analysis (top alternatives only) within the token budget
+        system_text += f"\n\nCurrent Analysis Context: {budget_json(analysis_context(analysis, max_alternatives=3), budget_for('chat.reply'))}"
     
     def map_message(role, content):
         if role == "user":
@@ -227,9 +213,17 @@ Keep responses concise and helpful."""
     for msg in chat_history[-5:]:
         messages.append(map_message(msg.get("role"), msg.get("content")))
     messages.append(HumanMessage(content=user_query))
+    record_prompt("chat.reply", messages)
     
-    chain = llm | StrOutputParser()
-    response = await chain.ainvoke(messages)
+    try:
+        with span("llm.chat.reply", kind="llm", model="gemini-2.0-flash"):
+            # Streamed: SSE clients get the reply token by token (`token` events)
+            response = await astream_text(llm, messages, "chat_response")
+    except LLMUnavailableError as e:
+        # Model overloaded (circuit open): preferences are still applied, only the wording is canned
+        print(f"   [Chat] ⚠️ Reply skipped: {e}")
+        response = ("Got it, I've updated your preferences." if loop_step != "end"
+                    else "I'm a bit overloaded right now, please try again in a moment.")
     
     # 6. Merge preferences into state for downstream nodes
     state_prefs = state.get("user_preferences", {})
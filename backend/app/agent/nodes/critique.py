@@ -1,12 +1,11 @@
 from typing import Dict, Any
 from app.agent.state import AgentState
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
-from app.core.config import settings
-import json
+from app.agent import budget
+from app.core import metrics
+import asyncio
 
-def node_skeptic_veto(state: AgentState) -> Dict[str, Any]:
+async def node_skeptic_veto(state: AgentState) -> Dict[str, Any]:
     """
     Node 2.5: The Veto Check (Fail Fast)
     Before running expensive analysis, check if we should even proceed.
@@ -14,24 +13,34 @@ def node_skeptic_veto(state: AgentState) -> Dict[str, Any]:
     print("--- 2.5 Executing Veto Check (The Gatekeeper) ---")
     
     # --- VETO CHECK (State-Aware) ---
-    from app.agent.skeptic import check_veto_status
+    from app.agent.skeptic import acheck_veto_status
     
     # We need candidates from Market Scout to perform Veto
     market_scout_data = state.get('market_scout_data', {})
     candidates = market_scout_data.get('candidates', [])
     user_prefs = state.get('user_preferences', {})
     loop_count = state.get('skeptic_loop_count', 0)
+
+    # A veto re-runs the scout; if the budget cannot pay for that pass, don't ask
+    if not budget.can_afford(state, "veto", 10.0):
+        return {
+            "skeptic_decision": "proceed",
+            "market_warning": None,
+            "degradations": [budget.degradation(state, "veto", "veto_check")]
+        }
     
-    veto_result = check_veto_status(candidates, user_prefs, loop_count)
+    veto_result = await acheck_veto_status(candidates, user_prefs, loop_count)
     print(f"   [Veto] Decision: {veto_result.get('decision')} (Reason: {veto_result.get('reason')})")
     
     if veto_result.get('decision') == 'veto':
          print(f"   [Veto] 🛑 VETO TRIGGERED. Loop: {loop_count}. Mutation: {veto_result.get('better_search_query')}")
+         metrics.record_veto_loop()
          # Return Veto Signal to State
          return {
              "skeptic_decision": "veto", 
              "skeptic_feedback_query": veto_result.get('better_search_query'),
              "skeptic_loop_count": loop_count + 1,
+             "skeptic_rejected_candidates": veto_result.get('rejected_candidates') or [],
              "market_warning": None 
          }
     else:
@@ -45,9 +54,29 @@ def node_skeptic_veto(state: AgentState) -> Dict[str, Any]:
              "market_warning": market_warning
          }
 
-def node_skeptic_critique(state: AgentState) -> Dict[str, Any]:
+def _risk_report_from_sentiment(sentiment) -> Dict[str, Any]:
+    """Maps the shared main-product ReviewSentiment to the risk_report structure."""
+    hidden_flaws = list(dict.fromkeys((sentiment.red_flags or []) + (sentiment.cons or [])))
+    return {
+        "trust_score": sentiment.trust_score,
+        "fake_review_likelihood": sentiment.fake_review_likelihood,
+        "price_integrity": sentiment.price_integrity,
+        "hidden_flaws": hidden_flaws,
+        # Same keys the analysis node reads when it reuses the risk report
+        "summary": sentiment.summary,
+        "sentiment_score": sentiment.sentiment_score,
+        "eco_score": sentiment.eco_score,
+        "eco_notes": sentiment.eco_notes,
+        "verdict": sentiment.verdict
+    }
+
+async def node_skeptic_critique(state: AgentState) -> Dict[str, Any]:
     """
     Node 3: The Skeptic (Critique & Verification)
+
+    The main product's review analysis is shared with the analysis node
+    (review_memo.py): whichever node asks first starts the LLM call, the
+    other awaits the same result.
     """
     print("--- 3. Executing Critique Node (The Skeptic) ---")
     log_file = "/app/debug_output.txt"
@@ -63,75 +92,34 @@ def node_skeptic_critique(state: AgentState) -> Dict[str, Any]:
     import time
     start_time = time.time()
     
-    research_results = state.get('research_data', {})
     market_warning = state.get('market_warning') # Get warning from Veto node
-    
-    # --- Check Cache ---
-    import hashlib
-    from app.services.snowflake_cache import snowflake_cache_service
-    
-    # Generate stable key from research data
-    data_str = json.dumps(research_results, sort_keys=True)
-    items_hash = hashlib.md5(data_str.encode()).hexdigest()
-    cache_key = f"skeptic:analysis:{items_hash}"
-    
-    cache_start = time.time()
-    cached_report = snowflake_cache_service.get(cache_key)
-    cache_time = time.time() - cache_start
-    
-    if cached_report:
-        log_debug(f"Critique Cache Hit! ({cache_key})")
-        print(f"--- Critique Node: Cache Hit in {cache_time:.2f}s ---")
-        return {"risk_report": cached_report}
-    # -------------------
 
-    # Initialize Skeptic Agent
+    # Latency budget: without time for the LLM, fall back to a neutral report
+    degradations = []
+    neutral_report = {
+        "trust_score": 7.0,
+        "fake_review_likelihood": "Unknown",
+        "hidden_flaws": []
+    }
+    if not budget.can_afford(state, "critique", 3.0):
+        return {
+            "risk_report": neutral_report,
+            "skeptic_decision": "proceed",
+            "market_warning": market_warning,
+            "degradations": [budget.degradation(state, "critique", "risk_analysis")]
+        }
+
+    from app.agent.review_memo import get_main_review_analysis
 
-    # Initialize Skeptic Agent
-    llm = ChatGoogleGenerativeAI(model=settings.MODEL_REASONING, google_api_key=settings.GOOGLE_API_KEY)
-    
-    prompt = f"""
-    You are a fair and balanced shopping analyst. Your job is to provide an honest assessment that helps users make informed decisions.
-    
-    Analyze this research data and look for BOTH positives and legitimate concerns:
-    {json.dumps(research_results, indent=2)}
-    
-    GUIDELINES:
-    - Most products are legitimate. Start with baseline trust score of 7.
-    - Only flag genuine red flags with clear evidence.
-    - A mix of positive and negative reviews is NORMAL and healthy.
-    - Detailed, specific reviews (positive OR negative) are more trustworthy.
-    - Price variations between retailers are normal market behavior.
-    
-    Return a JSON object:
-    {{
-        "trust_score": 7.0 (float 0-10, start at 7, adjust based on evidence. 8-10=excellent, 6-7=normal, below 5=real concerns),
-        "fake_review_likelihood": "Low/Medium/High + brief explanation (only High if clear evidence)",
-        "price_integrity": "Fair assessment of pricing - is it competitive for the category?",
-        "hidden_flaws": ["Only list REAL concerns backed by review data, not speculation"]
-    }}
-    """
-    
     try:
-        llm_start = time.time()
-        response = llm.invoke(prompt)
-        llm_time = time.time() - llm_start
-        print(f"--- Critique Node: LLM Analysis took {llm_time:.2f}s ---")
-        
-        content = response.content.replace('```json', '').replace('```', '').strip()
-        risk_report = json.loads(content)
+        sentiment = await asyncio.wait_for(get_main_review_analysis(state), timeout=budget.step_timeout(state, "critique", 30))
+        if sentiment.verdict == "Error":
+            raise RuntimeError(sentiment.red_flags[0] if sentiment.red_flags else "review analysis failed")
+        risk_report = _risk_report_from_sentiment(sentiment)
         log_debug(f"Critique Output: {risk_report}")
-        
-        # --- Store in Cache ---
-        snowflake_cache_service.set(
-            cache_key=cache_key,
-            cache_type="skeptic_analysis",
-            params={"data_hash": items_hash}, # Don't store full input if huge
-            result=risk_report,
-            ttl_minutes=30 
-        )
-        # ----------------------
-        
+    except asyncio.TimeoutError:
+        degradations.append(budget.degradation(state, "critique", "risk_analysis", "timed out"))
+        risk_report = neutral_report
     except Exception as e:
         print(f"Skeptic Error: {e}")
         log_debug(f"Skeptic Error: {e}")
@@ -153,5 +141,6 @@ def node_skeptic_critique(state: AgentState) -> Dict[str, Any]:
         "risk_report": risk_report, 
         "node_timings": existing_timings,
         "skeptic_decision": "proceed",
-        "market_warning": market_warning if 'market_warning' in locals() else None
+        "market_warning": market_warning,
+        "degradations": degradations
     }
@@ -1,11 +1,380 @@
 from typing import Dict, Any, List
+import asyncio
 from app.agent.state import AgentState
-from app.sources.tavily_client import find_review_snippets
+from app.sources.tavily_client import find_review_snippets, asearch_market_context
+from app.sources.serpapi_client import aget_shopping_offers
 from app.schemas.types import ProductQuery
 from app.db.session import SessionLocal
 from app.services.preference_service import get_user_explicit_preferences
+from app.services.blob_store import offload_json, resolve_json
+from app.agent import budget
+from app.agent.context import budget_for, budget_lines, record_prompt
+from app.agent.llm import get_llm, get_embeddings
+from app.agent.structured import ainvoke_json
+from app.schemas.llm_outputs import ScoutCandidate
+from app.core import metrics
+from app.core.config import settings
 
-def node_market_scout(state: AgentState) -> Dict[str, Any]:
+def _load_db_prefs(user_id: int) -> Dict[str, Any]:
+    with SessionLocal() as db:
+        return get_user_explicit_preferences(db, user_id)
+
+async def _search_alternatives(state: AgentState, queries: List[str]):
+    """Runs the scout queries concurrently. Returns (all results, results deduplicated by URL)."""
+    import time
+    scout_results = []
+    # Run all queries concurrently on the event loop
+    search_start = time.time()
+    search_outcomes = await asyncio.gather(
+        *[asyncio.wait_for(asearch_market_context(q), timeout=budget.step_timeout(state, "market_scout", 10))
+          for q in queries],
+        return_exceptions=True
+    )
+    for results in search_outcomes:
+        if isinstance(results, list):
+            scout_results.extend(results)
+    search_time = time.time() - search_start
+    print(f"   ⏱️  [Scout] Tavily search took {search_time:.2f}s")
+                
+    # Deduplicate results based on URL
+    seen_urls = set()
+    unique_results = []
+    for r in scout_results:
+        if r.get('url') and r.get('url') not in seen_urls:
+            seen_urls.add(r.get('url'))
+            unique_results.append(r)
+    return scout_results, unique_results
+
+
+async def _extract_candidates(product_name: str, strategy: str, search_criteria: Dict[str, Any],
+                              unique_results: List[dict]) -> List[dict]:
+    """Asks the LLM for candidate products in the search results (filtered by preferred brands)."""
+    import time
+
+    # Unique results in rank order, each shortened, until the node's token budget is spent
+    context_text = budget_lines((f"- {r.get('title')}: {r.get('content')}" for r in unique_results[:25]),
+                                budget_for("scout.extract"), max_line_chars=500)
+    
+    llm = get_llm(settings.MODEL_REASONING, 0.1)
+    
+    # Build brand preference instruction for LLM
+    brand_instruction = ""
+    prefer_brands = search_criteria.get('prefer_brands', []) if search_criteria else []
+    if prefer_brands:
+        brand_instruction = f"\n    IMPORTANT: User STRONGLY prefers these brands: {', '.join(prefer_brands)}. ONLY include products from these brands. Do NOT include products from other brands."
+    
+    prompt = f"""You are a Market Scout. 
+    Product: {product_name}
+    Goal: Find 10 best {strategy} products.{brand_instruction}
+    
+    Search Context:
+    {context_text}
+    
+    Return a Strict JSON List of objects with keys: "name", "category", "reason".
+    "name" MUST be the specific model name (e.g. "Sony WH-1000XM5", "BenQ TK700"), NOT just the brand.
+    "category" should be the product type (e.g. "Headphones", "Projector").
+    Example: [{{"name": "Competitor X Model Y", "category": "Smart Watch", "reason": "Better battery life"}}]
+    """
+    
+    record_prompt("scout.extract", prompt)
+    llm_extract_start = time.time()
+    candidates = await ainvoke_json(llm, prompt, "scout.extract", List[ScoutCandidate], strict=True, cache=True)
+    llm_extract_time = time.time() - llm_extract_start
+    print(f"   ⏱️  [Scout] LLM extraction took {llm_extract_time:.2f}s")
+
+    # Post-LLM filtering: Remove candidates that don't match preferred brands
+    if prefer_brands and candidates:
+        filtered_candidates = []
+        for cand in candidates:
+            cand_name = cand.get('name', '').lower()
+            if any(brand.lower() in cand_name for brand in prefer_brands):
+                filtered_candidates.append(cand)
+            else:
+                print(f"       -> Filtered out {cand.get('name')} (not preferred brand)")
+        candidates = filtered_candidates
+        print(f"   [Scout] After brand filtering: {len(candidates)} candidates remain")
+    return candidates
+
+
+async def _enrich_candidate(cand: Dict[str, Any]):
+    """Adds prices, image, purchase link and price text to one candidate (in place)."""
+    name = cand.get('name')
+    category = cand.get('category', '')
+    if not name:
+        return
+
+    # --- ENRICHMENT LOGIC ---
+    # 1. Try Google Shopping (SerpAPI) first for best prices/images
+    try:
+        # Construct a more specific query with category
+        search_query = f"{name} {category}".strip()
+        temp_query = ProductQuery(canonical_name=search_query)
+        temp_trace = []
+
+        # Get prices
+        price_offers = await aget_shopping_offers(temp_query, temp_trace)
+
+        # Filter out accessories/parts based on title
+        valid_offers = []
+        if price_offers:
+            bad_keywords = ["lamp", "bulb", "remote", "mount", "bracket", "case", "bag", "filter", "adapter", "cable", "part", "replacement", "stand", "ceiling", "screen"]
+
+            for p in price_offers:
+                title_lower = (p.title or "").lower()
+                if not any(kw in title_lower for kw in bad_keywords):
+                    valid_offers.append(p)
+                else:
+                    print(f"       -> Skipped accessory: {p.title}")
+
+        # Fallback to all offers if filtering is too aggressive
+        if not valid_offers and price_offers:
+            valid_offers = price_offers
+            print(f"       -> Filtering removed all offers, reverting to original list.")
+    except Exception as e:
+        print(f"       -> Enrichment API failed: {e}")
+        price_offers = []
+        valid_offers = []
+
+    try:
+        cand['prices'] = [
+            {
+                "vendor": p.vendor, 
+                "price": p.price_cents / 100, 
+                "price_cents": p.price_cents,
+                "currency": p.currency, 
+                "url": p.url,
+                "thumbnail": p.thumbnail
+            }
+            for p in valid_offers
+        ]
+
+        # --- PRICE LOGGING (Summary Only) ---
+        try:
+            with open("/app/logs/price_debug.log", "a", encoding="utf-8") as f:
+                best_p = price_offers[0].price_cents / 100 if price_offers else 0
+                f.write(f"[Alt] {name} | {len(price_offers)} offers | Best: ${best_p:.2f} CAD\n")
+        except Exception:
+            pass
+        # ---------------------
+
+        if valid_offers:
+            # Capture Image and Link from best offer
+            best_offer = valid_offers[0] 
+            cand['image_url'] = getattr(best_offer, 'thumbnail', None)
+            cand['purchase_link'] = best_offer.url
+
+            # Use Best Available Price (First Offer) to match Main Product logic
+            best_offer = valid_offers[0]
+            cand['estimated_price'] = f"${best_offer.price_cents / 100:.2f} {best_offer.currency or 'CAD'}"
+            cand['price_text'] = f"${best_offer.price_cents / 100:.2f}"
+            print(f"       -> {name}: {len(valid_offers)} valid prices found. Best: {cand['price_text']}")
+        else:
+            # --- FALLBACK: TARGETED TAVILY SEARCH ---
+            # If Google Shopping fails (Quota/Error), use Tavily to find price/image
+            print(f"       -> {name}: Google Shopping failed. Attempting Tavily Fallback Search...")
+            metrics.record_fallback("serpapi_to_tavily_price", reason="no_offers")
+
+            try:
+                fallback_results = await asearch_market_context(f"{name} price image")
+
+                # 1. Extract Price from Fallback Results
+                extracted_price = None
+                import re
+                for r in fallback_results:
+                    # Look for price text pattern
+                    prices = re.findall(r'\$[\d,]+(?:\.\d{2})?', r.get('content', ''))
+                    if prices:
+                        extracted_price = prices[0]
+                        if 2 <= len(extracted_price) <= 10:
+                            break
+                        extracted_price = None
+
+                if extracted_price:
+                    cand['estimated_price'] = f"{extracted_price} (Est.)"
+                    cand['price_text'] = extracted_price
+                    # Link to the result where we found price
+                    cand['purchase_link'] = r.get('url')
+                    print(f"       -> {name}: Recovered price: {extracted_price}")
+                else:
+                    cand['estimated_price'] = "Check Price"
+                    cand['price_text'] = "Check Price"
+                    # Fallback link
+                    import urllib.parse
+                    encoded_name = urllib.parse.quote(name)
+                    cand['purchase_link'] = f"https://www.google.com/search?q={encoded_name}"
+
+                # 2. Extract Image from Fallback Results
+                # Use the 'images' field if Tavily returned it, else placeholder
+                # We need to check if ANY result has an image or if global images exist
+                found_image = None
+                for r in fallback_results:
+                     # Sometimes Tavily results have inline images? (Rare)
+                     # Actually Tavily returns a global 'images' list usually.
+                     # Let's check the 'images' key in the RESULTDICT if we modified search_market_context
+                     pass
+
+                # Our search_market_context appends a special dict for images
+                images_entry = next((r for r in fallback_results if r.get('title') == "Related Images"), None)
+                if images_entry and images_entry.get('images'):
+                     found_image = images_entry['images'][0]
+
+                cand['image_url'] = found_image or "https://via.placeholder.com/150?text=No+Image"
+
+            except Exception as e:
+                print(f"       -> Tavily Fallback failed: {e}")
+                cand['estimated_price'] = "Check Price"
+                cand['price_text'] = "Check Price"
+                cand['image_url'] = "https://via.placeholder.com/150?text=Error"
+
+        # Skip reviews for alternatives - the LLM already captured why each is recommended
+        # This saves ~3-4s per candidate by removing the Tavily API call
+        cand['reviews'] = []
+
+    except Exception as inner_e:
+        print(f"       -> Error enriching {name}: {inner_e}")
+
+
+async def _enrich_candidates(state: AgentState, candidates: List[dict], degradations: List[dict]) -> List[dict]:
+    """
+    Enriches candidates concurrently within the request budget. Returns the
+    candidates that were processed (the list is cut when the budget is tight).
+    """
+    import time
+    # Run enrichment concurrently, at most 5 in flight to avoid API rate limits
+    # Latency Optimization: Limit to top 10 candidates total, fewer when the
+    # request budget is tight (unenriched candidates are dropped, not shown half-empty)
+    enrichment_start = time.time()
+    enrich_count = 10
+    if not budget.can_afford(state, "market_scout", 15.0):
+        enrich_count = 5 if budget.can_afford(state, "market_scout", 8.0) else 3
+    if len(candidates) > enrich_count:
+        degradations.append(budget.degradation(
+            state, "market_scout", f"enrichment of {min(len(candidates), 10) - enrich_count} candidates"))
+        candidates = candidates[:enrich_count]
+    candidates_to_process = candidates[:10]
+    enrich_limit = asyncio.Semaphore(5)
+    enrich_timeout = budget.step_timeout(state, "market_scout", 15)
+
+    async def enrich_bounded(cand):
+        async with enrich_limit:
+            await asyncio.wait_for(_enrich_candidate(cand), timeout=enrich_timeout)
+
+    outcomes = await asyncio.gather(
+        *[enrich_bounded(cand) for cand in candidates_to_process],
+        return_exceptions=True
+    )
+    for exc in outcomes:
+        if isinstance(exc, BaseException):
+            print(f"   [Scout] Candidate enrichment failed: {exc!r}")
+    enrichment_time = time.time() - enrichment_start
+    print(f"   ⏱️  [Scout] Enrichment (prices/reviews) took {enrichment_time:.2f}s")
+    return candidates_to_process
+
+
+def _ensure_display_fields(candidates: List[dict]):
+    """Ensures all candidates have the required keys for frontend display."""
+    for cand in candidates:
+        if not cand.get('image_url'):
+            cand['image_url'] = "https://placehold.co/400x300?text=No+Image"
+        if not cand.get('purchase_link'):
+             # Create Google Shopping fallback
+            import urllib.parse
+            encoded_name = urllib.parse.quote(cand.get('name', 'Product'))
+            cand['purchase_link'] = f"https://www.google.com/search?tbm=shop&q={encoded_name}"
+        if not cand.get('price_text'):
+            cand['price_text'] = "Check Price"
+
+
+def _enqueue_catalog_ingest(candidates: List[dict]):
+    """Catalog Ingestion (async, fire-and-forget)."""
+    # Newly seen, enriched candidates are embedded + upserted into the products
+    # table in the background so the vector tier can answer next time.
+    try:
+        from app.services.catalog_ingest import catalog_ingest_service
+        queued = catalog_ingest_service.enqueue_candidates(candidates[:10])
+        if queued:
+            print(f"   [Scout] Queued {queued} candidates for catalog ingestion")
+    except Exception as e:
+        print(f"   [Scout] Catalog ingestion skipped: {e}")
+
+
+async def _rescout_after_veto(state: AgentState, previous: Dict[str, Any], feedback_query: str) -> Dict[str, Any]:
+    """
+    Veto loop pass (incremental).
+
+    Searches only the skeptic's mutated query, keeps the candidates the
+    skeptic did not reject and enriches only names that were not already
+    enriched in this request. A veto that names no rejected candidates
+    rejects the whole previous set (only the new search results are kept). Preferences, strategy and the cleaned product
+    name are reused from the first pass instead of being reloaded.
+    """
+    import time
+    start_time = time.time()
+    print(f"   [Scout] 🔄 Incremental re-scout with Veto Feedback: '{feedback_query}'")
+
+    degradations = []
+    product_name = previous.get('product_name') or (state.get('product_query') or {}).get('canonical_name', '')
+    strategy = previous.get('strategy') or "best alternative"
+    search_criteria = previous.get('search_criteria') or {}
+
+    rejected = {n.lower() for n in (state.get('skeptic_rejected_candidates') or [])}
+    previous_candidates = previous.get('candidates') or []
+    if rejected:
+        survivors = [c for c in previous_candidates if (c.get('name') or '').lower() not in rejected]
+        print(f"   [Scout] Keeping {len(survivors)}/{len(previous_candidates)} candidates, rejected: {sorted(rejected)}")
+    else:
+        # The veto did not say which ones failed: none of the vetoed set is trusted
+        survivors = []
+        print(f"   [Scout] Veto named no rejected candidates, dropping all {len(previous_candidates)}")
+    known_names = {(c.get('name') or '').lower() for c in previous_candidates}
+
+    scout_results, unique_results = await _search_alternatives(state, [feedback_query])
+
+    new_candidates = []
+    try:
+        for cand in await _extract_candidates(product_name, strategy, search_criteria, unique_results):
+            name = (cand.get('name') or '').lower()
+            if name and name not in known_names:
+                known_names.add(name)
+                new_candidates.append(cand)
+        print(f"   [Scout] {len(new_candidates)} new candidates to enrich")
+        if new_candidates:
+            new_candidates = await _enrich_candidates(state, new_candidates, degradations)
+    except Exception as e:
+        print(f"   [Scout] Incremental extraction failed, keeping previous candidates: {e}")
+
+    # New finds first: the skeptic judged the previous set too weak
+    candidates = (new_candidates + survivors)[:10]
+    _ensure_display_fields(candidates)
+    _enqueue_catalog_ingest(new_candidates)
+
+    # Keep the first pass's search context alongside the new results
+    seen_urls = set()
+    raw_results = []
+    for r in (resolve_json(previous.get('raw_search_results'), default=[]) or []) + unique_results:
+        if r.get('url') not in seen_urls:
+            seen_urls.add(r.get('url'))
+            raw_results.append(r)
+
+    total_time = time.time() - start_time
+    print(f"--- Market Scout Node (veto pass): Total time {total_time:.2f}s ---")
+
+    # Both scout passes are on the critical path
+    existing_timings = state.get('node_timings', {}) or {}
+    existing_timings['market_scout'] = existing_timings.get('market_scout', 0) + total_time
+
+    return {
+        "market_scout_data": {
+            **previous,
+            "raw_search_results": offload_json(raw_results),
+            "candidates": candidates
+        },
+        "node_timings": existing_timings,
+        "degradations": degradations
+    }
+
+
+async def node_market_scout(state: AgentState) -> Dict[str, Any]:
     """
     Node 2b: Market Scout (The "Explorer")
     
@@ -29,8 +398,12 @@ def node_market_scout(state: AgentState) -> Dict[str, Any]:
     
     product_query_data = state.get('product_query', {})
     product_name = product_query_data.get('canonical_name') or product_query_data.get('product_name', '')
-    product_query_data = state.get('product_query', {})
-    product_name = product_query_data.get('canonical_name') or product_query_data.get('product_name', '')
+
+    # Veto loop: only the mutated query is searched, surviving candidates are kept
+    previous = state.get('market_scout_data') or {}
+    feedback_query = state.get('skeptic_feedback_query')
+    if state.get('skeptic_decision') == "veto" and feedback_query and previous.get('candidates'):
+        return await _rescout_after_veto(state, previous, feedback_query)
     
     # Load Preferences (Merge DB + State)
     state_prefs = state.get('user_preferences', {})
@@ -38,10 +411,9 @@ def node_market_scout(state: AgentState) -> Dict[str, Any]:
         state_id = state.get('user_id')
         user_id = int(state_id) if state_id else 1
         
-        with SessionLocal() as db:
-            db_prefs = get_user_explicit_preferences(db, user_id)
-            user_prefs = {**db_prefs, **state_prefs} # State overrides DB
-            print(f"   [Scout] 💾 Accessing Database... Retrieved User Prefs: {user_prefs}")
+        db_prefs = await asyncio.to_thread(_load_db_prefs, user_id)
+        user_prefs = {**db_prefs, **state_prefs} # State overrides DB
+        print(f"   [Scout] 💾 Accessing Database... Retrieved User Prefs: {user_prefs}")
     except Exception as e:
         print(f"   [Scout] Warning: Failed to load DB prefs ({e}), using state only.")
         user_prefs = state_prefs
@@ -100,14 +472,12 @@ def node_market_scout(state: AgentState) -> Dict[str, Any]:
         print(f"   [Scout] Applying search_criteria from Chat: {search_criteria}")
         
         # Handle color preferences
-        exclude_colors = search_criteria.get('exclude_colors', [])
         prefer_colors = search_criteria.get('prefer_colors', [])
         if prefer_colors:
             color_filter = " " + " ".join(prefer_colors)
         
         # Handle brand preferences
         prefer_brands = search_criteria.get('prefer_brands', [])
-        exclude_brands = search_criteria.get('exclude_brands', [])
         if prefer_brands:
             brand_filter = " " + " ".join(prefer_brands)
         
@@ -141,6 +511,12 @@ def node_market_scout(state: AgentState) -> Dict[str, Any]:
         ]
         queries.append(f"{product_name} vs competition 2026")
 
+    # Latency budget: with little time left, one query is enough to find candidates
+    degradations = []
+    if len(queries) > 1 and not budget.can_afford(state, "market_scout", 12.0):
+        degradations.append(budget.degradation(state, "market_scout", f"{len(queries) - 1} extra search queries"))
+        queries = queries[:1]
+
     print(f"   [Scout] Strategy: {search_modifiers[0]} | Queries: {queries}")
     
     import time
@@ -148,32 +524,7 @@ def node_market_scout(state: AgentState) -> Dict[str, Any]:
     
     # 3. Execute Search
     print(f"   [Scout] Executing search for alternatives...")
-    from app.sources.tavily_client import search_market_context
-    
-    scout_results = []
-    # Use parallel execution for search queries to speed up
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    
-    search_start = time.time()
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        future_to_query = {executor.submit(search_market_context, q): q for q in queries} # Run all queries
-        for future in as_completed(future_to_query):
-            try:
-                # Add timeout to search
-                results = future.result(timeout=10)
-                scout_results.extend(results)
-            except Exception:
-                pass
-    search_time = time.time() - search_start
-    print(f"   ⏱️  [Scout] Tavily search took {search_time:.2f}s")
-                
-    # Deduplicate results based on URL
-    seen_urls = set()
-    unique_results = []
-    for r in scout_results:
-        if r.get('url') and r.get('url') not in seen_urls:
-            seen_urls.add(r.get('url'))
-            unique_results.append(r)
+    scout_results, unique_results = await _search_alternatives(state, queries)
     
     # 4b. Extract Images from Search Results (for fallback)
     fallback_images = []
@@ -184,73 +535,18 @@ def node_market_scout(state: AgentState) -> Dict[str, Any]:
     # 4. Extract Candidates using LLM
     print(f"   [Scout] Extracting candidates from {len(unique_results)} search results...")
     
-    context_text = "\n".join([f"- {r.get('title')}: {r.get('content')}" for r in unique_results[:25]]) # Expanded context
-    
-    from langchain_google_genai import ChatGoogleGenerativeAI
-    from app.core.config import settings
-    import json
-    
-    llm = ChatGoogleGenerativeAI(model=settings.MODEL_REASONING, google_api_key=settings.GOOGLE_API_KEY, temperature=0.1)
-    
-    # Build brand preference instruction for LLM
-    brand_instruction = ""
-    prefer_brands = search_criteria.get('prefer_brands', []) if search_criteria else []
-    if prefer_brands:
-        brand_instruction = f"\n    IMPORTANT: User STRONGLY prefers these brands: {', '.join(prefer_brands)}. ONLY include products from these brands. Do NOT include products from other brands."
-    
-    prompt = f"""You are a Market Scout. 
-    Product: {product_name}
-    Goal: Find 10 best {search_modifiers[0]} products.{brand_instruction}
-    
-    Search Context:
-    {context_text}
-    
-    Return a Strict JSON List of objects with keys: "name", "category", "reason".
-    "name" MUST be the specific model name (e.g. "Sony WH-1000XM5", "BenQ TK700"), NOT just the brand.
-    "category" should be the product type (e.g. "Headphones", "Projector").
-    Example: [{{"name": "Competitor X Model Y", "category": "Smart Watch", "reason": "Better battery life"}}]
-    """
-    
-    llm_extract_start = time.time()
     candidates = []
     try:
-        response = llm.invoke(prompt)
-        content = response.content.strip()
-        if '```json' in content:
-            content = content.split('```json')[1].split('```')[0]
-        elif '```' in content:
-             content = content.split('```')[1].split('```')[0]
-             
-        candidates = json.loads(content)
-        if not isinstance(candidates, list):
-            candidates = []
-        llm_extract_time = time.time() - llm_extract_start
-        print(f"   ⏱️  [Scout] LLM extraction took {llm_extract_time:.2f}s")
-        
-        # Post-LLM filtering: Remove candidates that don't match preferred brands
-        if prefer_brands and candidates:
-            filtered_candidates = []
-            for cand in candidates:
-                cand_name = cand.get('name', '').lower()
-                if any(brand.lower() in cand_name for brand in prefer_brands):
-                    filtered_candidates.append(cand)
-                else:
-                    print(f"       -> Filtered out {cand.get('name')} (not preferred brand)")
-            candidates = filtered_candidates
-            print(f"   [Scout] After brand filtering: {len(candidates)} candidates remain")
+        candidates = await _extract_candidates(product_name, search_modifiers[0], search_criteria, unique_results)
 
         # --- Snowflake Vector Search Integration ---
         # Uses search_criteria to create a more targeted embedding query
         try:
-            from langchain_google_genai import GoogleGenerativeAIEmbeddings
-            from app.services.snowflake_vector import snowflake_vector_service
+            from app.services.hybrid_search import hybrid_search_service
             
             print("   [Scout] Checking Snowflake Vector DB for known alternatives...")
             
-            embeddings = GoogleGenerativeAIEmbeddings(
-                model="models/gemini-embedding-001", 
-                google_api_key=settings.GOOGLE_API_KEY
-            )
+            embeddings = get_embeddings()
             
             # Build enhanced query with search_criteria from Chat Node
             enhanced_query = product_name
@@ -266,34 +562,28 @@ def node_market_scout(state: AgentState) -> Dict[str, Any]:
                     enhanced_query = f"{product_name} {' '.join(criteria_parts)}"
                     print(f"   [Scout] Enhanced vector query: '{enhanced_query}'")
             
-            query_vector = embeddings.embed_query(enhanced_query)
+            query_vector = await embeddings.aembed_query(enhanced_query)
             
             # Search Snowflake
-            vector_results = snowflake_vector_service.search_similar_products(query_vector, limit=10)
+            # Brand/color/budget filters are pushed into the query so the top-k
+            # only contains qualifying products (no post-filtering in Python).
+            vector_filters = {
+                "prefer_brands": search_criteria.get('prefer_brands', []),
+                "exclude_brands": search_criteria.get('exclude_brands', []),
+                "exclude_colors": search_criteria.get('exclude_colors', []),
+                "max_price": search_criteria.get('max_budget'),
+            }
+            # Hybrid retrieval: BM25 over name/description catches exact model numbers
+            # that the embedding misses, fused with the vector ranking (RRF).
+            # Index build / Snowflake fallback are blocking, keep them off the loop
+            vector_results = await asyncio.to_thread(
+                hybrid_search_service.search_similar_products,
+                query_vector, limit=10, filters=vector_filters, query_text=enhanced_query
+            )
             
             if vector_results:
                 print(f"   [Scout] Found {len(vector_results)} matches in Snowflake.")
                 for res in vector_results:
-                    # Filter out results that match excluded colors/brands
-                    res_name = res.get('name', '').lower()
-                    exclude_colors = search_criteria.get('exclude_colors', [])
-                    exclude_brands = search_criteria.get('exclude_brands', [])
-                    prefer_brands = search_criteria.get('prefer_brands', [])
-                    
-                    # Skip if product matches exclusions
-                    if any(color.lower() in res_name for color in exclude_colors):
-                        print(f"       -> Skipping {res.get('name')} (excluded color)")
-                        continue
-                    if any(brand.lower() in res_name for brand in exclude_brands):
-                        print(f"       -> Skipping {res.get('name')} (excluded brand)")
-                        continue
-                    
-                    # If user has brand preferences, ONLY include products matching those brands
-                    if prefer_brands:
-                        if not any(brand.lower() in res_name for brand in prefer_brands):
-                            print(f"       -> Skipping {res.get('name')} (not preferred brand)")
-                            continue
-                    
                     # Convert to candidate format
                     cand = {
                         "name": res.get('name'),
@@ -315,165 +605,7 @@ def node_market_scout(state: AgentState) -> Dict[str, Any]:
         # 5. Enrich with Real-Time Prices, Images, and Reviews
         if candidates:
             try:
-                from app.sources.serpapi_client import get_shopping_offers
-                from app.sources.tavily_client import find_review_snippets
-                from app.schemas.types import ProductQuery
-                # ensure concurrent.futures is imported
-                from concurrent.futures import ThreadPoolExecutor, as_completed
-
-                def enrich_candidate(cand):
-                    name = cand.get('name')
-                    category = cand.get('category', '')
-                    if not name:
-                        return
-                    
-                    if not name:
-                        return
-                    
-                    # --- ENRICHMENT LOGIC ---
-                    # 1. Try Google Shopping (SerpAPI) first for best prices/images
-                    try:
-                        # Construct a more specific query with category
-                        search_query = f"{name} {category}".strip()
-                        temp_query = ProductQuery(canonical_name=search_query)
-                        temp_trace = []
-                        
-                        # Get prices
-                        price_offers = get_shopping_offers(temp_query, temp_trace)
-
-                        # Filter out accessories/parts based on title
-                        valid_offers = []
-                        if price_offers:
-                            bad_keywords = ["lamp", "bulb", "remote", "mount", "bracket", "case", "bag", "filter", "adapter", "cable", "part", "replacement", "stand", "ceiling", "screen"]
-                            
-                            for p in price_offers:
-                                title_lower = (p.title or "").lower()
-                                if not any(kw in title_lower for kw in bad_keywords):
-                                    valid_offers.append(p)
-                                else:
-                                    print(f"       -> Skipped accessory: {p.title}")
-                                    
-                        # Fallback to all offers if filtering is too aggressive
-                        if not valid_offers and price_offers:
-                            valid_offers = price_offers
-                            print(f"       -> Filtering removed all offers, reverting to original list.")
-                    except Exception as e:
-                        print(f"       -> Enrichment API failed: {e}")
-                        price_offers = []
-                        valid_offers = []
-                    
-                    try:
-                        if not is_retry: # Only process offers if we fetched them
-                            cand['prices'] = [
-                                {
-                                    "vendor": p.vendor, 
-                                    "price": p.price_cents / 100, 
-                                    "price_cents": p.price_cents,
-                                    "currency": p.currency, 
-                                    "url": p.url,
-                                    "thumbnail": p.thumbnail
-                                }
-                                for p in valid_offers
-                            ]
-                        
-                        # --- PRICE LOGGING (Summary Only) ---
-                        try:
-                            with open("/app/logs/price_debug.log", "a", encoding="utf-8") as f:
-                                best_p = price_offers[0].price_cents / 100 if price_offers else 0
-                                f.write(f"[Alt] {name} | {len(price_offers)} offers | Best: ${best_p:.2f} CAD\n")
-                        except Exception:
-                            pass
-                        # ---------------------
-                        
-                        if valid_offers:
-                            # Capture Image and Link from best offer
-                            best_offer = valid_offers[0] 
-                            cand['image_url'] = getattr(best_offer, 'thumbnail', None)
-                            cand['purchase_link'] = best_offer.url
-                            
-                            # Use Best Available Price (First Offer) to match Main Product logic
-                            best_offer = valid_offers[0]
-                            cand['estimated_price'] = f"${best_offer.price_cents / 100:.2f} {best_offer.currency or 'CAD'}"
-                            cand['price_text'] = f"${best_offer.price_cents / 100:.2f}"
-                            print(f"       -> {name}: {len(valid_offers)} valid prices found. Best: {cand['price_text']}")
-                        else:
-                            # --- FALLBACK: TARGETED TAVILY SEARCH ---
-                            # If Google Shopping fails (Quota/Error), use Tavily to find price/image
-                            print(f"       -> {name}: Google Shopping failed. Attempting Tavily Fallback Search...")
-                            
-                            try:
-                                from app.sources.tavily_client import search_market_context
-                                fallback_results = search_market_context(f"{name} price image")
-                                
-                                # 1. Extract Price from Fallback Results
-                                extracted_price = None
-                                import re
-                                for r in fallback_results:
-                                    # Look for price text pattern
-                                    prices = re.findall(r'\$[\d,]+(?:\.\d{2})?', r.get('content', ''))
-                                    if prices:
-                                        extracted_price = prices[0]
-                                        if 2 <= len(extracted_price) <= 10:
-                                            break
-                                        extracted_price = None
-                                
-                                if extracted_price:
-                                    cand['estimated_price'] = f"{extracted_price} (Est.)"
-                                    cand['price_text'] = extracted_price
-                                    # Link to the result where we found price
-                                    cand['purchase_link'] = r.get('url')
-                                    print(f"       -> {name}: Recovered price: {extracted_price}")
-                                else:
-                                    cand['estimated_price'] = "Check Price"
-                                    cand['price_text'] = "Check Price"
-                                    # Fallback link
-                                    import urllib.parse
-                                    encoded_name = urllib.parse.quote(name)
-                                    cand['purchase_link'] = f"https://www.google.com/search?q={encoded_name}"
-        
-                                # 2. Extract Image from Fallback Results
-                                # Use the 'images' field if Tavily returned it, else placeholder
-                                # We need to check if ANY result has an image or if global images exist
-                                found_image = None
-                                for r in fallback_results:
-                                     # Sometimes Tavily results have inline images? (Rare)
-                                     # Actually Tavily returns a global 'images' list usually.
-                                     # Let's check the 'images' key in the RESULTDICT if we modified search_market_context
-                                     pass
-                                
-                                # Our search_market_context appends a special dict for images
-                                images_entry = next((r for r in fallback_results if r.get('title') == "Related Images"), None)
-                                if images_entry and images_entry.get('images'):
-                                     found_image = images_entry['images'][0]
-                                
-                                cand['image_url'] = found_image or "https://via.placeholder.com/150?text=No+Image"
-                                
-                            except Exception as e:
-                                print(f"       -> Tavily Fallback failed: {e}")
-                                cand['estimated_price'] = "Check Price"
-                                cand['price_text'] = "Check Price"
-                                cand['image_url'] = "https://via.placeholder.com/150?text=Error"
-
-                        # Skip reviews for alternatives - the LLM already captured why each is recommended
-                        # This saves ~3-4s per candidate by removing the Tavily API call
-                        cand['reviews'] = []
-                        
-                    except Exception as inner_e:
-                        print(f"       -> Error enriching {name}: {inner_e}")
-
-                # Run enrichment in parallel, limit to 2 to avoid API rate limits
-                # Latency Optimization: Limit to top 10 candidates total
-                enrichment_start = time.time()
-                candidates_to_process = candidates[:10]
-                with ThreadPoolExecutor(max_workers=5) as executor:
-                    futures = [executor.submit(enrich_candidate, cand) for cand in candidates_to_process]
-                    for future in as_completed(futures):
-                        try:
-                            future.result(timeout=15)
-                        except Exception as exc:
-                            print(f"   [Scout] Candidate enrichment failed: {exc}")
-                enrichment_time = time.time() - enrichment_start
-                print(f"   ⏱️  [Scout] Enrichment (prices/reviews) took {enrichment_time:.2f}s")
+                candidates = await _enrich_candidates(state, candidates, degradations)
                     
             except Exception as e:
                 print(f"       -> Enrichment setup failed: {e}")
@@ -485,19 +617,9 @@ def node_market_scout(state: AgentState) -> Dict[str, Any]:
         # Fallback: just return empty candidates
         pass
         
-    # --- FINAL DATA GUARANTEE ---
-    # Ensure all candidates have the required keys for frontend display
-    for cand in candidates:
-        if not cand.get('image_url'):
-            cand['image_url'] = "https://placehold.co/400x300?text=No+Image"
-        if not cand.get('purchase_link'):
-             # Create Google Shopping fallback
-            import urllib.parse
-            encoded_name = urllib.parse.quote(cand.get('name', 'Product'))
-            cand['purchase_link'] = f"https://www.google.com/search?tbm=shop&q={encoded_name}"
-        if not cand.get('price_text'):
-            cand['price_text'] = "Check Price"
-            
+    _ensure_display_fields(candidates)
+    _enqueue_catalog_ingest(candidates)
+
     total_time = time.time() - start_time
     print(f"--- Market Scout Node: Total time {total_time:.2f}s ---")
     log_debug("Market Scout Node Completed")
@@ -509,8 +631,11 @@ def node_market_scout(state: AgentState) -> Dict[str, Any]:
     return {
         "market_scout_data": {
             "strategy": search_modifiers[0],
-            "raw_search_results": unique_results,
+            "product_name": product_name,  # Cleaned name, reused by the veto pass
+            "search_criteria": search_criteria,
+            "raw_search_results": offload_json(unique_results),  # Blob ref, resolve_json() to read
             "candidates": candidates[:10]  # Only return enriched candidates
         },
-        "node_timings": existing_timings
+        "node_timings": existing_timings,
+        "degradations": degradations
     }
@@ -1,11 +1,14 @@
 from typing import Dict, Any, List
+import asyncio
 import time
 from app.agent.state import AgentState
 from app.schemas.types import ProductQuery
-from app.sources.tavily_client import find_review_snippets, search_eco_sustainability
-from app.sources.serpapi_client import get_shopping_offers
+from app.sources.tavily_client import afind_review_snippets, asearch_eco_sustainability, asearch_company_stats
+from app.sources.serpapi_client import aget_shopping_offers
+from app.services.blob_store import offload_json
+from app.agent import budget
 
-def node_discovery_runner(state: AgentState) -> Dict[str, Any]:
+async def node_discovery_runner(state: AgentState) -> Dict[str, Any]:
     """
     Node 2: Discovery & Research (The "Runner")
     
@@ -22,6 +25,7 @@ def node_discovery_runner(state: AgentState) -> Dict[str, Any]:
         except Exception:
             pass
 
+    node_start = time.time()
     log_debug("--- 2. Executing Discovery Node (The Runner) ---")
     print("--- 2. Executing Discovery Node (The Runner) ---")
     
@@ -47,8 +51,6 @@ def node_discovery_runner(state: AgentState) -> Dict[str, Any]:
     print(f"   [Runner] Parallelizing search for: {product_name}")
     log_debug("Starting parallel research task...")
 
-    from concurrent.futures import ThreadPoolExecutor
-    
     reviews_data = []
     offers_data = []
     eco_data = {}
@@ -57,11 +59,11 @@ def node_discovery_runner(state: AgentState) -> Dict[str, Any]:
     # This is a simple approximation. In a real app, an LLM call would be better.
     brand_name = product_name.split()[0] if product_name else ""
     
-    def fetch_reviews():
+    async def fetch_reviews():
         try:
             log_debug("Starting Tavily search...")
             review_start = time.time()
-            reviews = find_review_snippets(product, trace_log)
+            reviews = await afind_review_snippets(product, trace_log)
             review_time = time.time() - review_start
             print(f"   ⏱️  [Runner] Tavily reviews took {review_time:.2f}s")
             log_debug(f"Tavily found {len(reviews)} reviews")
@@ -71,11 +73,11 @@ def node_discovery_runner(state: AgentState) -> Dict[str, Any]:
             log_debug(f"Tavily Error: {e}")
             return []
 
-    def fetch_prices():
+    async def fetch_prices():
         try:
             log_debug("Starting SerpAPI search...")
             price_start = time.time()
-            offers = get_shopping_offers(product, trace_log)
+            offers = await aget_shopping_offers(product, trace_log)
             price_time = time.time() - price_start
             print(f"   ⏱️  [Runner] SerpAPI prices took {price_time:.2f}s")
             log_debug(f"SerpAPI found {len(offers)} offers")
@@ -85,16 +87,20 @@ def node_discovery_runner(state: AgentState) -> Dict[str, Any]:
             log_debug(f"SerpAPI Error: {e}")
             return []
 
-    def fetch_eco_data():
+    async def fetch_eco_data():
         try:
             eco_start = time.time()
-            result = search_eco_sustainability(product_name)
+            # Eco and brand lookups are independent, so run them concurrently
+            if brand_name and len(brand_name) > 2:
+                result, brand_stats = await asyncio.gather(
+                    asearch_eco_sustainability(product_name),
+                    asearch_company_stats(brand_name),
+                )
+            else:
+                result, brand_stats = await asearch_eco_sustainability(product_name), {}
             
             # --- Integratrion of Brand Stats ---
-            if brand_name and len(brand_name) > 2:
-                 from app.sources.tavily_client import search_company_stats
-                 brand_stats = search_company_stats(brand_name)
-                 if brand_stats.get("found"):
+            if brand_stats.get("found"):
                      print(f"   [Runner] Brand stats found for {brand_name}")
                      # Merge brand context into eco context
                      result["eco_context"] += f"\n\nCORPORATE SUSTAINABILITY DATA ({brand_name}):\n{brand_stats.get('brand_context')}"
@@ -107,14 +113,32 @@ def node_discovery_runner(state: AgentState) -> Dict[str, Any]:
             print(f"   [Runner] Eco Search Error: {e}")
             return {"eco_context": "", "found": False}
 
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        future_reviews = executor.submit(fetch_reviews)
-        future_prices = executor.submit(fetch_prices)
-        future_eco = executor.submit(fetch_eco_data)
-        
-        reviews_data = future_reviews.result()
-        offers_data = future_prices.result()
-        eco_data = future_eco.result()
+    # Latency budget: every provider call is capped by what is left of the request,
+    # and the eco/brand lookup (only feeds the eco score) is the first thing dropped
+    degradations = []
+    step_timeout = budget.step_timeout(state, "research", 12)
+
+    async def bounded(coro, label, default):
+        try:
+            return await asyncio.wait_for(coro, timeout=step_timeout)
+        except asyncio.TimeoutError:
+            degradations.append(budget.degradation(state, "research", label, "timed out"))
+            return default
+
+    async def skipped_eco():
+        return {"eco_context": "", "found": False}
+
+    if budget.can_afford(state, "research", 6.0):
+        eco_task = bounded(fetch_eco_data(), "eco_lookup", {"eco_context": "", "found": False})
+    else:
+        degradations.append(budget.degradation(state, "research", "eco_lookup"))
+        eco_task = skipped_eco()
+
+    reviews_data, offers_data, eco_data = await asyncio.gather(
+        bounded(fetch_reviews(), "reviews", []),
+        bounded(fetch_prices(), "prices", []),
+        eco_task,
+    )
 
     # Fallback if no offers found for main product
     if not offers_data:
@@ -149,11 +173,7 @@ def node_discovery_runner(state: AgentState) -> Dict[str, Any]:
     # ---------------------
     
     # Calculate total time for this node
-    import time as time_module
-    node_end = time_module.time()
-    # Note: We need to track start time at the beginning of the function
-    # Since parallel tasks are internal, we'll approximate from the task times
-    node_time = max(review_time if 'review_time' in dir() else 0, price_time if 'price_time' in dir() else 0)
+    node_time = time.time() - node_start
     
     # Get existing timings and add this node's time  
     existing_timings = state.get('node_timings', {}) or {}
@@ -162,11 +182,11 @@ def node_discovery_runner(state: AgentState) -> Dict[str, Any]:
     # 3. Aggregate Data
     research_data = {
         "search_results": [r['snippet'] for r in reviews_data if 'snippet' in r], # Simplified list for simple prompts
-        "reviews": reviews_data, 
+        "reviews": offload_json(reviews_data),  # Blob ref, resolve_json() to read
         "competitor_prices": offers_data,
         "eco_data": eco_data,  # Include eco sustainability data
         "trace": trace_log
     }
     
     log_debug("Discovery Node Completed")
-    return {"research_data": research_data, "node_timings": existing_timings}
+    return {"research_data": research_data, "node_timings": existing_timings, "degradations": degradations}
@@ -1,15 +1,23 @@
 from typing import Dict, Any
 from app.agent.state import AgentState
-from langchain_google_genai import ChatGoogleGenerativeAI
+from app.agent.llm import get_llm
+from app.agent.llm_governor import LLMUnavailableError
+from app.agent.streaming import astream_text, emit
+from app.agent.structured import ainvoke_json, StructuredOutputError
+from app.schemas.llm_outputs import ResponsePayload
+from app.agent.context import analysis_context, budget_for, budget_json, compact_json, record_prompt
 from app.core.config import settings
-import json
+from app.agent import budget
+from app.agent.timing import span, trace_store, critical_path
+import asyncio
 import logging
+import time
 from app.services.snowflake_cache import snowflake_cache_service
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def node_response_formulation(state: AgentState) -> Dict[str, Any]:
+async def node_response_formulation(state: AgentState) -> Dict[str, Any]:
     """
     Node 5: Response Formulation (The "Speaker")
     
@@ -35,6 +43,249 @@ def node_response_formulation(state: AgentState) -> Dict[str, Any]:
     alternatives_analysis = state.get('alternatives_analysis', [])
     risk_report = state.get('risk_report', {})
     
+    start_time = time.time()
+    degradations = []
+
+    if settings.RESPONSE_MODE == "template":
+        # Fast path: payload assembled from analysis/risk data, LLM only writes the summary
+        final_payload = await _template_response(state, analysis, alternatives_analysis, risk_report, degradations)
+    else:
+        final_payload = await _llm_response(state, analysis, alternatives_analysis, risk_report, degradations, log_debug)
+    
+    total_time = time.time() - start_time
+    print(f"--- Response Node: Total time {total_time:.2f}s ---")
+    log_debug("Response Node Completed")
+    
+    # Get existing timings and add this node's time
+    existing_timings = state.get('node_timings', {}) or {}
+    existing_timings['response'] = total_time
+    
+    # Total Runtime = critical path through the node spans of this request (parallel branches count once)
+    total_runtime, critical = _critical_path_total(state, existing_timings)
+    existing_timings['total'] = total_runtime
+    print(f"=== TOTAL AGENT RUNTIME: {total_runtime:.2f}s ===")
+    print(f"    Critical path: {' -> '.join(critical) or 'n/a'}")
+    
+    # Add timing info to final payload for frontend
+    final_payload['timing'] = existing_timings
+    final_payload['critical_path'] = critical
+    final_payload['request_id'] = state.get('request_id')
+
+    # Report what was cut to stay inside REQUEST_SLO_SECONDS
+    skipped = budget.request_degradations({**state, "degradations": (state.get('degradations') or []) + degradations})
+    final_payload['degraded'] = bool(skipped)
+    final_payload['skipped'] = skipped
+
+    # --- Snowflake Caching ---
+    try:
+        # Cache the result for 24 hours (1440 mins)
+        # CRITICAL: Use the 'canonical_name' from product_query if available.
+        # This matches the key used in agent.py (which uses Lens result).
+        # We fallback to 'identified_product' only if canonical_name is missing.
+        product_query = state.get('product_query', {})
+        product_name = product_query.get('canonical_name') or final_payload.get('identified_product', 'unknown')
+        
+        # A degraded answer must not be served from cache for the next 24h
+        if skipped:
+            print("   [Response] Degraded response, skipping Snowflake cache")
+        elif product_name and product_name != 'unknown':
+            cache_key = snowflake_cache_service.generate_key(product_name)
+            print(f"   [Response] Saving to Snowflake Cache: {cache_key}")
+            
+            # Use a sanitized version of state for params if needed, or just basic info
+            cache_params = {"product": product_name, "model": settings.MODEL_RESPONSE}
+            
+            success = await asyncio.to_thread(
+                snowflake_cache_service.set,
+                cache_key=cache_key,
+                cache_type="product_analysis",
+                params=cache_params,
+                result=final_payload,
+                ttl_minutes=1440 
+            )
+            print(f"   [Response] Cache Write Success: {success}")
+    except Exception as e:
+        print(f"   [Response] Cache Save Error: {e}")
+    # -------------------------
+    
+    # --- REFINEMENT BADGE LOGIC ---
+    skeptic_count = state.get('skeptic_loop_count', 0)
+    market_warning = state.get('market_warning')
+    
+    if skeptic_count > 0:
+        final_payload['was_refined'] = True
+        final_payload['refinement_reason'] = "We detected low-quality initial results, so we automatically refined the search to find better options."
+        
+    if market_warning:
+        # If there's a specific warning and we refined, append it
+        final_payload['refinement_context'] = market_warning
+        
+    return {"final_recommendation": final_payload, "node_timings": existing_timings, "degradations": degradations}
+
+
+def _critical_path_total(state: AgentState, timings: dict):
+    """
+    End-to-end runtime from the request's trace: the first node start to
+    now (the response node is the last one running). Without a trace, falls
+    back to the graph shape: vision + max(research, scout) + max(critique,
+    analysis) + response.
+    """
+    spans = trace_store.get(state.get('request_id')) if state.get('request_id') else []
+    path = critical_path(spans)
+    if path["start_ns"]:
+        names = [p["name"] for p in path["path"]] + ["response"]
+        return (time.time_ns() - path["start_ns"]) / 1e9, names
+
+    total = (
+        timings.get('vision', 0)
+        + max(timings.get('research', 0), timings.get('market_scout', 0))
+        + max(timings.get('critique', 0), timings.get('analysis', 0))
+        + timings.get('response', 0)
+    )
+    return total, []
+
+
+def _active_product(state: AgentState, alternatives_analysis: list, name: str) -> dict:
+    """Main product card: vision data plus link/image/eco fields from the analysis."""
+    # We need to find the main product's metadata from alternatives_analysis list
+    main_prod_meta = next((item for item in alternatives_analysis if item.get("is_main")), {})
+    
+    product_query = state.get('product_query', {})
+    detected_objects = product_query.get('detected_objects', [])
+    bbox = detected_objects[0].get('bounding_box') if detected_objects else None
+    
+    return {
+        "name": name,
+        "bounding_box": bbox,
+        "detected_objects": detected_objects,
+        "image_url": main_prod_meta.get("image_url"),     # New field
+        "purchase_link": main_prod_meta.get("purchase_link"), # New field
+        "price_text": f"${main_prod_meta.get('price_val', 0):.2f}" if main_prod_meta.get('price_val') else "Check Price",
+        "eco_score": main_prod_meta.get("eco_score", 0.5), # Propagated field
+        "eco_notes": main_prod_meta.get("eco_notes", "")   # Propagated field
+    }
+
+
+def _outcome(match_score: float, trust_score: float) -> str:
+    """Same thresholds the LLM prompt used to apply."""
+    if match_score >= 70 or trust_score >= 7:
+        return "highly_recommended"
+    if match_score < 50 and trust_score < 5:
+        return "consider_alternatives"
+    return "recommended"
+
+
+def _template_summary(payload: dict, analysis: dict) -> str:
+    """Deterministic 2-3 sentence summary, used when the LLM summary is off or fails."""
+    name = payload.get('identified_product', 'This product')
+    match_score = analysis.get('match_score', 0) or 0
+    verdict = payload.get('price_analysis', {}).get('verdict', 'Fair Price')
+    sentences = [f"{name} is a {match_score:.0f}% match for your preferences."]
+    sentiment = payload.get('community_sentiment', {}).get('summary')
+    if sentiment:
+        sentences.append(sentiment.rstrip('.') + '.')
+    else:
+        sentences.append(f"Pricing looks like a {verdict.lower()} compared to similar products.")
+    if analysis.get('best_alternative'):
+        sentences.append(f"If you're open to options, {analysis['best_alternative']} scores higher.")
+    return " ".join(sentences[:3])
+
+
+def _build_template_response(state: AgentState, analysis: dict, alternatives_analysis: list, risk_report: dict) -> dict:
+    """
+    Assembles the final payload from analysis_object and risk_report without
+    an LLM: outcome thresholds, price verdict, sentiment and the ranked
+    alternatives are already computed upstream.
+    """
+    breakdown = analysis.get('scoring_breakdown') or {}
+    match_score = analysis.get('match_score', 0) or 0
+    trust_score = risk_report.get('trust_score', breakdown.get('trust_score', 5.0))
+    price_info = analysis.get('price_analysis') or {}
+    product_name = analysis.get('recommended_product') or (state.get('product_query') or {}).get('canonical_name', 'Unknown')
+
+    details = "Price context unavailable"
+    if price_info.get('market_average') and price_info.get('market_average') != "$0.00":
+        details = f"{price_info.get('price_difference', '0%')} vs. the market average of {price_info['market_average']}"
+
+    payload = {
+        "outcome": _outcome(match_score, trust_score),
+        "identified_product": product_name,
+        "price_analysis": {
+            "price_score": breakdown.get('price_score', 0.5),
+            "verdict": price_info.get('verdict', 'Fair Price'),
+            "details": details
+        },
+        "community_sentiment": {
+            "trust_score": trust_score,
+            "summary": analysis.get('summary') or "",
+            "red_flags": (risk_report.get('hidden_flaws') or [])[:3]
+        },
+        "alternatives": analysis.get('alternatives') or []
+    }
+    payload['summary'] = _template_summary(payload, analysis)
+    payload['active_product'] = _active_product(state, alternatives_analysis, product_name)
+    return payload
+
+
+async def _llm_summary(payload: dict, analysis: dict, timeout: float) -> str:
+    """Asks MODEL_RESPONSE for the 2-3 sentence summary only."""
+    llm = get_llm(settings.MODEL_RESPONSE, 0.7, 256)
+    top_alternatives = [
+        {"name": a.get('name'), "score": a.get('score'), "price_text": a.get('price_text')}
+        for a in payload.get('alternatives', [])[:3]
+    ]
+    prompt = f"""You are a friendly, helpful shopping assistant.
+Write 2-3 positive, helpful sentences for the user about this product. Focus on what it does well first, then any minor caveats.
+Plain text only, no markdown, no lists.
+
+Product: {payload.get('identified_product')}
+Outcome: {payload.get('outcome')}
+Match score: {analysis.get('match_score', 0):.0f}/100
+Price: {payload['price_analysis']['verdict']} ({payload['price_analysis']['details']})
+Trust score: {payload['community_sentiment']['trust_score']}/10
+What users say: {payload['community_sentiment']['summary']}
+Concerns: {compact_json(payload['community_sentiment']['red_flags'])}
+Top alternatives: {compact_json(top_alternatives)}
+"""
+    record_prompt("response.summary", prompt)
+    with span("llm.response.summary", kind="llm", model=settings.MODEL_RESPONSE):
+        # Streamed: SSE clients get the summary token by token (`token` events)
+        summary = await asyncio.wait_for(astream_text(llm, prompt, "summary"), timeout=timeout)
+    return summary.strip()
+
+
+async def _template_response(state: AgentState, analysis: dict, alternatives_analysis: list, risk_report: dict,
+                             degradations: list) -> dict:
+    """RESPONSE_MODE="template": deterministic payload, optional LLM summary."""
+    final_payload = _build_template_response(state, analysis, alternatives_analysis, risk_report)
+    if not settings.RESPONSE_SUMMARY_LLM:
+        return final_payload
+
+    # Everything but the summary is final now; streaming clients render it while the summary is written
+    emit("fields", {k: v for k, v in final_payload.items() if k != "summary"})
+
+    if not budget.can_afford(state, "response", 2.0):
+        degradations.append(budget.degradation(state, "response", "llm_summary"))
+        return final_payload
+
+    try:
+        llm_start = time.time()
+        summary = await _llm_summary(final_payload, analysis, budget.step_timeout(state, "response", 15))
+        print(f"--- Response Node: LLM summary took {time.time() - llm_start:.2f}s ---")
+        if summary:
+            final_payload['summary'] = summary
+    except asyncio.TimeoutError:
+        degradations.append(budget.degradation(state, "response", "llm_summary", "timed out"))
+    except LLMUnavailableError as e:
+        degradations.append(budget.degradation(state, "response", "llm_summary", str(e)))
+    except Exception as e:
+        print(f"   [Response] Summary generation failed, keeping template summary: {e}")
+    return final_payload
+
+
+async def _llm_response(state: AgentState, analysis: dict, alternatives_analysis: list, risk_report: dict,
+                        degradations: list, log_debug) -> dict:
+    """RESPONSE_MODE="llm": the whole payload is generated by MODEL_RESPONSE."""
     # Build context from Node 4's detailed analysis
     products_detail = []
     for alt in alternatives_analysis:
@@ -50,16 +301,18 @@ def node_response_formulation(state: AgentState) -> Dict[str, Any]:
             "eco_notes": alt.get("eco_notes", "")
         })
     
-    # Initialize Speaker Agent with MODEL_RESPONSE
-    llm = ChatGoogleGenerativeAI(
-        model=settings.MODEL_RESPONSE, 
-        google_api_key=settings.GOOGLE_API_KEY,
-        temperature=0.7  # Slightly creative for friendly responses
-    )
+    # Speaker Agent with MODEL_RESPONSE (slightly creative for friendly responses)
+    llm = get_llm(settings.MODEL_RESPONSE, 0.7)
     
     # Extract key metrics for prompt context
     trust_score = risk_report.get('trust_score', 5.0)
     match_score = analysis.get('match_score', 50)
+
+    # Compact, deduplicated context within the node's token budget (alternatives only once, in products_detail)
+    token_budget = budget_for("response")
+    details_context = budget_json(analysis_context(analysis, max_alternatives=0), token_budget // 3)
+    risk_context = budget_json(risk_report, token_budget // 6)
+    products_context = budget_json(products_detail, token_budget // 2)
     
     prompt = f"""You are a friendly, helpful shopping assistant.
 Your goal is to help the user make a confident purchase decision.
@@ -67,11 +320,11 @@ Your goal is to help the user make a confident purchase decision.
 === MAIN PRODUCT ===
 Name: {analysis.get('recommended_product', 'Unknown')}
 Match Score: {match_score}/100
-Details: {json.dumps(analysis, indent=2)}
-Risk Report: {json.dumps(risk_report, indent=2)}
+Details: {details_context}
+Risk Report: {risk_context}
 
 === ALTERNATIVES & COMPETITORS (Data) ===
-{json.dumps(products_detail, indent=2)}
+{products_context}
 
 === DECISION GUIDELINES ===
 Choose the outcome based on match_score:
@@ -101,7 +354,7 @@ JSON OUTPUT FORMAT:
     "community_sentiment": {{
         "trust_score": {trust_score},
         "summary": "What are users saying? Lead with positives.",
-        "red_flags": {json.dumps(risk_report.get('hidden_flaws', [])[:3])}
+        "red_flags": {compact_json(risk_report.get('hidden_flaws', [])[:3])}
     }},
     \"alternatives\": [
         {{
@@ -116,46 +369,23 @@ JSON OUTPUT FORMAT:
     ]
 }}
 """
+    record_prompt("response.full", prompt)
     
-    import time
-    start_time = time.time()
-    
+    # Latency budget: past the deadline, the template response goes out instead
+    if not budget.can_afford(state, "response", 2.0):
+        degradations.append(budget.degradation(state, "response", "llm_response"))
+        return _build_fallback_response(analysis, alternatives_analysis, risk_report)
+
     try:
         logger.info(f"Generating response with {settings.MODEL_RESPONSE}...")
         llm_start = time.time()
-        response = llm.invoke(prompt)
+        final_payload = await asyncio.wait_for(ainvoke_json(llm, prompt, "response.full", ResponsePayload),
+                                               timeout=budget.step_timeout(state, "response", 30))
         llm_time = time.time() - llm_start
         print(f"--- Response Node: LLM Generation took {llm_time:.2f}s ---")
         
-        content = response.content
-        
-        # Clean up response
-        if '```json' in content:
-            content = content.split('```json')[1].split('```')[0]
-        elif '```' in content:
-            content = content.split('```')[1].split('```')[0]
-        
-        content = content.strip()
-        final_payload = json.loads(content)
-        
         # Inject Vision Data & Main Product Link/Image into Final Payload
-        # We need to find the main product's metadata from alternatives_analysis list
-        main_prod_meta = next((item for item in alternatives_analysis if item.get("is_main")), {})
-        
-        product_query = state.get('product_query', {})
-        detected_objects = product_query.get('detected_objects', [])
-        bbox = detected_objects[0].get('bounding_box') if detected_objects else None
-        
-        final_payload['active_product'] = {
-            "name": final_payload.get('identified_product'),
-            "bounding_box": bbox,
-            "detected_objects": detected_objects,
-            "image_url": main_prod_meta.get("image_url"),     # New field
-            "purchase_link": main_prod_meta.get("purchase_link"), # New field
-            "price_text": f"${main_prod_meta.get('price_val', 0):.2f}" if main_prod_meta.get('price_val') else "Check Price",
-            "eco_score": main_prod_meta.get("eco_score", 0.5), # Propagated field
-            "eco_notes": main_prod_meta.get("eco_notes", "")   # Propagated field
-        }
+        final_payload['active_product'] = _active_product(state, alternatives_analysis, final_payload.get('identified_product'))
 
         # Double check alternatives have links (sometimes LLM hallucinates or drops them)
         # We enforce them from our source data just in case
@@ -173,7 +403,16 @@ JSON OUTPUT FORMAT:
         logger.info(f"Successfully generated response for: {final_payload.get('identified_product')}")
         log_debug(f"Response Node Payload: {final_payload}")
         
-    except json.JSONDecodeError as e:
+    except asyncio.TimeoutError:
+        degradations.append(budget.degradation(state, "response", "llm_response", "timed out"))
+        final_payload = _build_fallback_response(analysis, alternatives_analysis, risk_report)
+
+    except LLMUnavailableError as e:
+        # Circuit open / no slot: fail fast to the data-only response
+        degradations.append(budget.degradation(state, "response", "llm_response", str(e)))
+        final_payload = _build_fallback_response(analysis, alternatives_analysis, risk_report)
+
+    except StructuredOutputError as e:
         print(f"   [Response] JSON Parse Error: {e}")
         # Fallback with available data
         final_payload = _build_fallback_response(analysis, alternatives_analysis, risk_report)
@@ -184,77 +423,8 @@ JSON OUTPUT FORMAT:
         final_payload = _build_fallback_response(analysis, alternatives_analysis, risk_report)
         final_payload["outcome"] = "error"
         final_payload["summary"] = "We encountered an issue generating your recommendation. Please try again."
-    
-    total_time = time.time() - start_time
-    print(f"--- Response Node: Total time {total_time:.2f}s ---")
-    log_debug("Response Node Completed")
-    
-    # Get existing timings and add this node's time
-    existing_timings = state.get('node_timings', {}) or {}
-    existing_timings['response'] = total_time
-    
-    # Calculate Total Runtime (sequential: vision -> research -> scout, parallel: critique||analysis, then response)
-    # Sequential path: vision + research + market_scout + max(critique, analysis) + response
-    vision_time = existing_timings.get('vision', 0)
-    research_time = existing_timings.get('research', 0)
-    scout_time = existing_timings.get('market_scout', 0)
-    critique_time = existing_timings.get('critique', 0)
-    analysis_time = existing_timings.get('analysis', 0)
-    response_time = existing_timings.get('response', 0)
-    
-    # Parallel nodes count as max of the two (they run simultaneously)
-    parallel_time = max(critique_time, analysis_time)
-    total_runtime = vision_time + research_time + scout_time + parallel_time + response_time
-    
-    existing_timings['total'] = total_runtime
-    print(f"=== TOTAL AGENT RUNTIME: {total_runtime:.2f}s ===")
-    print(f"    Vision: {vision_time:.2f}s | Research: {research_time:.2f}s | Scout: {scout_time:.2f}s")
-    print(f"    Critique: {critique_time:.2f}s | Analysis: {analysis_time:.2f}s | Response: {response_time:.2f}s")
-    
-    # Add timing info to final payload for frontend
-    final_payload['timing'] = existing_timings
 
-    # --- Snowflake Caching ---
-    try:
-        # Cache the result for 24 hours (1440 mins)
-        # CRITICAL: Use the 'canonical_name' from product_query if available.
-        # This matches the key used in agent.py (which uses Lens result).
-        # We fallback to 'identified_product' only if canonical_name is missing.
-        product_query = state.get('product_query', {})
-        product_name = product_query.get('canonical_name') or final_payload.get('identified_product', 'unknown')
-        
-        if product_name and product_name != 'unknown':
-            cache_key = snowflake_cache_service.generate_key(product_name)
-            print(f"   [Response] Saving to Snowflake Cache: {cache_key}")
-            
-            # Use a sanitized version of state for params if needed, or just basic info
-            cache_params = {"product": product_name, "model": settings.MODEL_RESPONSE}
-            
-            success = snowflake_cache_service.set(
-                cache_key=cache_key,
-                cache_type="product_analysis",
-                params=cache_params,
-                result=final_payload,
-                ttl_minutes=1440 
-            )
-            print(f"   [Response] Cache Write Success: {success}")
-    except Exception as e:
-        print(f"   [Response] Cache Save Error: {e}")
-    # -------------------------
-    
-    # --- REFINEMENT BADGE LOGIC ---
-    skeptic_count = state.get('skeptic_loop_count', 0)
-    market_warning = state.get('market_warning')
-    
-    if skeptic_count > 0:
-        final_payload['was_refined'] = True
-        final_payload['refinement_reason'] = "We detected low-quality initial results, so we automatically refined the search to find better options."
-        
-    if market_warning:
-        # If there's a specific warning and we refined, append it
-        final_payload['refinement_context'] = market_warning
-        
-    return {"final_recommendation": final_payload, "node_timings": existing_timings}
+    return final_payload
 
 
 def _build_fallback_response(analysis: dict, alternatives_analysis: list, risk_report: dict) -> dict:
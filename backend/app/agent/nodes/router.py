@@ -1,13 +1,18 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from app.agent.state import AgentState
-from langchain_google_genai import ChatGoogleGenerativeAI
+from app.agent.intent_classifier import intent_classifier, record_agreement, record_decision
+from app.agent.llm import get_llm, FAST_MODEL
+from app.agent.llm_cache import acached_invoke
+from app.core.config import settings
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-import os
+import asyncio
 import logging
+import random
 
 logger = logging.getLogger(__name__)
 
+_background: set = set()
+
 async def node_router(state: AgentState) -> Dict[str, Any]:
     """
     Classifies the user's intent to route to the appropriate node.
@@ -29,12 +34,56 @@ async def node_router(state: AgentState) -> Dict[str, Any]:
         logger.info("ROUTER: New image detected -> vision_search")
         return {"router_decision": "vision_search"}
 
-    # 2. Use LLM to classify intent for text/follow-ups
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        temperature=0,
-        google_api_key=os.getenv("GOOGLE_API_KEY")
-    )
+    # 1b. Product name given directly (batch items): nothing analysed yet, so run the full
+    # pipeline; vision passes the product through. Follow-ups carry the prior analysis.
+    if state.get("skip_vision") and not chat_history and not state.get("analysis_object"):
+        logger.info("ROUTER: Product name without image -> vision_search (skip vision)")
+        return {"router_decision": "vision_search"}
+
+    # 2. Local classifier (keyword rules, then a model trained on past LLM decisions)
+    has_image = bool(image_base64)
+    local = None
+    if settings.ROUTER_LOCAL_ENABLED and user_query:
+        if intent_classifier.stale:
+            await asyncio.to_thread(intent_classifier.retrain)
+        local = intent_classifier.classify(user_query, has_image)
+        if local.confident:
+            record_decision(local.source, local.decision, local.confidence)
+            print(f"   [Router] ⚡ {local.source} -> {local.decision} ({local.confidence:.2f})")
+            if random.random() < settings.ROUTER_SHADOW_RATE:
+                _schedule_shadow_check(local, user_query, image_base64, chat_history)
+            return {"router_decision": local.decision}
+
+    # 3. Ambiguous: ask the LLM, and keep its answer as a training example
+    decision = await _llm_decision(user_query, image_base64, chat_history)
+    if decision is None:
+        return {"router_decision": "chat"}  # Default fallback
+    record_decision("llm", decision, 1.0)
+    if local is not None:
+        record_agreement(local.source, local.decision, decision)
+        await asyncio.to_thread(intent_classifier.log_decision, user_query, has_image, decision, "llm",
+                                local.confidence)
+    logger.info(f"ROUTER: Decision -> {decision}")
+    return {"router_decision": decision}
+
+
+def _schedule_shadow_check(local, user_query: str, image_base64, chat_history):
+    """Re-asks the LLM in the background to measure the local stage's agreement rate."""
+    async def check():
+        decision = await _llm_decision(user_query, image_base64, chat_history)
+        if decision is None:
+            return
+        record_agreement(local.source, local.decision, decision)
+        await asyncio.to_thread(intent_classifier.log_decision, user_query, bool(image_base64), decision, "llm")
+
+    task = asyncio.ensure_future(check())
+    _background.add(task)  # Keep a reference until it finishes
+    task.add_done_callback(_background.discard)
+
+
+async def _llm_decision(user_query: str, image_base64, chat_history) -> Optional[str]:
+    """The router LLM's classification, or None if the call failed."""
+    llm = get_llm(FAST_MODEL, 0)
     
     system_prompt = """You are the Router for a Shopping Assistant. Classify the user's latest message into ONE category:
 
@@ -72,10 +121,10 @@ async def node_router(state: AgentState) -> Dict[str, Any]:
         ("human", human_prompt)
     ])
     
-    chain = prompt | llm | StrOutputParser()
-    
     try:
-        decision = await chain.ainvoke({})
+        # Repeated (and near-identical) follow-ups are answered from the LLM cache;
+        # only the user's words are compared, the rest of the prompt must match
+        decision = await acached_invoke(llm, prompt.format_messages(), "router", semantic_text=user_query)
         decision = decision.strip().lower()
         
         # Fallback for safety
@@ -84,9 +133,8 @@ async def node_router(state: AgentState) -> Dict[str, Any]:
             logger.warning(f"ROUTER: Invalid decision '{decision}', defaulting to 'chat'")
             decision = "chat"
             
-        logger.info(f"ROUTER: Decision -> {decision}")
-        return {"router_decision": decision}
+        return decision
         
     except Exception as e:
         logger.error(f"ROUTER: Error in classification: {e}")
-        return {"router_decision": "chat"} # Default fallback
+        return None
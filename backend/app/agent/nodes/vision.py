@@ -1,9 +1,18 @@
 from typing import Dict, Any
+import asyncio
 import base64
 from app.agent.state import AgentState
-from app.services.lens_identify import identify_product_with_lens
+from app.services.lens_identify import aidentify_product_with_lens
+from app.services.blob_store import resolve_image_base64
+from app.services.box_identify import schedule_eager_identification
+from app.core.config import settings
+from app.agent import budget
+from app.agent.llm import get_llm
+from app.agent.structured import ainvoke_json
+from app.schemas.llm_outputs import VisionDetection
+from app.core import metrics
 
-def node_user_intent_vision(state: AgentState) -> Dict[str, Any]:
+async def node_user_intent_vision(state: AgentState) -> Dict[str, Any]:
     """
     Node 1: User Intent & Vision (The "Eye")
     
@@ -28,15 +37,19 @@ def node_user_intent_vision(state: AgentState) -> Dict[str, Any]:
     image_data = state.get("image_base64")
     user_query = state.get("user_query", "")
 
-    if not image_data:
-        return {"product_query": {"error": "No image provided"}}
-
-
-    # CHECK FOR SKIP FLAG (Stage 2 of Two-Stage Pipeline)
+    # CHECK FOR SKIP FLAG (Stage 2 of Two-Stage Pipeline, or a product name without image)
     if state.get("skip_vision"):
         print("--- Vision Node: SKIPPING (Deep Analysis Mode) ---")
         return {} # Pass-through, no changes to state
 
+    if not image_data:
+        return {"product_query": {"error": "No image provided"}}
+
+    # State carries a blob reference; inline base64 is still accepted
+    image_data = resolve_image_base64(image_data)
+    if not image_data:
+        return {"product_query": {"error": "Image blob expired or missing"}}
+
     import time
     start_time = time.time()
     
@@ -48,23 +61,16 @@ def node_user_intent_vision(state: AgentState) -> Dict[str, Any]:
     # STAGE 1: FAST DETECTION (Gemini)
     # ---------------------------------------------------------
     # Helper for Gemini Vision (Fast Mode / Fallback)
-    def _run_gemini_vision(image_b64):
+    async def _run_gemini_vision(image_b64):
         log_debug("--- Executing Vision: Gemini Mode ---")
         try:
-            from langchain_google_genai import ChatGoogleGenerativeAI
             from langchain_core.messages import HumanMessage
             from app.core.config import settings
-            import json
             
             if not settings.GOOGLE_API_KEY:
                  return {"product_query": {"error": "GOOGLE_API_KEY missing"}}
 
-            llm = ChatGoogleGenerativeAI(
-                model=settings.MODEL_VISION,
-                google_api_key=settings.GOOGLE_API_KEY,
-                temperature=0.4,
-                max_output_tokens=1024
-            )
+            llm = get_llm(settings.MODEL_VISION, 0.4, 1024)
             
             # Enhanced Prompt for Fallback & OCR
             prompt = """
@@ -99,15 +105,8 @@ def node_user_intent_vision(state: AgentState) -> Dict[str, Any]:
                 ]
             )
             
-            response = llm.invoke([message])
-            content = response.content.strip()
-            
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-                
-            data = json.loads(content)
+            # JSON mode + schema; a reply truncated at max_output_tokens is repaired locally
+            data = await ainvoke_json(llm, [message], "vision.detect", VisionDetection, strict=True)
             
             # Map to State Structure
             return {
@@ -129,22 +128,50 @@ def node_user_intent_vision(state: AgentState) -> Dict[str, Any]:
     # STAGE 1: FAST DETECTION (Gemini)
     # ---------------------------------------------------------
     if state.get("detect_only"):
-        return _run_gemini_vision(image_data)
+        result = await _run_gemini_vision(image_data)
+        detected = (result.get("product_query") or {}).get("detected_objects") or []
+        if state.get("eager_identify") and detected:
+            # Identify every box in the background so a click on /identify is a cache hit
+            scheduled = schedule_eager_identification(state.get("image_base64"), detected)
+            result["product_query"]["eager_identify"] = {
+                "scheduled": scheduled,
+                "budget_s": settings.EAGER_IDENTIFY_BUDGET_SECONDS,
+            }
+        return result
 
     # ---------------------------------------------------------
     # STAGE 2: DEEP IDENTIFICATION (Google Lens)
     # ---------------------------------------------------------
+    async def _gemini_fallback(reason: str) -> Dict[str, Any]:
+        """Gemini alone after Lens was skipped or failed, bounded by what is left of the budget."""
+        metrics.record_fallback("lens_to_gemini", reason=reason)
+        try:
+            return await asyncio.wait_for(_run_gemini_vision(image_data),
+                                          timeout=budget.step_timeout(state, "vision", 20))
+        except asyncio.TimeoutError:
+            return {
+                "product_query": {"error": "Vision timed out"},
+                "degradations": [budget.degradation(state, "vision", "gemini_vision", "timed out")],
+            }
     
+    # Lens is the slow path (upload + SerpAPI); below this budget Gemini alone is used
+    if not budget.can_afford(state, "vision", 3.0):
+        skipped = [budget.degradation(state, "vision", "google_lens")]
+        result = await _gemini_fallback("budget")
+        result["degradations"] = skipped + result.get("degradations", [])
+        return result
+
     image_bytes = base64.b64decode(image_data)
     
     log_debug("Sending request to Google Lens via SerpAPI...")
     
-    # Call Google Lens for product identification
-    lens_result = identify_product_with_lens(image_bytes, extension="jpg")
+    # Call Google Lens for product identification, bounded by the request budget
+    lens_timeout = budget.step_timeout(state, "vision", 60)
+    lens_result = await aidentify_product_with_lens(image_bytes, extension="jpg", timeout=lens_timeout)
     
     if "error" in lens_result:
         log_debug(f"Lens error: {lens_result['error']} -> FALLING BACK TO GEMINI")
-        return _run_gemini_vision(image_data)
+        return await _gemini_fallback("error")
     
     product_name = lens_result.get("product_name", "Unknown Product")
     confidence = lens_result.get("confidence", 0.5)
@@ -0,0 +1,130 @@
+"""
+Per-request memo for the main product's review analysis.
+
+skeptic_node and analysis_node run in the same superstep after
+parallel_start_node, so risk_report is never ready when the analysis node
+looks for it, and both used to send near-identical review prompts to the
+LLM. Now the first node to ask starts one analysis task; the other awaits the
+same task. Keys are (request_id, product name), so concurrent requests and
+later turns of the same thread never share a result.
+
+The task is shielded: a node that gives up on it (latency budget) does not
+cancel it for the other. Results are also cached in Snowflake like the old
+critique report, so repeated analyses of the same research data skip the LLM.
+"""
+from app.agent.skeptic import get_skeptic_agent, Review, ReviewSentiment
+from app.core.config import settings
+from app.services.blob_store import resolve_json
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Entries outlive the superstep briefly; both nodes read within seconds
+MEMO_TTL_SECONDS = 600
+MEMO_MAX_ENTRIES = 256
+
+_tasks: "OrderedDict[Tuple[str, str], Tuple[float, asyncio.Task]]" = OrderedDict()
+
+
+def main_review_inputs(state: Dict[str, Any]) -> Tuple[str, List[Review], str, str]:
+    """(product name, reviews, eco context, price context) for the main product."""
+    research = state.get('research_data') or {}
+    product_query = state.get('product_query') or {}
+    product_name = product_query.get('canonical_name') or product_query.get('product_name') or "Main Product"
+
+    reviews = []
+    for r in (resolve_json(research.get('reviews'), default=[]) or [])[:5]:
+        try:
+            reviews.append(Review(source=r.get("source", "Unknown"), text=r.get("snippet", "") or r.get("text", ""),
+                                  rating=r.get("rating"), date=r.get("date")))
+        except Exception:
+            pass
+
+    eco_context = (research.get('eco_data') or {}).get('eco_context', '')
+
+    offers = []
+    for o in (research.get('competitor_prices') or [])[:5]:
+        price = o.get('price_cents', 0) / 100.0 if o.get('price_cents') else float(o.get('price') or 0)
+        if price > 0:
+            offers.append(f"- {o.get('vendor', 'Unknown')}: ${price:.2f} {o.get('currency') or 'CAD'}")
+    return product_name, reviews, eco_context, "\n".join(offers)
+
+
+def _cache_key(product_name: str, reviews: List[Review], eco_context: str, price_context: str) -> str:
+    payload = json.dumps({
+        "product": product_name,
+        "reviews": [r.model_dump() for r in reviews],
+        "eco": eco_context,
+        "prices": price_context,
+        "model": settings.MODEL_ANALYSIS,
+    }, sort_keys=True, default=str)
+    return f"skeptic:analysis:{hashlib.md5(payload.encode()).hexdigest()}"
+
+
+async def _analyze(state: Dict[str, Any]) -> ReviewSentiment:
+    from app.services.snowflake_cache import snowflake_cache_service
+
+    product_name, reviews, eco_context, price_context = main_review_inputs(state)
+    cache_key = _cache_key(product_name, reviews, eco_context, price_context)
+
+    cached = await asyncio.to_thread(snowflake_cache_service.get, cache_key)
+    if isinstance(cached, dict):
+        try:
+            print(f"   [ReviewMemo] Cache Hit for {product_name}")
+            return ReviewSentiment(**cached)
+        except Exception:
+            pass
+
+    start = time.time()
+    result = await get_skeptic_agent(settings.MODEL_ANALYSIS).aanalyze_reviews(
+        product_name, reviews, eco_context, price_context)
+    print(f"   [ReviewMemo] Main product review analysis took {time.time() - start:.2f}s")
+
+    if result.verdict != "Error":
+        await asyncio.to_thread(
+            snowflake_cache_service.set,
+            cache_key=cache_key,
+            cache_type="skeptic_analysis",
+            params={"product": product_name},
+            result=result.model_dump(),
+            ttl_minutes=30
+        )
+    return result
+
+
+def _evict(now: float):
+    while _tasks:
+        key, (created, task) = next(iter(_tasks.items()))
+        if len(_tasks) <= MEMO_MAX_ENTRIES and now - created < MEMO_TTL_SECONDS:
+            break
+        _tasks.popitem(last=False)
+
+
+async def get_main_review_analysis(state: Dict[str, Any]) -> ReviewSentiment:
+    """
+    Review analysis of the main product for this request. The first caller
+    starts it, later callers in the same request await the same result.
+    """
+    request_id = state.get('request_id')
+    if not request_id:
+        # No request scope to share within (e.g. scripts); analyze directly
+        return await _analyze(state)
+
+    product_name = main_review_inputs(state)[0]
+    key = (request_id, product_name)
+    now = time.time()
+    _evict(now)
+
+    entry = _tasks.get(key)
+    if entry is None:
+        entry = (now, asyncio.ensure_future(_analyze(state)))
+        _tasks[key] = entry
+    else:
+        print(f"   [ReviewMemo] ♻️ Sharing in-flight review analysis for {product_name}")
+    return await asyncio.shield(entry[1])
@@ -0,0 +1,147 @@
+"""
+Persistent per-product sentiment memo.
+
+The Skeptic's trust/sentiment/eco assessments were recomputed on every
+request, although the same well-known alternatives ("Sony WH-1000XM5")
+come back in thousands of scans. The ReviewSentiment results are now stored
+in the `product_sentiment` table (SQLite by default, shared by the gunicorn
+workers like the checkpoint store) and reused until they expire.
+
+Rows are keyed by (canonical product id, model version, kind, inputs key):
+
+- product id: catalog_ingest.canonical_product_id, so retailer noise
+  ("(Black)", "| Unlocked", casing) maps to the same product, while model
+  numbers stay distinct.
+- model version: the Skeptic's model plus SKEPTIC_PROMPT_VERSION. Changing
+  either one starts a new memo instead of serving stale assessments.
+- kind, each with its own TTL in SENTIMENT_MEMO_TTLS:
+  - alternative: the name-only batch assessment (the main product's eco
+    research in that prompt is not part of the key);
+  - reviews: the full analysis of a product with collected reviews;
+  - category: the analysis of a product without reviews (eco/category only).
+    It is never served in place of a review-based one.
+- inputs key: for the review analyses, a digest of the reviews, eco research
+  and current offers in the prompt, so new reviews or prices mean a new
+  analysis (price_integrity depends on them). Empty for alternatives.
+
+SkepticAgent sends only the products missing here to the LLM and merges the
+rest in. Fallback results (errors, neutral defaults) are never stored.
+Lookups are counted in agent_sentiment_memo_total{kind,result}.
+"""
+from app.agent.checkpointer import create_store_engine
+from app.core.config import settings
+from app.core import metrics
+from app.services.catalog_ingest import canonical_product_id
+from typing import Any, Dict, Iterable, Optional
+import json
+import logging
+import time
+
+from sqlalchemy import (
+    Column, Float, MetaData, PrimaryKeyConstraint, String, Table, Text,
+    delete, select, and_,
+)
+
+logger = logging.getLogger(__name__)
+
+# Expired rows are deleted at most this often
+GC_INTERVAL_SECONDS = 3600
+
+metadata_obj = MetaData()
+
+sentiment_table = Table(
+    "product_sentiment", metadata_obj,
+    Column("product_id", String(64)),
+    Column("model_version", String(128)),
+    Column("kind", String(16)),
+    Column("inputs_key", String(64), default=""),
+    Column("product_name", String(512)),
+    Column("result", Text),
+    Column("created_at", Float),
+    Column("expires_at", Float, index=True),
+    PrimaryKeyConstraint("product_id", "model_version", "kind", "inputs_key"),
+)
+
+
+class SentimentMemo:
+    def __init__(self, db_url: Optional[str] = None):
+        self.db_url = db_url or settings.SENTIMENT_MEMO_DB_URL
+        self._engine = None
+        self._last_gc = 0.0
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = create_store_engine(self.db_url)
+            metadata_obj.create_all(self._engine)
+        return self._engine
+
+    @staticmethod
+    def enabled(kind: str) -> bool:
+        return settings.SENTIMENT_MEMO_ENABLED and bool(settings.SENTIMENT_MEMO_TTLS.get(kind))
+
+    def get_many(self, names: Iterable[str], model_version: str, kind: str,
+                 inputs_key: str = "") -> Dict[str, Dict[str, Any]]:
+        """Stored results for `names` (product name -> ReviewSentiment fields); misses are left out."""
+        ids = {}
+        for name in names:
+            ids.setdefault(canonical_product_id(name), []).append(name)
+        if not ids or not self.enabled(kind):
+            return {}
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(sentiment_table.c.product_id, sentiment_table.c.result)
+                    .where(and_(sentiment_table.c.product_id.in_(list(ids)),
+                                sentiment_table.c.model_version == model_version,
+                                sentiment_table.c.kind == kind,
+                                sentiment_table.c.inputs_key == inputs_key,
+                                sentiment_table.c.expires_at > time.time()))
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Sentiment memo read failed: {e}")
+            rows = []
+
+        found = {}
+        for row in rows:
+            result = json.loads(row.result)
+            for name in ids[row.product_id]:
+                found[name] = result
+        hits = sum(len(ids[row.product_id]) for row in rows)
+        misses = sum(len(names) for names in ids.values()) - hits
+        if hits:
+            metrics.SENTIMENT_MEMO.labels(kind=kind, result="hit").inc(hits)
+        if misses:
+            metrics.SENTIMENT_MEMO.labels(kind=kind, result="miss").inc(misses)
+        return found
+
+    def put_many(self, results: Dict[str, Dict[str, Any]], model_version: str, kind: str,
+                 inputs_key: str = ""):
+        """Stores product name -> ReviewSentiment fields for SENTIMENT_MEMO_TTLS[kind] seconds."""
+        if not results or not self.enabled(kind):
+            return
+        now = time.time()
+        expires_at = now + settings.SENTIMENT_MEMO_TTLS[kind]
+        rows = {canonical_product_id(name): (name, result) for name, result in results.items()}
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(delete(sentiment_table).where(and_(
+                    sentiment_table.c.product_id.in_(list(rows)),
+                    sentiment_table.c.model_version == model_version,
+                    sentiment_table.c.kind == kind,
+                    sentiment_table.c.inputs_key == inputs_key,
+                )))
+                conn.execute(sentiment_table.insert(), [
+                    {"product_id": product_id, "model_version": model_version, "kind": kind,
+                     "inputs_key": inputs_key, "product_name": name[:512], "result": json.dumps(result, default=str),
+                     "created_at": now, "expires_at": expires_at}
+                    for product_id, (name, result) in rows.items()
+                ])
+                if now - self._last_gc > GC_INTERVAL_SECONDS:
+                    self._last_gc = now
+                    conn.execute(delete(sentiment_table).where(sentiment_table.c.expires_at <= now))
+        except Exception as e:
+            logger.error(f"Sentiment memo write failed: {e}")
+
+
+sentiment_memo = SentimentMemo()
@@ -1,8 +1,10 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
+import asyncio
+import hashlib
+import json
 import os
 import logging
 
@@ -27,6 +29,8 @@ class ReviewSentiment(BaseModel):
     pros: List[str] = Field(default_factory=list, description="Key advantages mentioned by real users")
     cons: List[str] = Field(default_factory=list, description="Key flaws mentioned by real users")
     verdict: str = Field(..., description="One-line final verdict (e.g., 'Solid buy', 'Avoid - Likely scams', 'Good but overpriced')")
+    fake_review_likelihood: str = Field("Unknown", description="Low/Medium/High + brief explanation (only High if clear evidence)")
+    price_integrity: str = Field("", description="Fair assessment of pricing - is it competitive for the category?")
 
 class BatchReviewSentiment(BaseModel):
     assessments: List[ReviewSentiment] = Field(..., description="List of review assessments for each product provided")
@@ -36,10 +40,20 @@ class VetoDecision(BaseModel):
     better_search_query: Optional[str] = Field(None, description="A specific, mutated search query to find better results if vetoing (e.g., 'Sony WH-1000XM5 reddit reviews')")
     reason: str = Field(..., description="Why we are vetoing or proceeding")
     market_warning: Optional[str] = Field(None, description="Warning to display if we are forced to proceed despite low quality")
+    rejected_candidates: List[str] = Field(default_factory=list, description="Exact names of the candidates that should be dropped if vetoing (keep the acceptable ones out of this list)")
 
 # --- Agent Logic ---
 
 from app.core.config import settings
+from app.agent.timing import span
+from app.agent.context import budget_for, budget_lines
+from app.agent.llm import get_llm
+from app.agent.llm_cache import acached_invoke
+from app.agent.sentiment_memo import sentiment_memo
+
+# Part of the sentiment memo key (agent/sentiment_memo.py): bump when the review or
+# batch prompts change so memoized assessments from the old prompts are not reused
+SKEPTIC_PROMPT_VERSION = "1"
 
 class SkepticAgent:
     def __init__(self, model_name: Optional[str] = None):
@@ -50,19 +64,86 @@ class SkepticAgent:
         if not api_key:
              logger.warning("GOOGLE_API_KEY not set. Skeptic Agent will fail if invoked.")
         
-        self.llm = ChatGoogleGenerativeAI(
-            model=self.model_name,
-            temperature=0.1, # Low temperature for objective analysis
-            google_api_key=api_key,
-            max_retries=2,
-        )
+        # Shared client (agent/llm.py); low temperature for objective analysis
+        self.llm = get_llm(self.model_name, 0.1, None, 2)
         
         self.parser = PydanticOutputParser(pydantic_object=ReviewSentiment)
 
+    @property
+    def memo_version(self) -> str:
+        return f"{self.model_name}:{SKEPTIC_PROMPT_VERSION}"
+
+    @staticmethod
+    def _review_kind(reviews: List[Review]) -> str:
+        # An analysis without reviews is never served in place of one with reviews
+        return "reviews" if reviews else "category"
+
+    @staticmethod
+    def _review_inputs_key(reviews: List[Review], eco_context: str, price_context: str) -> str:
+        """Digest of the prompt inputs: new reviews or offers mean a new analysis."""
+        payload = json.dumps({"reviews": [r.model_dump() for r in reviews], "eco": eco_context,
+                              "prices": price_context}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
     def analyze_reviews(self, product_name: str, reviews: List[Review], eco_context: str = "") -> ReviewSentiment:
         """
         Analyzes a list of reviews to determine authenticity and sentiment.
+        Memoized per product and inputs (agent/sentiment_memo.py).
         """
+        kind = self._review_kind(reviews)
+        inputs_key = self._review_inputs_key(reviews, eco_context, "")
+        memoized = sentiment_memo.get_many([product_name], self.memo_version, kind, inputs_key)
+        if product_name in memoized:
+            print(f"   [Skeptic] ♻️ Memoized review analysis for {product_name}")
+            return ReviewSentiment(**memoized[product_name])
+        chain, inputs = self._review_chain(product_name, reviews, eco_context)
+        try:
+            logger.info(f"Analyzing {len(reviews)} reviews for {product_name}...")
+            result = chain.invoke(inputs)
+        except Exception as e:
+            logger.error(f"Skeptic Agent Analysis Failed: {e}")
+            return self._review_fallback(e)
+        sentiment_memo.put_many({product_name: result.model_dump()}, self.memo_version, kind, inputs_key)
+        return result
+
+    async def aanalyze_reviews(self, product_name: str, reviews: List[Review], eco_context: str = "",
+                               price_context: str = "") -> ReviewSentiment:
+        """Async variant of analyze_reviews."""
+        kind = self._review_kind(reviews)
+        inputs_key = self._review_inputs_key(reviews, eco_context, price_context)
+        memoized = await asyncio.to_thread(sentiment_memo.get_many, [product_name], self.memo_version, kind,
+                                           inputs_key)
+        if product_name in memoized:
+            print(f"   [Skeptic] ♻️ Memoized review analysis for {product_name}")
+            return ReviewSentiment(**memoized[product_name])
+        chain, inputs = self._review_chain(product_name, reviews, eco_context, price_context)
+        try:
+            logger.info(f"Analyzing {len(reviews)} reviews for {product_name}...")
+            with span("llm.skeptic.reviews", kind="llm", model=self.model_name):
+                result = await chain.ainvoke(inputs)
+        except Exception as e:
+            logger.error(f"Skeptic Agent Analysis Failed: {e}")
+            return self._review_fallback(e)
+        await asyncio.to_thread(sentiment_memo.put_many, {product_name: result.model_dump()}, self.memo_version, kind,
+                                inputs_key)
+        return result
+
+    @staticmethod
+    def _review_fallback(e: Exception) -> ReviewSentiment:
+        # Fallback for robustness
+        return ReviewSentiment(
+            summary="Error occurred during AI analysis of reviews.",
+            trust_score=0.0,
+            sentiment_score=0.0,
+            red_flags=[f"System Error: {str(e)}"],
+            msg="Analysis failed",
+            pros=[],
+            cons=[],
+            verdict="Error"
+        )
+
+    def _review_chain(self, product_name: str, reviews: List[Review], eco_context: str = "", price_context: str = ""):
+        """Builds the review analysis chain and its inputs."""
         # Analyzes a list of reviews to determine authenticity and sentiment.
         # Even if NO reviews are present, we still run the analysis to generate the Eco Score
         # and checking for inherent product flaws based on category/brand.
@@ -71,9 +152,10 @@ class SkepticAgent:
         if not reviews:
              reviews_context = "NO USER REVIEWS AVAILABLE. Focus analysis on Product Name/Brand for Eco Score and known category issues."
         else:
-            # Format reviews for the prompt
-            reviews_context = "\n---\n".join(
-                [f"Source: {r.source}\nRating: {r.rating}/5\nDate: {r.date}\nContent: {r.text}" for r in reviews]
+            # Format reviews for the prompt (duplicates dropped, within the token budget)
+            reviews_context = budget_lines(
+                (f"Source: {r.source} | Rating: {r.rating}/5 | Date: {r.date} | Content: {r.text}" for r in reviews),
+                budget_for("skeptic.reviews"), max_line_chars=800, separator="\n---\n",
             )
         
         system_prompt = """You are 'The Skeptic', a fair and balanced product analyst.
@@ -121,6 +203,11 @@ Score 0.8+ for B Corps, Net Zero verification, or clearly eco-conscious products
 Score 0.3 or below for disposable/harmful products or unknowns with bad reputation.
 Provide a brief eco_notes explanation, CITIING textual evidence if available.
 
+REVIEW AUTHENTICITY & PRICING:
+- fake_review_likelihood: "Low/Medium/High" + brief explanation (only High if clear evidence).
+- price_integrity: fair assessment of pricing. Price variations between retailers are normal market behavior.
+{price_section}
+
 BE FAIR. Most products deserve a trust score of 6-8 unless there are clear problems.
 Output the result in the specified JSON format.
 """
@@ -143,42 +230,116 @@ Do NOT claim any company has specific certifications unless that info was provid
         
         system_prompt = system_prompt.replace("{eco_section}", eco_section)
 
+        if price_context:
+            price_section = f"CURRENT OFFERS:\n{price_context}"
+        else:
+            price_section = "No current offers were found; say so in price_integrity."
+        system_prompt = system_prompt.replace("{price_section}", price_section)
+
         prompt = ChatPromptTemplate.from_messages([
             ("system", system_prompt),
             ("human", "Here are the collected reviews for '{product_name}':\n\n{reviews_context}\n\n{format_instructions}")
         ])
 
         chain = prompt | self.llm | self.parser
-
-        try:
-            logger.info(f"Analyzing {len(reviews)} reviews for {product_name}...")
-            result = chain.invoke({
-                "product_name": product_name,
-                "reviews_context": reviews_context,
-                "format_instructions": self.parser.get_format_instructions()
-            })
-            return result
-        except Exception as e:
-            logger.error(f"Skeptic Agent Analysis Failed: {e}")
-            # Fallback for robustness
-            return ReviewSentiment(
-                summary="Error occurred during AI analysis of reviews.",
-                trust_score=0.0,
-                sentiment_score=0.0,
-                red_flags=[f"System Error: {str(e)}"],
-                msg="Analysis failed",
-                pros=[],
-                cons=[],
-                verdict="Error"
-            )
+        inputs = {
+            "product_name": product_name,
+            "reviews_context": reviews_context,
+            "format_instructions": self.parser.get_format_instructions()
+        }
+        return chain, inputs
 
     def batch_analyze_alternatives(self, candidates: List[dict], eco_context: str = "") -> List[ReviewSentiment]:
         """
         Analyzes multiple candidates in a single LLM call for speed.
+        Only products without a memoized assessment (agent/sentiment_memo.py) are sent.
         """
         if not candidates:
             return []
-            
+        memoized = self.memoized_alternatives(candidates)
+        unseen = self._unseen(candidates, memoized)
+        fresh = {}
+        if unseen:
+            chain, inputs = self._batch_chain(unseen, eco_context)
+            try:
+                 fresh = self._pair(unseen, chain.invoke(inputs).assessments)
+            except Exception as e:
+                 logger.error(f"Batch Analysis Failed: {e}")
+            sentiment_memo.put_many({n: r.model_dump() for n, r in fresh.items()}, self.memo_version, "alternative")
+        return self._merge(candidates, memoized, fresh)
+
+    async def abatch_analyze_alternatives(self, candidates: List[dict], eco_context: str = "") -> List[ReviewSentiment]:
+        """Async variant of batch_analyze_alternatives."""
+        if not candidates:
+            return []
+        memoized = await asyncio.to_thread(self.memoized_alternatives, candidates)
+        unseen = self._unseen(candidates, memoized)
+        fresh = {}
+        if unseen:
+            chain, inputs = self._batch_chain(unseen, eco_context)
+            prompt, batch_parser = chain.first, chain.last
+            try:
+                 text = await acached_invoke(self.llm, prompt.format_messages(**inputs), "skeptic.batch_alternatives")
+                 fresh = self._pair(unseen, batch_parser.parse(text).assessments)
+            except Exception as e:
+                 logger.error(f"Batch Analysis Failed: {e}")
+            await asyncio.to_thread(sentiment_memo.put_many, {n: r.model_dump() for n, r in fresh.items()},
+                                    self.memo_version, "alternative")
+        return self._merge(candidates, memoized, fresh)
+
+    def memoized_alternatives(self, candidates: List[dict]) -> Dict[str, ReviewSentiment]:
+        """Memoized batch assessments for the candidates that have one, by candidate name."""
+        names = [c.get('name', 'Unknown') for c in candidates]
+        memoized = sentiment_memo.get_many(names, self.memo_version, "alternative")
+        return {name: ReviewSentiment(**result) for name, result in memoized.items()}
+
+    @staticmethod
+    def _unseen(candidates: List[dict], memoized: Dict[str, ReviewSentiment]) -> List[dict]:
+        unseen, names = [], set()
+        for c in candidates:
+            name = c.get('name', 'Unknown')
+            if name not in memoized and name not in names:
+                names.add(name)
+                unseen.append(c)
+        if len(unseen) < len(candidates):
+            print(f"   [Skeptic] ♻️ {len(candidates) - len(unseen)}/{len(candidates)} alternatives from memo")
+        return unseen
+
+    @staticmethod
+    def _pair(candidates: List[dict], assessments: List[ReviewSentiment]) -> Dict[str, ReviewSentiment]:
+        """
+        Assessments by product name. They come back in prompt order, so they
+        can only be matched when there is exactly one per product; otherwise
+        none is used (or memoized) and the products get neutral defaults.
+        """
+        if len(assessments) != len(candidates):
+            logger.warning(f"Batch analysis returned {len(assessments)} assessments for {len(candidates)} products")
+            return {}
+        return {c.get('name', 'Unknown'): a for c, a in zip(candidates, assessments)}
+
+    def _merge(self, candidates: List[dict], memoized: Dict[str, ReviewSentiment],
+               fresh: Dict[str, ReviewSentiment]) -> List[ReviewSentiment]:
+        neutral = self._batch_fallback(candidates)
+        results = []
+        for i, c in enumerate(candidates):
+            name = c.get('name', 'Unknown')
+            results.append(fresh.get(name) or memoized.get(name) or neutral[i])
+        return results
+
+    @staticmethod
+    def _batch_fallback(candidates: List[dict]) -> List[ReviewSentiment]:
+        # Fallback: Basic defaults
+        return [
+            ReviewSentiment(
+                summary="Analysis fallback used.",
+                trust_score=5.0,
+                sentiment_score=0.0,
+                verdict="Neutral"
+            ) for _ in candidates
+        ]
+
+    def _batch_chain(self, candidates: List[dict], eco_context: str = ""):
+        """Builds the batch alternatives chain and its inputs."""
         candidate_names = [c.get('name', 'Unknown') for c in candidates]
         print(f"   [Skeptic] 🚀 Batch Analyzing {len(candidate_names)} candidates...")
         
@@ -209,26 +370,37 @@ IMPORTANT:
         
         batch_parser = PydanticOutputParser(pydantic_object=BatchReviewSentiment)
         chain = prompt | self.llm | batch_parser
-        
-        try:
-             result = chain.invoke({"format_instructions": batch_parser.get_format_instructions()})
-             return result.assessments
-        except Exception as e:
-             logger.error(f"Batch Analysis Failed: {e}")
-             # Fallback: Basic defaults
-             return [
-                 ReviewSentiment(
-                     summary="Analysis fallback used.",
-                     trust_score=5.0,
-                     sentiment_score=0.0,
-                     verdict="Neutral"
-                 ) for _ in candidates
-             ]
+        return chain, {"format_instructions": batch_parser.get_format_instructions()}
 
     def evaluate_candidates_for_veto(self, candidates: List[dict], user_prefs: dict, loop_count: int) -> VetoDecision:
         """
         State-Aware Veto Logic ("The Gatekeeper")
         """
+        forced = self._forced_veto_decision(loop_count)
+        if forced:
+            return forced
+        chain = self._veto_chain(candidates, user_prefs, loop_count)
+        try:
+             return chain.invoke({})
+        except Exception as e:
+             logger.error(f"Veto Analysis Failed: {e}")
+             return VetoDecision(decision="proceed", reason="Error in Veto Logic", market_warning=None)
+
+    async def aevaluate_candidates_for_veto(self, candidates: List[dict], user_prefs: dict, loop_count: int) -> VetoDecision:
+        """Async variant of evaluate_candidates_for_veto."""
+        forced = self._forced_veto_decision(loop_count)
+        if forced:
+            return forced
+        chain = self._veto_chain(candidates, user_prefs, loop_count)
+        try:
+             with span("llm.skeptic.veto", kind="llm", model=self.model_name):
+                 return await chain.ainvoke({})
+        except Exception as e:
+             logger.error(f"Veto Analysis Failed: {e}")
+             return VetoDecision(decision="proceed", reason="Error in Veto Logic", market_warning=None)
+
+    @staticmethod
+    def _forced_veto_decision(loop_count: int) -> Optional[VetoDecision]:
         # OPTIMIZATION: If we are on Loop 2 (Final Attempt), FORCE PROCEED without LLM call.
         # This saves ~1.5s latency and prevents infinite loops.
         if loop_count >= 1: # "1" is the second try (0-indexed). Max 2 tries means 0, 1.
@@ -238,7 +410,9 @@ IMPORTANT:
                  reason="Max search attempts reached. Proceeding with best available options.",
                  market_warning="Results may be approximate due to limited market data."
              )
-        
+        return None
+
+    def _veto_chain(self, candidates: List[dict], user_prefs: dict, loop_count: int):
         candidates_context = "\n".join([
             f"- {c.get('name')} (Price: {c.get('price_text')})" for c in candidates
         ])
@@ -273,6 +447,8 @@ QUERY MUTATION:
 If you VETO, you MUST provide a 'better_search_query'.
 - If the issue was "Generic Junk", append "reddit", "best", or specific reputable brands.
 - Example: "Wireless earbuds" -> "Best budget wireless earbuds under $50 reddit"
+If you VETO, also list in 'rejected_candidates' the exact names of the candidates that are not good enough.
+Acceptable candidates are kept and merged with the new search results.
 Output JSON adhering to VetoDecision schema.
 """
         prompt = ChatPromptTemplate.from_messages([
@@ -281,13 +457,7 @@ Output JSON adhering to VetoDecision schema.
         ])
         
         parser = PydanticOutputParser(pydantic_object=VetoDecision)
-        chain = prompt | self.llm | parser
-        
-        try:
-             return chain.invoke({})
-        except Exception as e:
-             logger.error(f"Veto Analysis Failed: {e}")
-             return VetoDecision(decision="proceed", reason="Error in Veto Logic", market_warning=None)
+        return prompt | self.llm | parser
 
 log_file = "/app/debug_output.txt"
 def log_debug(message):
@@ -299,11 +469,33 @@ def log_debug(message):
 
 
 
+_agents: Dict[str, SkepticAgent] = {}
+
+
+def get_skeptic_agent(model_name: Optional[str] = None) -> SkepticAgent:
+    """One SkepticAgent (prompt parsers + shared LLM client) per model, reused across runs."""
+    model_name = model_name or settings.MODEL_REASONING
+    agent = _agents.get(model_name)
+    if agent is None:
+        agent = _agents[model_name] = SkepticAgent(model_name=model_name)
+    return agent
+
+
 def check_veto_status(candidates: List[dict], user_prefs: dict, loop_count: int) -> dict:
-     agent = SkepticAgent()
+     agent = get_skeptic_agent()
      try:
          decision = agent.evaluate_candidates_for_veto(candidates, user_prefs, loop_count)
          return decision.model_dump()
      except Exception as e:
          logger.error(f"Check Veto Status Failed: {e}")
          return {"decision": "proceed", "reason": "Error"}
+
+
+async def acheck_veto_status(candidates: List[dict], user_prefs: dict, loop_count: int) -> dict:
+     agent = get_skeptic_agent()
+     try:
+         decision = await agent.aevaluate_candidates_for_veto(candidates, user_prefs, loop_count)
+         return decision.model_dump()
+     except Exception as e:
+         logger.error(f"Check Veto Status Failed: {e}")
+         return {"decision": "proceed", "reason": "Error"}
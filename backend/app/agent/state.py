@@ -1,4 +1,5 @@
 from typing import TypedDict, List, Optional, Any, Annotated
+import operator
 
 class AgentState(TypedDict):
     """
@@ -7,7 +8,7 @@ class AgentState(TypedDict):
     """
     # Initial Inputs
     user_query: str
-    image_base64: str
+    image_base64: str  # Blob reference (blob:sha256:...) or legacy inline base64, see blob_store.py
     user_preferences: dict  # e.g. {'price': 0.8, 'quality': 0.9}
     user_id: Optional[str] # Auth0 User ID or Internal ID
 
@@ -25,7 +26,7 @@ class AgentState(TypedDict):
     research_data: Optional[dict]
     # Structure: {
     #   'search_results': list, 
-    #   'reviews': list,
+    #   'reviews': list | blob ref (resolve_json),
     #   'competitor_prices': list
     # }
 
@@ -33,7 +34,7 @@ class AgentState(TypedDict):
     market_scout_data: Optional[dict]
     # Structure: {
     #    'strategy': str,
-    #    'raw_search_results': list
+    #    'raw_search_results': list | blob ref (resolve_json)
     # }
 
     # Node 3: Skeptic (Critique)
@@ -61,6 +62,7 @@ class AgentState(TypedDict):
     skeptic_loop_count: int = 0
     skeptic_decision: Optional[str] = "proceed" # 'veto' or 'proceed'
     skeptic_feedback_query: Optional[str] = None
+    skeptic_rejected_candidates: Optional[List[str]] = None # Names dropped on veto; the rest survive the re-scout (empty = all dropped)
     market_warning: Optional[str] = None
 
     # Node 6: Chat & Router
@@ -74,9 +76,18 @@ class AgentState(TypedDict):
     # Control Flags for Two-Stage Pipeline
     detect_only: bool = False # If True, stop after Vision Node
     skip_vision: bool = False # If True, skip Vision Node (used for Deep Analysis stage)
+    eager_identify: bool = False # With detect_only: Lens-identify all detected boxes in the background
 
     # Node 5: Response (The Speaker) - Final Output
     final_recommendation: Optional[dict]
     
+    # Per-request identity (a thread spans many requests); keys in-process memos such as review_memo.py
+    # and is the trace id of the request's spans (timing.py)
+    request_id: Optional[str]
+
+    # Latency Budget (see budget.py)
+    deadline: Optional[float] # Epoch seconds by which the response must be out (REQUEST_SLO_SECONDS)
+    degradations: Annotated[List[dict], operator.add] # {node, skipped, reason, deadline} appended by nodes that cut corners
+
     # Performance Tracking
     node_timings: Annotated[dict, lambda a, b: {**(a or {}), **b}] # {node_name: time_seconds} for total runtime calculation
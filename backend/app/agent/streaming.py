@@ -0,0 +1,226 @@
+"""
+Server-Sent Events streaming for the agent graph.
+
+Runs the compiled graph with `astream(stream_mode=["updates", "custom"])`
+and turns each node's state update into a small, UI-ready event as soon as
+that node finishes, instead of waiting for response_node:
+
+    router_node        -> intent
+    vision_node        -> identified_product
+    research_node      -> main_price
+    market_scout_node  -> alternatives
+    veto_node          -> refining        (only when the skeptic vetoes)
+    analysis_node      -> scores
+    chat_node          -> chat_response   (full reply)
+    response_node      -> summary
+                          final           (full final_recommendation)
+                          done            (carries request_id; trace at /agent/trace/{request_id})
+
+Nodes also emit events while they run ("custom" mode, see `emit`):
+
+    fields  the response payload's structured fields (scores, price, sentiment,
+            alternatives) as soon as they are final, before the summary is written
+    token   {"field": "summary" | "chat_response", "delta": "..."}: the summary
+            and chat replies token by token, as the LLM produces them (`astream_text`)
+    token_reset  {"field": ...}: the stream for that field failed or timed out
+            part-way; discard the tokens received so far. The text that
+            replaces them (e.g. the template summary) arrives in the node's
+            regular event and in `final`, which always overwrite streamed text
+
+Outside a streamed run (ainvoke) `emit` is a no-op, so the nodes behave the
+same for every endpoint.
+"""
+from typing import Dict, Any, AsyncIterator, Optional
+import json
+import time
+
+from langchain_core.output_parsers import StrOutputParser
+
+_to_text = StrOutputParser()
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Encodes one SSE frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def emit(event: str, data: Any):
+    """Sends an event to stream_agent_events from inside a node (no-op when the graph is not streamed)."""
+    from langgraph.config import get_stream_writer
+    try:
+        writer = get_stream_writer()
+    except Exception:  # Not running inside the graph
+        return
+    writer({"event": event, "data": data})
+
+
+async def astream_text(llm, prompt: Any, field: str) -> str:
+    """
+    Runs `llm` in streaming mode, emitting each chunk as a `token` event for
+    `field`; returns the full text. If the stream fails or is cancelled (e.g.
+    by asyncio.wait_for) after tokens went out, emits `token_reset` so
+    clients drop the partial text.
+    """
+    parts = []
+    try:
+        async for chunk in llm.astream(prompt):
+            text = _to_text.invoke(chunk)
+            if text:
+                parts.append(text)
+                emit("token", {"field": field, "delta": text})
+    except BaseException:
+        if parts:
+            emit("token_reset", {"field": field})
+        raise
+    return "".join(parts)
+
+
+def _identified_product(update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    product_query = update.get("product_query") or {}
+    if not product_query or product_query.get("error"):
+        return None
+    return {
+        "name": product_query.get("canonical_name"),
+        "confidence": product_query.get("lens_confidence"),
+        "source": product_query.get("lens_source") or product_query.get("source"),
+        "detected_objects": product_query.get("detected_objects", []),
+        "bounding_box": update.get("bounding_box"),
+    }
+
+
+def _main_price(update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    offers = (update.get("research_data") or {}).get("competitor_prices") or []
+    if not offers:
+        return None
+    best = offers[0]
+    price = best.get("price_cents", 0) / 100.0 if best.get("price_cents") else float(best.get("price") or 0)
+    currency = best.get("currency") or "CAD"
+    return {
+        "price": price,
+        "price_text": f"${price:.2f} {currency}" if price > 0 else "Check Price",
+        "vendor": best.get("vendor"),
+        "url": best.get("url"),
+        "image_url": best.get("thumbnail"),
+        "offer_count": len(offers),
+    }
+
+
+def _alternatives(update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    candidates = (update.get("market_scout_data") or {}).get("candidates")
+    if candidates is None:
+        return None
+    return {
+        "alternatives": [
+            {
+                "name": c.get("name"),
+                "reason": c.get("reason"),
+                "price_text": c.get("price_text"),
+                "image": c.get("image_url"),
+                "link": c.get("purchase_link"),
+            }
+            for c in candidates
+        ]
+    }
+
+
+def _scores(update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    analysis = update.get("analysis_object") or {}
+    if not analysis:
+        return None
+    return {
+        "match_score": analysis.get("match_score"),
+        "recommended_product": analysis.get("recommended_product"),
+        "scoring_breakdown": analysis.get("scoring_breakdown"),
+        "price_analysis": analysis.get("price_analysis"),
+        "active_product": analysis.get("active_product"),
+        "alternatives": analysis.get("alternatives", []),
+    }
+
+
+def events_for_update(node: str, update: Dict[str, Any]) -> list:
+    """Maps one node's state update to zero or more (event, data) pairs."""
+    if not isinstance(update, dict):
+        return []
+
+    events = []
+    if node == "router_node":
+        if update.get("router_decision"):
+            events.append(("intent", {"intent": update["router_decision"]}))
+    elif node == "vision_node":
+        payload = _identified_product(update)
+        if payload:
+            events.append(("identified_product", payload))
+    elif node == "research_node":
+        payload = _main_price(update)
+        if payload:
+            events.append(("main_price", payload))
+    elif node == "market_scout_node":
+        payload = _alternatives(update)
+        if payload:
+            events.append(("alternatives", payload))
+    elif node == "veto_node":
+        if update.get("skeptic_decision") == "veto":
+            events.append(("refining", {
+                "reason": "Initial results looked weak, refining the search.",
+                "query": update.get("skeptic_feedback_query"),
+            }))
+    elif node == "analysis_node":
+        payload = _scores(update)
+        if payload:
+            events.append(("scores", payload))
+    elif node == "chat_node":
+        reply = (update.get("final_recommendation") or {}).get("chat_response")
+        if reply:
+            events.append(("chat_response", {"chat_response": reply}))
+    elif node == "response_node":
+        final = update.get("final_recommendation") or {}
+        if final:
+            events.append(("summary", {"summary": final.get("summary"), "outcome": final.get("outcome")}))
+            events.append(("final", final))
+    return events
+
+
+async def stream_agent_events(initial_state: Dict[str, Any], config: Dict[str, Any],
+                              done_data: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """
+    Runs the agent graph and yields SSE frames as nodes complete.
+    Always ends with a `done` (or `error`) event; `done_data` is merged into it.
+    """
+    from app.agent.graph import agent_app
+    from app.agent.timing import schedule_export
+    from app.core import metrics
+
+    start = time.time()
+    sent_final = False
+    # Node spans join this trace via state['request_id'] (no root span across yields)
+    request_id = initial_state.get("request_id")
+    try:
+        with metrics.in_flight("stream"):
+            async for mode, chunk in agent_app.astream(initial_state, config=config, stream_mode=["updates", "custom"]):
+                if mode == "custom":
+                    yield format_sse(chunk.get("event", "custom"), chunk.get("data"))
+                    continue
+                for node, update in chunk.items():
+                    for event, data in events_for_update(node, update):
+                        if event == "final":
+                            sent_final = True
+                        yield format_sse(event, data)
+    except Exception as e:
+        print(f"[Stream] Agent workflow failed: {e}")
+        if request_id:
+            schedule_export(request_id)
+        yield format_sse("error", {"detail": f"Agent workflow failed: {str(e)}", "request_id": request_id})
+        return
+
+    if not sent_final:
+        # Graph ended without response_node (e.g. detect_only); hand back what we have
+        try:
+            snapshot = (await agent_app.aget_state(config)).values or {}
+        except Exception:
+            snapshot = {}
+        if snapshot.get("final_recommendation"):
+            yield format_sse("final", snapshot["final_recommendation"])
+
+    if request_id:
+        schedule_export(request_id)
+    yield format_sse("done", {**(done_data or {}), "request_id": request_id, "elapsed_s": round(time.time() - start, 2)})
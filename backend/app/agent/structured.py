@@ -0,0 +1,186 @@
+"""
+Structured (JSON) LLM output.
+
+Vision, the scout, the response node, the chat node's preference extraction
+and /chat-analyze's target location each asked for JSON in the prompt, cut
+the reply at ``` fences and called json.loads; anything else (a sentence
+after the JSON, single quotes, an array truncated by max_output_tokens)
+meant a degraded result or a repeated step.
+
+`ainvoke_json(llm, prompt, call_site, schema)` instead:
+
+1. requests JSON mode from Gemini (response_mime_type=application/json),
+   plus the schema itself (response_json_schema) with `strict=True`, for
+   the small fixed shapes;
+2. parses the reply, repairing common defects locally rather than asking
+   again: code fences, text around the JSON, trailing commas, Python-style
+   quotes/literals, and unterminated strings/arrays/objects (the incomplete
+   last element is dropped);
+3. validates it against the pydantic model (schemas/llm_outputs.py) and
+   returns plain data with only the keys the model produced.
+
+Outcomes are counted per call site in llm_structured_output_total{result}
+(ok, repaired, failed). A reply that still cannot be used raises
+StructuredOutputError, and the call site keeps its existing fallback.
+"""
+from app.agent.llm_cache import acached_invoke
+from app.agent.timing import span
+from app.core import metrics
+from typing import Any, Callable, List, Optional, Tuple
+import ast
+import json
+import logging
+import re
+
+from langchain_core.output_parsers import StrOutputParser
+from pydantic import TypeAdapter, ValidationError
+
+logger = logging.getLogger(__name__)
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.S)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_CLOSERS = {"{": "}", "[": "]"}
+_to_text = StrOutputParser()
+_adapters: dict = {}
+
+
+class StructuredOutputError(ValueError):
+    """The LLM reply is not usable JSON for the expected schema, even after repair."""
+
+
+def _adapter(schema: Any) -> TypeAdapter:
+    adapter = _adapters.get(schema)
+    if adapter is None:
+        adapter = _adapters[schema] = TypeAdapter(schema)
+    return adapter
+
+
+def _strip_fences(text: str) -> str:
+    match = _FENCE.search(text)
+    return match.group(1) if match else text
+
+
+def _from_first_bracket(text: str) -> str:
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return text[min(starts):] if starts else text
+
+
+def _python_literal(text: str) -> Any:
+    """Single-quoted / Python-literal JSON ({'a': True, 'b': None})."""
+    text = re.sub(r"\btrue\b", "True", re.sub(r"\bfalse\b", "False", re.sub(r"\bnull\b", "None", text)))
+    return ast.literal_eval(text)
+
+
+def _close_truncated(text: str) -> List[str]:
+    """
+    Candidates for a reply cut off mid-structure: cut back to the last
+    complete element (dropping a half-written array element as a whole),
+    else just close the open string and brackets.
+    """
+    stack: List[str] = []
+    in_string = escaped = False
+    last_comma: Optional[Tuple[int, List[str]]] = None
+    last_array_comma: Optional[Tuple[int, List[str]]] = None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch in "}]" and stack:
+            stack.pop()
+        elif ch == "," and stack:
+            last_comma = (i, list(stack))
+            if stack[-1] == "]":
+                last_array_comma = last_comma
+    if not stack:
+        return []
+    cuts = [last_comma] if last_comma else []
+    if last_array_comma and last_array_comma is not last_comma:
+        array_stack = last_array_comma[1]
+        if len(stack) > len(array_stack) and stack[:len(array_stack)] == array_stack:
+            cuts.insert(0, last_array_comma)  # Still inside that array's last element
+    candidates = [text[:pos] + "".join(reversed(open_at_comma)) for pos, open_at_comma in cuts]
+    candidates.append(text + ('"' if in_string else "") + "".join(reversed(stack)))
+    return candidates
+
+
+def repair_json(text: str) -> Tuple[Any, bool]:
+    """(parsed value, repaired?) for an LLM reply; raises StructuredOutputError if nothing works."""
+    stripped = (text or "").strip()
+    try:
+        return json.loads(stripped), False
+    except ValueError:
+        pass
+
+    body = _from_first_bracket(_strip_fences(stripped)).strip()
+    decoder = json.JSONDecoder()
+    attempts: List[Callable[[str], Any]] = [
+        lambda s: decoder.raw_decode(s)[0],  # Ignores text after the JSON
+        lambda s: decoder.raw_decode(_TRAILING_COMMA.sub(r"\1", s))[0],
+        _python_literal,
+    ]
+    for attempt in attempts:
+        try:
+            return attempt(body), True
+        except (ValueError, SyntaxError):
+            continue
+    for candidate in _close_truncated(_TRAILING_COMMA.sub(r"\1", body)):
+        try:
+            return json.loads(_TRAILING_COMMA.sub(r"\1", candidate)), True
+        except ValueError:
+            continue
+    raise StructuredOutputError(f"Unparseable JSON ({len(stripped)} chars): {stripped[:120]!r}")
+
+
+def parse_structured(text: str, call_site: str, schema: Any = None) -> Any:
+    """Parses, repairs and validates one reply; records the outcome for `call_site`."""
+    try:
+        value, repaired = repair_json(text)
+        if schema is not None:
+            adapter = _adapter(schema)
+            value = adapter.dump_python(adapter.validate_python(value), exclude_unset=True)
+    except (StructuredOutputError, ValidationError) as e:
+        metrics.STRUCTURED_OUTPUT.labels(call_site=call_site, result="failed").inc()
+        logger.warning(f"Structured output failed for {call_site}: {e}")
+        raise StructuredOutputError(str(e)) from e
+    result = "repaired" if repaired else "ok"
+    metrics.STRUCTURED_OUTPUT.labels(call_site=call_site, result=result).inc()
+    if repaired:
+        print(f"   [Structured] 🔧 Repaired {call_site} output locally")
+    return value
+
+
+def json_mode_kwargs(schema: Any = None, strict: bool = False) -> dict:
+    """Per-call Gemini generation settings for JSON output (optionally schema-constrained)."""
+    kwargs = {"response_mime_type": "application/json"}
+    if strict and schema is not None:
+        kwargs["response_json_schema"] = _adapter(schema).json_schema()
+    return kwargs
+
+
+async def ainvoke_json(llm, prompt: Any, call_site: str, schema: Any = None,
+                       strict: bool = False, cache: bool = False) -> Any:
+    """
+    JSON-mode call of `llm`, parsed and validated against `schema` (a
+    pydantic model or e.g. List[Model]). `cache=True` goes through the LLM
+    response cache (agent/llm_cache.py); only replies that parse are stored.
+    """
+    kwargs = json_mode_kwargs(schema, strict)
+
+    def parse(text: str) -> Any:
+        return parse_structured(text, call_site, schema)
+
+    if cache:
+        return await acached_invoke(llm, prompt, call_site, parse=parse, **kwargs)
+
+    with span(f"llm.{call_site}", kind="llm", model=getattr(llm, "model", "unknown")):
+        response = await llm.ainvoke(prompt, **kwargs)
+    return parse(_to_text.invoke(response))
@@ -1,46 +1,498 @@
 """
-Timing utility for agent workflow profiling.
-Wraps node functions to log execution time.
+Timing and span tracing for the agent workflow.
+
+Every graph node (timed_node), provider call, cache access and LLM call
+(traced / span) records a Span with its parent, so one request yields a
+tree of spans:
+
+    request /analyze-image
+    ├── node vision
+    │   └── provider lens.identify
+    │       └── provider imgbb.upload
+    ├── node research                 ┐ parallel
+    │   ├── provider tavily.reviews   │
+    │   └── provider serpapi.shopping │
+    ├── node market_scout             ┘
+    │   └── llm scout.extract
+    ...
+
+The trace id is the request's `request_id` (AgentState), the current span
+travels in a ContextVar, so asyncio tasks (gather) and asyncio.to_thread
+calls inherit their parent automatically. Finished traces are kept in a
+bounded in-process store, written as OTLP/JSON under TRACE_EXPORT_DIR when
+the request span ends (shared by all workers) and optionally POSTed to an
+OTLP/HTTP collector (TRACE_OTLP_ENDPOINT).
+
+`critical_path` walks the node spans back from the last one to finish, so
+parallel branches (research || scout, critique || analysis) count once.
+Every span end also feeds the Prometheus histograms in core/metrics.py.
 """
-import time
+from app.core import metrics
+from app.core.config import settings
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import wraps
-from typing import Callable, Any
+from pathlib import Path
+from typing import Callable, Any, Dict, List, Optional
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
 
+logger = logging.getLogger(__name__)
 
-def timed_node(node_name: str):
-    """Decorator to time and log node execution."""
+SERVICE_NAME = "shopping-suggester-backend"
+
+# OTLP SpanKind: INTERNAL=1, SERVER=2, CLIENT=3
+_OTLP_KIND = {"request": 2, "provider": 3, "llm": 3, "cache": 3}
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("agent_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, kind: str, trace_id: Optional[str], parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes)
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_s(self) -> float:
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_s * 1000, 1),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class TraceStore:
+    """Finished spans per trace id, bounded to the most recent traces."""
+
+    def __init__(self, max_traces: int = 500):
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                if len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append(span)
+
+    def get(self, trace_id: str) -> List[Span]:
+        with self._lock:
+            return list(self._traces.get(trace_id, []))
+
+
+trace_store = TraceStore()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", trace_id: Optional[str] = None, **attributes):
+    """
+    Records a span around the block. Parent and trace come from the current
+    context; outside a traced request (no trace id) nothing is recorded.
+    """
+    parent = _current_span.get()
+    trace_id = trace_id or (parent.trace_id if parent else None)
+    parent_id = parent.span_id if parent and parent.trace_id == trace_id else None
+    current = Span(name, kind, trace_id, parent_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {str(e)[:200]}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        if current.trace_id and settings.TRACING_ENABLED:
+            trace_store.add(current)
+        _on_span_end(current)
+
+
+def _on_span_end(current: Span):
+    """Feeds the Prometheus latency histograms (core/metrics.py), traced request or not."""
+    try:
+        metrics.observe_span(current)
+    except Exception as e:
+        logger.warning(f"Span metrics failed for {current.name}: {e}")
+
+
+@contextmanager
+def trace_request(request_id: str, name: str, **attributes):
+    """
+    Root span of one request; exports the trace when it ends (also when the
+    request fails). Pass `user_id` so GET /trace only serves it to that user.
+    """
+    try:
+        with metrics.in_flight(name), span(name, kind="request", trace_id=request_id, **attributes) as root:
+            try:
+                yield root
+            finally:
+                root.end_ns = time.time_ns()
+    finally:
+        schedule_export(request_id)
+
+
+def traced(name: str, kind: str = "internal", **attributes):
+    """Decorator: records a span around every call (sync or async)."""
     def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, kind, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
         @wraps(func)
-        def wrapper(*args, **kwargs) -> Any:
-            start = time.time()
+        def wrapper(*args, **kwargs):
+            with span(name, kind, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_node(node_name: str):
+    """
+    Decorator to time and trace a graph node. The node span joins the
+    request trace (state['request_id']) and its duration is written to
+    node_timings[node_name] unless the node reported its own.
+    """
+    def decorator(func: Callable) -> Callable:
+        def _start(state) -> Optional[str]:
             print(f"\n⏱️  [{node_name}] Starting...")
-            
-            try:
-                result = func(*args, **kwargs)
-                elapsed = time.time() - start
-                print(f"✅ [{node_name}] Completed in {elapsed:.2f}s")
-                return result
-            except Exception as e:
-                elapsed = time.time() - start
-                print(f"❌ [{node_name}] Failed after {elapsed:.2f}s: {str(e)[:100]}")
-                raise
+            if current_trace_id():
+                return None
+            return (state or {}).get("request_id") if isinstance(state, dict) else None
+
+        def _finish(result, elapsed: float):
+            print(f"✅ [{node_name}] Completed in {elapsed:.2f}s")
+            if isinstance(result, dict):
+                # A node's own figure wins (market_scout accumulates across re-scouts)
+                timings = dict(result.get("node_timings") or {})
+                timings.setdefault(node_name, elapsed)
+                result["node_timings"] = timings
+            return result
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(state, *args, **kwargs) -> Any:
+                with span(node_name, kind="node", trace_id=_start(state)) as s:
+                    try:
+                        result = await func(state, *args, **kwargs)
+                    except Exception as e:
+                        print(f"❌ [{node_name}] Failed after {s.duration_s:.2f}s: {str(e)[:100]}")
+                        raise
+                return _finish(result, s.duration_s)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(state, *args, **kwargs) -> Any:
+            with span(node_name, kind="node", trace_id=_start(state)) as s:
+                try:
+                    result = func(state, *args, **kwargs)
+                except Exception as e:
+                    print(f"❌ [{node_name}] Failed after {s.duration_s:.2f}s: {str(e)[:100]}")
+                    raise
+            return _finish(result, s.duration_s)
         return wrapper
     return decorator
 
 
 def log_step(step_name: str):
-    """Context manager for timing sub-steps within a node."""
+    """Context manager for timing sub-steps within a node (also recorded as a span)."""
     class StepTimer:
         def __init__(self):
             self.start = None
-            
+            self._span = None
+
         def __enter__(self):
             self.start = time.time()
+            self._span = span(step_name)
+            self._span.__enter__()
             print(f"   → {step_name}...")
             return self
-            
+
         def __exit__(self, *args):
             elapsed = time.time() - self.start
+            self._span.__exit__(*args)
             print(f"   ← {step_name}: {elapsed:.2f}s")
-    
+
     return StepTimer()
+
+
+# --- Analysis ---
+
+def critical_path(spans: List[Span], kind: str = "node") -> Dict[str, Any]:
+    """
+    Longest chain of `kind` spans that determines the end-to-end time:
+    start from the span that finished last and repeatedly step to the
+    span that finished last before the current one started.
+    """
+    finished = [s for s in spans if s.kind == kind and s.end_ns]
+    if not finished:
+        return {"total_s": 0.0, "path": [], "start_ns": None}
+
+    path = []
+    current = max(finished, key=lambda s: s.end_ns)
+    while current is not None:
+        path.append(current)
+        # 1ms slack: a successor can start a hair before its predecessor's end is stamped
+        before = [s for s in finished if s.end_ns <= current.start_ns + 1_000_000 and s is not current and s not in path]
+        current = max(before, key=lambda s: s.end_ns) if before else None
+    path.reverse()
+
+    start_ns = min(s.start_ns for s in finished)
+    end_ns = max(s.end_ns for s in finished)
+    return {
+        "total_s": (end_ns - start_ns) / 1e9,
+        "path": [{"name": s.name, "duration_s": round(s.duration_s, 3)} for s in path],
+        "start_ns": start_ns,
+    }
+
+
+def waterfall(trace_id: str) -> Dict[str, Any]:
+    """Spans of a trace ordered by start, with depth and offsets for a waterfall view."""
+    spans = trace_store.get(trace_id) or _load_exported(trace_id)
+    if not spans:
+        return {}
+    by_id = {s.span_id: s for s in spans}
+    origin = min(s.start_ns for s in spans)
+
+    def depth(s: Span) -> int:
+        d = 0
+        while s.parent_id and s.parent_id in by_id and d < 32:
+            s = by_id[s.parent_id]
+            d += 1
+        return d
+
+    rows = [
+        {
+            "name": s.name,
+            "kind": s.kind,
+            "depth": depth(s),
+            "offset_ms": round((s.start_ns - origin) / 1e6, 1),
+            "duration_ms": round(s.duration_s * 1000, 1),
+            "error": s.error,
+            "attributes": s.attributes,
+        }
+        for s in sorted(spans, key=lambda s: s.start_ns)
+    ]
+    path = critical_path(spans)
+    return {
+        "trace_id": trace_id,
+        "total_ms": round((max(s.end_ns or s.start_ns for s in spans) - origin) / 1e6, 1),
+        "critical_path": path["path"],
+        "critical_path_ms": round(path["total_s"] * 1000, 1),
+        "spans": rows,
+    }
+
+
+# --- Export (OTLP/JSON) ---
+
+def _otlp_id(value: str, length: int) -> str:
+    value = (value or "").lower()
+    if len(value) == length and all(c in "0123456789abcdef" for c in value):
+        return value
+    return hashlib.sha256(value.encode()).hexdigest()[:length]
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Span]) -> Dict[str, Any]:
+    """OTLP/JSON ExportTraceServiceRequest for the given spans."""
+    otlp_spans = []
+    for s in spans:
+        otlp_span = {
+            "traceId": _otlp_id(s.trace_id, 32),
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": _OTLP_KIND.get(s.kind, 1),
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or s.start_ns),
+            "attributes": [{"key": "agent.span_kind", "value": {"stringValue": s.kind}}] + [
+                {"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items() if v is not None
+            ],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            otlp_span["parentSpanId"] = s.parent_id
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "app.agent.timing"}, "spans": otlp_spans}],
+        }]
+    }
+
+
+def _from_otlp(payload: Dict[str, Any]) -> List[Span]:
+    spans = []
+    for resource in payload.get("resourceSpans", []):
+        for scope in resource.get("scopeSpans", []):
+            for raw in scope.get("spans", []):
+                attrs = {a["key"]: next(iter(a["value"].values())) for a in raw.get("attributes", [])}
+                kind = attrs.pop("agent.span_kind", "internal")
+                s = Span(raw["name"], kind, raw["traceId"], raw.get("parentSpanId"), attrs)
+                s.span_id = raw["spanId"]
+                s.start_ns = int(raw["startTimeUnixNano"])
+                s.end_ns = int(raw["endTimeUnixNano"])
+                s.error = (raw.get("status") or {}).get("message")
+                spans.append(s)
+    return spans
+
+
+def _export_path(trace_id: str) -> Path:
+    return Path(settings.TRACE_EXPORT_DIR) / f"{_otlp_id(trace_id, 32)}.json"
+
+
+def _load_exported(trace_id: str) -> List[Span]:
+    """Traces finished in another worker are read back from TRACE_EXPORT_DIR."""
+    try:
+        with open(_export_path(trace_id), "r", encoding="utf-8") as f:
+            return _from_otlp(json.load(f))
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        logger.error(f"Failed to read exported trace {trace_id}: {e}")
+        return []
+
+
+def trace_owner(trace_id: str) -> Optional[str]:
+    """user_id on the trace's request span; None while it runs or for anonymous requests."""
+    for s in trace_store.get(trace_id) or _load_exported(trace_id):
+        if s.kind == "request" and not s.parent_id:
+            owner = s.attributes.get("user_id")
+            return str(owner) if owner is not None else None
+    return None
+
+
+def get_trace_otlp(trace_id: str) -> Optional[Dict[str, Any]]:
+    spans = trace_store.get(trace_id) or _load_exported(trace_id)
+    return to_otlp(spans) if spans else None
+
+
+def _write_export(trace_id: str, payload: Dict[str, Any]):
+    """Writes the trace file (atomic) and sweeps old ones. Blocking file I/O."""
+    try:
+        path = _export_path(trace_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f".{path.name}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp, path)
+        _maybe_sweep(path.parent)
+    except Exception as e:
+        logger.error(f"Trace export failed for {trace_id}: {e}")
+
+
+def export_trace(trace_id: str):
+    """Writes the trace as OTLP/JSON (atomic). Sync callers only; the OTLP POST needs a loop."""
+    if not settings.TRACING_ENABLED:
+        return
+    spans = trace_store.get(trace_id)
+    if spans:
+        _write_export(trace_id, to_otlp(spans))
+
+
+async def aexport_trace(trace_id: str):
+    """export_trace off the event loop, then ships the trace to the collector if configured."""
+    if not settings.TRACING_ENABLED:
+        return
+    spans = trace_store.get(trace_id)
+    if not spans:
+        return
+    payload = to_otlp(spans)
+    await asyncio.to_thread(_write_export, trace_id, payload)
+    if settings.TRACE_OTLP_ENDPOINT:
+        await _post_otlp(payload)
+
+
+_export_tasks: set = set()
+
+
+def schedule_export(trace_id: str):
+    """Exports in a background task when called on the event loop, inline otherwise."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        export_trace(trace_id)
+        return
+    task = loop.create_task(aexport_trace(trace_id))
+    _export_tasks.add(task)  # Keep a reference until it finishes
+    task.add_done_callback(_export_tasks.discard)
+
+
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+
+def _maybe_sweep(root: Path):
+    """Deletes exported traces older than TRACE_TTL_SECONDS (at most every 10 minutes)."""
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < 600 or not _sweep_lock.acquire(blocking=False):
+        return
+    try:
+        _last_sweep = now
+        cutoff = now - settings.TRACE_TTL_SECONDS
+        for path in root.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+    finally:
+        _sweep_lock.release()
+
+
+async def _post_otlp(payload: Dict[str, Any]):
+    from app.sources.http_client import get_async_client
+    try:
+        await get_async_client().post(settings.TRACE_OTLP_ENDPOINT, json=payload, timeout=5)
+    except Exception as e:
+        logger.warning(f"OTLP export failed: {e}")
@@ -1,14 +1,15 @@
 """
 On-demand product identification endpoint.
 Called when user clicks a bounding box to get specific product info via SerpAPI Lens.
+Results are cached per (image, bbox), and boxes prefetched by `identify_all`
+after detect_only are served from that cache (services/box_identify.py).
 """
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import base64
 
-from app.services.image_crop import crop_to_bounding_box
-from app.services.lens_identify import identify_product_with_lens
+from app.services.box_identify import aidentify_box
 
 router = APIRouter()
 
@@ -29,6 +30,7 @@ class IdentifyResponse(BaseModel):
     visual_matches_count: int = 0
     shopping_results_count: int = 0
     timing: Optional[Dict[str, float]] = None
+    cached: bool = False  # Served from the (image, bbox) cache / an eager identification
     error: Optional[str] = None
 
 
@@ -58,19 +60,13 @@ async def identify_object(request: IdentifyRequest):
         image_bytes = base64.b64decode(image_data)
         decode_time = time.time() - decode_start
         
-        # Crop to bounding box
-        crop_start = time.time()
-        cropped_bytes = crop_to_bounding_box(image_bytes, request.bounding_box)
-        crop_time = time.time() - crop_start
-        print(f"[Identify Endpoint] Cropped image size: {len(cropped_bytes)} bytes")
-        
-        # Call SerpAPI Lens
+        # Crop + SerpAPI Lens (cache / eager prefetch first)
         print("[Identify Endpoint] Calling Lens...")
-        result = identify_product_with_lens(cropped_bytes, "jpg")
+        result = await aidentify_box(image_bytes, request.bounding_box, timeout=60)
         print(f"[Identify Endpoint] Lens result: {result}")
         
         total_time = time.time() - start_time
-        print(f"[Identify Endpoint] Total time: {total_time:.2f}s (Decode: {decode_time:.2f}s, Crop: {crop_time:.2f}s)")
+        print(f"[Identify Endpoint] Total time: {total_time:.2f}s (Decode: {decode_time:.2f}s, cached: {result.get('cached')})")
         
         if "error" in result:
             return IdentifyResponse(
@@ -85,7 +81,8 @@ async def identify_object(request: IdentifyRequest):
             source=result.get("source"),
             link=result.get("link"),
             visual_matches_count=result.get("visual_matches_count", 0),
-            shopping_results_count=result.get("shopping_results_count", 0)
+            shopping_results_count=result.get("shopping_results_count", 0),
+            cached=result.get("cached", False)
         )
         
     except Exception as e:
@@ -1,12 +1,17 @@
 import os
 import base64
-import json
 import io
+import uuid
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from app.core.security import get_current_user
 from app.models.user import User
+from app.services.blob_store import offload_image_base64
+from app.services.job_queue import job_queue
+from app.agent import budget
+from app.agent.timing import span, trace_request, trace_owner, waterfall, get_trace_otlp
 from openai import OpenAI
 from PIL import Image
 from pillow_heif import register_heif_opener
@@ -16,6 +21,9 @@ register_heif_opener()
 
 router = APIRouter()
 
+# Disable proxy buffering so SSE frames reach the client as they are produced
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 # Lazy-loaded OpenAI client (via OpenRouter)
 _openai_client = None
 
@@ -52,6 +60,30 @@ class ImageAnalysisResponse(BaseModel):
     labels: List[dict] = []
 
 
+def _clean_base64(data: str) -> str:
+    if "base64," in data:
+        return data.split("base64,")[1]
+    return data
+
+
+def _analyze_image_state(base64_data: str, user_id: str) -> dict:
+    return {
+        "user_query": "Identify this product and find the best price and alternatives.",
+        "deadline": budget.new_deadline(),  # Latency budget (REQUEST_SLO_SECONDS)
+        "request_id": uuid.uuid4().hex,  # Per-request memos (review_memo.py) + trace id (timing.py)
+        "image_base64": offload_image_base64(base64_data),  # Blob ref; nodes resolve lazily
+        "user_preferences": {},  # Default preferences
+        "user_id": user_id,  # Authenticated User ID
+        "product_query": {},
+        "research_data": {},
+        "market_scout_data": {},
+        "risk_report": {},
+        "analysis_object": {},
+        "alternatives_analysis": [],
+        "final_recommendation": {}
+    }
+
+
 @router.post("/analyze-image")
 async def analyze_image(request: ImageAnalysisRequest, current_user: User = Depends(get_current_user)):
     """
@@ -73,19 +105,7 @@ async def analyze_image(request: ImageAnalysisRequest, current_user: User = Depe
         base64_data = base64_data.split("base64,")[1]
 
     # Initialize Agent State
-    initial_state = {
-        "user_query": "Identify this product and find the best price and alternatives.",
-        "image_base64": base64_data,
-        "user_preferences": {},  # Default preferences
-        "user_id": str(current_user.id),  # Authenticated User ID
-        "product_query": {},
-        "research_data": {},
-        "market_scout_data": {},
-        "risk_report": {},
-        "analysis_object": {},
-        "alternatives_analysis": [],
-        "final_recommendation": {}
-    }
+    initial_state = _analyze_image_state(base64_data, str(current_user.id))
 
     try:
         # Import the graph here to avoid circular dependencies at module level if any
@@ -93,7 +113,10 @@ async def analyze_image(request: ImageAnalysisRequest, current_user: User = Depe
         
         # Invoke the graph
         # This runs all nodes: Vision -> Research/Scout -> Skeptic -> Analysis -> Response
-        final_state = await agent_app.ainvoke(initial_state)
+        import uuid
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        with trace_request(initial_state["request_id"], "POST /agent/analyze-image", user_id=str(current_user.id)):
+            final_state = await agent_app.ainvoke(initial_state, config=config)
         
         result = final_state.get("final_recommendation", {})
         
@@ -115,6 +138,244 @@ async def analyze_image(request: ImageAnalysisRequest, current_user: User = Depe
         raise HTTPException(status_code=500, detail=f"Agent workflow failed: {str(e)}")
 
 
+@router.post("/analyze-image/stream")
+async def analyze_image_stream(request: ImageAnalysisRequest, current_user: User = Depends(get_current_user)):
+    """
+    Streaming variant of /analyze-image (Server-Sent Events).
+
+    Emits partial results as each node completes: identified_product (vision),
+    main_price (research), alternatives (scout), scores (analysis), then
+    summary + final (response) and done.
+    """
+    from app.agent.streaming import stream_agent_events
+    import uuid
+
+    if not request.imageBase64:
+        raise HTTPException(status_code=400, detail="No image data provided")
+
+    initial_state = _analyze_image_state(_clean_base64(request.imageBase64), str(current_user.id))
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+
+    return StreamingResponse(
+        stream_agent_events(initial_state, config),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+# ============================================================
+# BACKGROUND JOBS (services/job_queue.py)
+# ============================================================
+
+async def _run_analyze_image_job(payload: dict) -> dict:
+    """Job handler: the /analyze-image pipeline for a queued image (blob ref)."""
+    from app.agent.graph import agent_app
+
+    # The latency budget starts when a worker picks the job up, not at submit
+    initial_state = _analyze_image_state(payload["image"], payload["user_id"])
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    with trace_request(initial_state["request_id"], "job analyze_image", user_id=payload["user_id"]):
+        final_state = await agent_app.ainvoke(initial_state, config=config)
+
+    result = final_state.get("final_recommendation") or {}
+    if not result:
+        raise RuntimeError("Graph completed but returned no final_recommendation")
+    return result
+
+
+job_queue.register_handler("analyze_image", _run_analyze_image_job)
+
+
+def _get_own_job(job_id: str, current_user: User) -> dict:
+    job = job_queue.get(job_id)
+    if not job or job.get("user_id") != str(current_user.id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.pop("user_id", None)
+    return job
+
+
+@router.post("/jobs/analyze-image", status_code=202)
+async def submit_analyze_image_job(request: ImageAnalysisRequest, current_user: User = Depends(get_current_user)):
+    """
+    Queues a full /analyze-image run and returns its job id immediately.
+    Poll GET /agent/jobs/{job_id} or subscribe to /agent/jobs/{job_id}/events.
+    """
+    from app.core.config import settings
+    import asyncio
+
+    if not settings.JOB_QUEUE_ENABLED:
+        # No workers are running, so a queued job would never be picked up
+        raise HTTPException(status_code=503, detail="Background jobs are disabled; use /agent/analyze-image")
+    if not request.imageBase64:
+        raise HTTPException(status_code=400, detail="No image data provided")
+
+    # The image goes to the blob store; the job row only holds its reference
+    payload = {"image": offload_image_base64(_clean_base64(request.imageBase64)), "user_id": str(current_user.id)}
+    job_id = await asyncio.to_thread(job_queue.submit, "analyze_image", payload, str(current_user.id))
+    print(f"[Jobs] Queued analyze_image {job_id}")
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "poll_url": f"/api/v1/agent/jobs/{job_id}",
+        "events_url": f"/api/v1/agent/jobs/{job_id}/events",
+    }
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Job status; `result` holds the final recommendation once status is "succeeded"."""
+    import asyncio
+    return await asyncio.to_thread(_get_own_job, job_id, current_user)
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, current_user: User = Depends(get_current_user)):
+    """
+    SSE subscription to a job: `status` on every change, then `final` (or
+    `error`) and `done`. Finished jobs replay their stored result at once.
+    """
+    from app.agent.streaming import format_sse
+    from app.core.config import settings
+    import asyncio
+
+    job = await asyncio.to_thread(_get_own_job, job_id, current_user)
+
+    async def event_stream():
+        current = job
+        last_status = None
+        while True:
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield format_sse("status", {k: current.get(k) for k in ("job_id", "status", "attempts", "queue_position")})
+            if current["status"] == "succeeded":
+                yield format_sse("final", current["result"])
+                break
+            if current["status"] == "failed":
+                yield format_sse("error", {"detail": current.get("error") or "Job failed"})
+                break
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL_SECONDS)
+            current = await asyncio.to_thread(_get_own_job, job_id, current_user)
+        yield format_sse("done", {"job_id": job_id})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+# ============================================================
+# BATCH ANALYSIS
+# ============================================================
+
+class BatchItem(BaseModel):
+    """One batch entry: an image (base64) or a product name (skips vision)."""
+    image_base64: Optional[str] = None
+    product_name: Optional[str] = None
+
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[BatchItem]
+    max_concurrency: Optional[int] = None  # Capped at BATCH_MAX_CONCURRENCY
+
+
+def _product_name_state(product_name: str, user_id: str) -> dict:
+    return {
+        **_analyze_image_state("", user_id),
+        "user_query": f"Find the best deals for: {product_name}",
+        "product_query": {
+            "canonical_name": product_name,
+            "detected_objects": [],
+            "context": "User provided product name (batch)"
+        },
+        "skip_vision": True,
+    }
+
+
+def _batch_item_key(item: BatchItem) -> str:
+    """Identical items in one batch (same image / same product name) run once."""
+    if item.product_name:
+        return "name:" + " ".join(item.product_name.lower().split())
+    return "image:" + offload_image_base64(_clean_base64(item.image_base64 or ""))
+
+
+@router.post("/batch")
+async def analyze_batch(request: BatchAnalysisRequest, current_user: User = Depends(get_current_user)):
+    """
+    Runs N images / product names through the graph with bounded parallelism
+    and streams each item's result (SSE `item` events, in completion order)
+    as soon as it finishes, then `done` with a summary.
+
+    Duplicate items run once; sub-queries shared across items (same brand
+    stats, eco lookup, market search) are deduplicated by the provider
+    singleflight (sources/singleflight.py).
+    """
+    from app.agent.graph import agent_app
+    from app.agent.streaming import format_sse
+    from app.core.config import settings
+    import asyncio
+    import time
+
+    items = request.items
+    if not items:
+        raise HTTPException(status_code=400, detail="No items provided")
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_ITEMS} items per batch")
+    if any(not (item.product_name or item.image_base64) for item in items):
+        raise HTTPException(status_code=400, detail="Each item needs image_base64 or product_name")
+
+    user_id = str(current_user.id)
+    concurrency = max(1, min(request.max_concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY))
+
+    # Group duplicate items: key -> indices (images are stored once, in the blob store)
+    groups = {}
+    for index, item in enumerate(items):
+        groups.setdefault(_batch_item_key(item), []).append(index)
+    print(f"[Batch] {len(items)} items ({len(groups)} unique), concurrency {concurrency}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_group(key: str, indices: List[int]) -> dict:
+        item = items[indices[0]]
+        async with semaphore:
+            # State (and its latency deadline) is built when the item actually starts
+            if item.product_name:
+                initial_state = _product_name_state(item.product_name.strip(), user_id)
+            else:
+                initial_state = _analyze_image_state(key[len("image:"):], user_id)
+            config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+            try:
+                with trace_request(initial_state["request_id"], "POST /agent/batch item", user_id=user_id):
+                    final_state = await agent_app.ainvoke(initial_state, config=config)
+                result = final_state.get("final_recommendation") or {}
+                if not result:
+                    return {"indices": indices, "status": "failed", "error": "No recommendation generated"}
+                return {"indices": indices, "status": "succeeded", "result": result}
+            except Exception as e:
+                print(f"[Batch] Item {indices[0]} failed: {e}")
+                return {"indices": indices, "status": "failed", "error": str(e)[:500]}
+
+    async def event_stream():
+        start = time.time()
+        tasks = [asyncio.ensure_future(run_group(key, indices)) for key, indices in groups.items()]
+        counts = {"succeeded": 0, "failed": 0}
+        try:
+            for finished in asyncio.as_completed(tasks):
+                outcome = await finished
+                for index in outcome["indices"]:
+                    counts[outcome["status"]] += 1
+                    yield format_sse("item", {
+                        "index": index,
+                        "status": outcome["status"],
+                        "result": outcome.get("result"),
+                        "error": outcome.get("error"),
+                    })
+        finally:
+            # Client went away: stop the items still waiting for a slot
+            for task in tasks:
+                task.cancel()
+        yield format_sse("done", {**counts, "items": len(items), "unique": len(groups),
+                                  "elapsed_s": round(time.time() - start, 2)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 class RecommendationRequest(BaseModel):
     user_preferences: dict
     current_item_context: Optional[dict] = None
@@ -152,6 +413,93 @@ class ChatAnalyzeResponse(BaseModel):
     session_state: Optional[dict] = None  # Prior analysis state for follow-ups
 
 
+SESSION_STATE_KEYS = ("product_query", "market_scout_data", "research_data", "risk_report", "analysis_object")
+
+
+def _store_session_state(session_state: dict) -> dict:
+    from app.services.blob_store import blob_store
+    try:
+        return {"blob_ref": blob_store.put_json(session_state)}
+    except Exception as e:
+        print(f"[ChatAnalyze] Session blob write failed, returning inline state: {e}")
+        return session_state
+
+
+def _load_session_state(session_state: dict) -> dict:
+    """
+    Accepts either {"blob_ref": ...} or a legacy inline session_state. If the
+    blob has expired, nothing is restored and the thread's checkpoint is used.
+    """
+    from app.services.blob_store import resolve_json
+    if not session_state:
+        return {}
+    if "blob_ref" in session_state:
+        restored = resolve_json(session_state["blob_ref"])
+        if not isinstance(restored, dict):
+            print("[ChatFollowup] Session blob missing, relying on checkpointed thread state")
+            return {}
+        session_state = restored
+    return {key: session_state.get(key) or {} for key in SESSION_STATE_KEYS}
+
+
+def _chat_analyze_state(product_name: str, base64_data: str, bbox, lens_result: dict, current_user: User,
+                        deadline: float, request_id: str) -> dict:
+    return {
+        "user_query": f"Find the best deals for: {product_name}",
+        "deadline": deadline,  # Set when the request arrived, so target location + Lens count too
+        "request_id": request_id,  # Also the trace id (target location + Lens spans join it)
+        "image_base64": offload_image_base64(base64_data),
+        "user_preferences": {},
+        "user_id": str(current_user.id), # Authenticated User ID
+        "product_query": {
+            "canonical_name": product_name,
+            "detected_objects": [{
+                "name": product_name,
+                "bounding_box": bbox,
+                "lens_result": lens_result
+            }],
+            "context": "User identified via chat + Lens"
+        },
+        "skip_vision": True  # Skip vision node, we already have product
+    }
+
+
+async def _locate_target_object(user_query: str, base64_data: str):
+    """Asks Gemini Vision where the object the user is asking about is. Returns (name, bbox)."""
+    from app.agent.llm import get_llm, FAST_MODEL
+    from app.agent.structured import ainvoke_json
+    from app.schemas.llm_outputs import TargetLocation
+    from langchain_core.messages import HumanMessage
+
+    llm = get_llm(FAST_MODEL, 0)
+    
+    system_prompt = """You are a visual shopping assistant. The user is asking about a specific item in an image.
+
+Task:
+1. Identify the object the user is asking about
+2. Return its bounding box location
+
+Return JSON with:
+- "target_object": descriptive name of the object
+- "bounding_box": [y_min, x_min, y_max, x_max] as values 0-1000 (normalized)
+- "confidence": 0.0-1.0
+
+Return ONLY valid JSON, no markdown."""
+
+    message = HumanMessage(
+        content=[
+            {"type": "text", "text": f"{system_prompt}\n\nUser Query: {user_query}"},
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{base64_data}"}
+            }
+        ]
+    )
+    
+    vision_result = await ainvoke_json(llm, [message], "locate_target", TargetLocation, strict=True)
+    return vision_result.get("target_object", "Unknown"), vision_result.get("bounding_box")
+
+
 @router.post("/chat-analyze", response_model=ChatAnalyzeResponse)
 async def chat_analyze(request: ChatAnalyzeRequest, current_user: User = Depends(get_current_user)):
     """
@@ -164,14 +512,14 @@ async def chat_analyze(request: ChatAnalyzeRequest, current_user: User = Depends
     4. Invoke full agent workflow (Market Scout → Skeptic → Analysis → Response)
     5. Return complete recommendation in chat
     """
-    import os
-    from langchain_google_genai import ChatGoogleGenerativeAI
-    from langchain_core.messages import HumanMessage
     from app.services.image_crop import crop_to_bounding_box
-    from app.services.lens_identify import identify_product_with_lens
+    from app.services.lens_identify import aidentify_product_with_lens
     from app.services.snowflake_cache import snowflake_cache_service
+    from app.agent.structured import StructuredOutputError
     
     print(f"\n[ChatAnalyze] Query: {request.user_query}")
+    deadline = budget.new_deadline()
+    request_id = uuid.uuid4().hex
     
     if not request.image_base64:
         raise HTTPException(status_code=400, detail="No image data provided")
@@ -181,207 +529,226 @@ async def chat_analyze(request: ChatAnalyzeRequest, current_user: User = Depends
     if "base64," in base64_data:
         base64_data = base64_data.split("base64,")[1]
     
-    try:
-        # =====================================================
-        # STEP 1: Use Gemini Vision to find target object
-        # =====================================================
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            temperature=0,
-            google_api_key=os.getenv("GOOGLE_API_KEY")
-        )
-        
-        system_prompt = """You are a visual shopping assistant. The user is asking about a specific item in an image.
-
-Task:
-1. Identify the object the user is asking about
-2. Return its bounding box location
-
-Return JSON with:
-- "target_object": descriptive name of the object
-- "bounding_box": [y_min, x_min, y_max, x_max] as values 0-1000 (normalized)
-- "confidence": 0.0-1.0
-
-Return ONLY valid JSON, no markdown."""
-
-        message = HumanMessage(
-            content=[
-                {"type": "text", "text": f"{system_prompt}\n\nUser Query: {request.user_query}"},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_data}"}
-                }
-            ]
-        )
-        
-        response = await llm.ainvoke([message])
-        response_text = response.content.strip()
-        
-        # Clean markdown
-        if response_text.startswith("```"):
-            lines = response_text.split("\n")
-            response_text = "\n".join(lines[1:-1]) if len(lines) >= 3 else response_text
+    with trace_request(request_id, "POST /agent/chat-analyze", user_id=str(current_user.id)):
+        try:
+            # =====================================================
+            # STEP 1: Use Gemini Vision to find target object
+            # =====================================================
+            target_name, bbox = await _locate_target_object(request.user_query, base64_data)
         
-        vision_result = json.loads(response_text)
-        target_name = vision_result.get("target_object", "Unknown")
-        bbox = vision_result.get("bounding_box")
+            print(f"[ChatAnalyze] Target: {target_name}, BBox: {bbox}")
         
-        print(f"[ChatAnalyze] Target: {target_name}, BBox: {bbox}")
+            if not bbox:
+                return ChatAnalyzeResponse(
+                    chat_response=f"I couldn't find '{request.user_query}' in the image. Could you describe it differently?",
+                    targeted_object_name=None,
+                    targeted_bounding_box=None
+                )
         
-        if not bbox:
-            return ChatAnalyzeResponse(
-                chat_response=f"I couldn't find '{request.user_query}' in the image. Could you describe it differently?",
-                targeted_object_name=None,
-                targeted_bounding_box=None
-            )
-        
-        # =====================================================
-        # STEP 2: Crop image and identify with Google Lens
-        # =====================================================
-        image_bytes = base64.b64decode(base64_data)
+            # =====================================================
+            # STEP 2: Crop image and identify with Google Lens
+            # =====================================================
+            image_bytes = base64.b64decode(base64_data)
         
-        # Convert bbox from 0-1 to 0-1000 if needed
-        if all(0 <= v <= 1 for v in bbox):
-            bbox = [int(v * 1000) for v in bbox]
+            # Convert bbox from 0-1 to 0-1000 if needed
+            if all(0 <= v <= 1 for v in bbox):
+                bbox = [int(v * 1000) for v in bbox]
         
-        cropped_bytes = crop_to_bounding_box(image_bytes, bbox)
-        lens_result = identify_product_with_lens(cropped_bytes, "jpg")
+            cropped_bytes = crop_to_bounding_box(image_bytes, bbox)
+            lens_result = await aidentify_product_with_lens(
+                cropped_bytes, "jpg", timeout=budget.step_timeout({"deadline": deadline}, "vision", 60))
         
-        product_name = lens_result.get("product_name", target_name)
-        print(f"[ChatAnalyze] Lens ID: {product_name}")
+            product_name = lens_result.get("product_name", target_name)
+            print(f"[ChatAnalyze] Lens ID: {product_name}")
         
-        # =====================================================
-        # STEP 2b: Check Snowflake Cache
-        # =====================================================
-        cached_result = None
-        if product_name and product_name != "Unknown":
-            cache_key = snowflake_cache_service.generate_key(product_name)
-            print(f"[ChatAnalyze] Checking cache for: {cache_key}")
-            cached_result = snowflake_cache_service.get(cache_key)
-            print(f"[ChatAnalyze] Cache Get Result: {'HIT' if cached_result else 'MISS'}")
-            print(f"[ChatAnalyze] Cache Get Result: {'HIT' if cached_result else 'MISS'}")
+            # =====================================================
+            # STEP 2b: Check Snowflake Cache
+            # =====================================================
+            cached_result = None
+            if product_name and product_name != "Unknown":
+                cache_key = snowflake_cache_service.generate_key(product_name)
+                print(f"[ChatAnalyze] Checking cache for: {cache_key}")
+                cached_result = snowflake_cache_service.get(cache_key)
+                print(f"[ChatAnalyze] Cache Get Result: {'HIT' if cached_result else 'MISS'}")
+                print(f"[ChatAnalyze] Cache Get Result: {'HIT' if cached_result else 'MISS'}")
             
-        if cached_result:
-            try:
-                print(f"[ChatAnalyze] CACHE HIT! Processing stored analysis.")
-                if not isinstance(cached_result, dict):
-                    raise ValueError(f"Cached result is not a dict: {type(cached_result)}")
-                
-                full_result = cached_result
+            if cached_result:
+                try:
+                    print(f"[ChatAnalyze] CACHE HIT! Processing stored analysis.")
+                    if not isinstance(cached_result, dict):
+                        raise ValueError(f"Cached result is not a dict: {type(cached_result)}")
                 
-                # Inject current specific vision data into the cached result 
-                if 'active_product' in full_result and isinstance(full_result['active_product'], dict):
-                     full_result['active_product']['bounding_box'] = bbox
-                     full_result['active_product']['detected_objects'] = [{
-                        "name": product_name, 
-                        "bounding_box": bbox,
-                        "lens_result": lens_result
-                     }]
+                    full_result = cached_result
                 
-                # Synthesize final state wrapper for response formatting
-                import uuid
-                thread_id = str(uuid.uuid4()) # Fake thread ID for cache hit
-                
-                final_state = {
-                    "final_recommendation": full_result,
-                    "market_scout_data": {}, 
-                    "research_data": {},
-                    "risk_report": {},
-                    "analysis_object": {},
-                    "product_query": {
-                        "canonical_name": product_name,
-                        "detected_objects": [{
-                            "name": product_name,
+                    # Inject current specific vision data into the cached result 
+                    if 'active_product' in full_result and isinstance(full_result['active_product'], dict):
+                         full_result['active_product']['bounding_box'] = bbox
+                         full_result['active_product']['detected_objects'] = [{
+                            "name": product_name, 
                             "bounding_box": bbox,
                             "lens_result": lens_result
-                        }],
-                        "context": "User identified via chat + Lens"
+                         }]
+                
+                    # Synthesize final state wrapper for response formatting
+                    import uuid
+                    thread_id = str(uuid.uuid4()) # Fake thread ID for cache hit
+                
+                    final_state = {
+                        "final_recommendation": full_result,
+                        "market_scout_data": {}, 
+                        "research_data": {},
+                        "risk_report": {},
+                        "analysis_object": {},
+                        "product_query": {
+                            "canonical_name": product_name,
+                            "detected_objects": [{
+                                "name": product_name,
+                                "bounding_box": bbox,
+                                "lens_result": lens_result
+                            }],
+                            "context": "User identified via chat + Lens"
+                        }
                     }
-                }
-            except Exception as e:
-                print(f"[ChatAnalyze] Error processing cache hit: {e}")
-                cached_result = None # Fallback to miss
+                except Exception as e:
+                    print(f"[ChatAnalyze] Error processing cache hit: {e}")
+                    cached_result = None # Fallback to miss
                 
-        if not cached_result:
-            print(f"[ChatAnalyze] Cache Miss (or Error). Invoking full agent workflow.")
+            if not cached_result:
+                print(f"[ChatAnalyze] Cache Miss (or Error). Invoking full agent workflow.")
             
-            # =====================================================
-            # STEP 3: Invoke full agent workflow
-            # =====================================================
-            from app.agent.graph import agent_app
-            import uuid
+                # =====================================================
+                # STEP 3: Invoke full agent workflow
+                # =====================================================
+                from app.agent.graph import agent_app
+                import uuid
             
-            initial_state = {
-                "user_query": f"Find the best deals for: {product_name}",
-                "image_base64": base64_data,
-                "user_preferences": {},
-                "user_id": str(current_user.id), # Authenticated User ID
-                "product_query": {
-                    "canonical_name": product_name,
-                    "detected_objects": [{
-                        "name": product_name,
-                        "bounding_box": bbox,
-                        "lens_result": lens_result
-                    }],
-                    "context": "User identified via chat + Lens"
-                },
-                "skip_vision": True  # Skip vision node, we already have product
-            }
+                initial_state = _chat_analyze_state(product_name, base64_data, bbox, lens_result, current_user, deadline, request_id)
             
-            # Generate unique thread_id (required by MemorySaver)
-            thread_id = str(uuid.uuid4())
-            config = {"configurable": {"thread_id": thread_id}}
+                # Generate unique thread_id (required by the checkpointer)
+                thread_id = str(uuid.uuid4())
+                config = {"configurable": {"thread_id": thread_id}}
             
-            final_state = await agent_app.ainvoke(initial_state, config=config)
-            full_result = final_state.get("final_recommendation", {})
+                final_state = await agent_app.ainvoke(initial_state, config=config)
+                full_result = final_state.get("final_recommendation", {})
         
-        print(f"[ChatAnalyze] Pipeline complete. Outcome: {full_result.get('outcome', 'unknown')}")
+            print(f"[ChatAnalyze] Pipeline complete. Outcome: {full_result.get('outcome', 'unknown')}")
         
-        # =====================================================
-        # STEP 4: Format response for chat
-        # =====================================================
-        summary = full_result.get("summary", f"I found the {product_name}!")
+            # =====================================================
+            # STEP 4: Format response for chat
+            # =====================================================
+            summary = full_result.get("summary", f"I found the {product_name}!")
         
-        # Build chat response with key info
-        chat_response = f"**{product_name}**\n\n{summary}"
+            # Build chat response with key info
+            chat_response = f"**{product_name}**\n\n{summary}"
         
-        if full_result.get("active_product", {}).get("price"):
-            chat_response += f"\n\n💰 Price: {full_result['active_product']['price']}"
+            if full_result.get("active_product", {}).get("price"):
+                chat_response += f"\n\n💰 Price: {full_result['active_product']['price']}"
         
-        # Normalize bbox back to 0-1 for frontend
-        normalized_bbox = [v / 1000.0 for v in bbox] if bbox else None
+            # Normalize bbox back to 0-1 for frontend
+            normalized_bbox = [v / 1000.0 for v in bbox] if bbox else None
         
-        # Build session state for follow-ups (includes data needed for re-analysis)
-        session_state = {
-            "product_query": final_state.get("product_query"),
-            "market_scout_data": final_state.get("market_scout_data"),
-            "research_data": final_state.get("research_data"),
-            "risk_report": final_state.get("risk_report"),
-            "analysis_object": final_state.get("analysis_object"),
-        }
+            # Build session state for follow-ups (includes data needed for re-analysis).
+            # Stored once in the blob store; the client only round-trips the reference.
+            session_state = _store_session_state({
+                "product_query": final_state.get("product_query"),
+                "market_scout_data": final_state.get("market_scout_data"),
+                "research_data": final_state.get("research_data"),
+                "risk_report": final_state.get("risk_report"),
+                "analysis_object": final_state.get("analysis_object"),
+            })
         
-        return ChatAnalyzeResponse(
-            chat_response=chat_response,
-            targeted_object_name=product_name,
-            targeted_bounding_box=normalized_bbox,
-            confidence=lens_result.get("confidence", 0.8),
-            analysis=full_result,
-            thread_id=thread_id,  # Return for follow-up persistence
-            session_state=session_state  # Prior state for re-analysis
-        )
+            return ChatAnalyzeResponse(
+                chat_response=chat_response,
+                targeted_object_name=product_name,
+                targeted_bounding_box=normalized_bbox,
+                confidence=lens_result.get("confidence", 0.8),
+                analysis=full_result,
+                thread_id=thread_id,  # Return for follow-up persistence
+                session_state=session_state  # Prior state for re-analysis
+            )
         
-    except json.JSONDecodeError as e:
-        print(f"[ChatAnalyze] JSON parse error: {e}")
-        return ChatAnalyzeResponse(
-            chat_response="I had trouble understanding the image. Please try again.",
-            targeted_object_name=None,
-            targeted_bounding_box=None
-        )
-    except Exception as e:
-        print(f"[ChatAnalyze] Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+        except StructuredOutputError as e:
+            print(f"[ChatAnalyze] JSON parse error: {e}")
+            return ChatAnalyzeResponse(
+                chat_response="I had trouble understanding the image. Please try again.",
+                targeted_object_name=None,
+                targeted_bounding_box=None
+            )
+        except Exception as e:
+            print(f"[ChatAnalyze] Error: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+
+@router.post("/chat-analyze/stream")
+async def chat_analyze_stream(request: ChatAnalyzeRequest, current_user: User = Depends(get_current_user)):
+    """
+    Streaming variant of /chat-analyze (Server-Sent Events).
+
+    Emits the located target and Lens identification first, then the same
+    per-node events as /analyze-image/stream. A cache hit is sent as `final`
+    straight away. The `done` event carries the thread_id for follow-ups.
+    """
+    from app.agent.streaming import stream_agent_events, format_sse
+    from app.services.image_crop import crop_to_bounding_box
+    from app.services.lens_identify import aidentify_product_with_lens
+    from app.services.snowflake_cache import snowflake_cache_service
+    import asyncio
+    import uuid
+
+    if not request.image_base64:
+        raise HTTPException(status_code=400, detail="No image data provided")
+
+    base64_data = _clean_base64(request.image_base64)
+    deadline = budget.new_deadline()
+    request_id = uuid.uuid4().hex
+
+    async def event_stream():
+        try:
+            with span("locate_target", trace_id=request_id):
+                target_name, bbox = await _locate_target_object(request.user_query, base64_data)
+        except Exception as e:
+            print(f"[ChatAnalyzeStream] Target location failed: {e}")
+            yield format_sse("error", {"detail": "I had trouble understanding the image. Please try again."})
+            return
+
+        if not bbox:
+            yield format_sse("error", {"detail": f"I couldn't find '{request.user_query}' in the image. Could you describe it differently?"})
+            return
+
+        if all(0 <= v <= 1 for v in bbox):
+            bbox = [int(v * 1000) for v in bbox]
+        yield format_sse("target", {"name": target_name, "bounding_box": [v / 1000.0 for v in bbox]})
+
+        cropped_bytes = crop_to_bounding_box(base64.b64decode(base64_data), bbox)
+        with span("lens_identify", trace_id=request_id):
+            lens_result = await aidentify_product_with_lens(
+                cropped_bytes, "jpg", timeout=budget.step_timeout({"deadline": deadline}, "vision", 60))
+        product_name = lens_result.get("product_name", target_name)
+        yield format_sse("identified_product", {
+            "name": product_name,
+            "confidence": lens_result.get("confidence", 0.8),
+            "source": lens_result.get("source"),
+            "bounding_box": [v / 1000.0 for v in bbox],
+        })
+
+        thread_id = str(uuid.uuid4())
+        if product_name and product_name != "Unknown":
+            cache_key = snowflake_cache_service.generate_key(product_name)
+            cached_result = await asyncio.to_thread(snowflake_cache_service.get, cache_key)
+            if isinstance(cached_result, dict):
+                print(f"[ChatAnalyzeStream] CACHE HIT for {cache_key}")
+                yield format_sse("final", cached_result)
+                yield format_sse("done", {"thread_id": thread_id, "cached": True})
+                return
+
+        initial_state = _chat_analyze_state(product_name, base64_data, bbox, lens_result, current_user, deadline, request_id)
+        config = {"configurable": {"thread_id": thread_id}}
+        async for frame in stream_agent_events(initial_state, config, done_data={"thread_id": thread_id, "cached": False}):
+            yield frame
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 
 # ============================================================
@@ -404,6 +771,24 @@ class ChatFollowupResponse(BaseModel):
     intent: str  # What the router decided: 're_analysis', 're_search', 'chat'
 
 
+def _chat_followup_state(request: ChatFollowupRequest, user_id: str) -> dict:
+    """Graph input for a follow-up turn (starts at the router, prior analysis restored)."""
+    import uuid
+    return {
+        "user_query": request.user_query,
+        "image_base64": "",  # No new image
+        "user_preferences": {},
+        "user_id": user_id, # Authenticated User ID
+        "deadline": budget.new_deadline(),  # Latency budget (REQUEST_SLO_SECONDS)
+        "request_id": uuid.uuid4().hex,
+        "chat_history": request.chat_history,
+        # Skip vision - we already have the product
+        "skip_vision": True,
+        # Restore prior analysis state
+        **_load_session_state(request.session_state),
+    }
+
+
 @router.post("/chat-followup", response_model=ChatFollowupResponse)
 async def chat_followup(request: ChatFollowupRequest, current_user: User = Depends(get_current_user)):
     """
@@ -415,34 +800,20 @@ async def chat_followup(request: ChatFollowupRequest, current_user: User = Depen
     - chat: General question → Just respond
     """
     from app.agent.graph import agent_app
-    import uuid
     
     print(f"\n[ChatFollowup] Query: {request.user_query}")
     print(f"[ChatFollowup] Thread: {request.thread_id}")
     
     try:
         # Build state from prior session
-        initial_state = {
-            "user_query": request.user_query,
-            "image_base64": "",  # No new image
-            "user_preferences": {},
-            "user_id": str(current_user.id), # Authenticated User ID
-            "chat_history": request.chat_history,
-            # Restore prior analysis state
-            "product_query": request.session_state.get("product_query", {}),
-            "market_scout_data": request.session_state.get("market_scout_data", {}),
-            "research_data": request.session_state.get("research_data", {}),
-            "risk_report": request.session_state.get("risk_report", {}),
-            "analysis_object": request.session_state.get("analysis_object", {}),
-            # Skip vision - we already have the product
-            "skip_vision": True,
-        }
+        initial_state = _chat_followup_state(request, str(current_user.id))
         
         # Use same thread_id for state continuity
         config = {"configurable": {"thread_id": request.thread_id}}
         
         # Invoke the graph (starts at Router Node)
-        final_state = await agent_app.ainvoke(initial_state, config=config)
+        with trace_request(initial_state["request_id"], "POST /agent/chat-followup", user_id=str(current_user.id)):
+            final_state = await agent_app.ainvoke(initial_state, config=config)
         
         # Extract results
         router_decision = final_state.get("router_decision", "chat")
@@ -486,3 +857,47 @@ async def chat_followup(request: ChatFollowupRequest, current_user: User = Depen
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Follow-up failed: {str(e)}")
+
+
+@router.post("/chat-followup/stream")
+async def chat_followup_stream(request: ChatFollowupRequest, current_user: User = Depends(get_current_user)):
+    """
+    Streaming variant of /chat-followup (SSE). The chat reply arrives token
+    by token (`token` events, field "chat_response"), then `intent` /
+    `chat_response`; a re-analysis continues with the usual per-node events,
+    `fields` and the streamed summary, `final` and `done`.
+    """
+    from app.agent.streaming import stream_agent_events
+
+    print(f"\n[ChatFollowup/stream] Query: {request.user_query}")
+    initial_state = _chat_followup_state(request, str(current_user.id))
+    config = {"configurable": {"thread_id": request.thread_id}}
+    return StreamingResponse(
+        stream_agent_events(initial_state, config, done_data={"thread_id": request.thread_id}),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+# ============================================================
+# TRACES
+# ============================================================
+
+@router.get("/trace/{request_id}")
+async def get_trace(request_id: str, format: str = "waterfall", current_user: User = Depends(get_current_user)):
+    """
+    Span trace of one agent request (request_id is returned in the final
+    recommendation and the SSE `done` event).
+
+    format=waterfall: spans ordered by start with depth/offset + critical path.
+    format=otlp: OTLP/JSON ExportTraceServiceRequest.
+
+    Only the user the request ran for can read it (404 otherwise, as for
+    jobs), and only once it has finished.
+    """
+    if trace_owner(request_id) != str(current_user.id):
+        raise HTTPException(status_code=404, detail="Trace not found")
+    trace = get_trace_otlp(request_id) if format == "otlp" else waterfall(request_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
@@ -89,11 +89,16 @@ async def chat_message(
     # If using DB session, we might want to check if user has preferences manually if not passed
     # But for now we rely on what's passed or what's in the state persistence
     
+    from app.services.blob_store import offload_image_base64
+    from app.agent.budget import new_deadline
+
     inputs = {
         "user_query": chat_request.message,
-        "image_base64": chat_request.image,
+        "image_base64": offload_image_base64(chat_request.image),
         "chat_history": chat_history,
         "session_id": session_id,
+        "deadline": new_deadline(),  # Latency budget (REQUEST_SLO_SECONDS)
+        "request_id": uuid.uuid4().hex,  # Per-request memos (review_memo.py) + trace id (timing.py)
         "user_preferences": chat_request.user_preferences or {} 
         # Note: In a real app, we might merge stored prefs here if not in state
     }
@@ -104,9 +109,11 @@ async def chat_message(
     try:
         # Lazy import to avoid circular dependency
         from app.agent.graph import agent_app
+        from app.agent.timing import trace_request
         
         # We use ainvok for async execution
-        result = await agent_app.ainvoke(inputs, config=config)
+        with trace_request(inputs["request_id"], "POST /sessions/chat"):
+            result = await agent_app.ainvoke(inputs, config=config)
         
         # 5. Extract Response
         # The agent might return different things based on the node it ended in.
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import Optional
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     # Database
@@ -33,6 +33,135 @@ class Settings(BaseSettings):
     MODEL_ANALYSIS: str = "gemini-2.0-flash"
     MODEL_RESPONSE: str = "gemini-2.0-flash"  # Node 5 - Response Formulation
 
+    # Open the shared LLM clients' connections at startup with a free count_tokens call (agent/llm.py)
+    LLM_WARMUP_PING: bool = True
+
+    # Hybrid (BM25 + vector) product retrieval
+    HYBRID_INDEX_TTL_SECONDS: int = 600  # Rebuild the in-process lexical index (in the background) after this long
+    HYBRID_LEXICAL_BUDGET_MS: float = 20.0  # Log a warning if a lexical query exceeds this
+
+    # Shared memory-mapped embedding snapshots (read by every gunicorn worker)
+    EMBEDDING_STORE_DIR: str = "/app/data/embeddings"
+    EMBEDDING_SNAPSHOT_REFRESH_SECONDS: int = 3600  # Rebuild from Snowflake (one worker, background) after this long
+    EMBEDDING_SNAPSHOT_MAX_AGE_SECONDS: int = 21600  # Older snapshots are not used (searches go to Snowflake)
+
+    # Write enriched scout candidates back into the products catalog
+    CATALOG_INGEST_ENABLED: bool = True
+
+    # Shared stores (checkpoints, jobs, LLM cache, router log, sentiment memo): an empty *_DB_URL means
+    # DATABASE_URL (each store has its own tables), so they persist wherever the main database does.
+    # Point one at e.g. sqlite:////app/data/jobs.db to keep it local. The file caches below (blobs,
+    # traces, identify results) live under /app/data: ./backend/data with docker-compose's bind mount,
+    # lost on redeploy on Render (ephemeral disk), which only costs cache misses.
+
+    # Content-addressed blobs for large state fields (images, search results, reviews)
+    BLOB_STORE_DIR: str = "/app/data/blobs"
+    BLOB_TTL_SECONDS: int = 172800
+    BLOB_GC_INTERVAL_SECONDS: int = 600
+    BLOB_INLINE_MAX_BYTES: int = 4096
+
+    # LangGraph checkpoints ("sql" = shared SQL store, "memory" = per-process MemorySaver)
+    CHECKPOINT_BACKEND: str = "sql"
+    CHECKPOINT_DB_URL: str = ""
+    CHECKPOINT_TTL_SECONDS: int = 86400
+    CHECKPOINT_MAX_PER_THREAD: int = 20
+    CHECKPOINT_MAX_THREAD_BYTES: int = 20 * 1024 * 1024
+    CHECKPOINT_EVICT_INTERVAL_SECONDS: int = 300
+
+    # Response node: "template" = payload assembled from analysis data + LLM summary only,
+    # "llm" = whole payload generated by MODEL_RESPONSE
+    RESPONSE_MODE: str = "template"
+    RESPONSE_SUMMARY_LLM: bool = True
+
+    # End-to-end latency target per agent request; nodes degrade to stay inside it (see agent/budget.py)
+    REQUEST_SLO_SECONDS: float = 25.0
+
+    # Span tracing (see agent/timing.py): finished traces are written as OTLP/JSON
+    # to TRACE_EXPORT_DIR and POSTed to TRACE_OTLP_ENDPOINT (e.g. http://collector:4318/v1/traces) if set
+    TRACING_ENABLED: bool = True
+    TRACE_EXPORT_DIR: str = "/app/data/traces"
+    TRACE_OTLP_ENDPOINT: str = ""
+    TRACE_TTL_SECONDS: int = 86400
+
+    # Background jobs (services/job_queue.py): persistent queue shared by all workers,
+    # JOB_WORKERS_PER_PROCESS asyncio workers per gunicorn worker, at most JOB_MAX_RUNNING jobs at once
+    JOB_QUEUE_ENABLED: bool = True
+    JOB_DB_URL: str = ""
+    JOB_WORKERS_PER_PROCESS: int = 1
+    JOB_MAX_RUNNING: int = 3
+    JOB_POLL_INTERVAL_SECONDS: float = 0.5
+    JOB_LEASE_SECONDS: int = 300
+    JOB_MAX_ATTEMPTS: int = 2
+    JOB_RESULT_TTL_SECONDS: int = 604800
+
+    # Identical concurrent provider calls share one request; results reused for this long (sources/singleflight.py)
+    SINGLEFLIGHT_TTL_SECONDS: int = 60
+
+    # POST /agent/batch: items per call, and graph runs in flight per batch
+    BATCH_MAX_ITEMS: int = 500
+    BATCH_MAX_CONCURRENCY: int = 4
+
+    # Per-(image, bbox) Lens results (services/box_identify.py) and eager identification after detect_only
+    IDENTIFY_CACHE_DIR: str = "/app/data/identify"
+    IDENTIFY_CACHE_TTL_SECONDS: int = 86400
+    IDENTIFY_CACHE_SWEEP_INTERVAL_SECONDS: int = 600  # Expired results and orphaned .pending markers are deleted this often
+    EAGER_IDENTIFY_BUDGET_SECONDS: float = 30.0
+    EAGER_IDENTIFY_MAX_OBJECTS: int = 8
+
+    # LLM response cache (agent/llm_cache.py). Opt-in per call site: only sites in LLM_CACHE_TTLS
+    # (TTL seconds) are cached; sites in LLM_CACHE_SEMANTIC_SITES also match near-identical prompts
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_DB_URL: str = ""
+    LLM_CACHE_TTLS: Dict[str, int] = {
+        "router": 86400,
+        "chat.extract_preferences": 86400,
+        "scout.extract": 21600,
+        "skeptic.batch_alternatives": 21600,
+    }
+    LLM_CACHE_SEMANTIC_SITES: List[str] = ["router"]
+    LLM_CACHE_SIMILARITY_THRESHOLD: float = 0.97
+    LLM_CACHE_MEMORY_ENTRIES: int = 2048
+
+    # Local intent classifier in front of the router LLM (agent/intent_classifier.py): keyword rules,
+    # then Naive Bayes trained on logged LLM decisions; ROUTER_SHADOW_RATE of local decisions re-checked by the LLM
+    ROUTER_LOCAL_ENABLED: bool = True
+    ROUTER_DB_URL: str = ""
+    ROUTER_MODEL_MIN_CONFIDENCE: float = 0.9
+    ROUTER_MODEL_MIN_SAMPLES: int = 200
+    ROUTER_MODEL_MAX_SAMPLES: int = 5000
+    ROUTER_MODEL_RETRAIN_SECONDS: int = 3600
+    ROUTER_SHADOW_RATE: float = 0.05
+
+    # Estimated input-token budget per prompt (agent/context.py)
+    PROMPT_TOKEN_BUDGETS: Dict[str, int] = {
+        "response": 1500,
+        "scout.extract": 2000,
+        "chat.reply": 200,
+        "skeptic.reviews": 2500,
+    }
+
+    # LLM concurrency governor (agent/llm_governor.py), per model and worker: AIMD concurrency limit,
+    # jittered exponential backoff on 429/5xx, circuit breaker failing fast to the node fallbacks
+    LLM_GOVERNOR_INITIAL_CONCURRENCY: int = 8
+    LLM_GOVERNOR_MIN_CONCURRENCY: int = 1
+    LLM_GOVERNOR_MAX_CONCURRENCY: int = 32
+    LLM_GOVERNOR_QUEUE_TIMEOUT_SECONDS: float = 15.0
+    LLM_GOVERNOR_MAX_RETRIES: int = 3
+    LLM_GOVERNOR_BACKOFF_BASE_SECONDS: float = 0.5
+    LLM_GOVERNOR_BACKOFF_MAX_SECONDS: float = 8.0
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5
+    LLM_BREAKER_COOLDOWN_SECONDS: float = 30.0
+
+    # Persistent per-product ReviewSentiment memo (agent/sentiment_memo.py), keyed by canonical product id
+    # and Skeptic model version; TTL seconds per kind (0 disables that kind)
+    SENTIMENT_MEMO_ENABLED: bool = True
+    SENTIMENT_MEMO_DB_URL: str = ""
+    SENTIMENT_MEMO_TTLS: Dict[str, int] = {
+        "alternative": 604800,
+        "category": 604800,
+        "reviews": 86400,
+    }
+
     # External URL for SerpAPI Lens (ngrok URL in dev)
     PUBLIC_BASE_URL: str = "http://localhost:8000"
 
@@ -0,0 +1,183 @@
+"""
+Prometheus metrics, served at GET /metrics.
+
+Latency histograms are fed from span ends (agent/timing.py), so every
+traced node, provider call, cache access and LLM call is measured without
+extra instrumentation:
+
+    agent_node_duration_seconds{node}
+    provider_request_duration_seconds{endpoint, status}
+    llm_request_duration_seconds{model, call_site, status}
+    cache_request_duration_seconds{operation, status}
+    agent_request_duration_seconds{endpoint, status}
+
+plus counters for veto loops, fallbacks, LLM cache and sentiment memo lookups, router decisions
+(and local-vs-LLM agreement) and background jobs, in-flight gauges, and the
+LLM governor's per-model concurrency limit, breaker state, retries and
+rejections.
+
+Multi-worker: with PROMETHEUS_MULTIPROC_DIR set (Dockerfile), each gunicorn
+worker writes its samples to mmap files in that directory and /metrics
+aggregates all of them; gunicorn.conf.py wipes the directory on start and
+marks exited workers dead. The image sets the variable for every entry
+point, so the directory is also created here for those that do not go
+through gunicorn (uvicorn --reload in docker-compose, scripts). Without the
+variable the default in-process registry is used.
+"""
+from contextlib import contextmanager
+import os
+
+from prometheus_client import (
+    CollectorRegistry,
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Must exist before the first metric is built (values are mmap files in it)
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# Agent stages run from sub-second to tens of seconds (REQUEST_SLO_SECONDS = 25)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0)
+
+NODE_DURATION = Histogram(
+    "agent_node_duration_seconds", "Latency per LangGraph node",
+    ["node"], buckets=LATENCY_BUCKETS,
+)
+PROVIDER_DURATION = Histogram(
+    "provider_request_duration_seconds", "Latency per external provider endpoint (Tavily, SerpAPI, Lens, ImgBB)",
+    ["endpoint", "status"], buckets=LATENCY_BUCKETS,
+)
+LLM_DURATION = Histogram(
+    "llm_request_duration_seconds", "Latency per LLM call",
+    ["model", "call_site", "status"], buckets=LATENCY_BUCKETS,
+)
+CACHE_DURATION = Histogram(
+    "cache_request_duration_seconds", "Latency per cache access (Snowflake result cache)",
+    ["operation", "status"], buckets=LATENCY_BUCKETS,
+)
+REQUEST_DURATION = Histogram(
+    "agent_request_duration_seconds", "End-to-end latency per agent endpoint",
+    ["endpoint", "status"], buckets=LATENCY_BUCKETS,
+)
+
+VETO_LOOPS = Counter("agent_veto_loops_total", "Skeptic vetoes that sent the graph back to the market scout")
+FALLBACKS = Counter(
+    "agent_fallbacks_total", "Fallbacks to a secondary source (lens_to_gemini, serpapi_to_tavily_price)",
+    ["fallback", "reason"],
+)
+
+PROMPT_TOKENS = Histogram(
+    "agent_prompt_tokens", "Estimated input tokens per LLM prompt (agent/context.py)",
+    ["call_site"], buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000),
+)
+STRUCTURED_OUTPUT = Counter(
+    "llm_structured_output_total", "JSON replies per call site: parsed as is (ok), repaired locally, or failed",
+    ["call_site", "result"],
+)
+LLM_CACHE = Counter(
+    "llm_cache_requests_total", "LLM response cache lookups (hit, semantic_hit, miss) per opted-in call site",
+    ["call_site", "result"],
+)
+SENTIMENT_MEMO = Counter(
+    "agent_sentiment_memo_total", "Per-product sentiment memo lookups (hit, miss) by kind",
+    ["kind", "result"],
+)
+
+ROUTER_DECISIONS = Counter(
+    "agent_router_decisions_total", "Router decisions by stage (rules, model, llm)",
+    ["source", "decision"],
+)
+ROUTER_CONFIDENCE = Histogram(
+    "agent_router_confidence", "Confidence of routed decisions per stage",
+    ["source"], buckets=(0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0),
+)
+ROUTER_AGREEMENT = Counter(
+    "agent_router_agreement_total", "Local router guesses checked against the LLM (agree, disagree)",
+    ["source", "result"],
+)
+
+JOBS = Counter(
+    "agent_jobs_total", "Background job transitions (queued, succeeded, failed)",
+    ["kind", "status"],
+)
+
+# livesum: sum over live workers only (a dead worker's in-flight count is dropped)
+IN_FLIGHT = Gauge(
+    "agent_requests_in_flight", "Agent requests currently being processed",
+    ["endpoint"], multiprocess_mode="livesum",
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed",
+    multiprocess_mode="livesum",
+)
+
+# LLM concurrency governor (agent/llm_governor.py); limits are per worker, summed over live workers
+LLM_CONCURRENCY_LIMIT = Gauge(
+    "llm_governor_concurrency_limit", "Adaptive (AIMD) concurrency limit per model",
+    ["model"], multiprocess_mode="livesum",
+)
+LLM_GOVERNED_IN_FLIGHT = Gauge(
+    "llm_governor_in_flight", "LLM calls currently holding a governor slot",
+    ["model"], multiprocess_mode="livesum",
+)
+LLM_BREAKER_STATE = Gauge(
+    "llm_governor_breaker_state", "Circuit breaker per model (0 closed, 1 half-open, 2 open; worst worker)",
+    ["model"], multiprocess_mode="livemax",
+)
+LLM_GOVERNOR_RETRIES = Counter(
+    "llm_governor_retries_total", "LLM calls retried after a 429 (rate_limit) or 5xx (server_error)",
+    ["model", "reason"],
+)
+LLM_GOVERNOR_REJECTIONS = Counter(
+    "llm_governor_rejections_total", "LLM calls failed fast (circuit_open, queue_timeout)",
+    ["model", "reason"],
+)
+
+
+def observe_span(span):
+    """Span-end hook (timing.py): records the span's latency in the matching histogram."""
+    status = "error" if span.error else "ok"
+    duration = span.duration_s
+    if span.kind == "node":
+        NODE_DURATION.labels(node=span.name).observe(duration)
+    elif span.kind == "provider":
+        PROVIDER_DURATION.labels(endpoint=span.name, status=status).observe(duration)
+    elif span.kind == "llm":
+        model = str(span.attributes.get("model") or "unknown")
+        LLM_DURATION.labels(model=model, call_site=span.name, status=status).observe(duration)
+    elif span.kind == "cache":
+        CACHE_DURATION.labels(operation=span.name, status=status).observe(duration)
+    elif span.kind == "request":
+        REQUEST_DURATION.labels(endpoint=span.name, status=status).observe(duration)
+
+
+def record_veto_loop():
+    VETO_LOOPS.inc()
+
+
+def record_fallback(fallback: str, reason: str = "error"):
+    FALLBACKS.labels(fallback=fallback, reason=reason).inc()
+
+
+@contextmanager
+def in_flight(endpoint: str):
+    gauge = IN_FLIGHT.labels(endpoint=endpoint)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def render_metrics():
+    """(body, content type) for GET /metrics, aggregated over all workers when multiprocess."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
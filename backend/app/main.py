@@ -35,16 +35,65 @@ except Exception as e:
     traceback.print_exc()
     agent_app = None
 
+@app.middleware("http")
+async def track_in_flight(request, call_next):
+    from app.core.metrics import HTTP_IN_FLIGHT
+    HTTP_IN_FLIGHT.inc()
+    try:
+        return await call_next(request)
+    finally:
+        HTTP_IN_FLIGHT.dec()
+
 @app.on_event("startup")
 def startup_event():
     Base.metadata.create_all(bind=engine)
 
+@app.on_event("startup")
+async def start_job_workers():
+    from app.services.job_queue import job_queue
+    job_queue.start()
+
+@app.on_event("startup")
+async def warm_llm_clients():
+    import asyncio
+    from app.agent.llm import warm_up
+    # In the background: a slow or offline API must not hold up worker boot
+    asyncio.ensure_future(warm_up())
+
+@app.on_event("startup")
+async def warm_search_index():
+    from app.services.hybrid_search import hybrid_search_service
+    # Starts the lexical index build in a background thread; searches never wait for it
+    hybrid_search_service.get_index()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from app.services.job_queue import job_queue
+    from app.sources.http_client import close_async_clients
+    await job_queue.stop()
+    await close_async_clients()
+
 app.include_router(api_router, prefix="/api/v1")
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint (aggregated over all gunicorn workers)."""
+    from fastapi import Response
+    from app.core.metrics import render_metrics
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/health/checkpointer")
+def checkpointer_stats():
+    from app.agent.graph import checkpointer
+    if not hasattr(checkpointer, "stats"):
+        return {"backend": "memory"}
+    return checkpointer.stats()
+
 class AnalyzeRequest(BaseModel):
     image: str  # base64 string
     user_preferences: Dict[str, float]
@@ -52,6 +101,7 @@ class AnalyzeRequest(BaseModel):
     detect_only: bool = False  # Stage 1: Detect objects and stop
     skip_vision: bool = False  # Stage 2: Resume analysis (skip detection)
     product_name: str = ""     # Stage 2: Specific product to analyze
+    identify_all: bool = False  # Stage 1: also identify every detected box in the background
 
 @app.post("/analyze")
 async def analyze_image(request: AnalyzeRequest):
@@ -64,13 +114,20 @@ async def analyze_image(request: AnalyzeRequest):
     print(f"Received request for image analysis. Query: {request.user_query}")
     print(f"   Flags: detect_only={request.detect_only}, skip_vision={request.skip_vision}, product={request.product_name}")
     
+    from app.services.blob_store import offload_image_base64
+    from app.agent.budget import new_deadline
+    import uuid
+
     # Initialize the state with inputs
     initial_state = {
         "user_query": request.user_query,
-        "image_base64": request.image,
+        "deadline": new_deadline(),  # Latency budget (REQUEST_SLO_SECONDS)
+        "request_id": uuid.uuid4().hex,  # Per-request memos (review_memo.py) + trace id (timing.py)
+        "image_base64": offload_image_base64(request.image),  # Stored once, state carries the hash
         "user_preferences": request.user_preferences,
         "detect_only": request.detect_only,
         "skip_vision": request.skip_vision,
+        "eager_identify": request.identify_all,
         # Other state keys will be populated by the graph
     }
     
@@ -82,13 +139,15 @@ async def analyze_image(request: AnalyzeRequest):
             "context": "User provided product name via Lens identification"
         }
     
-    # Generate a unique thread_id for this request (required by MemorySaver)
+    # Generate a unique thread_id for this request (required by the checkpointer)
     import uuid
     thread_id = str(uuid.uuid4())
     config = {"configurable": {"thread_id": thread_id}}
     
-    # Run the graph asynchronously
-    result = await agent_app.ainvoke(initial_state, config=config)
+    # Run the graph asynchronously (traced; see /api/v1/agent/trace/{request_id})
+    from app.agent.timing import trace_request
+    with trace_request(initial_state["request_id"], "POST /analyze"):
+        result = await agent_app.ainvoke(initial_state, config=config)
     
     # The result contains the final state.
     # In 'detect_only' mode, we won't have 'final_recommendation', but we will have 'product_query'.
@@ -0,0 +1,63 @@
+"""
+Expected shapes of the JSON the agent's LLM calls return (agent/structured.py).
+
+Models are lenient on purpose: missing fields get the defaults the nodes
+already used, extra keys are kept, so validation only rejects output that
+the node could not have used anyway.
+"""
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, ConfigDict
+
+
+class LLMOutput(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+class DetectedObject(LLMOutput):
+    name: str
+    bounding_box: List[float] = []
+    confidence: Optional[float] = None
+
+
+class VisionDetection(LLMOutput):
+    detected_objects: List[DetectedObject] = []
+    main_product_name: str = "Unknown Product"
+    visual_attributes: str = ""
+    ocr_text: str = ""
+
+
+class TargetLocation(LLMOutput):
+    target_object: str = "Unknown"
+    bounding_box: Optional[List[float]] = None
+    confidence: Optional[float] = None
+
+
+class ScoutCandidate(LLMOutput):
+    name: str
+    category: str = ""
+    reason: str = ""
+
+
+class BudgetPreferences(LLMOutput):
+    max_budget: Optional[float] = None
+    price_sensitivity: Optional[float] = None
+    prefer_cheaper: Optional[bool] = None
+
+
+class SearchPreferences(LLMOutput):
+    exclude_colors: List[str] = []
+    prefer_colors: List[str] = []
+    prefer_brands: List[str] = []
+    exclude_brands: List[str] = []
+    style_keywords: List[str] = []
+    max_budget: Optional[float] = None
+    eco_friendly: Optional[float] = None
+
+
+class ResponsePayload(LLMOutput):
+    outcome: str = "recommended"
+    identified_product: str = "Unknown"
+    summary: str = ""
+    price_analysis: Dict[str, Any] = {}
+    community_sentiment: Dict[str, Any] = {}
+    alternatives: List[Dict[str, Any]] = []
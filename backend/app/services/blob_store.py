@@ -0,0 +1,225 @@
+"""
+Content-addressed blob store for large agent state fields.
+
+Images (multi-MB base64), raw scout search results, review lists and chat
+session snapshots used to be copied through every LangGraph superstep, every
+checkpoint row and every /chat-analyze response. They are now written once
+under their SHA-256 and only a short reference travels in state:
+
+    blob:sha256:<64 hex chars>
+
+Blobs live on disk under BLOB_STORE_DIR (shared by all gunicorn workers, same
+as the embedding store), fanned out by the first two hex chars. Writes are
+atomic (tmp + os.replace), identical content is stored once, and blobs not
+written or read for BLOB_TTL_SECONDS are garbage collected. Reads refresh
+the file's mtime (at most every TOUCH_INTERVAL_SECONDS per blob), so blobs of
+sessions still in use are kept however old they are.
+
+Readers go through `resolve_json` / `resolve_image_base64`, which accept
+either a reference or an inline value, so older checkpoints and clients that
+still send full payloads keep working.
+"""
+from app.core.config import settings
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+REF_PREFIX = "blob:sha256:"
+
+# Decoded JSON blobs kept in-process (several nodes resolve the same reviews)
+MEMO_SIZE = 64
+# A read refreshes the blob's mtime only if it is older than this (one utime per blob per interval)
+TOUCH_INTERVAL_SECONDS = 3600
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(REF_PREFIX) and len(value) == len(REF_PREFIX) + 64
+
+
+class BlobNotFound(KeyError):
+    pass
+
+
+class BlobStore:
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.BLOB_STORE_DIR)
+        self._memo: "OrderedDict[str, Any]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self._last_gc = 0.0
+        self._gc_lock = threading.Lock()
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    # --- Write ---
+
+    def put_bytes(self, data: bytes) -> str:
+        """Stores `data` (deduplicated by content) and returns its reference."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if path.exists():
+            self._touch(path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.parent / f".{digest}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        self._maybe_gc()
+        return f"{REF_PREFIX}{digest}"
+
+    def put_json(self, obj: Any) -> str:
+        payload = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+        return self.put_bytes(payload.encode("utf-8"))
+
+    def put_image_base64(self, image_b64: str) -> str:
+        """Stores an image given as base64 (data URL prefix allowed) as raw bytes."""
+        if "base64," in image_b64:
+            image_b64 = image_b64.split("base64,")[1]
+        return self.put_bytes(base64.b64decode(image_b64))
+
+    # --- Read ---
+
+    @staticmethod
+    def _touch(path: Path, mtime: Optional[float] = None):
+        """Refreshes the mtime so a blob in use survives GC (skipped if it was refreshed recently)."""
+        try:
+            if mtime is None:
+                mtime = path.stat().st_mtime
+            if time.time() - mtime > TOUCH_INTERVAL_SECONDS:
+                os.utime(path)
+        except OSError:
+            pass
+
+    def get_bytes(self, ref: str) -> bytes:
+        if not is_blob_ref(ref):
+            raise ValueError(f"Not a blob reference: {str(ref)[:40]}")
+        path = self._path(ref[len(REF_PREFIX):])
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:
+            raise BlobNotFound(ref)
+        self._touch(path, mtime)
+        return data
+
+    def get_json(self, ref: str) -> Any:
+        now = time.time()
+        with self._memo_lock:
+            entry = self._memo.get(ref)
+            if entry is not None:
+                self._memo.move_to_end(ref)
+                value, touched_at = entry
+                if now - touched_at > TOUCH_INTERVAL_SECONDS:
+                    self._memo[ref] = (value, now)
+        if entry is not None:
+            if now - touched_at > TOUCH_INTERVAL_SECONDS:
+                # Served from memory, but other workers may need the file after us
+                self._touch(self._path(ref[len(REF_PREFIX):]))
+            return value
+        value = json.loads(self.get_bytes(ref))
+        with self._memo_lock:
+            self._memo[ref] = (value, now)
+            if len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return value
+
+    # --- GC ---
+
+    def _maybe_gc(self):
+        now = time.time()
+        if now - self._last_gc < settings.BLOB_GC_INTERVAL_SECONDS:
+            return
+        if not self._gc_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_gc = now
+            self.gc(now)
+        except Exception as e:
+            logger.error(f"Blob GC failed: {e}")
+        finally:
+            self._gc_lock.release()
+
+    def gc(self, now: Optional[float] = None) -> int:
+        """Deletes blobs older than BLOB_TTL_SECONDS. Returns the number removed."""
+        cutoff = (now or time.time()) - settings.BLOB_TTL_SECONDS
+        removed = 0
+        if not self.root.exists():
+            return 0
+        for bucket in self.root.iterdir():
+            if not bucket.is_dir():
+                continue
+            for path in bucket.iterdir():
+                try:
+                    if path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            logger.info(f"Blob GC removed {removed} blobs")
+        return removed
+
+
+blob_store = BlobStore()
+
+
+def offload_json(value: Any) -> Any:
+    """
+    Replaces a large JSON-able value by a blob reference. Small values (and
+    values that already are references) are returned unchanged.
+    """
+    if value is None or is_blob_ref(value):
+        return value
+    payload = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    if len(payload) < settings.BLOB_INLINE_MAX_BYTES:
+        return value
+    try:
+        return blob_store.put_bytes(payload.encode("utf-8"))
+    except Exception as e:
+        logger.error(f"Blob offload failed, keeping value inline: {e}")
+        return value
+
+
+def offload_image_base64(image_b64: Optional[str]) -> Optional[str]:
+    """Stores an inline base64 image and returns its reference (inline on failure)."""
+    if not image_b64 or is_blob_ref(image_b64):
+        return image_b64
+    try:
+        return blob_store.put_image_base64(image_b64)
+    except Exception as e:
+        logger.error(f"Image offload failed, keeping it inline: {e}")
+        return image_b64
+
+
+def resolve_json(value: Any, default: Any = None) -> Any:
+    """Returns the stored value for a reference, or `value` itself if it is inline."""
+    if not is_blob_ref(value):
+        return default if value is None else value
+    try:
+        return blob_store.get_json(value)
+    except Exception as e:
+        logger.error(f"Blob resolve failed for {value[:24]}...: {e}")
+        return default
+
+
+def resolve_image_base64(value: Optional[str]) -> Optional[str]:
+    """Returns base64 image data for a reference, or `value` itself if it is inline."""
+    if not is_blob_ref(value):
+        return value
+    try:
+        return base64.b64encode(blob_store.get_bytes(value)).decode("utf-8")
+    except Exception as e:
+        logger.error(f"Image blob resolve failed for {value[:24]}...: {e}")
+        return None
@@ -0,0 +1,260 @@
+"""
+Per-(image, bounding box) Lens identification, with eager prefetch.
+
+After a detect_only pass the UI shows several boxes, and each click used to
+pay a crop, an ImgBB upload and a Lens call (up to 60s) through
+/agent/identify. With `identify_all` the vision node hands the detected
+boxes to `schedule_eager_identification`, which identifies all of them in
+parallel in the background under one per-request budget
+(EAGER_IDENTIFY_BUDGET_SECONDS). By the time the user clicks, /identify is a
+cache read.
+
+Results are keyed by sha256(image bytes) + the box normalized to 0-1000
+ints, so the blob reference in state and the base64 the client re-sends for
+/identify map to the same entry. They are stored as small JSON files under
+IDENTIFY_CACHE_DIR (shared by the gunicorn workers). While a box is being
+identified a `.pending` marker tells other workers to wait for it instead of
+calling Lens a second time; in the same process the caller simply joins the
+in-flight task.
+
+Expired results are deleted when read, and a periodic sweep (at most every
+IDENTIFY_CACHE_SWEEP_INTERVAL_SECONDS, piggybacked on writes) removes the
+ones never read again plus markers and temp files left by a crashed worker.
+"""
+from app.core.config import settings
+from app.services.blob_store import blob_store, is_blob_ref, REF_PREFIX
+from app.services.image_crop import crop_to_bounding_box
+from app.services.lens_identify import aidentify_product_with_lens
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# How often a waiting worker re-checks another worker's pending box
+PENDING_POLL_SECONDS = 0.25
+
+_inflight: Dict[str, asyncio.Task] = {}
+_background: set = set()
+
+
+def normalize_bbox(bbox: Sequence[float]) -> List[int]:
+    """[ymin, xmin, ymax, xmax] as ints on the 0-1000 scale (0-1 floats are scaled up)."""
+    values = [float(v) for v in bbox][:4]
+    if all(0 <= v <= 1 for v in values):
+        values = [v * 1000 for v in values]
+    return [int(round(v)) for v in values]
+
+
+def image_digest(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def box_key(digest: str, bbox: Sequence[float]) -> str:
+    box = ",".join(str(v) for v in normalize_bbox(bbox))
+    return hashlib.sha256(f"{digest}:{box}".encode()).hexdigest()[:32]
+
+
+def _pending_max_age() -> float:
+    """Markers older than this belong to a worker that died (identification is bounded by the budget)."""
+    return settings.EAGER_IDENTIFY_BUDGET_SECONDS + 5
+
+
+class BoxIdentifyCache:
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.IDENTIFY_CACHE_DIR)
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+
+    def _path(self, key: str, suffix: str = ".json") -> Path:
+        return self.root / f"{key}{suffix}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > settings.IDENTIFY_CACHE_TTL_SECONDS:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Identify cache read failed for {key}: {e}")
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.root / f".{key}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+            os.replace(tmp, self._path(key))
+        except Exception as e:
+            logger.error(f"Identify cache write failed for {key}: {e}")
+        self._maybe_sweep()
+
+    def mark_pending(self, key: str):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._path(key, ".pending").touch()
+        except Exception:
+            pass
+        self._maybe_sweep()
+
+    def clear_pending(self, key: str):
+        self._path(key, ".pending").unlink(missing_ok=True)
+
+    def is_pending(self, key: str) -> bool:
+        """True if another worker started this box recently (stale markers are ignored)."""
+        try:
+            age = time.time() - self._path(key, ".pending").stat().st_mtime
+        except FileNotFoundError:
+            return False
+        return age < _pending_max_age()
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep < settings.IDENTIFY_CACHE_SWEEP_INTERVAL_SECONDS:
+            return
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = now
+            self.sweep(now)
+        except Exception as e:
+            logger.error(f"Identify cache sweep failed: {e}")
+        finally:
+            self._sweep_lock.release()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Deletes results older than IDENTIFY_CACHE_TTL_SECONDS and stale
+        .pending markers / temp files. Returns the number of files removed.
+        """
+        now = now or time.time()
+        result_cutoff = now - settings.IDENTIFY_CACHE_TTL_SECONDS
+        marker_cutoff = now - _pending_max_age()
+        removed = 0
+        if not self.root.exists():
+            return 0
+        for path in self.root.iterdir():
+            if path.suffix == ".json":
+                cutoff = result_cutoff
+            elif path.suffix in (".pending", ".tmp"):
+                cutoff = marker_cutoff
+            else:
+                continue
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"Identify cache sweep removed {removed} files")
+        return removed
+
+
+box_cache = BoxIdentifyCache()
+
+
+async def _identify_and_store(key: str, image_bytes: bytes, bbox: Sequence[float], timeout: float) -> Dict[str, Any]:
+    await asyncio.to_thread(box_cache.mark_pending, key)
+    try:
+        cropped = await asyncio.to_thread(crop_to_bounding_box, image_bytes, normalize_bbox(bbox))
+        result = await aidentify_product_with_lens(cropped, "jpg", timeout=timeout)
+        if "error" not in result:
+            # Errors (quota, budget exhausted) are not cached; a click retries them
+            await asyncio.to_thread(box_cache.put, key, result)
+        return result
+    finally:
+        await asyncio.to_thread(box_cache.clear_pending, key)
+
+
+async def _wait_for_other_worker(key: str, timeout: float) -> Optional[Dict[str, Any]]:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        await asyncio.sleep(PENDING_POLL_SECONDS)
+        result = await asyncio.to_thread(box_cache.get, key)
+        if result is not None:
+            return result
+        if not await asyncio.to_thread(box_cache.is_pending, key):
+            return None
+    return None
+
+
+async def aidentify_box(image_bytes: bytes, bbox: Sequence[float], timeout: float = 60,
+                        digest: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Lens identification of one box: cache, then an in-flight identification
+    of the same box (this process or another worker), then a fresh Lens call.
+    The result carries `cached: True` when no new Lens call was needed.
+    """
+    key = box_key(digest or image_digest(image_bytes), bbox)
+
+    cached = await asyncio.to_thread(box_cache.get, key)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    task = _inflight.get(key)
+    if task is None and await asyncio.to_thread(box_cache.is_pending, key):
+        result = await _wait_for_other_worker(key, timeout)
+        if result is not None:
+            return {**result, "cached": True}
+        task = _inflight.get(key)
+
+    joined = task is not None
+    if task is None:
+        task = asyncio.ensure_future(_identify_and_store(key, image_bytes, bbox, timeout))
+        _inflight[key] = task
+        task.add_done_callback(lambda _t: _inflight.pop(key, None))
+
+    # Shielded: a caller giving up does not cancel the identification for the others
+    result = await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+    return {**result, "cached": joined}
+
+
+async def eager_identify_all(image_ref: str, detected_objects: List[Dict[str, Any]],
+                             budget_seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Identifies every detected box in parallel, all within one budget."""
+    budget_seconds = budget_seconds or settings.EAGER_IDENTIFY_BUDGET_SECONDS
+    deadline = time.time() + budget_seconds
+    start = time.time()
+
+    image_bytes = await asyncio.to_thread(blob_store.get_bytes, image_ref)
+    digest = image_ref[len(REF_PREFIX):]
+    boxes = [obj.get("bounding_box") for obj in detected_objects[:settings.EAGER_IDENTIFY_MAX_OBJECTS]]
+    boxes = [b for b in boxes if b and len(b) == 4]
+
+    async def identify(bbox):
+        try:
+            return await aidentify_box(image_bytes, bbox, timeout=max(1.0, deadline - time.time()), digest=digest)
+        except Exception as e:  # Timeout or Lens failure: the click path retries
+            return {"error": str(e) or type(e).__name__}
+
+    results = await asyncio.gather(*(identify(b) for b in boxes))
+    found = sum(1 for r in results if "error" not in r)
+    print(f"   [EagerIdentify] {found}/{len(boxes)} boxes identified in {time.time() - start:.2f}s")
+    return results
+
+
+def schedule_eager_identification(image_ref: Optional[str], detected_objects: List[Dict[str, Any]]) -> int:
+    """
+    Starts eager identification in the background (the detect_only response
+    does not wait for it). Returns the number of boxes scheduled.
+    """
+    if not is_blob_ref(image_ref) or not detected_objects:
+        return 0
+    count = min(len(detected_objects), settings.EAGER_IDENTIFY_MAX_OBJECTS)
+    task = asyncio.ensure_future(eager_identify_all(image_ref, detected_objects))
+    _background.add(task)  # Keep a reference until it finishes
+    task.add_done_callback(_background.discard)
+    return count
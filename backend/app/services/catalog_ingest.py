@@ -0,0 +1,235 @@
+"""
+Catalog ingestion for enriched Market Scout candidates.
+
+Every scout run produces enriched alternatives (name, category, price, image,
+purchase link). Instead of discarding them, they are queued here and a
+background worker embeds and upserts them into the Snowflake `products`
+table, deduplicated by a canonical product id. Over time the vector tier can
+answer "alternatives" for common categories without Tavily + LLM extraction.
+"""
+from app.core.config import settings
+from typing import List, Dict, Optional
+import hashlib
+import logging
+import queue
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Candidates we never write back (already from the catalog, or no usable data)
+SKIP_SOURCES = {"Snowflake Vector DB"}
+PLACEHOLDER_IMAGE_HOSTS = ("placehold.co", "via.placeholder.com")
+
+# Max candidates embedded in a single embed_documents call
+INGEST_BATCH_SIZE = 16
+
+# Task type of the catalog vectors. The seeded catalog was embedded with
+# embed_query, so ingested rows use the same type to stay comparable.
+EMBED_TASK_TYPE = "RETRIEVAL_QUERY"
+
+# Bound on the in-process "already ingested" memo
+MAX_SEEN_IDS = 50000
+
+
+def canonical_product_id(product_name: str) -> str:
+    """
+    Stable id for a product name, used to dedupe catalog rows.
+
+    Unlike SnowflakeCacheService.generate_key this keeps model numbers, so
+    "Sony WH-1000XM5" and "Sony WH-1000XM4" stay distinct products, while
+    retailer noise ("(Black)", "| Unlocked", punctuation, casing) is dropped.
+    """
+    normalized = (product_name or "").lower()
+    normalized = normalized.split('|')[0]
+    normalized = re.sub(r'\([^)]*\)', ' ', normalized)
+    normalized = re.sub(r'\b(unlocked|renewed|refurbished|certified|pre-owned|new|open box)\b', ' ', normalized)
+    normalized = re.sub(r'[^a-z0-9]+', ' ', normalized)
+    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    digest = hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:24]
+    return f"prod_{digest}"
+
+
+def _parse_price(cand: Dict) -> Optional[float]:
+    prices = cand.get('prices') or []
+    if prices:
+        try:
+            value = float(prices[0].get('price') or 0)
+            if value > 0:
+                return value
+        except (TypeError, ValueError):
+            pass
+
+    match = re.search(r'\$\s*([\d,]+(?:\.\d{1,2})?)', cand.get('price_text') or '')
+    if match:
+        try:
+            return float(match.group(1).replace(',', ''))
+        except ValueError:
+            pass
+    return None
+
+
+def candidate_to_product(cand: Dict) -> Optional[Dict]:
+    """
+    Converts an enriched scout candidate into a `products` row, or None if the
+    candidate is not worth persisting (no name, no price, catalog-sourced).
+    """
+    name = (cand.get('name') or '').strip()
+    if not name or cand.get('source') in SKIP_SOURCES or cand.get('is_main'):
+        return None
+
+    price = _parse_price(cand)
+    if not price:
+        return None
+
+    image_url = cand.get('image_url') or ''
+    if any(host in image_url for host in PLACEHOLDER_IMAGE_HOSTS):
+        image_url = ''
+
+    category = cand.get('category') or ''
+    reason = cand.get('reason') or ''
+    description = f"{category}. {reason}".strip('. ') if category else reason
+
+    return {
+        "id": canonical_product_id(name),
+        "name": name,
+        "description": description,
+        "price": price,
+        "image_url": image_url,
+        "source_url": cand.get('purchase_link') or '',
+        "metadata": {
+            "category": category,
+            "brand": name.split()[0] if name.split() else '',
+            "source": "market_scout",
+        },
+    }
+
+
+class CatalogIngestService:
+    """
+    Fire-and-forget ingestion queue with a single background worker thread.
+    Scout calls `enqueue_candidates` and never waits on embedding or Snowflake.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=1000)
+        self._seen_ids: Dict[str, None] = {}
+        self._seen_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._embeddings = None
+
+    def _ensure_worker(self):
+        if self._worker and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name="catalog-ingest", daemon=True)
+            self._worker.start()
+
+    def _mark_seen(self, product_id: str) -> bool:
+        """Returns False if the id was already queued/ingested by this process."""
+        with self._seen_lock:
+            if product_id in self._seen_ids:
+                return False
+            self._seen_ids[product_id] = None
+            if len(self._seen_ids) > MAX_SEEN_IDS:
+                # Drop the oldest half (dicts keep insertion order)
+                for key in list(self._seen_ids)[:MAX_SEEN_IDS // 2]:
+                    del self._seen_ids[key]
+            return True
+
+    def _unmark_seen(self, product_ids: List[str]):
+        """Forgets ids that were queued but never written, so a later run retries them."""
+        with self._seen_lock:
+            for product_id in product_ids:
+                self._seen_ids.pop(product_id, None)
+
+    def enqueue_candidates(self, candidates: List[Dict]) -> int:
+        """
+        Queues newly seen candidates for embedding + upsert. Non-blocking;
+        returns the number of products queued.
+        """
+        if not settings.CATALOG_INGEST_ENABLED or not candidates:
+            return 0
+
+        queued = 0
+        for cand in candidates:
+            product = candidate_to_product(cand)
+            if not product or not self._mark_seen(product['id']):
+                continue
+            try:
+                self._queue.put_nowait(product)
+                queued += 1
+            except queue.Full:
+                logger.warning("Catalog ingest queue full, dropping candidate")
+                self._unmark_seen([product['id']])
+                break
+
+        if queued:
+            self._ensure_worker()
+        return queued
+
+    def _get_embeddings(self):
+        if self._embeddings is None:
+            from app.agent.llm import get_embeddings
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < INGEST_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.ingest_batch(batch)
+            except Exception as e:
+                logger.error(f"Catalog ingest batch failed: {e}")
+                self._unmark_seen([p['id'] for p in batch])
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def ingest_batch(self, products: List[Dict]) -> int:
+        """
+        Embeds and upserts a batch of products. Rows already in the catalog
+        (written by another worker or an earlier run) are skipped; products
+        that fail to embed or insert are unmarked so they can be queued again.
+        """
+        from app.services.snowflake_vector import snowflake_vector_service
+
+        existing = snowflake_vector_service.get_existing_ids([p['id'] for p in products])
+        new_products = [p for p in products if p['id'] not in existing]
+        if not new_products:
+            return 0
+
+        # Same text recipe as seed_products.py so vectors are comparable
+        texts = [f"{p['name']} - {p['description']}" for p in new_products]
+        vectors = self._get_embeddings().embed_documents(texts, task_type=EMBED_TASK_TYPE)
+
+        inserted, failed = [], []
+        for product, vector in zip(new_products, vectors):
+            if not vector:
+                failed.append(product['id'])
+                continue
+            success, msg = snowflake_vector_service.insert_product(product, vector)
+            if success:
+                inserted.append(product)
+            else:
+                failed.append(product['id'])
+                logger.warning(f"Catalog ingest failed for {product['name']}: {msg}")
+        self._unmark_seen(failed)
+
+        if inserted:
+            from app.services.hybrid_search import hybrid_search_service
+            # Added to the live lexical index in place: no full catalog reload per batch
+            hybrid_search_service.add_documents(inserted)
+            print(f"   [Ingest] 📥 Added {len(inserted)} new products to catalog")
+        return len(inserted)
+
+
+catalog_ingest_service = CatalogIngestService()
@@ -0,0 +1,404 @@
+"""
+Shared, memory-mapped embedding store.
+
+gunicorn runs several worker processes; loading an in-process vector index in
+each one would multiply RAM by the worker count. Instead, snapshots are
+written once to disk as a float32 `.npy` matrix (rows L2-normalized), a
+fixed-width id table and the product rows themselves (JSON lines plus an
+offset table), and every worker maps them read-only (`np.load(mmap_mode='r')`,
+`mmap`). The OS page cache then holds a single copy that all workers share,
+and a search needs neither Snowflake nor a per-worker copy of the catalog.
+
+Layout under EMBEDDING_STORE_DIR:
+
+    snapshots/<version>/vectors.npy   float32 (n, dim)
+    snapshots/<version>/ids.npy       S64 (n,); longer ids are not published
+    snapshots/<version>/docs.jsonl    one product row per line
+    snapshots/<version>/offsets.npy   int64 (n + 1,) byte offsets into docs.jsonl
+    CURRENT                           name of the live snapshot
+
+Publishing writes a new snapshot directory and then atomically swaps CURRENT
+(os.replace), so readers never observe a half-written snapshot.
+
+Products ingested after a snapshot are not in it, so snapshots are rebuilt
+on a schedule: once the live one is older than EMBEDDING_SNAPSHOT_REFRESH_SECONDS
+(or when none was published yet, which builds the first one), one worker
+(holding a lock file) rebuilds it from Snowflake in the background. A snapshot older than EMBEDDING_SNAPSHOT_MAX_AGE_SECONDS (rebuilds
+failing) is not used, and searches go to Snowflake again.
+"""
+from app.core.config import settings
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pathlib import Path
+import fcntl
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ID_DTYPE = "S64"
+MAX_ID_BYTES = 64
+
+# How often readers check CURRENT for a newly published snapshot
+RELOAD_CHECK_SECONDS = 5.0
+
+# Number of old snapshots kept on disk after a publish
+KEEP_SNAPSHOTS = 2
+
+# After a rebuild that published nothing (no Snowflake, failure), wait this long before trying again
+REFRESH_RETRY_SECONDS = 60
+
+
+class EmbeddingSnapshot:
+    """Read-only view over one published snapshot."""
+
+    def __init__(self, version: str, path: Path):
+        self.version = version
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        self.ids = np.load(path / "ids.npy", mmap_mode="r")
+        self._docs: Optional[mmap.mmap] = None
+        self._offsets = None
+        if (path / "docs.jsonl").exists():
+            self._offsets = np.load(path / "offsets.npy", mmap_mode="r")
+            with open(path / "docs.jsonl", "rb") as f:
+                if os.fstat(f.fileno()).st_size:
+                    self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def has_docs(self) -> bool:
+        return self._offsets is not None
+
+    @property
+    def age_seconds(self) -> float:
+        # Versions are publish times in nanoseconds
+        return time.time() - int(self.version) / 1e9
+
+    def id_at(self, row: int) -> str:
+        return self.ids[row].decode("utf-8")
+
+    def doc(self, row: int) -> Dict[str, Any]:
+        """The product row published with vector `row`."""
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return json.loads(self._docs[start:end])
+
+    def search(self, query_vector: List[float], limit: int,
+               predicate: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float]]:
+        """
+        Cosine top-k over the mapped matrix, as [(row, score)]. With a
+        `predicate` (on the row), the candidate window is widened until
+        `limit` rows pass it (or the snapshot is exhausted).
+        """
+        n = len(self)
+        if n == 0 or limit <= 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = self.vectors @ (query / norm)
+
+        window = min(n, limit if predicate is None else limit * 4)
+        while True:
+            if window >= n:
+                top = np.argsort(-scores)
+            else:
+                top = np.argpartition(-scores, window - 1)[:window]
+                top = top[np.argsort(-scores[top])]
+
+            results = []
+            for row in top:
+                row = int(row)
+                if predicate is None or predicate(row):
+                    results.append((row, float(scores[row])))
+                    if len(results) >= limit:
+                        return results
+
+            if window >= n:
+                return results
+            window = min(n, window * 4)
+
+
+class EmbeddingStore:
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.EMBEDDING_STORE_DIR)
+        self._snapshot: Optional[EmbeddingSnapshot] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._retry_at = 0.0
+
+    @property
+    def current_file(self) -> Path:
+        return self.root / "CURRENT"
+
+    @property
+    def snapshots_dir(self) -> Path:
+        return self.root / "snapshots"
+
+    def _read_current_version(self) -> Optional[str]:
+        try:
+            return self.current_file.read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current(self) -> Optional[EmbeddingSnapshot]:
+        """
+        Returns the live snapshot, remapping if another process published a
+        new one since the last check. Returns None if nothing was published.
+        """
+        now = time.time()
+        if self._snapshot is not None and now - self._last_check < RELOAD_CHECK_SECONDS:
+            return self._snapshot
+
+        with self._lock:
+            self._last_check = now
+            version = self._read_current_version()
+            if not version:
+                return self._snapshot
+            if self._snapshot is None or self._snapshot.version != version:
+                try:
+                    self._snapshot = EmbeddingSnapshot(version, self.snapshots_dir / version)
+                    logger.info(f"Mapped embedding snapshot {version} ({len(self._snapshot)} vectors)")
+                except Exception as e:
+                    logger.error(f"Failed to map embedding snapshot {version}: {e}")
+        return self._snapshot
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @staticmethod
+    def _doc_line(doc: Dict[str, Any]) -> bytes:
+        return json.dumps(doc, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+
+    def _new_staging(self) -> Tuple[str, Path]:
+        version = f"{time.time_ns():020d}"  # Sortable, so pruning keeps the newest
+        self.snapshots_dir.mkdir(parents=True, exist_ok=True)
+        staging = self.snapshots_dir / f".{version}.tmp"
+        staging.mkdir()
+        return version, staging
+
+    def _commit(self, version: str, staging: Path, count: int) -> str:
+        """Moves a fully written staging directory into place and swaps CURRENT to it."""
+        os.rename(staging, self.snapshots_dir / version)
+
+        tmp_current = self.root / f".CURRENT.{uuid.uuid4().hex}"
+        with open(tmp_current, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_current, self.current_file)
+
+        self._last_check = 0.0
+        self._prune(keep=version)
+        logger.info(f"Published embedding snapshot {version} ({count} vectors)")
+        return version
+
+    def publish(self, ids: List[str], vectors, docs: Optional[List[Dict[str, Any]]] = None) -> str:
+        """
+        Writes a new snapshot and atomically makes it the live one.
+        Vectors are L2-normalized so search is a plain dot product. `docs`
+        are the product rows (same order as `ids`). Ids longer than
+        MAX_ID_BYTES do not fit the id table and are left out.
+        """
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError(f"Expected ({len(ids)}, dim) vectors, got {matrix.shape}")
+        if docs is not None and len(docs) != len(ids):
+            raise ValueError(f"Expected {len(ids)} docs, got {len(docs)}")
+
+        keep = [i for i, product_id in enumerate(ids) if len(product_id.encode("utf-8")) <= MAX_ID_BYTES]
+        if len(keep) < len(ids):
+            logger.warning(f"Skipping {len(ids) - len(keep)} products with ids over {MAX_ID_BYTES} bytes")
+            ids = [ids[i] for i in keep]
+            matrix = matrix[keep]
+            docs = [docs[i] for i in keep] if docs is not None else None
+
+        version, staging = self._new_staging()
+        np.save(staging / "vectors.npy", self._normalize(matrix))
+        np.save(staging / "ids.npy", np.asarray([i.encode("utf-8") for i in ids], dtype=ID_DTYPE))
+        if docs is not None:
+            offsets = [0]
+            with open(staging / "docs.jsonl", "wb") as f:
+                for doc in docs:
+                    line = self._doc_line(doc)
+                    f.write(line)
+                    offsets.append(offsets[-1] + len(line))
+            np.save(staging / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+        return self._commit(version, staging, len(ids))
+
+    def _prune(self, keep: str):
+        """Deletes old snapshots. Workers still mapping them keep their open inodes."""
+        versions = sorted(
+            (p for p in self.snapshots_dir.iterdir() if p.is_dir() and not p.name.startswith(".")),
+            key=lambda p: p.name,
+            reverse=True,
+        )
+        for path in versions[KEEP_SNAPSHOTS:]:
+            if path.name != keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def _truncate_npy(path: Path, rows: int, chunk: int):
+        """Rewrites a preallocated .npy file keeping only its first `rows` rows, `chunk` rows at a time."""
+        old = np.load(path, mmap_mode="r")
+        tmp = path.with_name(f".{path.name}")
+        new = np.lib.format.open_memmap(tmp, mode="w+", dtype=old.dtype, shape=(rows,) + old.shape[1:])
+        for start in range(0, rows, chunk):
+            end = min(start + chunk, rows)
+            new[start:end] = old[start:end]
+        new.flush()
+        del old, new
+        os.replace(tmp, path)
+
+    def rebuild_from_snowflake(self, batch_size: int = 5000) -> Optional[str]:
+        """
+        Exports all products (rows and embeddings) from Snowflake into a new
+        snapshot. Runs on a schedule (refresh_if_stale) or offline (see
+        build_embedding_snapshot.py).
+
+        Pages (keyset-paginated on id) are written straight into memory-mapped
+        arrays and docs.jsonl in the staging directory, so memory stays at
+        one page whatever the catalog size. The arrays are sized by a
+        COUNT(*) taken first: products inserted during the export wait for
+        the next snapshot.
+        """
+        from app.services.snowflake_vector import snowflake_vector_service
+
+        session = snowflake_vector_service.session
+        if not session:
+            logger.error("No Snowflake session, cannot rebuild embedding snapshot")
+            return None
+
+        total = session.sql("SELECT COUNT(*) AS n FROM products WHERE embedding IS NOT NULL").collect()[0]['N']
+        if not total:
+            return None
+
+        version, staging = self._new_staging()
+        try:
+            open_memmap = np.lib.format.open_memmap
+            ids = open_memmap(staging / "ids.npy", mode="w+", dtype=ID_DTYPE, shape=(total,))
+            offsets = open_memmap(staging / "offsets.npy", mode="w+", dtype=np.int64, shape=(total + 1,))
+            offsets[0] = 0
+            vectors = None  # Created on the first row, once the dimension is known
+            count = skipped = 0
+            last_id = None
+
+            with open(staging / "docs.jsonl", "wb") as docs_file:
+                while count < total:
+                    after = f"AND id > '{snowflake_vector_service._sql_literal(last_id)}' " if last_id is not None else ""
+                    rows = session.sql(
+                        f"SELECT id, name, description, price, image_url, source_url, metadata, "
+                        f"embedding::ARRAY AS embedding FROM products "
+                        f"WHERE embedding IS NOT NULL {after}ORDER BY id LIMIT {batch_size}"
+                    ).collect()
+                    if not rows:
+                        break
+                    last_id = rows[-1]['ID']
+
+                    for row in rows:
+                        if count >= total:
+                            break
+                        if len(row['ID'].encode("utf-8")) > MAX_ID_BYTES:
+                            skipped += 1
+                            continue
+                        vector = row['EMBEDDING']
+                        if isinstance(vector, str):
+                            vector = json.loads(vector)
+                        vector = np.asarray(vector, dtype=np.float32)
+                        if vectors is None:
+                            vectors = open_memmap(staging / "vectors.npy", mode="w+", dtype=np.float32, shape=(total, len(vector)))
+                        metadata = row['METADATA']
+                        if isinstance(metadata, str):
+                            try:
+                                metadata = json.loads(metadata)
+                            except ValueError:
+                                metadata = {}
+                        line = self._doc_line({
+                            "id": row['ID'],
+                            "name": row['NAME'],
+                            "description": row['DESCRIPTION'],
+                            "price": row['PRICE'],
+                            "image_url": row['IMAGE_URL'],
+                            "source_url": row['SOURCE_URL'],
+                            "metadata": metadata or {},
+                        })
+                        vectors[count] = self._normalize(vector)
+                        ids[count] = row['ID'].encode("utf-8")
+                        docs_file.write(line)
+                        offsets[count + 1] = offsets[count] + len(line)
+                        count += 1
+
+            if skipped:
+                logger.warning(f"Skipping {skipped} products with ids over {MAX_ID_BYTES} bytes")
+            if not count:
+                shutil.rmtree(staging, ignore_errors=True)
+                return None
+
+            for array in (vectors, ids, offsets):
+                array.flush()
+            del vectors, ids, offsets
+            if count < total:
+                # Rows deleted (or skipped) since the count: drop the unused tail
+                self._truncate_npy(staging / "vectors.npy", count, batch_size)
+                self._truncate_npy(staging / "ids.npy", count, batch_size)
+                self._truncate_npy(staging / "offsets.npy", count + 1, batch_size)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return self._commit(version, staging, count)
+
+    def refresh_if_stale(self, snapshot: Optional[EmbeddingSnapshot]):
+        """
+        Starts a background rebuild when `snapshot` is older than
+        EMBEDDING_SNAPSHOT_REFRESH_SECONDS, or when none was published yet
+        (None), which builds the first one. Only one process rebuilds at a
+        time (a lock file under the store root); the others keep serving it.
+        """
+        if snapshot is not None and snapshot.age_seconds < settings.EMBEDDING_SNAPSHOT_REFRESH_SECONDS:
+            return
+        if time.time() < self._retry_at:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="embedding-snapshot-refresh", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / ".rebuild.lock", "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return  # Another worker is rebuilding
+                # It may have published while we were starting
+                self._last_check = 0.0
+                snapshot = self.current()
+                if snapshot is not None and snapshot.age_seconds < settings.EMBEDDING_SNAPSHOT_REFRESH_SECONDS:
+                    return
+                if self.rebuild_from_snowflake() is None:
+                    self._retry_at = time.time() + REFRESH_RETRY_SECONDS
+        except Exception as e:
+            self._retry_at = time.time() + REFRESH_RETRY_SECONDS
+            logger.error(f"Scheduled embedding snapshot rebuild failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+embedding_store = EmbeddingStore()
@@ -0,0 +1,391 @@
+"""
+Hybrid (lexical + vector) product retrieval.
+
+Dense embeddings match model numbers ("WH-1000XM5", "MX Master 3S") poorly,
+so vector search alone returns near-misses. This service keeps an in-process
+BM25 index over product name + description (with model-number aware
+tokenization) and fuses it with the Snowflake vector ranking using
+Reciprocal Rank Fusion (RRF).
+
+The index is built in a background thread and swapped in atomically when
+ready: a search never waits for a build. Until the first build finishes a
+worker serves vector results only, and an expired index keeps being served
+while its replacement is built.
+
+When a memory-mapped embedding snapshot has been published (see
+embedding_store.py), the vector ranking and its product rows come from it
+instead of a round trip to Snowflake.
+
+Exposed as a drop-in for SnowflakeVectorService.search_similar_products.
+"""
+from app.services.snowflake_vector import snowflake_vector_service
+from app.services.embedding_store import embedding_store
+from app.core.config import settings
+from typing import List, Optional, Dict, Tuple
+import bisect
+import heapq
+import json
+import logging
+import math
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# RRF constant (standard value from Cormack et al.)
+RRF_K = 60
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_BOOST = 2  # Name terms count double vs description terms
+
+# After a failed build, wait this long before trying again
+REBUILD_RETRY_SECONDS = 60
+
+# Impact-ordered postings are truncated to this many entries per term.
+# Very common terms ("wireless", "black") would otherwise dominate query time
+# on large catalogs while contributing almost nothing to the ranking.
+MAX_POSTINGS_PER_TERM = 2000
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_MODEL_RE = re.compile(r"\b[a-z0-9]+(?:[-/.][a-z0-9]+)+\b|\b(?=[a-z]*\d)[a-z0-9]{3,}\b")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenizes text for the lexical index.
+
+    Besides plain words, model-number-like tokens are added in a "squashed"
+    form (punctuation removed) plus their character trigrams, so
+    "WH-1000XM5", "WH1000XM5" and "1000XM5" all share terms.
+    """
+    if not text:
+        return []
+    lowered = text.lower()
+    tokens = _WORD_RE.findall(lowered)
+
+    for match in _MODEL_RE.findall(lowered):
+        squashed = re.sub(r"[^a-z0-9]", "", match)
+        if len(squashed) < 3 or not any(ch.isdigit() for ch in squashed):
+            continue
+        tokens.append(squashed)
+        tokens.extend(f"#{squashed[i:i + 3]}" for i in range(len(squashed) - 2))
+
+    return tokens
+
+
+def matches_filters(doc: Dict, filters: Optional[Dict]) -> bool:
+    """
+    Python mirror of SnowflakeVectorService._build_filter_clause, used for
+    the lexical side so both rankings only contain qualifying products.
+    """
+    if not filters:
+        return True
+
+    name = (doc.get('name') or '').lower()
+    description = (doc.get('description') or '').lower()
+    metadata = doc.get('metadata') or {}
+    brand = str(metadata.get('brand') or '').lower()
+
+    def brand_match(b: str) -> bool:
+        b = b.strip().lower()
+        return b in name or b == brand
+
+    prefer_brands = [b for b in filters.get('prefer_brands') or [] if b and b.strip()]
+    if prefer_brands and not any(brand_match(b) for b in prefer_brands):
+        return False
+
+    if any(brand_match(b) for b in filters.get('exclude_brands') or [] if b and b.strip()):
+        return False
+
+    for color in filters.get('exclude_colors') or []:
+        if color and color.strip() and (color.strip().lower() in name or color.strip().lower() in description):
+            return False
+
+    max_price = filters.get('max_price')
+    price = doc.get('price')
+    if max_price is not None and price is not None:
+        try:
+            if float(price) > float(max_price):
+                return False
+        except (TypeError, ValueError):
+            pass
+
+    category = filters.get('category')
+    if category and str(category).strip():
+        if str(category).strip().lower() not in str(metadata.get('category') or '').lower():
+            return False
+
+    return True
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index with precomputed per-posting impacts.
+
+    Document-length normalization and IDF are folded into each posting at
+    build time, so a query is just a sum over (truncated) postings lists.
+    Documents added later (`add`) are scored against the collection
+    statistics as they are then; existing postings keep their build-time
+    impacts until the next full build.
+    """
+
+    def __init__(self, docs: List[Dict]):
+        self.docs = docs
+        self.docs_by_id = {doc['id']: doc for doc in docs}
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        self.doc_freq: Dict[str, int] = {}
+        self.avg_len = 1.0
+        self._write_lock = threading.Lock()
+        self._build()
+
+    @staticmethod
+    def _term_freqs(doc: Dict) -> Dict[str, int]:
+        tf: Dict[str, int] = {}
+        for term in tokenize(doc.get('name') or ''):
+            tf[term] = tf.get(term, 0) + NAME_BOOST
+        for term in tokenize(doc.get('description') or ''):
+            tf[term] = tf.get(term, 0) + 1
+        return tf
+
+    def _impact(self, freq: int, doc_len: int, df: int) -> float:
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / self.avg_len)
+        idf = math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+        return idf * freq * (BM25_K1 + 1) / (freq + norm)
+
+    def _build(self):
+        term_freqs = [self._term_freqs(doc) for doc in self.docs]
+        doc_lengths = [sum(tf.values()) for tf in term_freqs]
+        doc_freq: Dict[str, int] = {}
+        for tf in term_freqs:
+            for term in tf:
+                doc_freq[term] = doc_freq.get(term, 0) + 1
+
+        n_docs = len(self.docs)
+        self.avg_len = (sum(doc_lengths) / n_docs) if n_docs else 1.0
+        self.doc_freq = doc_freq
+
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for doc_idx, tf in enumerate(term_freqs):
+            for term, freq in tf.items():
+                impact = self._impact(freq, doc_lengths[doc_idx], doc_freq[term])
+                postings.setdefault(term, []).append((doc_idx, impact))
+
+        for term, plist in postings.items():
+            plist.sort(key=lambda p: p[1], reverse=True)
+            postings[term] = plist[:MAX_POSTINGS_PER_TERM]
+
+        self.postings = postings
+
+    def add(self, docs: List[Dict]) -> int:
+        """
+        Adds documents to the live index (ids already indexed are skipped).
+        Changed postings lists are replaced, not mutated, so concurrent
+        searches see either the old or the new list.
+        """
+        added = 0
+        with self._write_lock:
+            for doc in docs:
+                if doc['id'] in self.docs_by_id:
+                    continue
+                tf = self._term_freqs(doc)
+                doc_len = sum(tf.values())
+                doc_idx = len(self.docs)
+                self.docs.append(doc)
+                self.docs_by_id[doc['id']] = doc
+                for term, freq in tf.items():
+                    self.doc_freq[term] = self.doc_freq.get(term, 0) + 1
+                    impact = self._impact(freq, doc_len, self.doc_freq[term])
+                    plist = self.postings.get(term, [])
+                    pos = bisect.bisect_left(plist, -impact, key=lambda p: -p[1])
+                    if pos < MAX_POSTINGS_PER_TERM:
+                        self.postings[term] = (plist[:pos] + [(doc_idx, impact)] + plist[pos:])[:MAX_POSTINGS_PER_TERM]
+                added += 1
+        return added
+
+    def search(self, query: str, limit: int, filters: Optional[Dict] = None) -> List[Tuple[int, float]]:
+        """Returns [(doc_idx, bm25_score)] for the top `limit` qualifying docs."""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            for doc_idx, impact in self.postings.get(term, ()):
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + impact
+
+        if not filters:
+            return heapq.nlargest(limit, scores.items(), key=lambda x: x[1])
+
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+        results = []
+        for doc_idx, score in ranked:
+            if matches_filters(self.docs[doc_idx], filters):
+                results.append((doc_idx, score))
+                if len(results) >= limit:
+                    break
+        return results
+
+
+class HybridSearchService:
+    @property
+    def session(self):
+        return snowflake_vector_service.session
+
+    def __init__(self):
+        self._index: Optional[LexicalIndex] = None
+        self._index_built_at = 0.0
+        self._retry_at = 0.0
+        self._building = False
+        self._pending: List[Dict] = []  # Added while a build is running (may be missing from it)
+        self._lock = threading.Lock()
+
+    def _load_catalog(self) -> List[Dict]:
+        """Pulls the lexical fields of the products catalog from Snowflake."""
+        session = self.session
+        if not session:
+            return []
+        rows = session.sql(
+            "SELECT id, name, description, price, image_url, source_url, metadata FROM products"
+        ).collect()
+        docs = []
+        for row in rows:
+            metadata = row['METADATA']
+            if isinstance(metadata, str):
+                try:
+                    metadata = json.loads(metadata)
+                except ValueError:
+                    metadata = {}
+            docs.append({
+                "id": row['ID'],
+                "name": row['NAME'],
+                "description": row['DESCRIPTION'],
+                "price": row['PRICE'],
+                "image_url": row['IMAGE_URL'],
+                "source_url": row['SOURCE_URL'],
+                "metadata": metadata or {},
+            })
+        return docs
+
+    def get_index(self) -> Optional[LexicalIndex]:
+        """
+        The current lexical index, without waiting: if it is missing or older
+        than the TTL, a rebuild starts in the background and the old index
+        (or None before the first build) is returned meanwhile.
+        """
+        now = time.time()
+        expired = self._index is None or now - self._index_built_at >= settings.HYBRID_INDEX_TTL_SECONDS
+        if expired and now >= self._retry_at:
+            self._start_rebuild()
+        return self._index
+
+    def _start_rebuild(self):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+            self._pending = []
+        threading.Thread(target=self._rebuild, name="hybrid-index-build", daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            build_start = time.time()
+            docs = self._load_catalog()
+            index = LexicalIndex(docs)
+            with self._lock:
+                pending, self._pending = self._pending, []
+            index.add(pending)
+            self._index, self._index_built_at = index, time.time()  # Readers switch to it on their next call
+            logger.info(f"Hybrid lexical index built over {len(docs)} products in {time.time() - build_start:.2f}s")
+        except Exception as e:
+            self._retry_at = time.time() + REBUILD_RETRY_SECONDS
+            logger.error(f"Hybrid lexical index build failed: {e}")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def add_documents(self, docs: List[Dict]) -> int:
+        """
+        Makes newly ingested products searchable without a full catalog
+        reload. A build already running may have read the catalog before
+        they were written, so they are also handed to it.
+        """
+        with self._lock:
+            if self._building:
+                self._pending.extend(docs)
+        index = self._index
+        return index.add(docs) if index else 0
+
+    def _local_vector_search(self, query_vector: List[float], limit: int, filters: Optional[Dict]) -> Optional[List[dict]]:
+        """
+        Vector ranking from the shared memory-mapped snapshot (vectors and
+        product rows), if a usable one has been published. Returns None to
+        signal "fall back to Snowflake".
+        """
+        snapshot = embedding_store.current()
+        embedding_store.refresh_if_stale(snapshot)  # Also builds the first snapshot
+        if snapshot is None or not snapshot.has_docs:
+            return None
+        if snapshot.age_seconds > settings.EMBEDDING_SNAPSHOT_MAX_AGE_SECONDS:
+            return None  # Too old to miss the recently ingested products
+
+        def qualifies(row: int) -> bool:
+            return matches_filters(snapshot.doc(row), filters)
+
+        try:
+            hits = snapshot.search(query_vector, limit, predicate=qualifies if filters else None)
+            return [{**snapshot.doc(row), "score": score} for row, score in hits]
+        except Exception as e:
+            logger.error(f"Local vector search failed, falling back to Snowflake: {e}")
+            return None
+
+    def search_similar_products(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        filters: Optional[Dict] = None,
+        query_text: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Drop-in replacement for SnowflakeVectorService.search_similar_products.
+
+        When `query_text` is given, the vector ranking is fused with a BM25
+        ranking over name/description via RRF. Without it this is plain
+        vector search. Both rankings honour the same structured `filters`.
+        """
+        vector_results = self._local_vector_search(query_vector, limit, filters)
+        if vector_results is None:
+            vector_results = snowflake_vector_service.search_similar_products(query_vector, limit=limit, filters=filters)
+        if not query_text:
+            return vector_results
+
+        index = self.get_index()
+        if not index or not index.docs:
+            return vector_results
+
+        lexical_start = time.time()
+        lexical_hits = index.search(query_text, limit=limit, filters=filters)
+        lexical_ms = (time.time() - lexical_start) * 1000
+        if lexical_ms > settings.HYBRID_LEXICAL_BUDGET_MS:
+            logger.warning(f"Hybrid lexical search over budget: {lexical_ms:.1f}ms for '{query_text[:50]}'")
+
+        # Reciprocal Rank Fusion
+        fused: Dict[str, Dict] = {}
+        for rank, res in enumerate(vector_results, start=1):
+            entry = fused.setdefault(res['id'], {**res, "vector_score": res.get('score'), "rrf_score": 0.0})
+            entry['vector_rank'] = rank
+            entry['rrf_score'] += 1.0 / (RRF_K + rank)
+
+        for rank, (doc_idx, bm25_score) in enumerate(lexical_hits, start=1):
+            doc = index.docs[doc_idx]
+            entry = fused.setdefault(doc['id'], {**doc, "vector_score": None, "rrf_score": 0.0})
+            entry['lexical_rank'] = rank
+            entry['lexical_score'] = bm25_score
+            entry['rrf_score'] += 1.0 / (RRF_K + rank)
+
+        output = sorted(fused.values(), key=lambda r: r['rrf_score'], reverse=True)[:limit]
+        for res in output:
+            res['score'] = res['rrf_score']
+        return output
+
+
+hybrid_search_service = HybridSearchService()
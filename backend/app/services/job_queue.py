@@ -0,0 +1,290 @@
+"""
+Persistent background job queue for heavy agent runs.
+
+`/agent/analyze-image` holds a connection (and a gunicorn request slot) open
+for the whole pipeline. Job mode instead stores the request in the
+`agent_jobs` table (DATABASE_URL unless JOB_DB_URL is set, shared by all
+gunicorn workers, same setup as the checkpoint store) and returns a job id straight away; clients
+poll GET /agent/jobs/{id} or subscribe to /agent/jobs/{id}/events.
+
+Every gunicorn worker runs JOB_WORKERS_PER_PROCESS asyncio workers that
+claim queued jobs. A claim is a single UPDATE that also checks the global
+cap (at most JOB_MAX_RUNNING jobs running across all processes), so heavy
+analyses cannot take every request slot away from chat turns.
+
+A claimed job holds a lease of JOB_LEASE_SECONDS, extended by a heartbeat
+while the handler runs; if its process dies the heartbeat stops and the job
+is re-queued once the lease expires (up to JOB_MAX_ATTEMPTS). Results stay in the table for
+JOB_RESULT_TTL_SECONDS so they can be replayed. Large inputs (images) are
+stored as blob references (blob_store.py), never inline.
+
+Handlers are registered per job kind (`register_handler`) by the module that
+knows how to run them (api/v1/endpoints/agent.py for "analyze_image").
+"""
+from app.agent.checkpointer import create_store_engine
+from app.core.config import settings
+from app.core import metrics
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+from sqlalchemy import (
+    Column, Float, Integer, MetaData, String, Table, Text,
+    delete, func, select, update, and_,
+)
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+metadata_obj = MetaData()
+
+jobs_table = Table(
+    "agent_jobs", metadata_obj,
+    Column("job_id", String(32), primary_key=True),
+    Column("kind", String(64)),
+    Column("user_id", String(64), index=True),
+    Column("status", String(16), index=True),
+    Column("payload", Text),
+    Column("result", Text, nullable=True),
+    Column("error", Text, nullable=True),
+    Column("attempts", Integer, default=0),
+    Column("claim_token", String(32), nullable=True, index=True),
+    Column("worker", String(64), nullable=True),
+    Column("created_at", Float, index=True),
+    Column("started_at", Float, nullable=True),
+    Column("finished_at", Float, nullable=True),
+    Column("lease_expires_at", Float, nullable=True),
+)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class JobQueue:
+    def __init__(self, db_url: Optional[str] = None):
+        self.db_url = db_url or settings.JOB_DB_URL
+        self._engine = None
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_gc = 0.0
+        self._last_recover = 0.0
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = create_store_engine(self.db_url)
+            metadata_obj.create_all(self._engine)
+        return self._engine
+
+    def register_handler(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    # --- Client side ---
+
+    def submit(self, kind: str, payload: Dict[str, Any], user_id: Optional[str] = None) -> str:
+        """Stores a queued job and returns its id. `payload` must be small (blob refs for images)."""
+        job_id = uuid.uuid4().hex
+        with self.engine.begin() as conn:
+            conn.execute(jobs_table.insert().values(
+                job_id=job_id, kind=kind, user_id=user_id, status=QUEUED,
+                payload=json.dumps(payload), attempts=0, created_at=time.time(),
+            ))
+        metrics.JOBS.labels(kind=kind, status=QUEUED).inc()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.engine.connect() as conn:
+            row = conn.execute(select(jobs_table).where(jobs_table.c.job_id == job_id)).first()
+        if row is None:
+            return None
+        job = {
+            "job_id": row.job_id,
+            "kind": row.kind,
+            "user_id": row.user_id,
+            "status": row.status,
+            "attempts": row.attempts,
+            "created_at": row.created_at,
+            "started_at": row.started_at,
+            "finished_at": row.finished_at,
+            "error": row.error,
+            "result": json.loads(row.result) if row.result else None,
+        }
+        if row.status == QUEUED:
+            job["queue_position"] = self._queue_position(row.created_at)
+        return job
+
+    def _queue_position(self, created_at: float) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(func.count()).select_from(jobs_table)
+                .where(and_(jobs_table.c.status == QUEUED, jobs_table.c.created_at < created_at))
+            ).scalar() or 0
+
+    # --- Worker side ---
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Atomically claims the oldest queued job unless JOB_MAX_RUNNING jobs are
+        already running (one UPDATE statement, so two processes cannot both win).
+
+        On Postgres the oldest queued row is picked with FOR UPDATE SKIP LOCKED,
+        so concurrent claimers take different jobs instead of queueing on the
+        same row, and `status == queued` is re-checked on the locked row. The
+        running-count check is not serialized there, so the cap can be briefly
+        exceeded by concurrent claims. SQLite serializes writers anyway.
+        """
+        token = uuid.uuid4().hex
+        now = time.time()
+        oldest_queued = (
+            select(jobs_table.c.job_id).where(jobs_table.c.status == QUEUED)
+            .order_by(jobs_table.c.created_at).limit(1)
+            .with_for_update(skip_locked=True).scalar_subquery()
+        )
+        running = select(func.count()).select_from(jobs_table).where(jobs_table.c.status == RUNNING).scalar_subquery()
+        with self.engine.begin() as conn:
+            claimed = conn.execute(
+                update(jobs_table)
+                .where(and_(jobs_table.c.job_id == oldest_queued, jobs_table.c.status == QUEUED,
+                            running < settings.JOB_MAX_RUNNING))
+                .values(status=RUNNING, claim_token=token, worker=self.worker_id, started_at=now,
+                        lease_expires_at=now + settings.JOB_LEASE_SECONDS, attempts=jobs_table.c.attempts + 1)
+            ).rowcount
+            if not claimed:
+                return None
+            row = conn.execute(select(jobs_table).where(jobs_table.c.claim_token == token)).first()
+        if row is None:
+            return None
+        return {"job_id": row.job_id, "kind": row.kind, "payload": json.loads(row.payload),
+                "attempts": row.attempts, "claim_token": token}
+
+    def _extend_lease(self, job: Dict[str, Any]) -> bool:
+        """Pushes the lease of a job we still hold JOB_LEASE_SECONDS ahead. False if it was taken from us."""
+        with self.engine.begin() as conn:
+            return bool(conn.execute(
+                update(jobs_table)
+                .where(and_(jobs_table.c.job_id == job["job_id"], jobs_table.c.claim_token == job["claim_token"],
+                            jobs_table.c.status == RUNNING))
+                .values(lease_expires_at=time.time() + settings.JOB_LEASE_SECONDS)
+            ).rowcount)
+
+    async def _heartbeat(self, job: Dict[str, Any]):
+        """Extends the job's lease every third of JOB_LEASE_SECONDS while the handler runs."""
+        interval = max(1.0, settings.JOB_LEASE_SECONDS / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await asyncio.to_thread(self._extend_lease, job):
+                    logger.warning(f"Job {job['job_id']} lost its lease; its result will be discarded")
+                    return
+            except Exception as e:
+                # Try again next beat; the lease still has two intervals left
+                logger.warning(f"Job lease heartbeat failed for {job['job_id']}: {e}")
+
+    def _finish(self, job: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None):
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(jobs_table)
+                .where(and_(jobs_table.c.job_id == job["job_id"], jobs_table.c.claim_token == job["claim_token"]))
+                .values(status=status, result=json.dumps(result, default=str) if result is not None else None,
+                        error=error, finished_at=time.time(), lease_expires_at=None)
+            )
+        metrics.JOBS.labels(kind=job["kind"], status=status).inc()
+
+    def _recover_expired(self):
+        """Re-queues jobs whose worker died mid-run (lease expired); fails them after JOB_MAX_ATTEMPTS."""
+        now = time.time()
+        expired = and_(jobs_table.c.status == RUNNING, jobs_table.c.lease_expires_at < now)
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(jobs_table).where(and_(expired, jobs_table.c.attempts >= settings.JOB_MAX_ATTEMPTS))
+                .values(status=FAILED, error="Worker lost (lease expired)", finished_at=now, lease_expires_at=None)
+            )
+            requeued = conn.execute(
+                update(jobs_table).where(expired)
+                .values(status=QUEUED, claim_token=None, worker=None, lease_expires_at=None)
+            ).rowcount
+        if requeued:
+            logger.warning(f"Job queue re-queued {requeued} jobs with expired leases")
+
+    def _maintenance(self):
+        """Lease recovery every 30s and result GC every 10 minutes (run by idle workers)."""
+        now = time.time()
+        if now - self._last_recover >= 30:
+            self._last_recover = now
+            self._recover_expired()
+        if now - self._last_gc < 600:
+            return
+        self._last_gc = now
+        cutoff = now - settings.JOB_RESULT_TTL_SECONDS
+        with self.engine.begin() as conn:
+            removed = conn.execute(
+                delete(jobs_table).where(and_(jobs_table.c.status.in_(FINISHED), jobs_table.c.finished_at < cutoff))
+            ).rowcount
+        if removed:
+            logger.info(f"Job queue GC removed {removed} finished jobs")
+
+    async def _run_job(self, job: Dict[str, Any]):
+        handler = self._handlers.get(job["kind"])
+        print(f"[Jobs] ▶ {job['kind']} {job['job_id']} (attempt {job['attempts']}, worker {self.worker_id})")
+        if handler is None:
+            await asyncio.to_thread(self._finish, job, FAILED, None, f"No handler for job kind '{job['kind']}'")
+            return
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await handler(job["payload"])
+        except Exception as e:
+            print(f"[Jobs] ✗ {job['job_id']}: {e}")
+            await asyncio.to_thread(self._finish, job, FAILED, None, str(e)[:500])
+            return
+        finally:
+            heartbeat.cancel()
+        await asyncio.to_thread(self._finish, job, SUCCEEDED, result)
+        print(f"[Jobs] ✓ {job['job_id']}")
+
+    async def _worker_loop(self):
+        while True:
+            try:
+                job = await asyncio.to_thread(self._claim)
+                if job is not None:
+                    await self._run_job(job)
+                    continue
+                await asyncio.to_thread(self._maintenance)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # SQLite "database is locked" under contention lands here; just poll again
+                logger.warning(f"Job worker error: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Starts this process's workers (FastAPI startup, inside the event loop)."""
+        if self._workers or not settings.JOB_QUEUE_ENABLED:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker_loop(), name=f"agent-job-worker-{i}")
+            for i in range(settings.JOB_WORKERS_PER_PROCESS)
+        ]
+        print(f"[Jobs] Started {len(self._workers)} workers in process {os.getpid()}")
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+job_queue = JobQueue()
@@ -3,9 +3,12 @@ SerpAPI Google Lens integration for product identification.
 Uses ImgBB for fast, reliable image hosting.
 """
 import requests
+import asyncio
 import base64
+import time
 from typing import Dict, Any, Optional
 from app.core.config import settings
+from app.agent.timing import traced
 
 
 def upload_to_imgbb(image_bytes: bytes) -> Optional[str]:
@@ -44,10 +47,36 @@ def upload_to_imgbb(image_bytes: bytes) -> Optional[str]:
     return None
 
 
-def identify_product_with_lens(image_bytes: bytes, extension: str = "jpg") -> Dict[str, Any]:
-    """
-    Upload image and call SerpAPI Google Lens to identify the product.
-    """
+@traced("imgbb.upload", kind="provider")
+async def aupload_to_imgbb(image_bytes: bytes, timeout: float = 15) -> Optional[str]:
+    """Async variant of upload_to_imgbb using the pooled httpx client."""
+    from app.sources.http_client import get_async_client
+
+    api_key = getattr(settings, 'IMGBB_API_KEY', None) or "YOUR_IMGBB_KEY"
+    if not api_key or api_key == "YOUR_IMGBB_KEY":
+        return None
+    
+    try:
+        b64_image = base64.b64encode(image_bytes).decode('utf-8')
+        response = await get_async_client().post(
+            "https://api.imgbb.com/1/upload",
+            data={
+                "key": api_key,
+                "image": b64_image,
+                "expiration": 600  # 10 minutes
+            },
+            timeout=timeout
+        )
+        if response.status_code == 200:
+            data = response.json()
+            return data.get("data", {}).get("url")
+    except Exception as e:
+        print(f"ImgBB upload failed: {e}")
+    
+    return None
+
+
+def _lens_debug_logger():
     log_file = "/app/debug_output.txt"
     
     def log_debug(message):
@@ -56,14 +85,80 @@ def identify_product_with_lens(image_bytes: bytes, extension: str = "jpg") -> Di
                 f.write(f"[Lens] {str(message)}\n")
         except:
             pass
+    return log_debug
+
+
+def _lens_params(public_url: str, api_key: str) -> dict:
+    return {
+        "engine": "google_lens",
+        "url": public_url,
+        "api_key": api_key,
+        "hl": "en",
+        "country": "ca"
+    }
+
+
+def _parse_lens_results(results: Dict[str, Any], log_debug, timing: Dict[str, float]) -> Dict[str, Any]:
+    """Picks the best product name from a Lens response (KG > visual > shopping)."""
+    product_name = None
+    confidence = 0.0
+    source = None
+    link = None
+    
+    # Try knowledge_graph first
+    if "knowledge_graph" in results:
+        kg = results["knowledge_graph"]
+        product_name = kg.get("title")
+        confidence = 0.95
+        source = "knowledge_graph"
+        log_debug(f"KG match: {product_name}")
+    
+    # Try visual_matches
+    if not product_name and "visual_matches" in results:
+        vm = results["visual_matches"]
+        # Log top 5 matches for debugging
+        log_debug(f"Visual matches ({len(vm)} total):")
+        for i, match in enumerate(vm[:5]):
+            log_debug(f"  #{i+1}: {match.get('title', 'No title')} (source: {match.get('source', '?')})")
+        if vm:
+            product_name = vm[0].get("title")
+            confidence = 0.8
+            source = vm[0].get("source", "visual_matches")
+            link = vm[0].get("link")
+            log_debug(f"Visual match selected: {product_name}")
+    
+    # Try shopping_results
+    if not product_name and "shopping_results" in results:
+        sr = results["shopping_results"]
+        if sr:
+            product_name = sr[0].get("title")
+            confidence = 0.85
+            source = sr[0].get("source", "shopping")
+            link = sr[0].get("link")
+            log_debug(f"Shopping match: {product_name}")
+    
+    return {
+        "product_name": product_name or "Unknown Product",
+        "confidence": confidence,
+        "source": source,
+        "link": link,
+        "visual_matches_count": len(results.get("visual_matches", [])),
+        "shopping_results_count": len(results.get("shopping_results", [])),
+        "timing": timing
+    }
+
+
+def identify_product_with_lens(image_bytes: bytes, extension: str = "jpg") -> Dict[str, Any]:
+    """
+    Upload image and call SerpAPI Google Lens to identify the product.
+    """
+    log_debug = _lens_debug_logger()
     
     api_key = settings.SERPAPI_API_KEY
     if not api_key:
         log_debug("Skipping Lens - No SERPAPI_API_KEY")
         return {"error": "SERPAPI_API_KEY not configured"}
     
-    import time
-    
     try:
         start_time = time.time()
         
@@ -87,13 +182,7 @@ def identify_product_with_lens(image_bytes: bytes, extension: str = "jpg") -> Di
         log_debug(f"Image stored: {public_url}")
         
         # Call SerpAPI Lens with retry
-        params = {
-            "engine": "google_lens",
-            "url": public_url,
-            "api_key": api_key,
-            "hl": "en",
-            "country": "ca"
-        }
+        params = _lens_params(public_url, api_key)
         
         # Retry logic for connection issues
         max_retries = 3
@@ -132,59 +221,107 @@ def identify_product_with_lens(image_bytes: bytes, extension: str = "jpg") -> Di
             log_debug(f"Lens error: {results['error']}")
             return {"error": results["error"]}
         
-        # Extract best product name
-        product_name = None
-        confidence = 0.0
-        source = None
-        link = None
-        
-        # Try knowledge_graph first
-        if "knowledge_graph" in results:
-            kg = results["knowledge_graph"]
-            product_name = kg.get("title")
-            confidence = 0.95
-            source = "knowledge_graph"
-            log_debug(f"KG match: {product_name}")
-        
-        # Try visual_matches
-        if not product_name and "visual_matches" in results:
-            vm = results["visual_matches"]
-            # Log top 5 matches for debugging
-            log_debug(f"Visual matches ({len(vm)} total):")
-            for i, match in enumerate(vm[:5]):
-                log_debug(f"  #{i+1}: {match.get('title', 'No title')} (source: {match.get('source', '?')})")
-            if vm:
-                product_name = vm[0].get("title")
-                confidence = 0.8
-                source = vm[0].get("source", "visual_matches")
-                link = vm[0].get("link")
-                log_debug(f"Visual match selected: {product_name}")
-        
-        # Try shopping_results
-        if not product_name and "shopping_results" in results:
-            sr = results["shopping_results"]
-            if sr:
-                product_name = sr[0].get("title")
-                confidence = 0.85
-                source = sr[0].get("source", "shopping")
-                link = sr[0].get("link")
-                log_debug(f"Shopping match: {product_name}")
-        
-        total_time = time.time() - start_time
-        
-        return {
-            "product_name": product_name or "Unknown Product",
-            "confidence": confidence,
-            "source": source,
-            "link": link,
-            "visual_matches_count": len(results.get("visual_matches", [])),
-            "shopping_results_count": len(results.get("shopping_results", [])),
-            "timing": {
-                "upload_time_s": round(upload_time, 2),
-                "lens_api_time_s": round(lens_time, 2),
-                "total_time_s": round(total_time, 2)
-            }
-        }
+        return _parse_lens_results(results, log_debug, {
+            "upload_time_s": round(upload_time, 2),
+            "lens_api_time_s": round(lens_time, 2),
+            "total_time_s": round(time.time() - start_time, 2)
+        })
+        
+    except Exception as e:
+        log_debug(f"Lens exception: {str(e)}")
+        return {"error": str(e)}
+
+
+@traced("serpapi.lens", kind="provider")
+async def aidentify_product_with_lens(image_bytes: bytes, extension: str = "jpg",
+                                      timeout: float = 60) -> Dict[str, Any]:
+    """
+    Async variant of identify_product_with_lens: same upload fallback and
+    retry policy, but awaits the HTTP calls instead of blocking a thread.
+
+    `timeout` bounds the whole call (upload + Lens + retries), so callers with
+    a latency budget get an error back in time to fall back to Gemini.
+    """
+    import httpx
+    from app.sources.http_client import get_async_client
+
+    log_debug = _lens_debug_logger()
+    
+    api_key = settings.SERPAPI_API_KEY
+    if not api_key:
+        log_debug("Skipping Lens - No SERPAPI_API_KEY")
+        return {"error": "SERPAPI_API_KEY not configured"}
+    
+    try:
+        start_time = time.time()
+        call_deadline = start_time + timeout
+        
+        upload_start = time.time()
+        public_url = await aupload_to_imgbb(image_bytes, timeout=min(15, timeout))
+        upload_time = time.time() - upload_start
+        log_debug(f"Image upload took {upload_time:.2f}s")
+        
+        if not public_url:
+            from app.services.image_hosting import store_temp_image, get_public_image_url
+            
+            if "localhost" in settings.PUBLIC_BASE_URL:
+                log_debug("Skipping Lens - PUBLIC_BASE_URL is localhost and no ImgBB key")
+                return {"error": "No external image hosting available"}
+            
+            image_id = store_temp_image(image_bytes, extension)
+            public_url = get_public_image_url(image_id)
+        
+        log_debug(f"Image stored: {public_url}")
+        
+        params = _lens_params(public_url, api_key)
+        client = get_async_client()
+        
+        max_retries = 3
+        response = None
+        last_error = None
+        lens_time = 0.0
+        
+        for attempt in range(max_retries):
+            time_left = call_deadline - time.time()
+            if time_left <= 0:
+                last_error = "time budget exhausted"
+                break
+            try:
+                lens_start = time.time()
+                response = await client.get(
+                    "https://serpapi.com/search.json",
+                    params=params,
+                    timeout=min(60, time_left)
+                )
+                lens_time = time.time() - lens_start
+                log_debug(f"Lens API call took {lens_time:.2f}s (attempt {attempt + 1})")
+                break
+            except (httpx.ConnectError, httpx.RemoteProtocolError, httpx.ReadError) as e:
+                last_error = e
+                log_debug(f"Lens connection error (attempt {attempt + 1}): {e}")
+                if attempt < max_retries - 1 and call_deadline - time.time() > 1 * (attempt + 1):
+                    await asyncio.sleep(1 * (attempt + 1))
+                continue
+        
+        if response is None:
+            log_debug(f"Lens API failed after {max_retries} retries: {last_error}")
+            return {"error": f"Connection failed after {max_retries} retries"}
+        
+        if response.status_code != 200:
+            log_debug(f"Lens API error: {response.status_code}")
+            return {"error": f"API returned {response.status_code}"}
+        
+        results = response.json()
+        
+        if "error" in results:
+            log_debug(f"Lens error: {results['error']}")
+            return {"error": results["error"]}
+        
+        return _parse_lens_results(results, log_debug, {
+            "upload_time_s": round(upload_time, 2),
+            "lens_api_time_s": round(lens_time, 2),
+            "total_time_s": round(time.time() - start_time, 2)
+        })
         
     except Exception as e:
         log_debug(f"Lens exception: {str(e)}")
@@ -2,6 +2,7 @@ from app.core.snowflake import get_snowflake_session
 import logging
 import json
 from typing import Optional, Dict, Any
+from app.agent.timing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -58,6 +59,7 @@ class SnowflakeCacheService:
 
 
 
+    @traced("snowflake_cache.get", kind="cache")
     def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
         """
         Check cache, return if valid (not expired).
@@ -99,6 +101,7 @@ class SnowflakeCacheService:
             logger.error(f"Cache GET failed: {e}")
             return None
 
+    @traced("snowflake_cache.set", kind="cache")
     def set(self, cache_key: str, cache_type: str, params: Dict, result: Dict, ttl_minutes: int):
         """
         Store result with expiry using MERGE (upsert).
@@ -5,14 +5,88 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Backslash escapes LIKE wildcards in filter patterns (the SQL literal '\\' is one backslash)
+LIKE_ESCAPE = "ESCAPE '\\\\'"
+
 class SnowflakeVectorService:
     @property
     def session(self):
         return get_snowflake_session()
 
-    def search_similar_products(self, query_vector: List[float], limit: int = 5) -> List[dict]:
+    @staticmethod
+    def _sql_literal(value: str) -> str:
+        """Escapes a value for use inside a single-quoted SQL string."""
+        return str(value).replace("\\", "\\\\").replace("'", "''")
+
+    @classmethod
+    def _like_literal(cls, value: str) -> str:
+        """
+        Escapes a value for use inside a single-quoted ILIKE pattern: LIKE
+        wildcards (%, _) and backslash are matched literally. Use with
+        LIKE_ESCAPE.
+        """
+        pattern = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return cls._sql_literal(pattern)
+
+    def _build_filter_clause(self, filters: Optional[Dict]) -> str:
+        """
+        Translates structured search filters into a SQL WHERE clause so they are
+        applied by Snowflake BEFORE the top-k cut (instead of dropping rows in Python).
+
+        Supported keys:
+        - prefer_brands: list[str]  -> product must match at least one brand
+        - exclude_brands: list[str] -> product must match none of these brands
+        - exclude_colors: list[str] -> name/description must not mention these colors
+        - max_price: float          -> price ceiling (rows without a price are kept)
+        - category: str             -> metadata:category must match
+        """
+        if not filters:
+            return ""
+
+        conditions = []
+
+        def brand_match(brand: str) -> str:
+            b = self._like_literal(brand.strip())
+            return (f"(name ILIKE '%{b}%' {LIKE_ESCAPE} "
+                    f"OR COALESCE(metadata:brand::STRING, '') ILIKE '{b}' {LIKE_ESCAPE})")
+
+        prefer_brands = [b for b in filters.get('prefer_brands') or [] if b and b.strip()]
+        if prefer_brands:
+            conditions.append("(" + " OR ".join(brand_match(b) for b in prefer_brands) + ")")
+
+        for brand in filters.get('exclude_brands') or []:
+            if brand and brand.strip():
+                conditions.append(f"NOT {brand_match(brand)}")
+
+        for color in filters.get('exclude_colors') or []:
+            if color and color.strip():
+                c = self._like_literal(color.strip())
+                conditions.append(f"NOT (name ILIKE '%{c}%' {LIKE_ESCAPE} "
+                                  f"OR COALESCE(description, '') ILIKE '%{c}%' {LIKE_ESCAPE})")
+
+        max_price = filters.get('max_price')
+        if max_price is not None:
+            try:
+                conditions.append(f"(price IS NULL OR price <= {float(max_price)})")
+            except (TypeError, ValueError):
+                logger.warning(f"Ignoring invalid max_price filter: {max_price}")
+
+        category = filters.get('category')
+        if category and str(category).strip():
+            cat = self._like_literal(str(category).strip())
+            conditions.append(f"COALESCE(metadata:category::STRING, '') ILIKE '%{cat}%' {LIKE_ESCAPE}")
+
+        if not conditions:
+            return ""
+        return "WHERE " + "\n              AND ".join(conditions)
+
+    def search_similar_products(self, query_vector: List[float], limit: int = 5, filters: Optional[Dict] = None) -> List[dict]:
         """
         Searches for similar products using Snowflake Vector Search (Cosine Similarity).
+
+        `filters` (see _build_filter_clause) are pushed into the query so the
+        LIMIT applies to qualifying rows only - callers get up to `limit`
+        matching products without over-fetching.
         """
         try:
             # Snowflake requires the vector to be passed as a string representation in SQL ?? 
@@ -22,13 +96,15 @@ class SnowflakeVectorService:
             # Construct SQL query
             # We convert the list to a SQL array string
             vector_str = str(query_vector)
+            where_clause = self._build_filter_clause(filters)
             
             cmd = f"""
-            SELECT id, name, description, price, image_url, source_url, 
+            SELECT id, name, description, price, image_url, source_url, metadata,
                    VECTOR_COSINE_SIMILARITY(embedding, PARSE_JSON('{vector_str}')::VECTOR(FLOAT, 3072)) as score
             FROM products
+            {where_clause}
             ORDER BY score DESC
-            LIMIT {limit}
+            LIMIT {int(limit)}
             """
             
             # Execute
@@ -37,6 +113,12 @@ class SnowflakeVectorService:
             # Parse results
             output = []
             for row in results:
+                metadata = row['METADATA']
+                if isinstance(metadata, str):
+                    try:
+                        metadata = json.loads(metadata)
+                    except ValueError:
+                        metadata = {}
                 output.append({
                     "id": row['ID'],
                     "name": row['NAME'],
@@ -44,6 +126,7 @@ class SnowflakeVectorService:
                     "price": row['PRICE'],
                     "image_url": row['IMAGE_URL'],
                     "source_url": row['SOURCE_URL'],
+                    "metadata": metadata or {},
                     "score": row['SCORE']
                 })
             return output
@@ -54,16 +137,17 @@ class SnowflakeVectorService:
 
     def insert_product(self, product_data: Dict, embedding: List[float]):
         """
-        Inserts a product with its embedding into Snowflake.
+        Upserts a product with its embedding into Snowflake (MERGE on id).
         """
         try:
-            # We use a merge (upsert) logic ideally, but for now simple insert
-            id = product_data.get('id')
-            name = product_data.get('name').replace("'", "''")
-            desc = product_data.get('description', '').replace("'", "''")
-            price = product_data.get('price', 0.0)
-            img = product_data.get('image_url', '').replace("'", "''")
-            src = product_data.get('source_url', '').replace("'", "''")
+            id = self._sql_literal(product_data.get('id'))
+            name = self._sql_literal(product_data.get('name') or '')
+            desc = self._sql_literal(product_data.get('description') or '')
+            price = float(product_data.get('price') or 0.0)
+            img = self._sql_literal(product_data.get('image_url') or '')
+            src = self._sql_literal(product_data.get('source_url') or '')
+            metadata_json = json.dumps(product_data.get('metadata') or {}, ensure_ascii=True, separators=(',', ':'))
+            metadata_str = self._sql_literal(metadata_json)
             vector_str = str(embedding)
             
             cmd = f"""
@@ -77,16 +161,30 @@ class SnowflakeVectorService:
                     price = {price}, 
                     image_url = '{img}', 
                     source_url = '{src}',
+                    metadata = PARSE_JSON('{metadata_str}'),
                     embedding = PARSE_JSON('{vector_str}')::VECTOR(FLOAT, 3072)
             WHEN NOT MATCHED THEN
-                INSERT (id, name, description, price, image_url, source_url, embedding)
-                VALUES ('{id}', '{name}', '{desc}', {price}, '{img}', '{src}', PARSE_JSON('{vector_str}')::VECTOR(FLOAT, 3072))
+                INSERT (id, name, description, price, image_url, source_url, metadata, embedding)
+                VALUES ('{id}', '{name}', '{desc}', {price}, '{img}', '{src}', PARSE_JSON('{metadata_str}'), PARSE_JSON('{vector_str}')::VECTOR(FLOAT, 3072))
             """
             self.session.sql(cmd).collect()
-            self.session.sql(cmd).collect()
             return True, "Success"
         except Exception as e:
             logger.error(f"Insert Product Failed: {e}")
             return False, str(e)
 
+    def get_existing_ids(self, ids: List[str]) -> set:
+        """
+        Returns the subset of `ids` already present in the products table.
+        """
+        if not ids or not self.session:
+            return set()
+        try:
+            id_list = ", ".join(f"'{self._sql_literal(i)}'" for i in ids)
+            rows = self.session.sql(f"SELECT id FROM products WHERE id IN ({id_list})").collect()
+            return {row['ID'] for row in rows}
+        except Exception as e:
+            logger.error(f"Existing ID lookup failed: {e}")
+            return set()
+
 snowflake_vector_service = SnowflakeVectorService()
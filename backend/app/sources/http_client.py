@@ -0,0 +1,31 @@
+"""
+Shared async HTTP client for provider calls (Tavily, SerpAPI, ImgBB).
+
+One connection-pooled httpx.AsyncClient per event loop, so concurrent agent
+runs in a worker reuse TLS connections instead of blocking a thread each.
+"""
+import asyncio
+import weakref
+import httpx
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+DEFAULT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the pooled client bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=DEFAULT_LIMITS, timeout=httpx.Timeout(10.0))
+        _clients[loop] = client
+    return client
+
+
+async def close_async_clients():
+    """Closes the client for the running loop (called on app shutdown)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
@@ -1,3 +1,4 @@
+import asyncio
 import requests
 from typing import List, Dict, Any
 from app.schemas.types import ProductQuery, PriceOffer
@@ -6,10 +7,93 @@ from app.core.config import settings
 import hashlib
 import json
 from app.services.snowflake_cache import snowflake_cache_service
+from app.sources.http_client import get_async_client
+from app.agent.timing import traced
+from app.sources.singleflight import singleflight
 
 SERPAPI_URL = "https://serpapi.com/search.json"
 
 
+def _shopping_params(product: ProductQuery, api_key: str) -> dict:
+    return {
+        "engine": "google_shopping",
+        "q": product.canonical_name,
+        "gl": "ca",
+        "hl": "en",
+        "location": "Canada",
+        "num": 10,  # Limit results to 10 to reduce processing time
+        "api_key": api_key,
+    }
+
+
+def _parse_shopping_response(data: dict, trace: list) -> List[PriceOffer]:
+    if "error" in data:
+        msg = f"SerpAPI Error: {data['error']}"
+        print(f"⚠️ {msg}")
+        trace.append({"step": "serpapi", "detail": msg})
+        return []
+
+    offers = []
+
+    for item in data.get("shopping_results", []):
+        # SerpAPI uses "price" (e.g. "$5.88") or "extracted_price" (numeric)
+        price_val = item.get("extracted_price")
+        price_str = item.get("price")
+        
+        price_cents = 0
+        # Priority 1: Use extracted_price if available (it's usually a reliable float)
+        if isinstance(price_val, (int, float)):
+            price_cents = int(round(price_val * 100))
+        
+        # Priority 2: Parse price string if extracted_price failed
+        elif price_str:
+            import re
+            # Clean string: remove currency symbols, letters, etc. keep digits, dots, commas
+            # Matches: $1,234.56 -> 1,234.56
+            # Matches: CA$ 1200 -> 1200
+            match = re.search(r'[\d,]+\.?\d*', str(price_str))
+            if match:
+                clean_str = match.group(0).replace(",", "")
+                try:
+                    price_cents = int(round(float(clean_str) * 100))
+                except (ValueError, TypeError):
+                    pass
+
+        if price_cents == 0:
+            continue
+
+        # SerpAPI Google Shopping uses "product_link", not "link"
+        link = item.get("product_link") or item.get("link")
+        if not link:
+            continue
+
+        offers.append(
+            PriceOffer(
+                vendor=item.get("source") or "Unknown",
+                price_cents=price_cents,
+                currency="CAD",
+                url=link,
+                title=item.get("title") or item.get("source"), # Capture title
+                thumbnail=item.get("thumbnail") # Extract thumbnail
+            )
+        )
+
+    trace.append({"step": "serpapi", "detail": f"Found {len(offers)} offers"})
+    return offers
+
+
+def _cache_offers(cache_key: str, product: ProductQuery, offers: List[PriceOffer]):
+    if offers:
+        # Cache for 15 minutes (prices change often)
+        snowflake_cache_service.set(
+            cache_key=cache_key,
+            cache_type="serpapi_offers",
+            params={"product": product.model_dump()},
+            result=[o.model_dump() for o in offers],
+            ttl_minutes=15
+        )
+
+
 def get_shopping_offers(product: ProductQuery, trace: list) -> List[PriceOffer]:
     # --- Check Cache ---
     cache_key = f"serpapi:offers:{hashlib.md5(product.canonical_name.encode()).hexdigest()}"
@@ -26,84 +110,12 @@ def get_shopping_offers(product: ProductQuery, trace: list) -> List[PriceOffer]:
         trace.append({"step": "serpapi", "detail": "Missing API key"})
         return []
 
-    params = {
-        "engine": "google_shopping",
-        "q": product.canonical_name,
-        "gl": "ca",
-        "hl": "en",
-        "location": "Canada",
-        "num": 10,  # Limit results to 10 to reduce processing time
-        "api_key": api_key,
-    }
-
     try:
-        r = requests.get(SERPAPI_URL, params=params, timeout=10)
-        data = r.json()
-
-        if "error" in data:
-            msg = f"SerpAPI Error: {data['error']}"
-            print(f"⚠️ {msg}")
-            trace.append({"step": "serpapi", "detail": msg})
-            return []
-
-        offers = []
-
-        for item in data.get("shopping_results", []):
-            # SerpAPI uses "price" (e.g. "$5.88") or "extracted_price" (numeric)
-            # SerpAPI uses "price" (e.g. "$5.88") or "extracted_price" (numeric)
-            price_val = item.get("extracted_price")
-            price_str = item.get("price")
-            
-            price_cents = 0
-            # Priority 1: Use extracted_price if available (it's usually a reliable float)
-            if isinstance(price_val, (int, float)):
-                price_cents = int(round(price_val * 100))
-            
-            # Priority 2: Parse price string if extracted_price failed
-            elif price_str:
-                import re
-                # Clean string: remove currency symbols, letters, etc. keep digits, dots, commas
-                # Matches: $1,234.56 -> 1,234.56
-                # Matches: CA$ 1200 -> 1200
-                match = re.search(r'[\d,]+\.?\d*', str(price_str))
-                if match:
-                    clean_str = match.group(0).replace(",", "")
-                    try:
-                        price_cents = int(round(float(clean_str) * 100))
-                    except (ValueError, TypeError):
-                        pass
-
-            if price_cents == 0:
-                continue
-
-            # SerpAPI Google Shopping uses "product_link", not "link"
-            link = item.get("product_link") or item.get("link")
-            if not link:
-                continue
-
-            offers.append(
-                PriceOffer(
-                    vendor=item.get("source") or "Unknown",
-                    price_cents=price_cents,
-                    currency="CAD",
-                    url=link,
-                    title=item.get("title") or item.get("source"), # Capture title
-                    thumbnail=item.get("thumbnail") # Extract thumbnail
-                )
-            )
-
-        trace.append({"step": "serpapi", "detail": f"Found {len(offers)} offers"})
+        r = requests.get(SERPAPI_URL, params=_shopping_params(product, api_key), timeout=10)
+        offers = _parse_shopping_response(r.json(), trace)
         
         # --- Store in Cache ---
-        if offers:
-            # Cache for 15 minutes (prices change often)
-            snowflake_cache_service.set(
-                cache_key=cache_key,
-                cache_type="serpapi_offers",
-                params={"product": product.model_dump()},
-                result=[o.model_dump() for o in offers],
-                ttl_minutes=15
-            )
+        _cache_offers(cache_key, product, offers)
         # ----------------------
         
         return offers
@@ -112,6 +124,32 @@ def get_shopping_offers(product: ProductQuery, trace: list) -> List[PriceOffer]:
         return []
 
 
+@singleflight(lambda product, trace, timeout=10: product.canonical_name)
+@traced("serpapi.shopping", kind="provider")
+async def aget_shopping_offers(product: ProductQuery, trace: list, timeout: float = 10) -> List[PriceOffer]:
+    """Async variant of get_shopping_offers (shared httpx client)."""
+    cache_key = f"serpapi:offers:{hashlib.md5(product.canonical_name.encode()).hexdigest()}"
+    cached_data = await asyncio.to_thread(snowflake_cache_service.get, cache_key)
+
+    if cached_data:
+        trace.append({"step": "serpapi", "detail": f"Cache Hit ({len(cached_data)} offers)"})
+        return [PriceOffer(**item) for item in cached_data]
+
+    api_key = settings.SERPAPI_API_KEY
+    if not api_key:
+        trace.append({"step": "serpapi", "detail": "Missing API key"})
+        return []
+
+    try:
+        r = await get_async_client().get(SERPAPI_URL, params=_shopping_params(product, api_key), timeout=timeout)
+        offers = _parse_shopping_response(r.json(), trace)
+        await asyncio.to_thread(_cache_offers, cache_key, product, offers)
+        return offers
+    except Exception as e:
+        trace.append({"step": "serpapi", "detail": f"Request Failed: {e}"})
+        return []
+
+
 def check_single_price(query: str) -> str | None:
     """
     Quickly checks the price of a product query.
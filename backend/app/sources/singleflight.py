@@ -0,0 +1,88 @@
+"""
+Singleflight for provider calls.
+
+Concurrent agent runs (a /agent/batch of 200 products, a burst of jobs) ask
+the same sub-queries at the same moment: the same brand's company stats, the
+same eco lookup, the same "best X" market search. The Snowflake cache only
+helps once the first call has written its result, so every concurrent miss
+used to hit Tavily/SerpAPI on its own.
+
+`@singleflight(key_fn)` makes identical in-flight calls share one task, and
+keeps the finished result for SINGLEFLIGHT_TTL_SECONDS so items of a batch
+that arrive a moment later reuse it too. The call runs as its own task, so a
+caller that times out (asyncio.wait_for) does not cancel it for the others.
+Every caller gets a deep copy, since callers mutate results in place.
+
+Functions with a `trace` list argument run the shared call with a private
+list; each caller gets those entries appended to its own trace once the
+result is back. Put `@traced` below `@singleflight` so the provider span is
+recorded once, inside the shared call, and joined waits are not counted as
+provider calls.
+"""
+from app.core.config import settings
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Hashable
+import asyncio
+import copy
+import inspect
+import time
+
+# Finished results kept per process
+MAX_ENTRIES = 1024
+
+# (loop id, function, key) -> [task, finished_at or None, trace entries]
+_entries: "OrderedDict[tuple, list]" = OrderedDict()
+
+
+def _evict(now: float):
+    for key in [k for k, (task, finished_at, _trace) in _entries.items()
+                if finished_at is not None and now - finished_at > settings.SINGLEFLIGHT_TTL_SECONDS]:
+        del _entries[key]
+    while len(_entries) > MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+
+def singleflight(key_fn: Callable[..., Hashable]):
+    """
+    Decorator for async provider functions. `key_fn` receives the call's
+    arguments and returns the dedupe key (e.g. the query string); arguments
+    that don't change the answer (timeouts, trace lists) stay out of it.
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        has_trace = "trace" in signature.parameters
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            now = time.time()
+            _evict(now)
+            key = (id(loop), func.__qualname__, key_fn(*args, **kwargs))
+
+            caller_trace = None
+            if has_trace:
+                bound = signature.bind(*args, **kwargs)
+                caller_trace = bound.arguments.get("trace")
+                shared_trace = []
+                bound.arguments["trace"] = shared_trace
+                args, kwargs = bound.args, bound.kwargs
+            else:
+                shared_trace = None
+
+            entry = _entries.get(key)
+            if entry is None or (entry[0].done() and (entry[0].cancelled() or entry[0].exception() is not None)):
+                task = loop.create_task(func(*args, **kwargs))
+                entry = _entries[key] = [task, None, shared_trace]
+                task.add_done_callback(lambda _t, e=entry: e.__setitem__(1, time.time()))
+            else:
+                print(f"   [Singleflight] Sharing {func.__name__}({str(key[2])[:60]})")
+
+            try:
+                result = await asyncio.shield(entry[0])
+            finally:
+                if caller_trace is not None and entry[2]:
+                    caller_trace.extend(copy.deepcopy(entry[2]))
+            return copy.deepcopy(result)
+        return wrapper
+    return decorator
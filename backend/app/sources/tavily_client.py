@@ -1,3 +1,4 @@
+import asyncio
 import requests
 from typing import List, Dict
 from app.schemas.types import ProductQuery, ReviewSnippet
@@ -6,10 +7,66 @@ from app.core.config import settings
 import hashlib
 import json
 from app.services.snowflake_cache import snowflake_cache_service
+from app.sources.http_client import get_async_client
+from app.agent.timing import traced
+from app.sources.singleflight import singleflight
 
 TAVILY_URL = "https://api.tavily.com/search"
 
 
+def _review_queries(product: ProductQuery) -> List[str]:
+    return [
+        f"{product.canonical_name} review Canada",
+        f"{product.canonical_name} review reddit Canada",
+        f"site:reddit.com {product.canonical_name} worth it Canada",
+    ]
+
+
+def _review_payload(api_key: str, query: str) -> dict:
+    return {
+        "api_key": api_key,
+        "query": query,
+        "search_depth": "basic",
+        "include_images": True,
+    }
+
+
+def _parse_review_response(data: dict, trace: list) -> List[ReviewSnippet]:
+    if data.get("error"):
+        trace.append({"step": "tavily", "detail": f"API Error: {data.get('error')}"})
+        return []
+
+    # Extract images from the main response if available
+    main_images = data.get("images", [])
+
+    results = []
+    for item in data.get("results", []):
+        url = item.get("url")
+        if not url:
+            continue
+        results.append(
+            ReviewSnippet(
+                source=item.get("title") or "",
+                url=url,
+                snippet=item.get("content") or "",
+                images=main_images # Attach general search images to snippets for now as fallback context
+            )
+        )
+    return results
+
+
+def _cache_reviews(cache_key: str, product: ProductQuery, results: List[ReviewSnippet]):
+    if results:
+        # Cache for 60 minutes
+        snowflake_cache_service.set(
+            cache_key=cache_key,
+            cache_type="tavily_reviews",
+            params={"product": product.model_dump()},
+            result=[r.model_dump() for r in results],
+            ttl_minutes=60
+        )
+
+
 def find_review_snippets(product: ProductQuery, trace: list) -> List[ReviewSnippet]:
     # --- Check Cache ---
     cache_key = f"tavily:reviews:{hashlib.md5(product.canonical_name.encode()).hexdigest()}"
@@ -26,63 +83,116 @@ def find_review_snippets(product: ProductQuery, trace: list) -> List[ReviewSnipp
         trace.append({"step": "tavily", "detail": "Missing API key"})
         return []
 
-    queries = [
-        f"{product.canonical_name} review Canada",
-        f"{product.canonical_name} review reddit Canada",
-        f"site:reddit.com {product.canonical_name} worth it Canada",
-    ]
-
     results = []
 
-    for q in queries:
-        payload = {
-            "api_key": api_key,
-            "query": q,
-            "search_depth": "basic",
-            "include_images": True,
-        }
-
+    for q in _review_queries(product):
         try:
-            r = requests.post(TAVILY_URL, json=payload, timeout=10)
-            data = r.json()
-            
-            if data.get("error"):
-                 trace.append({"step": "tavily", "detail": f"API Error: {data.get('error')}"})
-                 continue
-            
-            # Extract images from the main response if available
-            main_images = data.get("images", [])
-
-            for item in data.get("results", []):
-                url = item.get("url")
-                if not url:
-                    continue
-                results.append(
-                    ReviewSnippet(
-                        source=item.get("title") or "",
-                        url=url,
-                        snippet=item.get("content") or "",
-                        images=main_images # Attach general search images to snippets for now as fallback context
-                    )
-                )
+            r = requests.post(TAVILY_URL, json=_review_payload(api_key, q), timeout=10)
+            results.extend(_parse_review_response(r.json(), trace))
         except Exception as e:
             trace.append({"step": "tavily", "detail": f"Request Failed: {e}"})
 
     trace.append({"step": "tavily", "detail": f"Found {len(results)} review snippets"})
     
     # --- Store in Cache ---
+    _cache_reviews(cache_key, product, results)
+    
+    return results
+
+
+@singleflight(lambda product, trace: product.canonical_name)
+@traced("tavily.reviews", kind="provider")
+async def afind_review_snippets(product: ProductQuery, trace: list) -> List[ReviewSnippet]:
+    """
+    Async variant of find_review_snippets: the three review queries run
+    concurrently over the shared httpx client.
+    """
+    cache_key = f"tavily:reviews:{hashlib.md5(product.canonical_name.encode()).hexdigest()}"
+    cached_data = await asyncio.to_thread(snowflake_cache_service.get, cache_key)
+
+    if cached_data:
+        trace.append({"step": "tavily", "detail": f"Cache Hit ({len(cached_data)} items)"})
+        return [ReviewSnippet(**item) for item in cached_data]
+
+    api_key = settings.TAVILY_API_KEY
+    if not api_key:
+        trace.append({"step": "tavily", "detail": "Missing API key"})
+        return []
+
+    client = get_async_client()
+
+    async def run_query(q: str) -> List[ReviewSnippet]:
+        try:
+            r = await client.post(TAVILY_URL, json=_review_payload(api_key, q), timeout=10)
+            return _parse_review_response(r.json(), trace)
+        except Exception as e:
+            trace.append({"step": "tavily", "detail": f"Request Failed: {e}"})
+            return []
+
+    results = []
+    for batch in await asyncio.gather(*(run_query(q) for q in _review_queries(product))):
+        results.extend(batch)
+
+    trace.append({"step": "tavily", "detail": f"Found {len(results)} review snippets"})
+    await asyncio.to_thread(_cache_reviews, cache_key, product, results)
+    return results
+
+
+def _market_payload(api_key: str, query: str) -> dict:
+    return {
+        "api_key": api_key,
+        "query": query,
+        "search_depth": "basic",
+        "include_answer": True,
+        "include_images": True, # Request images from Tavily
+    }
+
+
+def _parse_market_response(data: dict) -> List[Dict[str, str]]:
+    if data.get("error"):
+         return []
+
+    results = []
+    # Tavily sometimes returns an 'answer' block
+    if data.get("answer"):
+        results.append({"title": "Tavily AI Summary", "url": "", "content": data.get("answer")})
+
+    # Process main results
+    for item in data.get("results", []):
+         results.append({
+             "title": item.get("title", ""),
+             "url": item.get("url", ""),
+             "content": item.get("content", "")
+         })
+         
+    # Extract images if available (usually in a separate 'images' key or inside results)
+    # Tavily response format for images: {"images": ["url1", "url2", ...]}
+    images = data.get("images", [])
+    
+    # Attach images to the FIRST result just to pass them along, 
+    # or we can return them separately. 
+    # For simplicity in the current architecture, we'll embed them in a special result entry
+    # or rely on the fact that we return a list of dicts.
+    # Let's add a special entry for images so Market Scout can find them.
+    if images:
+        results.append({
+            "title": "Related Images",
+            "url": "",
+            "content": "",
+            "images": images # List of URL strings
+        })
+    return results
+
+
+def _cache_market_results(cache_key: str, query: str, results: List[Dict[str, str]]):
     if results:
-        # Cache for 60 minutes
         snowflake_cache_service.set(
             cache_key=cache_key,
-            cache_type="tavily_reviews",
-            params={"product": product.model_dump()},
-            result=[r.model_dump() for r in results],
+            cache_type="tavily_search",
+            params={"query": query},
+            result=results,
             ttl_minutes=60
-        )
-    # --- End Cache Store ---
-    
-    return results
+        ) 
 
 
 def search_market_context(query: str) -> List[Dict[str, str]]:
@@ -102,60 +212,12 @@ def search_market_context(query: str) -> List[Dict[str, str]]:
     if not api_key:
         return []
 
-    payload = {
-        "api_key": api_key,
-        "query": query,
-        "search_depth": "basic",
-        "include_answer": True,
-        "include_images": True, # Request images from Tavily
-    }
-
     try:
-        r = requests.post(TAVILY_URL, json=payload, timeout=10)
-        data = r.json()
-        
-        if data.get("error"):
-             return []
-
-        results = []
-        # Tavily sometimes returns an 'answer' block
-        if data.get("answer"):
-            results.append({"title": "Tavily AI Summary", "url": "", "content": data.get("answer")})
-
-        # Process main results
-        for item in data.get("results", []):
-             results.append({
-                 "title": item.get("title", ""),
-                 "url": item.get("url", ""),
-                 "content": item.get("content", "")
-             })
-             
-        # Extract images if available (usually in a separate 'images' key or inside results)
-        # Tavily response format for images: {"images": ["url1", "url2", ...]}
-        images = data.get("images", [])
-        
-        # Attach images to the FIRST result just to pass them along, 
-        # or we can return them separately. 
-        # For simplicity in the current architecture, we'll embed them in a special result entry
-        # or rely on the fact that we return a list of dicts.
-        # Let's add a special entry for images so Market Scout can find them.
-        if images:
-            results.append({
-                "title": "Related Images",
-                "url": "",
-                "content": "",
-                "images": images # List of URL strings
-            })
+        r = requests.post(TAVILY_URL, json=_market_payload(api_key, query), timeout=10)
+        results = _parse_market_response(r.json())
         
         # --- Store in Cache ---
-        if results:
-            snowflake_cache_service.set(
-                cache_key=cache_key,
-                cache_type="tavily_search",
-                params={"query": query},
-                result=results,
-                ttl_minutes=60
-            ) 
+        _cache_market_results(cache_key, query, results)
         # ----------------------
         
         return results
@@ -164,6 +226,87 @@ def search_market_context(query: str) -> List[Dict[str, str]]:
         return []
 
 
+@singleflight(lambda query, timeout=10: query)
+@traced("tavily.market_search", kind="provider")
+async def asearch_market_context(query: str, timeout: float = 10) -> List[Dict[str, str]]:
+    """Async variant of search_market_context."""
+    cache_key = f"tavily:search:{hashlib.md5(query.encode()).hexdigest()}"
+    cached_data = await asyncio.to_thread(snowflake_cache_service.get, cache_key)
+
+    if cached_data:
+        return cached_data
+
+    api_key = settings.TAVILY_API_KEY
+    if not api_key:
+        return []
+
+    try:
+        r = await get_async_client().post(TAVILY_URL, json=_market_payload(api_key, query), timeout=timeout)
+        results = _parse_market_response(r.json())
+        await asyncio.to_thread(_cache_market_results, cache_key, query, results)
+        return results
+    except Exception as e:
+        print(f"Tavily Market Search Error: {e}")
+        return []
+
+
+def _eco_payload(api_key: str, query: str) -> dict:
+    return {
+        "api_key": api_key,
+        "query": query,
+        "search_depth": "basic",
+        "include_answer": True,
+        "max_results": 5,
+    }
+
+
+def _eco_snippets(data: dict, summary_label: str = "Summary") -> List[str]:
+    snippets = []
+    # Get AI summary if available
+    if data.get("answer"):
+        snippets.append(f"{summary_label}: {data.get('answer')}")
+
+    # Extract relevant content from results
+    for item in data.get("results", []):
+        content = item.get("content", "")
+        title = item.get("title", "")
+        if content:
+            snippets.append(f"{title}: {content[:300]}")
+    return snippets
+
+
+def _eco_queries(product_name: str) -> tuple:
+    """Returns (primary_query, fallback_query or None)."""
+    # Broader and more specific eco search query including B Corp and company ethics
+    eco_query = f'{product_name} sustainability B Corp certification company environmental impact ethical manufacturing'
+    # Fallback: just the first few words of the product name
+    # e.g., "GLAMBERGET extendable bed" instead of the full 20-word description
+    simple_name = " ".join(product_name.split()[:4])
+    fallback_query = f'{simple_name} material sustainability eco-friendly reviews' if simple_name != product_name else None
+    return eco_query, fallback_query
+
+
+def _eco_result(cache_key: str, product_name: str, eco_snippets: List[str]) -> Dict[str, any]:
+    eco_context = "\n".join(eco_snippets[:5])  # Limit to 5 snippets
+    
+    result = {
+        "eco_context": eco_context,
+        "found": bool(eco_snippets)
+    }
+    
+    # --- Store in Cache ---
+    if result["found"]:
+        snowflake_cache_service.set(
+            cache_key=cache_key,
+            cache_type="tavily_eco",
+            params={"product": product_name},
+            result=result,
+            ttl_minutes=120  # Cache eco data longer (2 hours)
+        ) 
+    # ----------------------
+    return result
+
+
 def search_eco_sustainability(product_name: str) -> Dict[str, any]:
     """
     Search for product sustainability and environmental impact info.
@@ -183,95 +326,133 @@ def search_eco_sustainability(product_name: str) -> Dict[str, any]:
         print("   [Eco] No API key!")
         return {"eco_context": "", "found": False}
 
-    # Broader and more specific eco search query including B Corp and company ethics
-    eco_query = f'{product_name} sustainability B Corp certification company environmental impact ethical manufacturing'
+    eco_query, fallback_query = _eco_queries(product_name)
     print(f"   [Eco] Searching: {eco_query[:60]}...")
 
-    payload = {
-        "api_key": api_key,
-        "query": eco_query,
-        "search_depth": "basic",
-        "include_answer": True,
-        "max_results": 5,
-    }
-
     try:
-        r = requests.post(TAVILY_URL, json=payload, timeout=8)
+        r = requests.post(TAVILY_URL, json=_eco_payload(api_key, eco_query), timeout=8)
         data = r.json()
         
         if data.get("error"):
             print(f"   [Eco] API Error: {data.get('error')}")
             return {"eco_context": "", "found": False}
 
-        eco_snippets = []
-        
-        # Get AI summary if available
-        if data.get("answer"):
-            eco_snippets.append(f"Summary: {data.get('answer')}")
-            print(f"   [Eco] Got AI summary ({len(data.get('answer'))} chars)")
-
-        # Extract relevant content from results
-        for item in data.get("results", []):
-            content = item.get("content", "")
-            title = item.get("title", "")
-            if content:
-                eco_snippets.append(f"{title}: {content[:300]}")
-        
+        eco_snippets = _eco_snippets(data)
         print(f"   [Eco] Found {len(eco_snippets)} eco snippets")
         
         # --- Fallback Search Strategy ---
-        if not eco_snippets:
-            # Try a broader search with just the first few words of the product name
-            # e.g., "GLAMBERGET extendable bed" instead of the full 20-word description
-            simple_name = " ".join(product_name.split()[:4])
-            if simple_name != product_name:
-                print(f"   [Eco] Specific search failed. Trying fallback: {simple_name}...")
-                fallback_query = f'{simple_name} material sustainability eco-friendly reviews'
-                
-                payload["query"] = fallback_query
-                try:
-                    r2 = requests.post(TAVILY_URL, json=payload, timeout=8)
-                    data2 = r2.json()
-                    
-                    if not data2.get("error"):
-                         if data2.get("answer"):
-                             eco_snippets.append(f"Summary (Broad): {data2.get('answer')}")
-                         
-                         for item in data2.get("results", []):
-                             title = item.get("title", "")
-                             content = item.get("content", "")
-                             if content:
-                                 eco_snippets.append(f"{title}: {content[:300]}")
-                                 
-                         print(f"   [Eco] Fallback found {len(eco_snippets)} snippets")
-                except Exception as e2:
-                    print(f"   [Eco] Fallback failed: {e2}")
+        if not eco_snippets and fallback_query:
+            print(f"   [Eco] Specific search failed. Trying fallback: {fallback_query[:40]}...")
+            try:
+                r2 = requests.post(TAVILY_URL, json=_eco_payload(api_key, fallback_query), timeout=8)
+                data2 = r2.json()
+                if not data2.get("error"):
+                    eco_snippets.extend(_eco_snippets(data2, summary_label="Summary (Broad)"))
+                    print(f"   [Eco] Fallback found {len(eco_snippets)} snippets")
+            except Exception as e2:
+                print(f"   [Eco] Fallback failed: {e2}")
         # --------------------------------
 
-        eco_context = "\n".join(eco_snippets[:5])  # Limit to 5 snippets
-        
-        result = {
-            "eco_context": eco_context,
-            "found": bool(eco_snippets)
-        }
-        
-        # --- Store in Cache ---
-        if result["found"]:
-            snowflake_cache_service.set(
-                cache_key=cache_key,
-                cache_type="tavily_eco",
-                params={"product": product_name},
-                result=result,
-                ttl_minutes=120  # Cache eco data longer (2 hours)
-            ) 
-        # ----------------------
-        
-        return result
+        return _eco_result(cache_key, product_name, eco_snippets)
+    except Exception as e:
+        print(f"   [Eco] Search Error: {e}")
+        return {"eco_context": "", "found": False}
+
+
+@singleflight(lambda product_name: product_name)
+@traced("tavily.eco", kind="provider")
+async def asearch_eco_sustainability(product_name: str) -> Dict[str, any]:
+    """Async variant of search_eco_sustainability."""
+    cache_key = f"tavily:eco:{hashlib.md5(product_name.encode()).hexdigest()}"
+    cached_data = await asyncio.to_thread(snowflake_cache_service.get, cache_key)
+
+    if cached_data:
+        print(f"   [Eco] Cache hit for {product_name[:30]}")
+        return cached_data
+
+    api_key = settings.TAVILY_API_KEY
+    if not api_key:
+        print("   [Eco] No API key!")
+        return {"eco_context": "", "found": False}
+
+    eco_query, fallback_query = _eco_queries(product_name)
+    client = get_async_client()
+
+    try:
+        r = await client.post(TAVILY_URL, json=_eco_payload(api_key, eco_query), timeout=8)
+        data = r.json()
+
+        if data.get("error"):
+            print(f"   [Eco] API Error: {data.get('error')}")
+            return {"eco_context": "", "found": False}
+
+        eco_snippets = _eco_snippets(data)
+
+        if not eco_snippets and fallback_query:
+            try:
+                r2 = await client.post(TAVILY_URL, json=_eco_payload(api_key, fallback_query), timeout=8)
+                data2 = r2.json()
+                if not data2.get("error"):
+                    eco_snippets.extend(_eco_snippets(data2, summary_label="Summary (Broad)"))
+            except Exception as e2:
+                print(f"   [Eco] Fallback failed: {e2}")
+
+        print(f"   [Eco] Found {len(eco_snippets)} eco snippets")
+        return await asyncio.to_thread(_eco_result, cache_key, product_name, eco_snippets)
     except Exception as e:
         print(f"   [Eco] Search Error: {e}")
         return {"eco_context": "", "found": False}
 
 
+def _brand_payload(api_key: str, brand_name: str) -> dict:
+    # Targeted query for stats
+    return {
+        "api_key": api_key,
+        "query": f'{brand_name} company sustainability ESG score "Net Zero" "B Corp"',
+        "search_depth": "basic",
+        "include_answer": True,
+        "max_results": 3,
+    }
+
+
+def _brand_result(cache_key: str, brand_name: str, data: dict) -> Dict[str, any]:
+    if data.get("error"):
+        return {"brand_context": "", "found": False}
+
+    brand_snippets = []
+    
+    if data.get("answer"):
+        brand_snippets.append(f"AI Summary: {data.get('answer')}")
+
+    for item in data.get("results", []):
+        content = item.get("content", "")
+        title = item.get("title", "")
+        if content:
+            brand_snippets.append(f"{title}: {content[:300]}")
+    
+    print(f"   [Brand] Found {len(brand_snippets)} stats")
+    
+    brand_context = "\n".join(brand_snippets[:4])
+    
+    result = {
+        "brand_context": brand_context,
+        "found": bool(brand_snippets)
+    }
+    
+    # --- Store in Cache ---
+    if result["found"]:
+        snowflake_cache_service.set(
+            cache_key=cache_key,
+            cache_type="tavily_brand",
+            params={"brand": brand_name},
+            result=result,
+            ttl_minutes=1440  # Cache brand stats for 24 hours (stats don't change often)
+        ) 
+    # ----------------------
+    
+    return result
+
+
 def search_company_stats(brand_name: str) -> Dict[str, any]:
     """
     Search for high-level company statistics (ESG, Net Zero, B Corp).
@@ -289,57 +470,34 @@ def search_company_stats(brand_name: str) -> Dict[str, any]:
     if not api_key:
         return {"brand_context": "", "found": False}
 
-    # Targeted query for stats
-    brand_query = f'{brand_name} company sustainability ESG score "Net Zero" "B Corp"'
-    print(f"   [Brand] Searching: {brand_query[:60]}...")
-
-    payload = {
-        "api_key": api_key,
-        "query": brand_query,
-        "search_depth": "basic",
-        "include_answer": True,
-        "max_results": 3,
-    }
+    print(f"   [Brand] Searching stats for {brand_name}...")
 
     try:
-        r = requests.post(TAVILY_URL, json=payload, timeout=8)
-        data = r.json()
-        
-        if data.get("error"):
-            return {"brand_context": "", "found": False}
+        r = requests.post(TAVILY_URL, json=_brand_payload(api_key, brand_name), timeout=8)
+        return _brand_result(cache_key, brand_name, r.json())
+    except Exception as e:
+        print(f"   [Brand] Search Error: {e}")
+        return {"brand_context": "", "found": False}
 
-        brand_snippets = []
-        
-        if data.get("answer"):
-            brand_snippets.append(f"AI Summary: {data.get('answer')}")
-
-        for item in data.get("results", []):
-            content = item.get("content", "")
-            title = item.get("title", "")
-            if content:
-                brand_snippets.append(f"{title}: {content[:300]}")
-        
-        print(f"   [Brand] Found {len(brand_snippets)} stats")
-        
-        brand_context = "\n".join(brand_snippets[:4])
-        
-        result = {
-            "brand_context": brand_context,
-            "found": bool(brand_snippets)
-        }
-        
-        # --- Store in Cache ---
-        if result["found"]:
-            snowflake_cache_service.set(
-                cache_key=cache_key,
-                cache_type="tavily_brand",
-                params={"brand": brand_name},
-                result=result,
-                ttl_minutes=1440  # Cache brand stats for 24 hours (stats don't change often)
-            ) 
-        # ----------------------
-        
-        return result
+
+@singleflight(lambda brand_name: (brand_name or "").strip().lower())
+@traced("tavily.company_stats", kind="provider")
+async def asearch_company_stats(brand_name: str) -> Dict[str, any]:
+    """Async variant of search_company_stats."""
+    cache_key = f"tavily:brand:{hashlib.md5(brand_name.encode()).hexdigest()}"
+    cached_data = await asyncio.to_thread(snowflake_cache_service.get, cache_key)
+
+    if cached_data:
+        print(f"   [Brand] Cache hit for {brand_name}")
+        return cached_data
+
+    api_key = settings.TAVILY_API_KEY
+    if not api_key:
+        return {"brand_context": "", "found": False}
+
+    try:
+        r = await get_async_client().post(TAVILY_URL, json=_brand_payload(api_key, brand_name), timeout=8)
+        return await asyncio.to_thread(_brand_result, cache_key, brand_name, r.json())
     except Exception as e:
         print(f"   [Brand] Search Error: {e}")
         return {"brand_context": "", "found": False}
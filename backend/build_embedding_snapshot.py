@@ -0,0 +1,27 @@
+"""
+Exports product embeddings from Snowflake into a new memory-mapped snapshot
+and atomically publishes it for all API workers.
+
+Workers also rebuild it on a schedule (EMBEDDING_SNAPSHOT_REFRESH_SECONDS); run it
+by hand to publish one right away, e.g. after a bulk import:
+    python build_embedding_snapshot.py
+"""
+import logging
+import time
+from app.services.embedding_store import embedding_store
+
+logging.basicConfig(level=logging.INFO)
+
+
+def build_snapshot():
+    print(f"Exporting product embeddings to {embedding_store.root}...")
+    start = time.time()
+    version = embedding_store.rebuild_from_snowflake()
+    if version:
+        print(f"Published snapshot {version} in {time.time() - start:.1f}s")
+    else:
+        print("No embeddings exported (missing Snowflake session or empty catalog).")
+
+
+if __name__ == "__main__":
+    build_snapshot()
@@ -0,0 +1,27 @@
+"""
+Gunicorn settings for the production image (see Dockerfile).
+
+Prometheus multiprocess mode: every worker writes metric samples to
+PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them (app/core/metrics.py).
+The directory is wiped when the master starts, and a worker's live gauges
+are dropped when it exits.
+"""
+import os
+import shutil
+
+bind = "0.0.0.0:8000"
+workers = 4
+worker_class = "uvicorn.workers.UvicornWorker"
+
+
+def on_starting(server):
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -6,7 +6,7 @@ SCENARIO: "I prefer Nike" -> Trigger new search with brand filter
 import asyncio
 import os
 import sys
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from dotenv import load_dotenv
 
 # Load env from backend if on host, otherwise assume env vars or .env in root
@@ -60,11 +60,11 @@ async def test_scenario_brand_preference():
     }
     
     # Patch the actual location where the function is defined/imported from
-    with patch('app.sources.tavily_client.search_market_context') as mock_search:
+    with patch('app.sources.tavily_client.asearch_market_context', new_callable=AsyncMock) as mock_search:
         mock_search.return_value = [{"title": "Nike Air Zoom", "price": "$120", "url": "http://nike.com"}]
         
         # Run Scout
-        result = node_market_scout(scout_state)
+        result = await node_market_scout(scout_state)
         
         # Verify calls
         if mock_search.call_count > 0:
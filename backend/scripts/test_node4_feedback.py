@@ -77,10 +77,14 @@ async def test_scenario_a():
     
     class MockSkeptic:
         def __init__(self, model_name=None): pass
-        def analyze_reviews(self, name, reviews):
+        async def aanalyze_reviews(self, name, reviews, eco_context=""):
             mock = MagicMock()
             mock.model_dump.return_value = {"trust_score": 7.0, "sentiment_score": 0.8, "summary": "Good"}
             return mock
+        async def abatch_analyze_alternatives(self, candidates, eco_context=""):
+            mock = MagicMock()
+            mock.model_dump.return_value = {"trust_score": 7.0, "sentiment_score": 0.8, "summary": "Good"}
+            return [mock for _ in candidates]
     
     analysis_state = {
         "product_query": {"canonical_name": "Sony WH-1000XM5"},
@@ -91,7 +95,7 @@ async def test_scenario_a():
     }
     
     with patch('app.agent.nodes.analysis.SkepticAgent', MockSkeptic):
-        result = node_analysis_synthesis(analysis_state)
+        result = await node_analysis_synthesis(analysis_state)
     
     ranked = result['analysis_object']['alternatives_ranked']
     print("\n📊 Ranking (with high price sensitivity):")
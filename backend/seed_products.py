@@ -3,6 +3,7 @@ import time
 from typing import List, Dict
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from app.services.snowflake_vector import snowflake_vector_service
+from app.services.catalog_ingest import canonical_product_id
 from app.core.config import settings
 
 # Configure logging
@@ -12,7 +13,6 @@ logger = logging.getLogger(__name__)
 # Sample Product Data
 SAMPLE_PRODUCTS = [
     {
-        "id": "prod_Sony_WH1000XM5",
         "name": "Sony WH-1000XM5 Wireless Noise Canceling Headphones",
         "description": "Industry-leading noise cancellation, exceptional sound quality, and crystal-clear hands-free calling. up to 30-hour battery life with quick charging.",
         "price": 348.00,
@@ -20,7 +20,6 @@ SAMPLE_PRODUCTS = [
         "source_url": "https://electronics.sony.com/audio/headphones/headband/p/wh1000xm5-b"
     },
     {
-        "id": "prod_Bose_QC45",
         "name": "Bose QuietComfort 45 Bluetooth Wireless Noise Cancelling Headphones",
         "description": "Iconic quiet, comfort, and sound. World-class noise cancelling technology with a noise-rejecting microphone system for clear calls.",
         "price": 279.00,
@@ -28,7 +27,6 @@ SAMPLE_PRODUCTS = [
         "source_url": "https://www.bose.com/en_us/products/headphones/noise_cancelling_headphones/quietcomfort-headphones-45.html"
     },
     {
-        "id": "prod_Apple_AirPodsMax",
         "name": "Apple AirPods Max Wireless Over-Ear Headphones",
         "description": "High-fidelity audio. Active Noise Cancellation with Transparency mode. Spatial audio for theater-like sound that surrounds you.",
         "price": 549.00,
@@ -36,7 +34,6 @@ SAMPLE_PRODUCTS = [
         "source_url": "https://www.apple.com/airpods-max/"
     },
     {
-        "id": "prod_Dyson_V15",
         "name": "Dyson V15 Detect Cordless Vacuum",
         "description": "Powerful cordless vacuum with laser illumination. Scientific proof of a deep clean. Piezo sensor counts and measures the size of dust particles.",
         "price": 749.99,
@@ -44,7 +41,6 @@ SAMPLE_PRODUCTS = [
         "source_url": "https://www.dyson.com/vacuum-cleaners/cordless/v15-detect"
     },
     {
-        "id": "prod_Logitech_MXMaster3S",
         "name": "Logitech MX Master 3S Performance Wireless Mouse",
         "description": "An icon remastered. Feel every moment of your workflow with even more precision, tactility, and performance, thanks to Quiet Clicks and an 8,000 DPI track-on-glass sensor.",
         "price": 99.99,
@@ -52,7 +48,6 @@ SAMPLE_PRODUCTS = [
         "source_url": "https://www.logitech.com/en-us/products/mice/mx-master-3s.html"
     },
      {
-        "id": "prod_HermanMiller_Aeron",
         "name": "Herman Miller Aeron Chair",
         "description": "Ergonomic office chair with Pellicle suspension and PostureFit SL support. Adjustable arms, tilt limiter, and seat angle.",
         "price": 1650.00,
@@ -60,7 +55,6 @@ SAMPLE_PRODUCTS = [
         "source_url": "https://store.hermanmiller.com/office-chairs-aeron/aeron-chair/2195348.html"
     },
     {
-        "id": "prod_Steelcase_Leap",
         "name": "Steelcase Leap V2 Office Chair",
         "description": "High performance ergonomic chair. LiveBack technology that changes shape to mimic and support the movement of your spine.",
         "price": 1299.00,
@@ -87,6 +81,8 @@ def seed_products():
     # 2. Loop and Insert
     for product in SAMPLE_PRODUCTS:
         product_name = product['name']
+        # Same id scheme as catalog ingest, so scout results for a seeded product merge into its row
+        product = {**product, "id": canonical_product_id(product_name)}
         print(f"Processing: {product_name}...")
         
         try:
@@ -0,0 +1,87 @@
+import sys
+import os
+import json
+import types
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.agent.nodes.router import node_router
+from app.agent.nodes.vision import node_user_intent_vision
+from app.api.v1.endpoints import agent as agent_endpoints
+from app.core.security import get_current_user
+from app.services.blob_store import blob_store
+
+
+class StubGraph:
+    """Runs the real router and vision entry logic, stubs everything after them."""
+
+    def __init__(self):
+        self.states = []
+
+    async def ainvoke(self, state, config=None):
+        self.states.append(state)
+        state = {**state, **await node_router(state)}
+        if state["router_decision"] != "vision_search":
+            # Chat node: no analysis
+            return {**state, "final_recommendation": {"chat_response": "..."}}
+        if state.get("skip_vision"):
+            state = {**state, **await node_user_intent_vision(state)}
+            product = state["product_query"].get("canonical_name")
+        else:
+            product = "From image"  # Lens/Gemini are not called here
+        if not product:
+            return {**state, "final_recommendation": {}}
+        return {**state, "final_recommendation": {"identified_product": product, "outcome": "recommended"}}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    graph = StubGraph()
+    monkeypatch.setitem(sys.modules, "app.agent.graph", types.SimpleNamespace(agent_app=graph))
+    monkeypatch.setattr(blob_store, "root", tmp_path / "blobs")
+    app = FastAPI()
+    app.include_router(agent_endpoints.router, prefix="/agent")
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=7)
+    client = TestClient(app)
+    client.graph = graph
+    return client
+
+
+def sse_events(body: str):
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_batch_analyses_product_names_and_images(client):
+    response = client.post("/agent/batch", json={"items": [
+        {"product_name": "Sony WH-1000XM5"},
+        {"image_base64": "aGVsbG8="},
+        {"product_name": "  sony wh-1000xm5 "},  # Duplicate of item 0: runs once
+    ]})
+    assert response.status_code == 200
+
+    events = sse_events(response.text)
+    items = {data["index"]: data for event, data in events if event == "item"}
+    assert all(item["status"] == "succeeded" for item in items.values())
+    assert items[0]["result"]["identified_product"] == "Sony WH-1000XM5"
+    assert items[2]["result"] == items[0]["result"]
+    assert items[1]["result"]["identified_product"] == "From image"
+
+    done = events[-1]
+    assert done[0] == "done"
+    assert done[1]["succeeded"] == 3 and done[1]["unique"] == 2
+    assert len(client.graph.states) == 2
+
+
+def test_batch_rejects_empty_items(client):
+    response = client.post("/agent/batch", json={"items": [{}]})
+    assert response.status_code == 400
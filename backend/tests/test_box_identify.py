@@ -0,0 +1,57 @@
+import sys
+import os
+import time
+
+import pytest
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.config import settings
+from app.services.box_identify import BoxIdentifyCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "IDENTIFY_CACHE_TTL_SECONDS", 3600)
+    monkeypatch.setattr(settings, "EAGER_IDENTIFY_BUDGET_SECONDS", 30.0)
+    return BoxIdentifyCache(str(tmp_path))
+
+
+def write(cache, name, age_seconds):
+    path = cache.root / name
+    path.write_text("{}")
+    mtime = time.time() - age_seconds
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_sweep_removes_expired_results_and_orphaned_markers(cache):
+    keep = [
+        write(cache, "fresh.json", 60),
+        write(cache, "running.pending", 10),
+        write(cache, "unrelated.txt", 10 ** 6),
+    ]
+    stale = [
+        write(cache, "expired.json", 7200),
+        write(cache, "orphan.pending", 600),
+        write(cache, ".crashed.abc.tmp", 600),
+    ]
+    assert cache.sweep() == 3
+    assert all(p.exists() for p in keep)
+    assert not any(p.exists() for p in stale)
+
+
+def test_sweep_of_missing_dir(tmp_path):
+    assert BoxIdentifyCache(str(tmp_path / "missing")).sweep() == 0
+
+
+def test_writes_sweep_at_most_once_per_interval(cache, monkeypatch):
+    monkeypatch.setattr(settings, "IDENTIFY_CACHE_SWEEP_INTERVAL_SECONDS", 600)
+    sweeps = []
+    monkeypatch.setattr(cache, "sweep", sweeps.append)
+    cache.put("a", {"name": "A"})
+    cache.mark_pending("b")
+    cache.put("c", {"name": "C"})
+    assert len(sweeps) == 1
+    assert cache.get("a") == {"name": "A"}
@@ -0,0 +1,97 @@
+import sys
+import os
+import time
+
+import pytest
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.config import settings
+from app.services.catalog_ingest import CatalogIngestService, candidate_to_product, canonical_product_id
+from app.services.hybrid_search import LexicalIndex, hybrid_search_service
+from app.services.snowflake_vector import snowflake_vector_service
+
+
+class StubEmbeddings:
+    def __init__(self):
+        self.task_types = []
+
+    def embed_documents(self, texts, task_type=None):
+        self.task_types.append(task_type)
+        return [[0.1, 0.2] for _ in texts]
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    rows = {}
+
+    def insert_product(product, vector):
+        if product['name'].startswith("Broken"):
+            return False, "MERGE failed"
+        rows[product['id']] = product
+        return True, "Success"
+
+    monkeypatch.setattr(snowflake_vector_service, "get_existing_ids", lambda ids: {i for i in ids if i in rows})
+    monkeypatch.setattr(snowflake_vector_service, "insert_product", insert_product)
+    # A fresh, already built index: no background rebuild from Snowflake
+    monkeypatch.setattr(hybrid_search_service, "_index", LexicalIndex([]))
+    monkeypatch.setattr(hybrid_search_service, "_index_built_at", time.time())
+    return rows
+
+
+@pytest.fixture
+def service():
+    service = CatalogIngestService()
+    service._embeddings = StubEmbeddings()
+    return service
+
+
+def scout_candidate(name, price="$349.99"):
+    return {"name": name, "price_text": price, "category": "Headphones", "reason": "Top noise cancelling"}
+
+
+def test_ingested_products_are_lexically_searchable(catalog, service):
+    product = candidate_to_product(scout_candidate("Sony WH-1000XM5"))
+    assert service.ingest_batch([product]) == 1
+    assert product['id'] in catalog
+    # Embedded like the seeded catalog (embed_query)
+    assert service._embeddings.task_types == ["RETRIEVAL_QUERY"]
+
+    index = hybrid_search_service.get_index()
+    hits = index.search("wh-1000xm5", limit=5)
+    assert [index.docs[doc_idx]['id'] for doc_idx, _ in hits] == [product['id']]
+
+
+def test_products_added_during_a_build_are_handed_to_it(catalog, service, monkeypatch):
+    monkeypatch.setattr(hybrid_search_service, "_building", True)
+    monkeypatch.setattr(hybrid_search_service, "_pending", [])
+    product = candidate_to_product(scout_candidate("Bose QuietComfort Ultra"))
+    service.ingest_batch([product])
+    assert hybrid_search_service._pending == [product]
+    assert hybrid_search_service.get_index().search("quietcomfort", limit=5)
+
+
+def test_existing_products_are_skipped(catalog, service):
+    product = candidate_to_product(scout_candidate("Sony WH-1000XM5"))
+    service.ingest_batch([product])
+    assert service.ingest_batch([product]) == 0
+
+
+def test_failed_inserts_can_be_queued_again(catalog, service, monkeypatch):
+    monkeypatch.setattr(settings, "CATALOG_INGEST_ENABLED", True)
+    monkeypatch.setattr(service, "_ensure_worker", lambda: None)
+    candidates = [scout_candidate("Broken Speaker"), scout_candidate("Sony WH-1000XM5")]
+    assert service.enqueue_candidates(candidates) == 2
+    assert service.enqueue_candidates(candidates) == 0  # Already queued
+
+    service.ingest_batch([service._queue.get_nowait() for _ in range(2)])
+    assert service.enqueue_candidates(candidates) == 1  # Only the failed one is retried
+
+
+@pytest.mark.parametrize("seeded, scouted", [
+    ("Sony WH-1000XM5", "Sony WH-1000XM5 (Black)"),
+    ("Herman Miller Aeron Chair", "herman miller aeron chair | Renewed"),
+])
+def test_seeded_and_scouted_names_share_an_id(seeded, scouted):
+    assert canonical_product_id(seeded) == candidate_to_product(scout_candidate(scouted))['id']
@@ -0,0 +1,179 @@
+import sys
+import os
+import re
+
+import numpy as np
+import pytest
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services import embedding_store as es
+from app.services.embedding_store import EmbeddingStore
+from app.services.snowflake_vector import snowflake_vector_service
+
+
+class FakeSession:
+    """Answers the export queries from an in-memory products table, recording the SQL."""
+
+    def __init__(self, products, count=None):
+        self.products = sorted(products, key=lambda p: p['ID'])
+        self.count = len(products) if count is None else count
+        self.queries = []
+
+    def sql(self, cmd):
+        self.queries.append(cmd)
+        if "COUNT(*)" in cmd:
+            rows = [{'N': self.count}]
+        else:
+            after = re.search(r"id > '([^']*)'", cmd)
+            limit = int(re.search(r"LIMIT (\d+)", cmd).group(1))
+            rows = [p for p in self.products if not after or p['ID'] > after.group(1)][:limit]
+        return type("Result", (), {"collect": lambda _: rows})()
+
+
+class InlineThread:
+    """Runs the background rebuild inline."""
+
+    def __init__(self, target, name=None, daemon=None):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+def product_row(i, vector):
+    return {
+        'ID': f"prod_{i:03d}", 'NAME': f"Product {i}", 'DESCRIPTION': "", 'PRICE': 10.0 + i,
+        'IMAGE_URL': "", 'SOURCE_URL': "", 'METADATA': '{"brand": "Acme"}', 'EMBEDDING': vector,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path))
+
+
+def test_rebuild_streams_pages_with_keyset_pagination(store, monkeypatch):
+    products = [product_row(i, [float(i + 1), 0.0, 0.0]) for i in range(7)]
+    session = FakeSession(products)
+    monkeypatch.setattr(type(snowflake_vector_service), "session", session, raising=False)
+
+    version = store.rebuild_from_snowflake(batch_size=3)
+    snapshot = store.current()
+    assert snapshot.version == version
+    assert len(snapshot) == 7
+    assert [snapshot.id_at(row) for row in range(7)] == [p['ID'] for p in products]
+    assert snapshot.doc(6) == {
+        "id": "prod_006", "name": "Product 6", "description": "", "price": 16.0,
+        "image_url": "", "source_url": "", "metadata": {"brand": "Acme"},
+    }
+    assert np.allclose(np.linalg.norm(snapshot.vectors, axis=1), 1.0)
+
+    pages = [q for q in session.queries if "LIMIT" in q]
+    assert "OFFSET" not in " ".join(pages)
+    assert "id > 'prod_002'" in pages[1] and "id > 'prod_005'" in pages[2]
+
+
+def test_rebuild_trims_rows_missing_since_the_count(store, monkeypatch):
+    products = [product_row(i, [1.0, float(i)]) for i in range(4)]
+    products.append({**product_row(9, [0.0, 1.0]), 'ID': "x" * 80})  # Over MAX_ID_BYTES
+    session = FakeSession(products, count=6)  # One row deleted after the count
+    monkeypatch.setattr(type(snowflake_vector_service), "session", session, raising=False)
+
+    store.rebuild_from_snowflake(batch_size=2)
+    snapshot = store.current()
+    assert len(snapshot) == 4
+    assert snapshot.ids.shape == (4,)
+    assert snapshot.doc(3)["id"] == "prod_003"
+    assert not [p for p in store.snapshots_dir.iterdir() if p.name.startswith(".")]
+
+
+def test_rebuild_with_empty_catalog_publishes_nothing(store, monkeypatch):
+    monkeypatch.setattr(type(snowflake_vector_service), "session", FakeSession([]), raising=False)
+    assert store.rebuild_from_snowflake() is None
+    assert store.current() is None
+
+
+def publish_products(store, n, dim=2):
+    ids = [f"prod_{i:03d}" for i in range(n)]
+    vectors = [[float(i + 1), 1.0] + [0.0] * (dim - 2) for i in range(n)]
+    docs = [{"id": product_id, "name": f"Product {i}", "price": float(i)} for i, product_id in enumerate(ids)]
+    return store.publish(ids, vectors, docs)
+
+
+def test_publish_swaps_current_atomically(store):
+    assert store.current() is None
+    first = publish_products(store, 3)
+    assert store.current().version == first
+    assert store.current_file.read_text() == first
+
+    second = publish_products(store, 5)
+    assert second > first
+    assert store.current().version == second
+    assert len(store.current()) == 5
+    # Staging dirs and temporary CURRENT files are renamed away
+    assert not [p for p in store.root.rglob(".*") if p.name != ".rebuild.lock"]
+
+
+def test_publish_prunes_old_snapshots(store):
+    versions = [publish_products(store, 2) for _ in range(4)]
+    kept = sorted(p.name for p in store.snapshots_dir.iterdir())
+    assert kept == versions[-2:]
+
+
+def test_publish_skips_ids_over_the_id_table_width(store):
+    ids = ["prod_a", "x" * 80, "prod_b"]
+    store.publish(ids, [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]], [{"id": i} for i in ids])
+    snapshot = store.current()
+    assert [snapshot.id_at(row) for row in range(len(snapshot))] == ["prod_a", "prod_b"]
+    assert snapshot.doc(1) == {"id": "prod_b"}
+
+
+def test_publish_rejects_mismatched_shapes(store):
+    with pytest.raises(ValueError):
+        store.publish(["a", "b"], [[1.0, 0.0]])
+    with pytest.raises(ValueError):
+        store.publish(["a"], [[1.0, 0.0]], docs=[])
+
+
+def test_search_ranks_by_cosine(store):
+    publish_products(store, 5)
+    hits = store.current().search([1.0, 0.0], limit=2)
+    # Larger first component: closer to the query direction
+    assert [row for row, _ in hits] == [4, 3]
+    assert hits[0][1] > hits[1][1]
+
+
+def test_search_with_predicate_widens_the_window(store):
+    publish_products(store, 50)
+    snapshot = store.current()
+    hits = snapshot.search([1.0, 0.0], limit=3, predicate=lambda row: snapshot.doc(row)["price"] < 5)
+    assert [row for row, _ in hits] == [4, 3, 2]
+    assert snapshot.search([1.0, 0.0], limit=3, predicate=lambda row: False) == []
+
+
+def test_missing_snapshot_starts_the_first_build(store, monkeypatch):
+    calls = []
+
+    def rebuild():
+        calls.append(1)
+        return publish_products(store, 2)
+
+    monkeypatch.setattr(store, "rebuild_from_snowflake", rebuild)
+    monkeypatch.setattr(es.threading, "Thread", InlineThread)
+    store.refresh_if_stale(store.current())
+    assert calls == [1]
+    fresh = store.current()
+    assert fresh is not None
+    store.refresh_if_stale(fresh)  # Fresh: nothing to do
+    assert calls == [1]
+
+
+def test_empty_rebuild_backs_off(store, monkeypatch):
+    calls = []
+    monkeypatch.setattr(store, "rebuild_from_snowflake", lambda: calls.append(1))
+    monkeypatch.setattr(es.threading, "Thread", InlineThread)
+    store.refresh_if_stale(None)
+    store.refresh_if_stale(None)  # Within REFRESH_RETRY_SECONDS
+    assert calls == [1]
@@ -0,0 +1,68 @@
+import sys
+import os
+
+import pytest
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.agent.intent_classifier import NaiveBayes, features, rule_decision
+
+
+@pytest.mark.parametrize("message, expected", [
+    # Preference statements are routed locally
+    ("Show me blue ones", "re_search"),
+    ("I don't like red", "re_search"),
+    ("Something more modern looking", "re_search"),
+    ("I only have $120", "re_search"),
+    ("$120 budget", "re_search"),
+    ("My budget is 80", "re_search"),
+    ("Find cheaper ones", "re_analysis"),
+    ("Price is important to me", "re_analysis"),
+    ("Thanks!", "chat"),
+    ("hello", "chat"),
+    # Questions about the current product are chat for the router prompt: left to the model/LLM
+    ("Tell me more about this brand", None),
+    ("Is this a good brand?", None),
+    ("Is this design waterproof?", None),
+    ("What colors does it come in?", None),
+    ("Is the warranty under 24 months?", None),
+    ("Does it come in red", None),
+    # Bare attribute words are not preferences
+    ("The design is nice", None),
+    ("It has a 24 month warranty", None),
+    # Conflicting rules
+    ("Find cheaper blue ones", None),
+    ("", None),
+])
+def test_rule_decision(message, expected):
+    assert rule_decision(message) == expected
+
+
+def test_features_normalize_numbers_and_image():
+    feats = features("Under $50 please", has_image=True)
+    assert "<money>" in feats
+    assert "under_<money>" in feats
+    assert feats[-1] == "<image>"
+    assert features("24 months")[0] == "<num>"
+
+
+def test_naive_bayes_learns_from_decisions():
+    samples = [(features(m), label) for m, label in [
+        ("tell me more about it", "chat"),
+        ("what do reviews say about it", "chat"),
+        ("how long does the battery last", "chat"),
+        ("show me other brands", "re_search"),
+        ("different brands please", "re_search"),
+        ("other brands like sony", "re_search"),
+    ]]
+    model = NaiveBayes().fit(samples)
+    assert model.size == 6
+    label, confidence = model.predict(features("what do people say about the battery"))
+    assert label == "chat"
+    assert 0.5 < confidence <= 1.0
+    assert model.predict(features("other brands"))[0] == "re_search"
+
+
+def test_naive_bayes_untrained():
+    assert NaiveBayes().predict(features("anything")) == (None, 0.0)
@@ -0,0 +1,113 @@
+import sys
+import os
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.config import settings
+from app.services.job_queue import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, jobs_table
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_RUNNING", 1)
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", 300)
+    return JobQueue(f"sqlite:///{tmp_path / 'jobs.db'}")
+
+
+def expire_leases(queue):
+    with queue.engine.begin() as conn:
+        conn.execute(update(jobs_table).where(jobs_table.c.status == RUNNING).values(lease_expires_at=0))
+
+
+def test_claims_oldest_job_within_running_cap(queue):
+    first = queue.submit("analyze_image", {"n": 1}, "u1")
+    second = queue.submit("analyze_image", {"n": 2}, "u1")
+
+    job = queue._claim()
+    assert job["job_id"] == first
+    assert job["payload"] == {"n": 1}
+    assert job["attempts"] == 1
+    assert queue.get(first)["status"] == RUNNING
+
+    # JOB_MAX_RUNNING=1: the second job waits
+    assert queue._claim() is None
+    assert queue.get(second)["queue_position"] == 0
+
+    queue._finish(job, SUCCEEDED, {"ok": True})
+    assert queue.get(first)["result"] == {"ok": True}
+    assert queue._claim()["job_id"] == second
+
+
+def test_claim_on_empty_queue(queue):
+    assert queue._claim() is None
+
+
+def test_expired_lease_is_requeued_then_failed(queue):
+    job_id = queue.submit("analyze_image", {}, "u1")
+
+    stale = queue._claim()
+    expire_leases(queue)
+    queue._recover_expired()
+    assert queue.get(job_id)["status"] == QUEUED
+
+    retry = queue._claim()
+    assert retry["attempts"] == 2
+    # The first worker's late result is ignored: its claim token is gone
+    queue._finish(stale, SUCCEEDED, {"late": True})
+    assert queue.get(job_id)["status"] == RUNNING
+
+    expire_leases(queue)
+    queue._recover_expired()
+    job = queue.get(job_id)
+    assert job["status"] == FAILED
+    assert "lease expired" in job["error"]
+
+
+def test_extend_lease_keeps_running_job(queue):
+    queue.submit("analyze_image", {}, "u1")
+    job = queue._claim()
+    expire_leases(queue)
+
+    assert queue._extend_lease(job)
+    queue._recover_expired()
+    assert queue.get(job["job_id"])["status"] == RUNNING
+
+    queue._finish(job, SUCCEEDED, {})
+    assert not queue._extend_lease(job)
+
+
+def test_heartbeat_runs_while_handler_is_busy(queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", 3)  # Heartbeat every second
+    beats = []
+    extend = queue._extend_lease
+    monkeypatch.setattr(queue, "_extend_lease", lambda job: beats.append(job["job_id"]) or extend(job))
+
+    async def slow_handler(payload):
+        await asyncio.sleep(1.5)
+        return {"done": True}
+
+    queue.register_handler("slow", slow_handler)
+    job_id = queue.submit("slow", {}, "u1")
+    asyncio.run(queue._run_job(queue._claim()))
+
+    assert beats == [job_id]
+    assert queue.get(job_id)["status"] == SUCCEEDED
+
+
+def test_failing_handler_marks_job_failed(queue):
+    async def broken(payload):
+        raise ValueError("bad image")
+
+    queue.register_handler("broken", broken)
+    job_id = queue.submit("broken", {}, "u1")
+    asyncio.run(queue._run_job(queue._claim()))
+
+    job = queue.get(job_id)
+    assert job["status"] == FAILED
+    assert job["error"] == "bad image"
@@ -0,0 +1,213 @@
+import sys
+import os
+import asyncio
+
+import pytest
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.agent import llm_governor as lg
+from app.agent.llm_governor import CLOSED, HALF_OPEN, OPEN, LLMUnavailableError, ModelGovernor, classify_error
+from app.core.config import settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(lg.time, "time", clock.time)
+    return clock
+
+
+@pytest.fixture
+def governor(clock, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_GOVERNOR_INITIAL_CONCURRENCY", 8)
+    monkeypatch.setattr(settings, "LLM_GOVERNOR_MIN_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "LLM_GOVERNOR_MAX_CONCURRENCY", 10)
+    monkeypatch.setattr(settings, "LLM_BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "LLM_BREAKER_COOLDOWN_SECONDS", 30.0)
+    return ModelGovernor("test-model")
+
+
+class APIError(Exception):
+    def __init__(self, code, message=""):
+        super().__init__(message or f"{code} error")
+        self.code = code
+
+
+# --- AIMD ---
+
+def test_success_increases_limit_additively(governor):
+    for _ in range(8):
+        governor.on_success()
+    # About one slot per window of `limit` successes
+    assert governor.limit == pytest.approx(9.0, abs=0.1)
+
+
+def test_limit_capped_at_max(governor):
+    for _ in range(200):
+        governor.on_success()
+    assert governor.limit == settings.LLM_GOVERNOR_MAX_CONCURRENCY
+
+
+def test_throttle_halves_limit_once_per_second(governor, clock):
+    governor.on_throttle()
+    assert governor.limit == 4
+    governor.on_throttle()  # Same burst of 429s
+    assert governor.limit == 4
+    clock.now += 1.0
+    governor.on_throttle()
+    assert governor.limit == 2
+
+
+def test_limit_floored_at_min(governor, clock):
+    for _ in range(10):
+        governor.on_throttle()
+        clock.now += 1.0
+    assert governor.limit == settings.LLM_GOVERNOR_MIN_CONCURRENCY
+
+
+def test_slots_follow_the_limit(governor, clock):
+    governor.on_throttle()
+    clock.now += 1.0
+    governor.on_throttle()  # limit 2
+    assert governor._try_acquire()
+    assert governor._try_acquire()
+    assert not governor._try_acquire()
+    governor.release()
+    assert governor._try_acquire()
+
+
+def test_async_acquire_waits_for_release(governor, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_GOVERNOR_QUEUE_TIMEOUT_SECONDS", 1.0)
+    governor.limit = 1.0
+
+    async def run():
+        await governor.acquire()
+        waiter = asyncio.ensure_future(governor.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        governor.release()
+        await asyncio.wait_for(waiter, 0.5)
+        assert governor.in_flight == 1
+
+    asyncio.run(run())
+
+
+def test_async_acquire_times_out(governor, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_GOVERNOR_QUEUE_TIMEOUT_SECONDS", 0.05)
+    governor.limit = 1.0
+
+    async def run():
+        await governor.acquire()
+        with pytest.raises(LLMUnavailableError):
+            await governor.acquire()
+
+    asyncio.run(run())
+    assert governor._waiters == []
+
+
+# --- Circuit breaker ---
+
+def open_breaker(governor):
+    for _ in range(settings.LLM_BREAKER_FAILURE_THRESHOLD):
+        governor.on_failure()
+
+
+def test_breaker_opens_after_consecutive_failures(governor):
+    governor.on_failure()
+    governor.on_failure()
+    assert governor.state == CLOSED
+    governor.on_success()  # Resets the streak
+    governor.on_failure()
+    governor.on_failure()
+    assert governor.state == CLOSED
+    governor.on_failure()
+    assert governor.state == OPEN
+    with pytest.raises(LLMUnavailableError):
+        governor.check()
+
+
+def test_half_open_admits_a_single_probe(governor, clock):
+    open_breaker(governor)
+    clock.now += settings.LLM_BREAKER_COOLDOWN_SECONDS
+
+    assert governor.check() is True
+    assert governor.state == HALF_OPEN
+    with pytest.raises(LLMUnavailableError):
+        governor.check()  # Probe still in flight
+
+
+def test_probe_success_closes_breaker(governor, clock):
+    open_breaker(governor)
+    clock.now += settings.LLM_BREAKER_COOLDOWN_SECONDS
+    governor.check()
+    governor.on_success()
+    assert governor.state == CLOSED
+    assert governor.check() is False
+
+
+def test_probe_failure_reopens_breaker(governor, clock):
+    open_breaker(governor)
+    clock.now += settings.LLM_BREAKER_COOLDOWN_SECONDS
+    governor.check()
+    governor.on_failure()
+    assert governor.state == OPEN
+    assert governor.opened_at == clock.now
+    with pytest.raises(LLMUnavailableError):
+        governor.check()
+
+
+def test_abandoned_probe_lets_the_next_one_through(governor, clock):
+    open_breaker(governor)
+    clock.now += settings.LLM_BREAKER_COOLDOWN_SECONDS
+    governor.check()
+    governor.end_probe()  # e.g. cancelled while queued for a slot
+    assert governor.check() is True
+
+
+# --- Errors and backoff ---
+
+@pytest.mark.parametrize("error, expected", [
+    (APIError(429), "rate_limit"),
+    (RuntimeError("429 RESOURCE_EXHAUSTED"), "rate_limit"),
+    (APIError(503), "server_error"),
+    (RuntimeError("UNAVAILABLE: overloaded"), "server_error"),
+    (APIError(400), None),
+    (ValueError("safety block"), None),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
+
+
+def test_classify_error_follows_cause():
+    try:
+        try:
+            raise APIError(429)
+        except APIError as inner:
+            raise RuntimeError("wrapped") from inner
+    except RuntimeError as e:
+        assert classify_error(e) == "rate_limit"
+
+
+def test_backoff_honours_server_retry_delay(governor, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_GOVERNOR_BACKOFF_MAX_SECONDS", 8.0)
+    error = APIError(429, "429 RESOURCE_EXHAUSTED {'retryDelay': '5s'}")
+    assert 5.0 <= governor.backoff(0, error) <= 8.0
+    capped = APIError(429, "retryDelay: '60s'")
+    assert governor.backoff(0, capped) == 8.0
+
+
+def test_backoff_is_bounded(governor, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_GOVERNOR_BACKOFF_BASE_SECONDS", 0.5)
+    monkeypatch.setattr(settings, "LLM_GOVERNOR_BACKOFF_MAX_SECONDS", 2.0)
+    for attempt in range(6):
+        assert 0.0 <= governor.backoff(attempt, APIError(503)) <= 2.0
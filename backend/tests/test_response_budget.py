@@ -0,0 +1,19 @@
+import sys
+import os
+import asyncio
+import time
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.agent.nodes.response import _llm_response
+from app.core.config import settings
+
+
+def test_llm_response_over_budget_records_the_skipped_step(monkeypatch):
+    monkeypatch.setattr(settings, "GOOGLE_API_KEY", "test-key")  # The client is built, never called
+    state = {"deadline": time.time() - 1, "product_query": {"canonical_name": "Sony WH-1000XM5"}}
+    degradations = []
+    payload = asyncio.run(_llm_response(state, {}, [], {}, degradations, lambda msg: None))
+    assert payload
+    assert [(d["node"], d["skipped"]) for d in degradations] == [("response", "llm_response")]
@@ -0,0 +1,119 @@
+import sys
+import os
+import asyncio
+
+import pytest
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.config import settings
+from app.sources import singleflight as sf
+from app.sources.singleflight import singleflight
+
+
+@pytest.fixture(autouse=True)
+def clear_entries():
+    sf._entries.clear()
+    yield
+    sf._entries.clear()
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    @singleflight(lambda query, timeout=10: query)
+    async def search(query, timeout=10):
+        calls.append(query)
+        await asyncio.sleep(0.01)
+        return {"query": query, "items": []}
+
+    async def run():
+        return await asyncio.gather(search("a"), search("a", timeout=5), search("b"))
+
+    a1, a2, b = asyncio.run(run())
+    assert sorted(calls) == ["a", "b"]
+    assert a1 == a2 == {"query": "a", "items": []}
+    assert b["query"] == "b"
+    # Every caller gets its own copy
+    a1["items"].append(1)
+    assert a2["items"] == []
+
+
+def test_each_caller_gets_the_shared_trace_entries():
+    calls = []
+
+    @singleflight(lambda product, trace: product)
+    async def reviews(product, trace):
+        calls.append(product)
+        trace.append({"step": "tavily", "detail": "Found 3 review snippets"})
+        await asyncio.sleep(0.01)
+        return [product]
+
+    first, second = [], [{"step": "start"}]
+
+    async def run():
+        return await asyncio.gather(reviews("x", first), reviews("x", trace=second))
+
+    assert asyncio.run(run()) == [["x"], ["x"]]
+    assert calls == ["x"]
+    assert first == [{"step": "tavily", "detail": "Found 3 review snippets"}]
+    assert second == [{"step": "start"}, {"step": "tavily", "detail": "Found 3 review snippets"}]
+
+
+def test_failed_calls_are_not_reused():
+    calls = []
+
+    @singleflight(lambda key: key)
+    async def flaky(key):
+        calls.append(key)
+        if len(calls) == 1:
+            raise RuntimeError("provider down")
+        return "ok"
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await flaky("k")
+        return await flaky("k")
+
+    assert asyncio.run(run()) == "ok"
+    assert calls == ["k", "k"]
+
+
+def test_finished_results_expire_after_ttl(monkeypatch):
+    calls = []
+    now = [1000.0]
+    monkeypatch.setattr(sf.time, "time", lambda: now[0])
+    monkeypatch.setattr(settings, "SINGLEFLIGHT_TTL_SECONDS", 30)
+
+    @singleflight(lambda key: key)
+    async def lookup(key):
+        calls.append(key)
+        return key
+
+    async def run():
+        await lookup("k")
+        now[0] += 10
+        await lookup("k")  # Within the TTL: reused
+        now[0] += 60
+        await lookup("k")  # Expired: called again
+
+    asyncio.run(run())
+    assert calls == ["k", "k"]
+
+
+def test_entries_are_bounded(monkeypatch):
+    monkeypatch.setattr(sf, "MAX_ENTRIES", 3)
+
+    @singleflight(lambda key: key)
+    async def lookup(key):
+        return key
+
+    async def run():
+        for key in range(5):
+            await lookup(key)
+        await lookup("last")  # Evicts down to the bound before adding
+
+    asyncio.run(run())
+    assert len(sf._entries) <= 4
+    assert [k[2] for k in sf._entries][-1] == "last"
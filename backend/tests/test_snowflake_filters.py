@@ -0,0 +1,84 @@
+import sys
+import os
+
+import pytest
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.snowflake_vector import LIKE_ESCAPE, SnowflakeVectorService
+
+
+class CapturingSession:
+    def __init__(self):
+        self.queries = []
+
+    def sql(self, cmd):
+        self.queries.append(cmd)
+        return type("Result", (), {"collect": lambda _: []})()
+
+
+@pytest.fixture
+def service():
+    return SnowflakeVectorService()
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("Nike", "Nike"),
+    ("Levi's", "Levi''s"),
+    ("100%", "100\\\\%"),
+    ("t_shirt", "t\\\\_shirt"),
+    ("back\\slash", "back\\\\\\\\slash"),
+])
+def test_like_literal_escapes_quotes_and_wildcards(value, expected):
+    assert SnowflakeVectorService._like_literal(value) == expected
+
+
+def test_sql_literal_escapes_quotes_and_backslashes():
+    assert SnowflakeVectorService._sql_literal("it's \\ fine") == "it''s \\\\ fine"
+
+
+def test_filter_clause_empty(service):
+    assert service._build_filter_clause(None) == ""
+    assert service._build_filter_clause({"prefer_brands": [" "], "exclude_colors": [""]}) == ""
+
+
+def test_filter_clause_escapes_every_pattern(service):
+    clause = service._build_filter_clause({
+        "prefer_brands": ["Levi's"],
+        "exclude_brands": ["50%_off"],
+        "exclude_colors": ["red"],
+        "category": "T_Shirts",
+    })
+    assert clause.startswith("WHERE ")
+    assert "name ILIKE '%Levi''s%'" in clause
+    assert "NOT (name ILIKE '%50\\\\%\\\\_off%'" in clause
+    assert "COALESCE(description, '') ILIKE '%red%'" in clause
+    assert "metadata:category::STRING, '') ILIKE '%T\\\\_Shirts%'" in clause
+    # Every LIKE pattern declares the escape character
+    assert clause.count("ILIKE") == clause.count(LIKE_ESCAPE) == 7
+
+
+@pytest.mark.parametrize("max_price, expected", [
+    (120, "(price IS NULL OR price <= 120.0)"),
+    ("99.5", "(price IS NULL OR price <= 99.5)"),
+])
+def test_filter_clause_max_price(service, max_price, expected):
+    assert service._build_filter_clause({"max_price": max_price}) == f"WHERE {expected}"
+
+
+def test_filter_clause_ignores_invalid_max_price(service):
+    assert service._build_filter_clause({"max_price": "cheap; DROP TABLE products"}) == ""
+
+
+def test_filters_are_applied_before_the_limit(service, monkeypatch):
+    session = CapturingSession()
+    monkeypatch.setattr(SnowflakeVectorService, "session", session)
+    service.search_similar_products([0.1, 0.2], limit=3, filters={
+        "exclude_brands": ["Apple"], "max_price": 300, "category": "Headphones",
+    })
+    [cmd] = session.queries
+    where, limit = cmd.index("WHERE"), cmd.index("LIMIT 3")
+    assert where < cmd.index("ORDER BY") < limit
+    for condition in ("NOT (name ILIKE '%Apple%'", "price <= 300.0", "ILIKE '%Headphones%'"):
+        assert where < cmd.index(condition) < limit
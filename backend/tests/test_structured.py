@@ -0,0 +1,84 @@
+import sys
+import os
+from typing import List
+
+import pytest
+from pydantic import BaseModel
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.agent.structured import StructuredOutputError, _close_truncated, parse_structured, repair_json
+
+
+def test_valid_json_is_not_repaired():
+    assert repair_json('{"a": [1, 2]}') == ({"a": [1, 2]}, False)
+    assert repair_json('  [1]\n') == ([1], False)
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Markdown fences and chatter around the JSON
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('```\n[1, 2]\n```', [1, 2]),
+    ('Sure! {"a": 1} hope it helps', {"a": 1}),
+    ('Here you go:\n[{"a": 1}]', [{"a": 1}]),
+    # Trailing commas
+    ('{"a": 1,}', {"a": 1}),
+    ('[1, 2, ]', [1, 2]),
+    # Python literals
+    ("{'a': True, 'b': None}", {"a": True, "b": None}),
+    ("{'a': true, 'b': null}", {"a": True, "b": None}),
+])
+def test_repairs_common_llm_mistakes(text, expected):
+    assert repair_json(text) == (expected, True)
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Cut inside a string value: close it
+    ('{"a": "hel', {"a": "hel"}),
+    # An escaped quote does not end the string
+    ('{"a": "x\\"y', {"a": 'x"y'}),
+    # Half-written array element is dropped as a whole
+    ('[{"name": "A", "s": 1}, {"name": "B", "s"', [{"name": "A", "s": 1}]),
+    ('{"a": [1, 2, {"b": "x', {"a": [1, 2]}),
+    # Cut after a complete element
+    ('{"a": 1, "b": [1, 2],', {"a": 1, "b": [1, 2]}),
+    # The last element may itself be cut ("2" of "25"), so it is dropped
+    ('{"items": [1, 2', {"items": [1]}),
+])
+def test_closes_truncated_replies(text, expected):
+    assert repair_json(text) == (expected, True)
+
+
+def test_close_truncated_candidates_order():
+    # The cut at the last array comma comes first, then the last comma, then closing in place
+    candidates = _close_truncated('[{"a": 1}, {"a": 2, "b"')
+    assert candidates[0] == '[{"a": 1}]'
+    assert candidates[1] == '[{"a": 1}, {"a": 2}]'
+    assert candidates[-1] == '[{"a": 1}, {"a": 2, "b"}]'
+
+
+def test_close_truncated_balanced_text():
+    assert _close_truncated('{"a": 1}') == []
+
+
+def test_brackets_inside_strings_are_ignored():
+    assert repair_json('{"a": "[not {an array"') == ({"a": "[not {an array"}, True)
+    assert _close_truncated('{"a": "x, ]", "b": [1') == ['{"a": "x, ]"}', '{"a": "x, ]", "b": [1]}']
+
+
+@pytest.mark.parametrize("text", ["", "no json here", "{{{", '{"a": }'])
+def test_unrepairable_raises(text):
+    with pytest.raises(StructuredOutputError):
+        repair_json(text)
+
+
+class Item(BaseModel):
+    name: str
+    score: float = 0.0
+
+
+def test_parse_structured_validates_schema():
+    assert parse_structured('[{"name": "A", "score": "1.5"}]', "test", List[Item]) == [{"name": "A", "score": 1.5}]
+    with pytest.raises(StructuredOutputError):
+        parse_structured('[{"score": 1}]', "test", List[Item])
@@ -0,0 +1,116 @@
+import sys
+import os
+import asyncio
+
+import pytest
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.agent import timing
+from app.agent.timing import Span, critical_path, trace_request
+
+
+def make_span(name, start_ms, end_ms, kind="node"):
+    s = Span(name, kind, "trace", None, {})
+    s.start_ns = start_ms * 1_000_000
+    s.end_ns = end_ms * 1_000_000 if end_ms is not None else None
+    return s
+
+
+def path_names(spans, **kwargs):
+    return [p["name"] for p in critical_path(spans, **kwargs)["path"]]
+
+
+def test_critical_path_sequential_chain():
+    spans = [make_span("a", 0, 100), make_span("b", 100, 300), make_span("c", 300, 350)]
+    result = critical_path(spans)
+    assert [p["name"] for p in result["path"]] == ["a", "b", "c"]
+    assert result["total_s"] == pytest.approx(0.35)
+    assert result["start_ns"] == 0
+
+
+def test_critical_path_follows_slowest_parallel_branch():
+    # b and c run in parallel after a; d waits for both, so c is on the path
+    spans = [
+        make_span("a", 0, 50),
+        make_span("b", 50, 120),
+        make_span("c", 50, 400),
+        make_span("d", 400, 450),
+    ]
+    assert path_names(spans) == ["a", "c", "d"]
+
+
+def test_critical_path_tolerates_start_before_predecessor_end():
+    # The successor starts half a millisecond before the predecessor's end is stamped
+    a = make_span("a", 0, 100)
+    b = make_span("b", 0, 200)
+    b.start_ns = a.end_ns - 500_000
+    assert path_names([a, b]) == ["a", "b"]
+
+
+def test_critical_path_ignores_unfinished_and_other_kinds():
+    spans = [
+        make_span("a", 0, 100),
+        make_span("llm", 0, 900, kind="llm"),
+        make_span("running", 100, None),
+    ]
+    assert path_names(spans) == ["a"]
+    assert path_names(spans, kind="llm") == ["llm"]
+
+
+def test_critical_path_empty():
+    assert critical_path([]) == {"total_s": 0.0, "path": [], "start_ns": None}
+
+
+@pytest.fixture
+def exports(monkeypatch):
+    exported = []
+    monkeypatch.setattr(timing, "export_trace", exported.append)
+
+    async def aexport(trace_id):
+        exported.append(trace_id)
+
+    monkeypatch.setattr(timing, "aexport_trace", aexport)
+    return exported
+
+
+def test_trace_request_exports_failed_requests(exports):
+    with pytest.raises(ValueError):
+        with trace_request("req-fail", "scan"):
+            raise ValueError("boom")
+    assert exports == ["req-fail"]
+
+
+def test_trace_request_exports_in_background_on_event_loop(exports):
+    async def run():
+        with trace_request("req-async", "scan"):
+            pass
+        # Scheduled, not done inline on the loop
+        assert exports == []
+        await asyncio.gather(*timing._export_tasks)
+
+    asyncio.run(run())
+    assert exports == ["req-async"]
+
+
+def test_trace_owner_is_the_request_span_user(exports, tmp_path, monkeypatch):
+    monkeypatch.setattr(timing.settings, "TRACE_EXPORT_DIR", str(tmp_path))
+    with trace_request("req-owned", "scan", user_id="7"):
+        with timing.span("child", kind="node", user_id="8"):
+            pass
+    with trace_request("req-anon", "scan"):
+        pass
+    assert timing.trace_owner("req-owned") == "7"
+    assert timing.trace_owner("req-anon") is None
+    assert timing.trace_owner("req-unknown") is None
+
+
+def test_trace_owner_survives_export(tmp_path, monkeypatch):
+    # Another worker reads the owner back from the exported OTLP file
+    monkeypatch.setattr(timing.settings, "TRACE_EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(timing, "schedule_export", timing.export_trace)
+    with trace_request("req-exported", "scan", user_id="7"):
+        pass
+    monkeypatch.setattr(timing, "trace_store", timing.TraceStore())
+    assert timing.trace_owner("req-exported") == "7"
@@ -0,0 +1,43 @@
+import sys
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Add backend to path so we can import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.agent import timing
+from app.agent.timing import trace_request
+from app.api.v1.endpoints import agent as agent_endpoints
+from app.core.security import get_current_user
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(timing.settings, "TRACE_EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(timing, "schedule_export", lambda trace_id: None)
+    app = FastAPI()
+    app.include_router(agent_endpoints.router, prefix="/agent")
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=7)
+    return TestClient(app)
+
+
+def test_owner_reads_trace(client):
+    with trace_request("req-mine", "POST /agent/analyze-image", user_id="7"):
+        pass
+    response = client.get("/agent/trace/req-mine")
+    assert response.status_code == 200
+    assert response.json()["spans"][0]["name"] == "POST /agent/analyze-image"
+    assert client.get("/agent/trace/req-mine?format=otlp").status_code == 200
+
+
+@pytest.mark.parametrize("owner", ["8", None])
+def test_other_users_traces_are_not_found(client, owner):
+    attributes = {"user_id": owner} if owner else {}
+    with trace_request("req-other", "POST /agent/analyze-image", **attributes):
+        pass
+    assert client.get("/agent/trace/req-other").status_code == 404
+    assert client.get("/agent/trace/req-other?format=otlp").status_code == 404